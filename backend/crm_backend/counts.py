@@ -0,0 +1,95 @@
+"""
+關聯計數欄位
+
+列表常需要輸出每筆資料的關聯數量 (分類的產品數、工單的備註數…)，若以
+SerializerMethodField 逐筆 .count()，每頁會多出與筆數相同的查詢。改為：
+
+- 序列化器以 RelatedCountField(relation, condition) 宣告要計數的反向關聯
+- ViewSet 加上 CountedRelationsViewSetMixin，列表 / 詳情會依序列化器實際輸出的
+  計數欄位加上相關子查詢 (annotate)，整頁的查詢數與筆數無關，也可以依計數排序
+- 沒有 annotate 的情況 (建立 / 修改後的回應、自訂 action) 才逐筆計數；
+  自訂 action 可用 annotate_counts 自行加上
+"""
+
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+
+
+def _reverse_relation(model, accessor_name):
+    for relation in model._meta.related_objects:
+        if relation.get_accessor_name() == accessor_name:
+            return relation
+    raise ValueError(f"{model.__name__} 沒有反向關聯 {accessor_name}")
+
+
+def count_subquery(model, relation, condition=None):
+    """model 每一列在反向關聯 relation (例如 "products") 中符合 condition 的數量"""
+    reverse = _reverse_relation(model, relation)
+    foreign_key = reverse.field.name
+    counts = (
+        reverse.related_model._default_manager.filter(
+            condition or Q(), **{foreign_key: OuterRef("pk")}
+        )
+        .order_by()
+        .values(foreign_key)
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class RelatedCountField(serializers.Field):
+    """
+    反向關聯的數量 (唯讀)
+    優先讀取同名的 annotate，沒有時才對該筆資料執行 COUNT 查詢
+    """
+
+    # 供 SparseFieldsetViewSetMixin 使用：計數來自子查詢，不需要載入其他欄位
+    only_dependencies = ()
+
+    def __init__(self, relation, condition=None, **kwargs) -> None:
+        self.relation = relation
+        self.condition = condition
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        try:
+            return getattr(instance, self.field_name)
+        except AttributeError:
+            related = getattr(instance, self.relation)
+            if self.condition is None:
+                return related.count()
+            return related.filter(self.condition).count()
+
+    def to_representation(self, value):
+        return value
+
+    def annotation(self, model):
+        return count_subquery(model, self.relation, self.condition)
+
+
+def annotate_counts(queryset, serializer):
+    """依序列化器 (實例) 輸出的 RelatedCountField 為 queryset 加上計數子查詢"""
+    annotations = {
+        name: field.annotation(queryset.model)
+        for name, field in serializer.fields.items()
+        if isinstance(field, RelatedCountField)
+    }
+    if not annotations:
+        return queryset
+    return queryset.annotate(**annotations)
+
+
+class CountedRelationsViewSetMixin:
+    """列表 / 詳情查詢時，為序列化器的 RelatedCountField 加上計數子查詢"""
+
+    def filter_queryset(self, queryset):
+        if self.action in {"list", "retrieve"}:
+            # 在排序之前加上，ordering_fields 才能使用計數欄位
+            serializer = self.get_serializer_class()(
+                context=self.get_serializer_context()
+            )
+            queryset = annotate_counts(queryset, serializer)
+        return super().filter_queryset(queryset)
@@ -0,0 +1,164 @@
+"""
+列表 API 的串流匯出
+
+列表端點加上 ``?format=csv`` 或 ``?format=ndjson`` 時不分頁、不計算 COUNT(*)，
+直接輸出所有符合條件的資料：
+
+- 沿用列表的篩選、搜尋、排序與 ?fields= / ?expand= 稀疏欄位
+- 以 queryset.iterator(chunk_size=...) 從伺服器端游標分批讀取，每批各自序列化後
+  立即輸出，記憶體用量只與批次大小有關
+- 加上 ``?gzip=true`` 時即時壓縮，以 .gz 檔案下載
+
+format 是 DRF 內建的格式參數，因此以 renderer 註冊 csv / ndjson 兩種格式，
+內容協商才不會回應 404；實際輸出由 StreamingExportMixin 處理。
+不是列表的匯出端點 (例如客戶餘額) 以 csv_lines + export_response 輸出。
+"""
+
+import csv
+import json
+import zlib
+from typing import ClassVar
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+EXPORT_CHUNK_SIZE = 2000
+GZIP_PARAM = "gzip"
+
+
+class _ExportRenderer(BaseRenderer):
+    """
+    匯出格式的 renderer，只用於內容協商
+    匯出以外的回應 (例如錯誤訊息) 以 JSON 輸出
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+
+
+class CSVExportRenderer(_ExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONExportRenderer(_ExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+EXPORT_RENDERERS = {
+    renderer.format: renderer for renderer in (CSVExportRenderer, NDJSONExportRenderer)
+}
+
+
+class _Echo:
+    """csv.writer 的寫入目標，直接回傳寫入的內容供 StreamingHttpResponse 輸出"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    # 巢狀欄位 (例如 customer_info、items) 以 JSON 字串輸出
+    if isinstance(value, dict | list):
+        return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return value
+
+
+def csv_lines(field_names, batches):
+    """標題列與每一列的 CSV 文字；batches 為分批的 dict，依 field_names 取值"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(field_names)
+    for rows in batches:
+        for row in rows:
+            yield writer.writerow([_csv_value(row.get(name)) for name in field_names])
+
+
+def _ndjson_lines(batches):
+    for rows in batches:
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def _gzip(lines):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        # 累積一定大小再壓縮，避免每行一個極小的區塊
+        if len(buffer) >= 500:
+            yield compressor.compress("".join(buffer).encode())
+            buffer = []
+    yield compressor.compress("".join(buffer).encode())
+    yield compressor.flush()
+
+
+def export_response(request, lines, export_format, filename):
+    """
+    以 StreamingHttpResponse 下載 lines；filename 不含副檔名
+    ?gzip=true 時即時壓縮為 .gz
+    """
+    filename = f"{filename}.{export_format}"
+    compress = request.query_params.get(GZIP_PARAM, "").lower() in {"1", "true"}
+    if compress:
+        response = StreamingHttpResponse(_gzip(lines), content_type="application/gzip")
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(
+            (line.encode() for line in lines),
+            content_type=f"{EXPORT_RENDERERS[export_format].media_type}; charset=utf-8",
+        )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+class StreamingExportMixin:
+    """
+    讓 ModelViewSet 的列表支援 ?format=csv|ndjson 串流匯出
+    export_filename 為下載檔名 (不含副檔名)，預設為資料表名稱
+    """
+
+    renderer_classes: ClassVar[list] = [
+        *api_settings.DEFAULT_RENDERER_CLASSES,
+        *EXPORT_RENDERERS.values(),
+    ]
+    export_chunk_size = EXPORT_CHUNK_SIZE
+    export_filename = None
+
+    def list(self, request, *args, **kwargs):
+        export_format = getattr(request.accepted_renderer, "format", None)
+        if export_format not in EXPORT_RENDERERS:
+            return super().list(request, *args, **kwargs)
+        return self.export(request, export_format)
+
+    def _serialized_batches(self, queryset):
+        batch = []
+        for instance in queryset.iterator(chunk_size=self.export_chunk_size):
+            batch.append(instance)
+            if len(batch) == self.export_chunk_size:
+                yield self.get_serializer(batch, many=True).data
+                batch = []
+        if batch:
+            yield self.get_serializer(batch, many=True).data
+
+    def export(self, request, export_format):
+        queryset = self.filter_queryset(self.get_queryset())
+        batches = self._serialized_batches(queryset)
+        if export_format == "csv":
+            field_names = list(self.get_serializer().fields)
+            lines = csv_lines(field_names, batches)
+        else:
+            lines = _ndjson_lines(batches)
+
+        filename = (
+            f"{self.export_filename or queryset.model._meta.db_table}"
+            f"-{timezone.localdate():%Y%m%d}"
+        )
+        return export_response(request, lines, export_format, filename)
@@ -0,0 +1,155 @@
+"""
+稀疏欄位集 (sparse fieldsets) 支援
+
+列表頁通常只需要少數欄位，透過查詢參數讓前端指定要回傳的欄位：
+
+- ``?fields=id,order_number,total``：只回傳指定欄位 (id 一律保留)
+- ``?expand=customer_info``：展開巢狀關聯欄位；只給 expand 時，回傳所有非巢狀欄位
+  加上指定的巢狀欄位
+
+兩個參數都沒給時維持原本的完整輸出。ViewSet 端會依照實際選到的欄位，
+同步調整 queryset 的 select_related / prefetch_related / only()，
+讓沒被要求的欄位不需要 JOIN、也不用從資料庫讀出來。
+"""
+
+from typing import ClassVar
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = "fields"
+EXPAND_PARAM = "expand"
+
+# 無論如何都會保留的欄位
+ALWAYS_INCLUDED_FIELDS = frozenset({"id"})
+
+
+def _split_param(value: str | None) -> set[str] | None:
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+def select_sparse_fields(request, field_names, expandable_fields) -> set[str] | None:
+    """
+    依照 ?fields= / ?expand= 計算要保留的欄位名稱
+    回傳 None 表示不需要裁剪 (沒有帶參數或不是讀取請求)
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+
+    query_params = getattr(request, "query_params", request.GET)
+    requested = _split_param(query_params.get(FIELDS_PARAM))
+    expand = _split_param(query_params.get(EXPAND_PARAM))
+
+    if requested is None and expand is None:
+        return None
+
+    field_names = set(field_names)
+    expand = expand or set()
+    if requested is None:
+        # 只有 expand：保留所有非巢狀欄位，巢狀欄位需明確展開
+        selected = (field_names - set(expandable_fields)) | expand
+    else:
+        selected = requested | expand
+
+    return (selected | ALWAYS_INCLUDED_FIELDS) & field_names
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    讓序列化器依照請求參數裁剪輸出欄位
+    expandable_fields 列出較昂貴的巢狀欄位，只有在 fields 或 expand 指定時才會輸出
+    """
+
+    expandable_fields: ClassVar[tuple[str, ...]] = ()
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # 巢狀序列化器在宣告時沒有 context，因此只會裁剪最外層
+        self.sparse_selection = select_sparse_fields(
+            self.context.get("request"), self.fields.keys(), self.expandable_fields
+        )
+        if self.sparse_selection is None:
+            return
+
+        for field_name in set(self.fields.keys()) - self.sparse_selection:
+            self.fields.pop(field_name)
+
+
+class SparseFieldsetViewSetMixin:
+    """
+    依照選取到的欄位調整 queryset
+
+    - sparse_select_related / sparse_prefetch_related：欄位名稱 → 需要的關聯
+    - sparse_only_dependencies：非模型欄位 (property、SerializerMethodField、annotate)
+      需要讀取的模型欄位；未列出的非模型欄位會讓 only() 停用，以免產生額外查詢
+    """
+
+    sparse_select_related: ClassVar[dict[str, tuple[str, ...]]] = {}
+    sparse_prefetch_related: ClassVar[dict[str, tuple[str, ...]]] = {}
+    sparse_only_dependencies: ClassVar[dict[str, tuple[str, ...]]] = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in {"list", "retrieve"}:
+            return queryset
+
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, SparseFieldsetSerializerMixin):
+            return queryset
+
+        serializer = serializer_class(context=self.get_serializer_context())
+        if serializer.sparse_selection is None:
+            return queryset
+
+        return self.apply_sparse_fieldset(queryset, serializer.fields)
+
+    def apply_sparse_fieldset(self, queryset, fields):
+        """只保留選取欄位需要的關聯與資料欄位"""
+        select_related = []
+        prefetch_related = []
+        for field_name in fields:
+            select_related.extend(self.sparse_select_related.get(field_name, ()))
+            prefetch_related.extend(self.sparse_prefetch_related.get(field_name, ()))
+
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select_related:
+            queryset = queryset.select_related(*dict.fromkeys(select_related))
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*dict.fromkeys(prefetch_related))
+
+        only_fields = self._resolve_only_fields(queryset.model, fields)
+        if only_fields is None:
+            return queryset
+        # select_related 的外鍵本身也必須載入
+        only_fields.update(name.split("__")[0] for name in select_related)
+        return queryset.only(*only_fields)
+
+    def _resolve_only_fields(self, model, fields) -> set[str] | None:
+        only_fields = {"pk"}
+        for field_name, field in fields.items():
+            if field_name in self.sparse_only_dependencies:
+                only_fields.update(self.sparse_only_dependencies[field_name])
+                continue
+            # 欄位本身宣告的依賴 (例如 crm_backend.counts.RelatedCountField)
+            dependencies = getattr(field, "only_dependencies", None)
+            if dependencies is not None:
+                only_fields.update(dependencies)
+                continue
+
+            source = field.source.split(".")[0]
+            if source == "*":
+                return None
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                return None
+
+            if model_field.concrete:
+                only_fields.add(model_field.name)
+            elif not model_field.is_relation:
+                return None
+            # 反向關聯交給 prefetch_related 處理，不需要額外欄位
+
+        return only_fields
@@ -0,0 +1,487 @@
+"""
+訂單 / 交易資料表的月份分割 (PostgreSQL declarative range partitioning)
+
+大多數查詢只會用到最近 90 天的資料，依月份分割後，帶時間範圍的查詢只需要掃描
+相關月份的分割區，舊資料也可以整個分割區卸離或封存，不需要大量 DELETE。
+
+分割為選用功能，以 manage_partitions 指令操作，不透過 Django migration：
+
+- convert：將現有的資料表原地轉換成分割表。原資料表改名為 <table>_legacy，
+  以 (MINVALUE, 下個月 1 日) 的範圍掛回成第一個分割區，不需要搬移資料；
+  之後的月份各自建立新的分割區，另有一個 DEFAULT 分割區承接範圍外的資料
+- create：預先建立未來月份的分割區 (建議每月排程執行)
+- detach：卸離指定月份之前的分割區，可選擇移到封存 schema 或直接刪除；
+  鍵表 (見下方) 中這些資料列的 id 與唯一值會保留
+
+PostgreSQL 分割表的唯一索引必須包含分割欄位，主鍵因此改為 (id, 分割欄位)，其他資料表
+的外鍵也無法再參照分割表的 id。冪等鍵、金流事件、狀態歷程與預留等都依賴這些保證，
+轉換時改由鍵表 <table>_keys 維持：
+
+- 鍵表以 id 為主鍵，並存放不含分割欄位的唯一欄位 (例如 order_number)；原本的唯一
+  約束以相同名稱移到鍵表，分割表上則為這些欄位建立一般索引 (<名稱>_lookup) 供查詢
+- 分割表的 AFTER 觸發程序在新增、修改與刪除時同步鍵表，重複的值與轉換前一樣在同一個
+  INSERT / UPDATE 拋出 IntegrityError
+- 其他資料表參照此表的外鍵以相同名稱改為參照 <table>_keys(id)
+
+ON CONFLICT 無法以其他資料表的唯一約束為準，依賴它的 upsert 需改寫 (金流事件匯入
+見 transactions.gateway)。部分唯一索引、運算式唯一索引、參照 id 以外欄位或自我參照
+的外鍵無法以鍵表處理，conversion_blockers 會列出原因並拒絕轉換。
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import date
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+# 資料表 → 分割欄位
+PARTITIONED_TABLES = {
+    "orders_order": "order_date",
+    "orders_orderitem": "created_at",
+    "transactions_transaction": "created_at",
+}
+
+_BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+_MAX_IDENTIFIER_LENGTH = 63
+
+
+class PartitioningError(ValueError):
+    """資料表無法轉換為分割表"""
+
+
+@dataclass
+class Partition:
+    name: str
+    # None 表示 MINVALUE
+    lower: date | None
+    upper: date | None
+    is_default: bool = False
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def _identifier(name) -> str:
+    return connection.ops.quote_name(name[:_MAX_IDENTIFIER_LENGTH])
+
+
+def _legacy_name(name) -> str:
+    suffix = "_legacy"
+    return _identifier(name[: _MAX_IDENTIFIER_LENGTH - len(suffix)] + suffix)
+
+
+def _parse_bound(value) -> date | None:
+    if value == "MINVALUE":
+        return None
+    return date.fromisoformat(value.strip("'")[:10])
+
+
+def is_partitioned(table) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT 1 FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = %s AND pg_table_is_visible(c.oid)
+            """,
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(table) -> list[Partition]:
+    """依下限排序的分割區列表，DEFAULT 分割區排在最後"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)
+            """,
+            [table],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        if bound == "DEFAULT":
+            partitions.append(Partition(name, None, None, is_default=True))
+            continue
+        lower, upper = _BOUND_PATTERN.search(bound).groups()
+        partitions.append(Partition(name, _parse_bound(lower), _parse_bound(upper)))
+    return sorted(partitions, key=lambda p: (p.is_default, p.lower or date.min, p.name))
+
+
+def _fetch_all(sql, params) -> list[tuple]:
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def keys_table(table) -> str:
+    return f"{table}_keys"
+
+
+@dataclass
+class GlobalUnique:
+    """不含分割欄位、轉換時移到鍵表的唯一索引"""
+
+    name: str
+    columns: list[str]
+    # pg_indexes.indexdef
+    index_definition: str
+    # 唯一約束的 pg_get_constraintdef；單純的唯一索引為 None
+    constraint_definition: str | None
+
+
+def incoming_foreign_keys(table) -> list[tuple]:
+    """
+    (參照的資料表, 外鍵名稱, 定義, 被參照的欄位)，包含自我參照
+    參照的資料表若已是分割表，只列出分割表本身的外鍵 (分割區上的外鍵由它繼承)
+    """
+    return _fetch_all(
+        """
+        SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid),
+            ARRAY(
+                SELECT attname FROM pg_attribute
+                WHERE attrelid = confrelid AND attnum = ANY(confkey)
+            )
+        FROM pg_constraint
+        WHERE confrelid = %s::regclass AND contype = 'f' AND conparentid = 0
+        ORDER BY 1, 2
+        """,
+        [table],
+    )
+
+
+def _unique_indexes(table) -> list[tuple]:
+    """(索引名稱, 欄位, 是否為部分或運算式索引, indexdef, 唯一約束定義)"""
+    return _fetch_all(
+        """
+        SELECT index_class.relname,
+            ARRAY(
+                SELECT attname FROM pg_attribute
+                WHERE attrelid = pg_index.indrelid
+                  AND attnum = ANY(pg_index.indkey)
+                ORDER BY attnum
+            ),
+            pg_index.indpred IS NOT NULL OR pg_index.indexprs IS NOT NULL,
+            pg_get_indexdef(pg_index.indexrelid),
+            (
+                SELECT pg_get_constraintdef(pg_constraint.oid) FROM pg_constraint
+                WHERE conindid = pg_index.indexrelid AND contype = 'u'
+                  AND conrelid = pg_index.indrelid
+            )
+        FROM pg_index JOIN pg_class index_class
+            ON index_class.oid = pg_index.indexrelid
+        WHERE pg_index.indrelid = %s::regclass
+          AND pg_index.indisunique AND NOT pg_index.indisprimary
+        ORDER BY 1
+        """,
+        [table],
+    )
+
+
+def global_uniques(table, column) -> list[GlobalUnique]:
+    """不含分割欄位的唯一索引，轉換後由鍵表保證唯一"""
+    return [
+        GlobalUnique(name, columns, index_definition, constraint_definition)
+        for name, columns, partial, index_definition, constraint_definition in (
+            _unique_indexes(table)
+        )
+        if column not in columns and not partial
+    ]
+
+
+def conversion_blockers(table, column) -> list[str]:
+    """無法以鍵表維持的約束，回傳說明文字；空列表表示可以轉換"""
+    blockers = []
+    for referencing, name, _, columns in incoming_foreign_keys(table):
+        if referencing == table:
+            blockers.append(f"外鍵 {name} 自我參照")
+        elif columns != ["id"]:
+            blockers.append(
+                f"{referencing} 的外鍵 {name} 參照 id 以外的欄位 ({', '.join(columns)})"
+            )
+    blockers.extend(
+        f"唯一索引 {name} 為部分或運算式索引，且不包含分割欄位 {column}"
+        for name, columns, partial, _, _ in _unique_indexes(table)
+        if partial and column not in columns
+    )
+    return blockers
+
+
+def _replace_index_target(definition, table, name=None, unique=None) -> str:
+    """改寫 CREATE INDEX 的目標資料表，可一併改名或改變是否唯一"""
+    match = re.match(r"CREATE (UNIQUE )?INDEX (\S+) ON (?:ONLY )?\S+ ", definition)
+    unique = bool(match.group(1)) if unique is None else unique
+    return (
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX"
+        f" {_identifier(name) if name else match.group(2)} ON {_identifier(table)} "
+        + definition[match.end() :]
+    )
+
+
+def _keys_sql(table, uniques, incoming) -> list[str]:
+    """建立並回填鍵表，把其他資料表的外鍵改為參照鍵表"""
+    keys, quoted = _identifier(keys_table(table)), _identifier(table)
+    columns = ["id"] + sorted(
+        {column for unique in uniques for column in unique.columns}
+    )
+    types = dict(
+        _fetch_all(
+            """
+            SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attname = ANY(%s)
+            """,
+            [table, columns],
+        )
+    )
+    column_list = ", ".join(_identifier(column) for column in columns)
+    sql = [
+        f"CREATE TABLE {keys} ("
+        + ", ".join(f"{_identifier(column)} {types[column]}" for column in columns)
+        + ", PRIMARY KEY (id))",
+        f"INSERT INTO {keys} ({column_list}) SELECT {column_list} FROM {quoted}",
+    ]
+    for referencing, name, definition, _ in incoming:
+        definition = re.sub(
+            r"REFERENCES \S+\(id\)", f"REFERENCES {keys}(id)", definition, count=1
+        )
+        sql.extend(
+            [
+                f"ALTER TABLE {_identifier(referencing)}"
+                f" DROP CONSTRAINT {_identifier(name)}",
+                f"ALTER TABLE {_identifier(referencing)}"
+                f" ADD CONSTRAINT {_identifier(name)} {definition}",
+            ]
+        )
+    return sql
+
+
+def _sync_keys_sql(table, uniques) -> list[str]:
+    """分割表的 AFTER 觸發程序，新增、修改與刪除時同步鍵表"""
+    keys, quoted = _identifier(keys_table(table)), _identifier(table)
+    function = _identifier(f"{table}_sync_keys")
+    columns = ["id"] + sorted(
+        {column for unique in uniques for column in unique.columns}
+    )
+    column_list = ", ".join(_identifier(column) for column in columns)
+    new_values = ", ".join(f"NEW.{_identifier(column)}" for column in columns)
+    assignments = ", ".join(
+        f"{_identifier(column)} = NEW.{_identifier(column)}" for column in columns
+    )
+    return [
+        f"""CREATE FUNCTION {function}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO {keys} ({column_list}) VALUES ({new_values});
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE {keys} SET {assignments} WHERE id = OLD.id;
+    ELSE
+        DELETE FROM {keys} WHERE id = OLD.id;
+    END IF;
+    RETURN NULL;
+END
+$$""",
+        f"CREATE TRIGGER {function} AFTER INSERT OR DELETE OR UPDATE OF {column_list}"
+        f" ON {quoted} FOR EACH ROW EXECUTE FUNCTION {function}()",
+    ]
+
+
+def conversion_sql(table, column, today=None) -> list[str]:
+    """
+    產生將 table 原地轉換為分割表的 SQL，有 conversion_blockers 時拋出 PartitioningError
+    索引、約束與外鍵沿用原本的名稱 (不含分割欄位的唯一約束移到鍵表)，
+    Django 之後的 migration 仍可依名稱操作
+    """
+    blockers = conversion_blockers(table, column)
+    if blockers:
+        raise PartitioningError(f"{table} 無法轉換為分割表：" + "；".join(blockers))
+
+    legacy = f"{table}_legacy"
+    bound = add_months(month_start(today or timezone.localdate()), 1)
+    quoted, quoted_legacy = _identifier(table), _identifier(legacy)
+
+    constraints = _fetch_all(
+        """
+        SELECT conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint WHERE conrelid = %s::regclass ORDER BY conname
+        """,
+        [table],
+    )
+    constraint_names = {name for name, _, _ in constraints}
+    indexes = _fetch_all(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s"
+        " ORDER BY indexname",
+        [table],
+    )
+    uniques = global_uniques(table, column)
+    moved = {unique.name for unique in uniques}
+    incoming = incoming_foreign_keys(table)
+
+    sql = [f"LOCK TABLE {quoted} IN ACCESS EXCLUSIVE MODE"]
+    if uniques or incoming:
+        sql.extend(_keys_sql(table, uniques, incoming))
+
+    # 原資料表與其索引、約束改名，讓出原本的名稱給分割表
+    sql.append(f"ALTER TABLE {quoted} RENAME TO {quoted_legacy}")
+    for name, contype, _ in constraints:
+        if contype == "p" or name in moved:
+            # 分割區不能有自己的主鍵，改由分割表的 (id, 分割欄位) 主鍵涵蓋；
+            # 不含分割欄位的唯一約束改由鍵表保證
+            sql.append(
+                f"ALTER TABLE {quoted_legacy} DROP CONSTRAINT {_identifier(name)}"
+            )
+            continue
+        sql.append(
+            f"ALTER TABLE {quoted_legacy} RENAME CONSTRAINT {_identifier(name)}"
+            f" TO {_legacy_name(name)}"
+        )
+    for name, _ in indexes:
+        if name in moved and name not in constraint_names:
+            sql.append(f"DROP INDEX {_identifier(name)}")
+        elif name not in constraint_names:
+            sql.append(
+                f"ALTER INDEX {_identifier(name)} RENAME TO {_legacy_name(name)}"
+            )
+
+    # 唯一約束以原本的名稱建立在鍵表上
+    keys = keys_table(table)
+    for unique in uniques:
+        if unique.constraint_definition:
+            sql.append(
+                f"ALTER TABLE {_identifier(keys)} ADD CONSTRAINT"
+                f" {_identifier(unique.name)} {unique.constraint_definition}"
+            )
+        else:
+            sql.append(_replace_index_target(unique.index_definition, keys))
+
+    # identity 欄位改為一般序列，由分割表與所有分割區共用
+    sequence = _identifier(f"{table}_id_seq")
+    sql.extend(
+        [
+            # 原本的 identity 序列會隨之刪除，再以相同名稱建立序列
+            f"ALTER TABLE {quoted_legacy} ALTER COLUMN id DROP IDENTITY IF EXISTS",
+            f"CREATE SEQUENCE {sequence}",
+            f"SELECT setval('{sequence}',"
+            f" COALESCE((SELECT MAX(id) FROM {quoted_legacy}), 0) + 1, false)",
+            f"CREATE TABLE {quoted} (LIKE {quoted_legacy} INCLUDING DEFAULTS"
+            f" INCLUDING STORAGE) PARTITION BY RANGE ({_identifier(column)})",
+            f"ALTER TABLE {quoted} ALTER COLUMN id SET DEFAULT nextval('{sequence}')",
+            f"ALTER SEQUENCE {sequence} OWNED BY {quoted}.id",
+            # 先以 CHECK 約束驗證範圍，ATTACH 時就不需要再掃描一次
+            f"ALTER TABLE {quoted_legacy} ADD CONSTRAINT"
+            f" {_identifier(f'{legacy}_bound')}"
+            f" CHECK ({_identifier(column)} IS NOT NULL"
+            f" AND {_identifier(column)} < '{bound.isoformat()}')",
+            f"ALTER TABLE {quoted} ATTACH PARTITION {quoted_legacy}"
+            f" FOR VALUES FROM (MINVALUE) TO ('{bound.isoformat()}')",
+        ]
+    )
+
+    for name, contype, definition in constraints:
+        if contype == "p":
+            sql.append(
+                f"ALTER TABLE {quoted} ADD CONSTRAINT {_identifier(name)}"
+                f" PRIMARY KEY (id, {_identifier(column)})"
+            )
+        elif contype in {"u", "f", "c"} and name not in moved:
+            # 外鍵與 CHECK 原樣建立，新的分割區會繼承；
+            # 留在分割表上的唯一約束都包含分割欄位
+            sql.append(
+                f"ALTER TABLE {quoted} ADD CONSTRAINT {_identifier(name)} {definition}"
+            )
+
+    # 一般索引沿用原定義；legacy 上相同定義的索引會直接掛上，不會重建
+    for name, definition in indexes:
+        if name in constraint_names or name in moved:
+            continue
+        sql.append(_replace_index_target(definition, table))
+    # 移到鍵表的唯一欄位在分割表上改用一般索引查詢
+    for unique in uniques:
+        sql.append(
+            _replace_index_target(
+                unique.index_definition,
+                table,
+                name=f"{unique.name[: _MAX_IDENTIFIER_LENGTH - 7]}_lookup",
+                unique=False,
+            )
+        )
+    if uniques or incoming:
+        sql.extend(_sync_keys_sql(table, uniques))
+
+    sql.append(
+        f"CREATE TABLE {_identifier(f'{table}_default')} PARTITION OF {quoted} DEFAULT"
+    )
+    return sql
+
+
+def create_partition_sql(table, month) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {_identifier(partition_name(table, month))}"
+        f" PARTITION OF {_identifier(table)} FOR VALUES FROM"
+        f" ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def missing_partition_months(table, months_ahead, today=None) -> list[date]:
+    """本月起算 months_ahead 個月內，尚未被任何分割區涵蓋的月份"""
+    partitions = [p for p in list_partitions(table) if not p.is_default]
+    current = month_start(today or timezone.localdate())
+    missing = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        covered = any(
+            (p.lower is None or p.lower <= month) and p.upper and month < p.upper
+            for p in partitions
+        )
+        if not covered:
+            missing.append(month)
+    return missing
+
+
+def detach_partition_sql(table, partition, archive_schema=None, drop=False):
+    sql = [
+        f"ALTER TABLE {_identifier(table)}"
+        f" DETACH PARTITION {_identifier(partition.name)}"
+    ]
+    if drop:
+        sql.append(f"DROP TABLE {_identifier(partition.name)}")
+    elif archive_schema:
+        sql.extend(
+            [
+                f"CREATE SCHEMA IF NOT EXISTS {_identifier(archive_schema)}",
+                f"ALTER TABLE {_identifier(partition.name)}"
+                f" SET SCHEMA {_identifier(archive_schema)}",
+            ]
+        )
+    return sql
+
+
+def expired_partitions(table, before) -> list[Partition]:
+    """上限不超過 before 的分割區 (整個分割區都早於 before)"""
+    return [
+        partition
+        for partition in list_partitions(table)
+        if not partition.is_default and partition.upper and partition.upper <= before
+    ]
+
+
+def execute(statements) -> None:
+    with transaction.atomic(), connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
@@ -172,6 +172,30 @@ REST_FRAMEWORK = {
     ],
 }
 
+# 金流 webhook 簽章密鑰 (HMAC-SHA256)，未設定時金流事件端點只接受已登入的使用者
+PAYMENT_GATEWAY_WEBHOOK_SECRET = os.getenv("PAYMENT_GATEWAY_WEBHOOK_SECRET", "")
+
+# 報表金額統一換算成的基準幣別，匯率以 load_fx_rates 指令載入
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", "USD").upper()
+
+# 待付款 (pending) 訂單預留庫存的保留時間 (分鐘)，逾時由 expire_stock_reservations 釋放
+STOCK_RESERVATION_TTL_MINUTES = int(os.getenv("STOCK_RESERVATION_TTL_MINUTES", "30"))
+
+# 預設為各行程獨立的記憶體快取；多個 worker 部署時改用共用的快取 (例如
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache、CACHE_LOCATION=redis://...)
+# 失效才會同步到所有 worker
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# 產品統計 (/api/products/products/stats/) 的快取秒數，異動時會提早失效
+PRODUCT_STATS_CACHE_SECONDS = int(os.getenv("PRODUCT_STATS_CACHE_SECONDS", "300"))
+
 # JWT Configuration
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
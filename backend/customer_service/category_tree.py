@@ -0,0 +1,138 @@
+"""
+知識庫分類樹 (閉包表)
+
+KnowledgeBaseCategoryPath 為每個分類與其所有祖先 (含自己) 各存一列，
+查詢子樹或「分類下的所有文章」只需以 ancestor 篩選並 JOIN 一次，與樹的深度無關：
+
+- 新增分類：複製上級分類的所有祖先列 (depth + 1)，再加上自己
+- 移動分類：刪除子樹與原祖先之間的列，再以新祖先 x 子樹的交叉組合寫入
+- 刪除分類：閉包列隨分類以 CASCADE 刪除
+
+KnowledgeBaseCategory.save() 會自動維護；bulk_create / QuerySet.update 等不經過
+save() 的修改需執行 rebuild_kb_category_paths 指令重建。
+"""
+
+from collections import defaultdict
+
+from crm_backend.counts import annotate_counts
+from django.db import connection, transaction
+
+from .models import KnowledgeBaseCategory, KnowledgeBaseCategoryPath
+
+
+class CategoryTreeError(ValueError):
+    """分類樹的變更不合法 (例如移到自己的子分類之下)"""
+
+
+INSERT_SQL = """
+INSERT INTO {paths} (ancestor_id, descendant_id, depth)
+SELECT ancestor_id, %(category)s, depth + 1 FROM {paths}
+WHERE descendant_id = %(parent)s
+UNION ALL
+SELECT %(category)s, %(category)s, 0
+"""
+
+# 子樹內部的列保留，只刪除子樹與原祖先之間的列
+DETACH_SQL = """
+DELETE FROM {paths}
+WHERE descendant_id IN (
+        SELECT descendant_id FROM {paths} WHERE ancestor_id = %(category)s
+    )
+  AND ancestor_id IN (
+        SELECT ancestor_id FROM {paths}
+        WHERE descendant_id = %(category)s AND ancestor_id <> %(category)s
+    )
+"""
+
+ATTACH_SQL = """
+INSERT INTO {paths} (ancestor_id, descendant_id, depth)
+SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+FROM {paths} above CROSS JOIN {paths} below
+WHERE above.descendant_id = %(parent)s AND below.ancestor_id = %(category)s
+"""
+
+REBUILD_SQL = """
+INSERT INTO {paths} (ancestor_id, descendant_id, depth)
+WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM {categories}
+    UNION ALL
+    SELECT tree.ancestor_id, category.id, tree.depth + 1
+    FROM tree JOIN {categories} category ON category.parent_id = tree.descendant_id
+)
+SELECT ancestor_id, descendant_id, depth FROM tree
+"""
+
+
+def _execute(sql, params=None) -> int:
+    sql = sql.format(
+        paths=KnowledgeBaseCategoryPath._meta.db_table,
+        categories=KnowledgeBaseCategory._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def check_move(category) -> bool | None:
+    """
+    儲存分類前呼叫：回傳 None 表示分類尚未在閉包表中 (新分類)，
+    True / False 表示上級分類是否變動；移到自己或子分類之下時拋出 CategoryTreeError
+    """
+    if category.pk is None:
+        return None
+    stored = dict(
+        KnowledgeBaseCategoryPath.objects.filter(
+            descendant_id=category.pk, depth__lte=1
+        ).values_list("depth", "ancestor_id")
+    )
+    if 0 not in stored:
+        return None
+    if stored.get(1) == category.parent_id:
+        return False
+    if (
+        category.parent_id is not None
+        and KnowledgeBaseCategoryPath.objects.filter(
+            ancestor_id=category.pk, descendant_id=category.parent_id
+        ).exists()
+    ):
+        raise CategoryTreeError("不可將分類移到自己或自己的子分類之下")
+    return True
+
+
+def update_paths(category, moved) -> None:
+    """儲存分類後呼叫，依 check_move 的結果更新閉包表"""
+    params = {"category": category.pk, "parent": category.parent_id}
+    if moved is None:
+        _execute(INSERT_SQL, params)
+    elif moved:
+        _execute(DETACH_SQL, params)
+        if category.parent_id is not None:
+            _execute(ATTACH_SQL, params)
+
+
+def rebuild_paths() -> int:
+    """依 parent 欄位重建整個閉包表，回傳寫入的列數"""
+    with transaction.atomic():
+        KnowledgeBaseCategoryPath.objects.all().delete()
+        return _execute(REBUILD_SQL)
+
+
+def category_subtree(root=None, serializer=None):
+    """
+    啟用中的分類 (root 為 None) 或 root 的子樹 (含 root)，單一查詢
+    提供 serializer 時一併加上其計數欄位的子查詢
+    """
+    categories = KnowledgeBaseCategory.objects.filter(is_active=True)
+    if root is not None:
+        categories = categories.filter(ancestor_paths__ancestor=root)
+    if serializer is not None:
+        categories = annotate_counts(categories, serializer)
+    return categories
+
+
+def children_by_parent(categories) -> dict:
+    """{上級分類 id: [子分類]}，子分類維持 categories 的排序"""
+    children = defaultdict(list)
+    for category in categories:
+        children[category.parent_id].append(category)
+    return children
@@ -0,0 +1,20 @@
+"""
+依 KnowledgeBaseCategory.parent 重建知識庫分類樹的閉包表
+
+KnowledgeBaseCategory.save() 會自動維護閉包表；以 bulk_create、QuerySet.update
+等方式直接修改 parent 之後需執行：
+
+    python manage.py rebuild_kb_category_paths
+"""
+
+from django.core.management.base import BaseCommand
+
+from customer_service.category_tree import rebuild_paths
+
+
+class Command(BaseCommand):
+    help = "依 parent 欄位重建知識庫分類的閉包表"
+
+    def handle(self, *args, **options) -> None:
+        rows = rebuild_paths()
+        self.stdout.write(self.style.SUCCESS(f"已重建 {rows} 筆分類路徑"))
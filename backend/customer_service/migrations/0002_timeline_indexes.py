@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("customer_service", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="servicenote",
+            index=models.Index(
+                fields=["ticket", "created_at"], name="customer_se_ticket__e7c410_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="serviceticket",
+            index=models.Index(
+                fields=["customer", "created_at", "id"],
+                name="customer_se_custome_3eda51_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("customer_service", "0002_timeline_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KnowledgeBaseCategoryPath",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("depth", models.PositiveSmallIntegerField(verbose_name="層數")),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_paths",
+                        to="customer_service.knowledgebasecategory",
+                        verbose_name="祖先分類",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_paths",
+                        to="customer_service.knowledgebasecategory",
+                        verbose_name="子孫分類",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "知識庫分類路徑",
+                "verbose_name_plural": "知識庫分類路徑",
+                "indexes": [
+                    models.Index(
+                        fields=["descendant", "depth"],
+                        name="customer_se_descend_741547_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="knowledgebasecategorypath",
+            constraint=models.UniqueConstraint(
+                fields=("ancestor", "descendant"), name="unique_kb_category_path"
+            ),
+        ),
+        # 以現有的 parent 回填閉包表
+        migrations.RunSQL(
+            sql="""
+            INSERT INTO customer_service_knowledgebasecategorypath
+                (ancestor_id, descendant_id, depth)
+            WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM customer_service_knowledgebasecategory
+                UNION ALL
+                SELECT tree.ancestor_id, category.id, tree.depth + 1
+                FROM tree
+                JOIN customer_service_knowledgebasecategory category
+                    ON category.parent_id = tree.descendant_id
+            )
+            SELECT ancestor_id, descendant_id, depth FROM tree
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
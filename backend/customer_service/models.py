@@ -3,7 +3,7 @@ from typing import ClassVar
 
 from customers.models import Customer
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Max
 from django.utils import timezone
 
@@ -101,6 +101,9 @@ class ServiceTicket(models.Model):
         verbose_name = "客服工單"
         verbose_name_plural = "客服工單"
         ordering: ClassVar[list[str]] = ["-created_at"]
+        indexes: ClassVar[list[models.Index]] = [
+            models.Index(fields=["customer", "created_at", "id"]),
+        ]
 
     def __str__(self) -> str:
         return f"{self.ticket_number} - {self.title}"
@@ -179,6 +182,9 @@ class ServiceNote(models.Model):
         verbose_name = "客服記錄"
         verbose_name_plural = "客服記錄"
         ordering: ClassVar[list[str]] = ["created_at"]
+        indexes: ClassVar[list[models.Index]] = [
+            models.Index(fields=["ticket", "created_at"]),
+        ]
 
     def __str__(self) -> str:
         return f"{self.ticket.ticket_number} - {self.get_note_type_display()}"  # type: ignore[attr-defined]
@@ -209,6 +215,49 @@ class KnowledgeBaseCategory(models.Model):
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs) -> None:
+        # 在同一個交易中維護分類樹的閉包表 (見 category_tree.py)
+        from .category_tree import check_move, update_paths  # noqa: PLC0415
+
+        with transaction.atomic():
+            moved = check_move(self)
+            super().save(*args, **kwargs)
+            update_paths(self, moved)
+
+
+class KnowledgeBaseCategoryPath(models.Model):
+    """知識庫分類樹的閉包表：每個分類與其所有祖先 (含自己，depth 0) 各一列"""
+
+    ancestor: models.ForeignKey = models.ForeignKey(
+        KnowledgeBaseCategory,
+        on_delete=models.CASCADE,
+        related_name="descendant_paths",
+        verbose_name="祖先分類",
+    )
+    descendant: models.ForeignKey = models.ForeignKey(
+        KnowledgeBaseCategory,
+        on_delete=models.CASCADE,
+        related_name="ancestor_paths",
+        verbose_name="子孫分類",
+    )
+    depth: models.PositiveSmallIntegerField = models.PositiveSmallIntegerField(verbose_name="層數")
+
+    class Meta:
+        verbose_name = "知識庫分類路徑"
+        verbose_name_plural = "知識庫分類路徑"
+        constraints: ClassVar[list[models.UniqueConstraint]] = [
+            # (ancestor, descendant) 的索引同時供子樹查詢與「分類下的所有文章」使用
+            models.UniqueConstraint(
+                fields=["ancestor", "descendant"], name="unique_kb_category_path"
+            ),
+        ]
+        indexes: ClassVar[list[models.Index]] = [
+            models.Index(fields=["descendant", "depth"])
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
 
 class KnowledgeBase(models.Model):
     """知識庫文章"""
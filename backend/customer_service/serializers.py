@@ -1,7 +1,11 @@
+from crm_backend.counts import RelatedCountField
+from crm_backend.fieldsets import SparseFieldsetSerializerMixin
 from customers.serializers import CustomerSerializer
 from django.contrib.auth.models import User
+from django.db.models import Q
 from rest_framework import serializers
 
+from .category_tree import category_subtree, children_by_parent
 from .models import (
     FAQ,
     KnowledgeBase,
@@ -19,9 +23,11 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "first_name", "last_name", "email"]
 
 
-class ServiceNoteSerializer(serializers.ModelSerializer):
+class ServiceNoteSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """客服記錄序列化器"""
 
+    expandable_fields = ("created_by_info",)
+
     created_by_info = UserSerializer(source="created_by", read_only=True)
 
     class Meta:
@@ -39,13 +45,17 @@ class ServiceNoteSerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at", "created_by"]
 
 
-class ServiceTicketListSerializer(serializers.ModelSerializer):
+class ServiceTicketListSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     """客服工單列表序列化器"""
 
+    expandable_fields = ("customer_info", "assigned_to_info", "created_by_info")
+
     customer_info = CustomerSerializer(source="customer", read_only=True)
     assigned_to_info = UserSerializer(source="assigned_to", read_only=True)
     created_by_info = UserSerializer(source="created_by", read_only=True)
-    notes_count = serializers.SerializerMethodField()
+    notes_count = RelatedCountField("notes")
 
     class Meta:
         model = ServiceTicket
@@ -68,13 +78,19 @@ class ServiceTicketListSerializer(serializers.ModelSerializer):
             "satisfaction_rating",
         ]
 
-    def get_notes_count(self, obj):
-        return obj.notes.count()
-
 
-class ServiceTicketDetailSerializer(serializers.ModelSerializer):
+class ServiceTicketDetailSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     """客服工單詳情序列化器"""
 
+    expandable_fields = (
+        "customer_info",
+        "assigned_to_info",
+        "created_by_info",
+        "notes",
+    )
+
     customer_info = CustomerSerializer(source="customer", read_only=True)
     assigned_to_info = UserSerializer(source="assigned_to", read_only=True)
     created_by_info = UserSerializer(source="created_by", read_only=True)
@@ -159,11 +175,15 @@ class ServiceTicketCreateUpdateSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class KnowledgeBaseCategorySerializer(serializers.ModelSerializer):
+class KnowledgeBaseCategorySerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     """知識庫分類序列化器"""
 
+    expandable_fields = ("children",)
+
     children = serializers.SerializerMethodField()
-    articles_count = serializers.SerializerMethodField()
+    articles_count = RelatedCountField("knowledgebase_set", Q(is_active=True))
 
     class Meta:
         model = KnowledgeBaseCategory
@@ -179,19 +199,25 @@ class KnowledgeBaseCategorySerializer(serializers.ModelSerializer):
         ]
 
     def get_children(self, obj):
-        if obj.children.exists():
-            return KnowledgeBaseCategorySerializer(
-                obj.children.filter(is_active=True), many=True
-            ).data
-        return []
-
-    def get_articles_count(self, obj):
-        return obj.knowledgebase_set.filter(is_active=True).count()
-
-
-class KnowledgeBaseListSerializer(serializers.ModelSerializer):
+        # 第一次用到時以單一查詢載入子樹 (列表時為整個分類樹)，
+        # 存在共用的 context 中，各層的子分類都從這裡取得
+        children = self.context.get("category_children")
+        if children is None:
+            root = None if isinstance(self.parent, serializers.ListSerializer) else obj
+            children = children_by_parent(category_subtree(root, self))
+            self.context["category_children"] = children
+        return KnowledgeBaseCategorySerializer(
+            children.get(obj.pk, []), many=True, context=self.context
+        ).data
+
+
+class KnowledgeBaseListSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     """知識庫列表序列化器"""
 
+    expandable_fields = ("category_info", "created_by_info")
+
     category_info = KnowledgeBaseCategorySerializer(source="category", read_only=True)
     created_by_info = UserSerializer(source="created_by", read_only=True)
 
@@ -215,9 +241,13 @@ class KnowledgeBaseListSerializer(serializers.ModelSerializer):
         ]
 
 
-class KnowledgeBaseDetailSerializer(serializers.ModelSerializer):
+class KnowledgeBaseDetailSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     """知識庫詳情序列化器"""
 
+    expandable_fields = ("category_info", "created_by_info", "updated_by_info")
+
     category_info = KnowledgeBaseCategorySerializer(source="category", read_only=True)
     created_by_info = UserSerializer(source="created_by", read_only=True)
     updated_by_info = UserSerializer(source="updated_by", read_only=True)
@@ -277,9 +307,11 @@ class KnowledgeBaseCreateUpdateSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class FAQSerializer(serializers.ModelSerializer):
+class FAQSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """FAQ 序列化器"""
 
+    expandable_fields = ("category_info", "created_by_info")
+
     category_info = KnowledgeBaseCategorySerializer(source="category", read_only=True)
     created_by_info = UserSerializer(source="created_by", read_only=True)
 
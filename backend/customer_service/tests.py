@@ -0,0 +1,60 @@
+from customers.models import Customer
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .models import KnowledgeBase, KnowledgeBaseCategory, ServiceNote, ServiceTicket
+from .views import KnowledgeBaseCategoryViewSet, ServiceTicketViewSet
+
+
+class ListQueryTests(TestCase):
+    """列表的查詢數固定，計數欄位以子查詢取得，與每頁筆數無關"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("service")
+        customer = Customer.objects.create(
+            first_name="Test", last_name="User", email="service@example.com"
+        )
+        for i in range(12):
+            ticket = ServiceTicket.objects.create(
+                customer=customer,
+                title=f"工單 {i}",
+                description="內容",
+                created_by=cls.user,
+                assigned_to=cls.user,
+            )
+            ServiceNote.objects.create(
+                ticket=ticket, content="備註", created_by=cls.user
+            )
+            category = KnowledgeBaseCategory.objects.create(name=f"分類 {i}")
+            KnowledgeBaseCategory.objects.create(name=f"子分類 {i}", parent=category)
+            KnowledgeBase.objects.create(
+                title=f"文章 {i}",
+                content="內容",
+                category=category,
+                created_by=cls.user,
+                updated_by=cls.user,
+            )
+
+    def _list(self, viewset, limit):
+        request = APIRequestFactory().get("/", {"limit": limit})
+        force_authenticate(request, self.user)
+        return viewset.as_view({"get": "list"})(request).data["results"]
+
+    def test_ticket_list(self):
+        # 總筆數、工單 (含客戶、負責人、建立者與備註數子查詢)
+        for limit in (5, 10):
+            with self.subTest(limit=limit), self.assertNumQueries(3):
+                results = self._list(ServiceTicketViewSet, limit)
+            self.assertEqual(len(results), limit)
+            self.assertEqual(results[0]["notes_count"], 1)
+
+    def test_knowledge_base_category_list(self):
+        # 總筆數、分類 (含文章數子查詢)、子分類
+        for limit in (5, 10):
+            with self.subTest(limit=limit), self.assertNumQueries(3):
+                results = self._list(KnowledgeBaseCategoryViewSet, limit)
+            self.assertEqual(len(results), limit)
+        counts = {row["name"]: row["articles_count"] for row in results}
+        self.assertEqual(counts["分類 0"], 1)
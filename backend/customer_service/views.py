@@ -1,11 +1,17 @@
+from crm_backend.counts import CountedRelationsViewSetMixin
+from crm_backend.export import StreamingExportMixin
+from crm_backend.fieldsets import SparseFieldsetViewSetMixin
 from django.db.models import Count, F, Q
 from django.utils import timezone
+from django_filters import rest_framework as filters_drf
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from .category_tree import CategoryTreeError, category_subtree, children_by_parent
 from .models import (
     FAQ,
     KnowledgeBase,
@@ -27,7 +33,12 @@ from .serializers import (
 )
 
 
-class ServiceTicketViewSet(viewsets.ModelViewSet):
+class ServiceTicketViewSet(
+    StreamingExportMixin,
+    CountedRelationsViewSetMixin,
+    SparseFieldsetViewSetMixin,
+    viewsets.ModelViewSet,
+):
     """客服工單 ViewSet"""
 
     permission_classes = [IsAuthenticated]
@@ -47,10 +58,20 @@ class ServiceTicketViewSet(viewsets.ModelViewSet):
     ]
     ordering_fields = ["created_at", "updated_at", "priority", "status"]
     ordering = ["-created_at"]
+    sparse_select_related = {
+        "customer_info": ("customer__stats",),
+        "assigned_to_info": ("assigned_to",),
+        "created_by_info": ("created_by",),
+    }
+    sparse_prefetch_related = {"notes": ("notes",)}
+    sparse_only_dependencies = {
+        "response_time_display": ("created_at", "first_response_at"),
+        "resolution_time_display": ("created_at", "resolved_at"),
+    }
 
     def get_queryset(self):
         return ServiceTicket.objects.select_related(
-            "customer", "assigned_to", "created_by"
+            "customer__stats", "assigned_to", "created_by"
         ).prefetch_related("notes")
 
     def get_serializer_class(self):
@@ -180,7 +201,7 @@ class ServiceTicketViewSet(viewsets.ModelViewSet):
         )
 
 
-class ServiceNoteViewSet(viewsets.ModelViewSet):
+class ServiceNoteViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     """客服記錄 ViewSet"""
 
     queryset = ServiceNote.objects.select_related("ticket", "created_by").all()
@@ -190,12 +211,15 @@ class ServiceNoteViewSet(viewsets.ModelViewSet):
     filterset_fields = ["ticket", "note_type", "is_visible_to_customer"]
     ordering_fields = ["created_at"]
     ordering = ["created_at"]
+    sparse_select_related = {"created_by_info": ("created_by",)}
 
     def perform_create(self, serializer) -> None:
         serializer.save(created_by=self.request.user)
 
 
-class KnowledgeBaseCategoryViewSet(viewsets.ModelViewSet):
+class KnowledgeBaseCategoryViewSet(
+    CountedRelationsViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet
+):
     """知識庫分類 ViewSet"""
 
     queryset = KnowledgeBaseCategory.objects.filter(is_active=True)
@@ -203,20 +227,76 @@ class KnowledgeBaseCategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
     ordering = ["sort_order", "name"]
+    sparse_only_dependencies = {"children": ()}
+
+    def perform_create(self, serializer) -> None:
+        self._save_category(serializer)
+
+    def perform_update(self, serializer) -> None:
+        self._save_category(serializer)
+
+    def _save_category(self, serializer) -> None:
+        try:
+            serializer.save()
+        except CategoryTreeError as exc:
+            raise ValidationError({"parent": [str(exc)]}) from exc
+
+    @action(detail=False, methods=["get"])
+    def tree(self, request):
+        """整個分類樹，?root=<id> 時為該分類的子樹；分類只需一個查詢"""
+        root = request.query_params.get("root")
+        if root is not None and not root.isdigit():
+            raise ValidationError({"root": ["必須為分類 id"]})
+
+        serializer_context = self.get_serializer_context()
+        categories = list(
+            category_subtree(root, self.get_serializer(context=serializer_context))
+        )
+        children = children_by_parent(categories)
+        if root is None:
+            roots = children[None]
+        else:
+            roots = [category for category in categories if category.pk == int(root)]
+            if not roots:
+                raise NotFound("分類不存在或未啟用")
+
+        serializer_context["category_children"] = children
+        serializer = self.get_serializer(roots, many=True, context=serializer_context)
+        return Response(serializer.data)
 
     @action(detail=True, methods=["get"])
     def articles(self, request, pk=None):
-        """取得分類下的文章"""
+        """取得分類下的文章，?include_descendants=true 時包含所有子分類的文章"""
         category = self.get_object()
-        articles = KnowledgeBase.objects.filter(
-            category=category, is_active=True
-        ).order_by("-updated_at")
+        articles = KnowledgeBase.objects.filter(is_active=True)
+        if request.query_params.get("include_descendants", "").lower() in {"1", "true"}:
+            articles = articles.filter(category__ancestor_paths__ancestor=category)
+        else:
+            articles = articles.filter(category=category)
+        articles = articles.order_by("-updated_at")
 
         serializer = KnowledgeBaseListSerializer(articles, many=True)
         return Response(serializer.data)
 
 
-class KnowledgeBaseViewSet(viewsets.ModelViewSet):
+class KnowledgeBaseFilter(filters_drf.FilterSet):
+    # 分類及其所有子分類下的文章 (經閉包表 JOIN 一次)
+    under_category = filters_drf.NumberFilter(
+        field_name="category__ancestor_paths__ancestor"
+    )
+
+    class Meta:
+        model = KnowledgeBase
+        fields = [
+            "category",
+            "content_type",
+            "is_public",
+            "is_featured",
+            "under_category",
+        ]
+
+
+class KnowledgeBaseViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     """知識庫 ViewSet"""
 
     permission_classes = [IsAuthenticated]
@@ -225,10 +305,18 @@ class KnowledgeBaseViewSet(viewsets.ModelViewSet):
         filters.SearchFilter,
         filters.OrderingFilter,
     ]
-    filterset_fields = ["category", "content_type", "is_public", "is_featured"]
+    filterset_class = KnowledgeBaseFilter
     search_fields = ["title", "content", "summary", "tags"]
     ordering_fields = ["created_at", "updated_at", "view_count"]
     ordering = ["-updated_at"]
+    sparse_select_related = {
+        "category_info": ("category",),
+        "created_by_info": ("created_by",),
+        "updated_by_info": ("updated_by",),
+    }
+    sparse_only_dependencies = {
+        "helpfulness_ratio": ("helpful_count", "not_helpful_count"),
+    }
 
     def get_queryset(self):
         return KnowledgeBase.objects.filter(is_active=True).select_related(
@@ -297,7 +385,7 @@ class KnowledgeBaseViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class FAQViewSet(viewsets.ModelViewSet):
+class FAQViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     """FAQ ViewSet"""
 
     permission_classes = [IsAuthenticated]
@@ -310,6 +398,10 @@ class FAQViewSet(viewsets.ModelViewSet):
     search_fields = ["question", "answer"]
     ordering_fields = ["sort_order", "view_count", "created_at"]
     ordering = ["-is_featured", "sort_order"]
+    sparse_select_related = {
+        "category_info": ("category",),
+        "created_by_info": ("created_by",),
+    }
 
     def get_queryset(self):
         return FAQ.objects.filter(is_active=True).select_related(
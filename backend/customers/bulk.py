@@ -0,0 +1,156 @@
+"""
+客戶批次更新
+
+以單一 UPDATE 套用欄位變更，依 id 分批各自提交，避免一次鎖住大量資料列。
+queryset.update 不會觸發 post_save，全部完成後改送出一次 customers_bulk_updated。
+"""
+
+import re
+
+from django.db import transaction
+from django.db.models import Case, F, Func, Q, TextField, Value, When
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from .geo import assign_geo_codes
+from .models import Customer
+from .signals import customers_bulk_updated
+
+DEFAULT_CHUNK_SIZE = 1000
+GEO_FIELDS = {"country", "state", "city"}
+
+# 可批次更新的欄位；email 為唯一值，不開放批次修改
+BULK_UPDATE_FIELDS = [
+    "company",
+    "city",
+    "state",
+    "country",
+    "source",
+    "tags",
+    "notes",
+    "age",
+    "gender",
+    "product_categories_interest",
+    "seasonal_purchase_pattern",
+    "is_active",
+]
+
+
+def _iter_id_chunks(target, chunk_size):
+    """
+    依 id 遞增分批；target 可以是 id 列表或 queryset
+    queryset 以 keyset 方式 (id > 上一批最大值) 取下一批，不需要 OFFSET
+    """
+    if not hasattr(target, "filter"):
+        ids = sorted(set(target))
+        for start in range(0, len(ids), chunk_size):
+            yield ids[start : start + chunk_size]
+        return
+
+    queryset = target.order_by("id").values_list("id", flat=True)
+    last_id = None
+    while True:
+        chunk_queryset = (
+            queryset if last_id is None else queryset.filter(id__gt=last_id)
+        )
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]
+
+
+def _apply(target, values, user, chunk_size, extra_filter=None):
+    values = {**values, "updated_at": timezone.now()}
+    if user is not None:
+        values["updated_by"] = user
+
+    updated_ids = []
+    chunks = 0
+    for chunk in _iter_id_chunks(target, chunk_size):
+        rows = Customer.objects.filter(id__in=chunk)
+        if extra_filter is not None:
+            rows = rows.filter(extra_filter)
+        with transaction.atomic():
+            chunk_updated = list(
+                rows.select_for_update().order_by("id").values_list("id", flat=True)
+            )
+            if chunk_updated:
+                Customer.objects.filter(id__in=chunk_updated).update(**values)
+                # queryset.update 不會經過 save()，地區代碼需另外重算
+                if GEO_FIELDS & set(values):
+                    assign_geo_codes(Customer.objects.filter(id__in=chunk_updated))
+        updated_ids.extend(chunk_updated)
+        chunks += 1
+    return updated_ids, chunks
+
+
+def _send(updated_ids, fields, user) -> None:
+    if updated_ids:
+        customers_bulk_updated.send(
+            sender=Customer, customer_ids=updated_ids, fields=fields, user=user
+        )
+
+
+def bulk_update_customers(target, patch, user=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    將 patch 套用到 target (id 列表或 queryset) 的所有客戶
+    回傳 (更新筆數, 分批數)
+    """
+    updated_ids, chunks = _apply(target, patch, user, chunk_size)
+    _send(updated_ids, sorted(patch), user)
+    return len(updated_ids), chunks
+
+
+class RegexpReplace(Func):
+    function = "REGEXP_REPLACE"
+    output_field = TextField()
+
+
+def _tag_pattern(tag) -> str:
+    return rf"(^|,)\s*{re.escape(tag)}\s*(,\s*|$)"
+
+
+def bulk_add_tag(target, tag, user=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """為客戶加上標籤 (逗號分隔)，已有該標籤的客戶不會被更新"""
+    has_no_tags = Q(tags__isnull=True) | Q(tags="")
+    values = {
+        "tags": Case(
+            When(has_no_tags, then=Value(tag)),
+            default=Concat(F("tags"), Value(f", {tag}")),
+            output_field=TextField(),
+        )
+    }
+    updated_ids, chunks = _apply(
+        target,
+        values,
+        user,
+        chunk_size,
+        extra_filter=has_no_tags | ~Q(tags__iregex=_tag_pattern(tag)),
+    )
+    _send(updated_ids, ["tags"], user)
+    return len(updated_ids), chunks
+
+
+def bulk_remove_tag(target, tag, user=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """移除客戶的指定標籤，沒有該標籤的客戶不會被更新"""
+    # 移除標籤後把前後留下的逗號整理成 ", "
+    values = {
+        "tags": RegexpReplace(
+            RegexpReplace(
+                F("tags"), Value(_tag_pattern(tag)), Value(", "), Value("gi")
+            ),
+            Value(r"^\s*,\s*|\s*,\s*$"),
+            Value(""),
+            Value("g"),
+        )
+    }
+    updated_ids, chunks = _apply(
+        target,
+        values,
+        user,
+        chunk_size,
+        extra_filter=Q(tags__iregex=_tag_pattern(tag)),
+    )
+    _send(updated_ids, ["tags"], user)
+    return len(updated_ids), chunks
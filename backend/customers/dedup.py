@@ -0,0 +1,383 @@
+"""
+重複客戶偵測與合併
+
+偵測流程：
+
+1. 串流讀取客戶，為每位客戶產生幾組分群鍵 (blocking key)：
+   正規化後的電話、email 網域 + 姓氏、姓名 trigram 的 MinHash 桶
+2. 只比較落在同一群的客戶，避免 O(n²) 的全體比對；過大的群 (例如常見網域 + 常見姓氏)
+   沒有鑑別度，直接略過
+3. 候選配對分批以 numpy 向量化計分：姓名與公司的稀疏 trigram 雜湊向量 cosine
+   相似度，加上電話與 email 帳號是否相同
+4. 分數達門檻的配對寫入 DuplicateCandidate 等待審核
+
+合併時以 queryset.update 一次把訂單、交易與客服工單改掛到主要客戶，再刪除重複的客戶。
+"""
+
+import re
+import zlib
+
+import numpy as np
+from customer_service.models import ServiceTicket
+from django.db import transaction
+from django.utils import timezone
+from orders.models import Order
+from transactions.models import Transaction
+
+from .models import Customer, DuplicateCandidate
+from .stats import refresh_customer_stats
+
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_MAX_BLOCK_SIZE = 50
+DEFAULT_BATCH_SIZE = 50_000
+
+# trigram 雜湊向量的維度
+TRIGRAM_DIMENSIONS = 512
+# MinHash 的雜湊種子，每個種子產生一個姓名分群鍵
+MINHASH_SEEDS = (0x9E3779B1, 0x85EBCA77)
+
+SCORE_WEIGHTS = {
+    "name": 0.45,
+    "company": 0.15,
+    "phone": 0.25,
+    "email": 0.15,
+}
+
+# 分群鍵的種類，放在雜湊值的高位，避免不同種類的鍵互相碰撞
+KEY_PHONE = 1
+KEY_EMAIL_DOMAIN_LAST_NAME = 2
+KEY_NAME_MINHASH = 3
+
+# 合併時，主要客戶空白的欄位由重複客戶補上
+MERGE_FILL_FIELDS = [
+    "phone",
+    "company",
+    "address",
+    "city",
+    "state",
+    "zip_code",
+    "age",
+    "gender",
+    "seasonal_purchase_pattern",
+]
+
+_NON_DIGIT = re.compile(r"\D")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_phone(phone) -> str:
+    """只保留數字並取後 9 碼，+886 912-345-678 與 0912345678 視為相同"""
+    digits = _NON_DIGIT.sub("", phone or "")
+    return digits[-9:] if len(digits) >= 7 else ""
+
+
+def normalize_text(value) -> str:
+    """轉小寫並移除空白與標點，中文字會保留"""
+    return _NON_WORD.sub("", (value or "").lower())
+
+
+def normalize_email_local(email) -> str:
+    """email 帳號部分，忽略 + 之後的標籤與 . (john.smith+crm → johnsmith)"""
+    local = (email or "").lower().split("@")[0]
+    return local.split("+")[0].replace(".", "")
+
+
+def trigrams(text) -> set[str]:
+    if not text:
+        return set()
+    padded = f"#{text}#"
+    return {padded[i : i + 3] for i in range(max(len(padded) - 2, 1))}
+
+
+def _crc32(value, seed=0) -> int:
+    return zlib.crc32(value.encode(), seed)
+
+
+def _key(kind, value) -> int:
+    return (kind << 32) | _crc32(value)
+
+
+class CustomerTable:
+    """
+    以欄位陣列保存比對所需的客戶資料，分群與計分都以陣列位置 (position) 操作
+    """
+
+    def __init__(self) -> None:
+        self.ids = []
+        self.names = []
+        self.companies = []
+        self.phone_hashes = []
+        self.email_hashes = []
+        # 分群鍵與其所屬客戶的位置
+        self.block_keys = []
+        self.block_positions = []
+
+    def add(self, customer_id, first_name, last_name, email, phone, company) -> None:
+        position = len(self.ids)
+        name = normalize_text(f"{first_name}{last_name}")
+        phone = normalize_phone(phone)
+        email_local = normalize_email_local(email)
+
+        self.ids.append(customer_id)
+        self.names.append(name)
+        self.companies.append(normalize_text(company))
+        self.phone_hashes.append(_crc32(phone) if phone else 0)
+        self.email_hashes.append(_crc32(email_local) if email_local else 0)
+
+        keys = []
+        if phone:
+            keys.append(_key(KEY_PHONE, phone))
+        domain = (email or "").lower().rpartition("@")[2]
+        last_name = normalize_text(last_name)
+        if domain and last_name:
+            keys.append(_key(KEY_EMAIL_DOMAIN_LAST_NAME, f"{domain}|{last_name}"))
+        grams = trigrams(name)
+        if grams:
+            for index, seed in enumerate(MINHASH_SEEDS):
+                minhash = min(_crc32(gram, seed) for gram in grams)
+                keys.append(((KEY_NAME_MINHASH + index) << 32) | minhash)
+
+        self.block_keys.extend(keys)
+        self.block_positions.extend([position] * len(keys))
+
+    def finalize(self) -> None:
+        self.ids = np.asarray(self.ids, dtype=np.int64)
+        self.phone_hashes = np.asarray(self.phone_hashes, dtype=np.int64)
+        self.email_hashes = np.asarray(self.email_hashes, dtype=np.int64)
+        self.block_keys = np.asarray(self.block_keys, dtype=np.int64)
+        self.block_positions = np.asarray(self.block_positions, dtype=np.int64)
+
+
+def load_customer_table(queryset=None) -> CustomerTable:
+    queryset = Customer.objects.all() if queryset is None else queryset
+    table = CustomerTable()
+    rows = (
+        queryset.order_by("id")
+        .values_list("id", "first_name", "last_name", "email", "phone", "company")
+        .iterator(chunk_size=10_000)
+    )
+    for row in rows:
+        table.add(*row)
+    table.finalize()
+    return table
+
+
+def candidate_pairs(table, max_block_size=DEFAULT_MAX_BLOCK_SIZE):
+    """
+    產生同群客戶的配對 (位置較小者在前)，回傳 (a, b, 略過的群數)
+    相同大小的群一起以 triu_indices 展開，不需要逐群迴圈
+    """
+    order = np.argsort(table.block_keys, kind="stable")
+    keys = table.block_keys[order]
+    positions = table.block_positions[order]
+
+    boundaries = np.flatnonzero(np.diff(keys)) + 1
+    starts = np.concatenate(([0], boundaries))
+    sizes = np.diff(np.concatenate((starts, [len(keys)])))
+    skipped_blocks = int(np.count_nonzero(sizes > max_block_size))
+
+    pair_a = []
+    pair_b = []
+    for size in np.unique(sizes):
+        if size < 2 or size > max_block_size:
+            continue
+        block_starts = starts[sizes == size]
+        members = positions[block_starts[:, None] + np.arange(size)]
+        upper_i, upper_j = np.triu_indices(size, k=1)
+        pair_a.append(members[:, upper_i].ravel())
+        pair_b.append(members[:, upper_j].ravel())
+
+    if not pair_a:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, skipped_blocks
+
+    a = np.concatenate(pair_a)
+    b = np.concatenate(pair_b)
+    low = np.minimum(a, b)
+    high = np.maximum(a, b)
+    # 同一組配對可能同時落在多個群，合併成單一編碼後去除重複
+    codes = np.unique((low << 32 | high)[low != high])
+    return codes >> 32, codes & 0xFFFFFFFF, skipped_blocks
+
+
+def trigram_vectors(texts):
+    """
+    將字串轉為 L2 正規化的 trigram 雜湊向量，以 CSR 形式回傳 (keys, weights, indptr)
+    keys 為 列 * TRIGRAM_DIMENSIONS + 欄，依列、欄排序；第 i 列的非零值位於
+    indptr[i]:indptr[i + 1]。每個字串只有十幾個 trigram，不需要展開成稠密矩陣
+    """
+    keys = [
+        row * TRIGRAM_DIMENSIONS + _crc32(gram) % TRIGRAM_DIMENSIONS
+        for row, text in enumerate(texts)
+        for gram in trigrams(text)
+    ]
+    keys, counts = np.unique(np.asarray(keys, dtype=np.int64), return_counts=True)
+    rows = keys // TRIGRAM_DIMENSIONS
+    weights = counts.astype(np.float32)
+    norms = np.sqrt(np.bincount(rows, weights=weights**2, minlength=len(texts)))
+    weights /= norms[rows]
+    indptr = np.searchsorted(rows, np.arange(len(texts) + 1))
+    return keys, weights, indptr
+
+
+def cosine_similarity(vectors, index_a, index_b) -> np.ndarray:
+    """
+    計算 index_a[k] 與 index_b[k] 兩列的 cosine 相似度
+    展開 index_a 各列的非零值，再以 searchsorted 在 index_b 的列中找相同的欄，
+    記憶體只與配對數 × 每列非零值數量成正比
+    """
+    keys, weights, indptr = vectors
+    if not len(keys):
+        return np.zeros(len(index_a))
+
+    starts = indptr[index_a]
+    lengths = indptr[index_a + 1] - starts
+    pairs = np.repeat(np.arange(len(index_a)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    entries = np.repeat(starts, lengths) + offsets
+
+    targets = index_b[pairs] * TRIGRAM_DIMENSIONS + keys[entries] % TRIGRAM_DIMENSIONS
+    found = np.minimum(np.searchsorted(keys, targets), len(keys) - 1)
+    matched = keys[found] == targets
+    return np.bincount(
+        pairs[matched],
+        weights=weights[entries[matched]] * weights[found[matched]],
+        minlength=len(index_a),
+    )
+
+
+def score_pairs(table, a, b) -> np.ndarray:
+    """向量化計算一批配對的相似度分數 (0 ~ 1)"""
+    positions, inverse = np.unique(np.concatenate((a, b)), return_inverse=True)
+    index_a = inverse[: len(a)]
+    index_b = inverse[len(a) :]
+
+    names = trigram_vectors([table.names[position] for position in positions])
+    companies = trigram_vectors([table.companies[position] for position in positions])
+    name_similarity = cosine_similarity(names, index_a, index_b)
+    company_similarity = cosine_similarity(companies, index_a, index_b)
+
+    phone_a = table.phone_hashes[a]
+    same_phone = (phone_a != 0) & (phone_a == table.phone_hashes[b])
+    email_a = table.email_hashes[a]
+    same_email = (email_a != 0) & (email_a == table.email_hashes[b])
+
+    return (
+        SCORE_WEIGHTS["name"] * name_similarity
+        + SCORE_WEIGHTS["company"] * company_similarity
+        + SCORE_WEIGHTS["phone"] * same_phone
+        + SCORE_WEIGHTS["email"] * same_email
+    )
+
+
+def find_duplicate_candidates(
+    queryset=None,
+    threshold=DEFAULT_THRESHOLD,
+    max_block_size=DEFAULT_MAX_BLOCK_SIZE,
+    batch_size=DEFAULT_BATCH_SIZE,
+):
+    """
+    偵測重複客戶並寫入 DuplicateCandidate，回傳各階段的統計數字
+    已存在的配對只更新分數，不會改變審核狀態
+    """
+    table = load_customer_table(queryset)
+    a, b, skipped_blocks = candidate_pairs(table, max_block_size)
+
+    candidates = 0
+    for start in range(0, len(a), batch_size):
+        batch_a = a[start : start + batch_size]
+        batch_b = b[start : start + batch_size]
+        scores = score_pairs(table, batch_a, batch_b)
+        matched = scores >= threshold
+        if not matched.any():
+            continue
+
+        DuplicateCandidate.objects.bulk_create(
+            [
+                DuplicateCandidate(
+                    customer_a_id=int(customer_a),
+                    customer_b_id=int(customer_b),
+                    score=round(float(score), 4),
+                )
+                for customer_a, customer_b, score in zip(
+                    table.ids[batch_a[matched]],
+                    table.ids[batch_b[matched]],
+                    scores[matched],
+                    strict=True,
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=["customer_a", "customer_b"],
+            update_fields=["score", "updated_at"],
+            batch_size=5000,
+        )
+        candidates += int(matched.sum())
+
+    return {
+        "customers": len(table.ids),
+        "skipped_blocks": skipped_blocks,
+        "compared_pairs": len(a),
+        "candidates": candidates,
+    }
+
+
+def merge_customers(primary, duplicates, user=None) -> Customer:
+    """
+    將重複客戶合併到主要客戶
+
+    - 訂單、交易與客服工單一次改掛到主要客戶
+    - 主要客戶的空白欄位由重複客戶補上，標籤取聯集
+    - 刪除重複客戶並重新計算主要客戶的統計
+    """
+    duplicate_ids = sorted({customer.id for customer in duplicates} - {primary.id})
+    if not duplicate_ids:
+        return primary
+
+    with transaction.atomic():
+        # 依主鍵順序鎖定所有相關客戶，避免同時合併造成死結
+        locked = {
+            customer.id: customer
+            for customer in Customer.objects.select_for_update()
+            .filter(id__in=[primary.id, *duplicate_ids])
+            .order_by("id")
+        }
+        primary = locked[primary.id]
+        duplicates = [locked[customer_id] for customer_id in duplicate_ids]
+
+        # 一併寫入 updated_at (update 不會觸發 auto_now)，分類帳檢查點等依此判斷異動
+        now = timezone.now()
+        for model in (Order, Transaction, ServiceTicket):
+            model.objects.filter(customer_id__in=duplicate_ids).update(
+                customer_id=primary.id, updated_at=now
+            )
+
+        for field in MERGE_FILL_FIELDS:
+            if getattr(primary, field) in {None, ""}:
+                for duplicate in duplicates:
+                    value = getattr(duplicate, field)
+                    if value not in {None, ""}:
+                        setattr(primary, field, value)
+                        break
+
+        tags = [tag.strip() for tag in (primary.tags or "").split(",") if tag.strip()]
+        for duplicate in duplicates:
+            tags.extend(
+                tag.strip() for tag in (duplicate.tags or "").split(",") if tag.strip()
+            )
+        primary.tags = ", ".join(dict.fromkeys(tags)) or primary.tags
+
+        interests = list(primary.product_categories_interest or [])
+        for duplicate in duplicates:
+            interests.extend(duplicate.product_categories_interest or [])
+        primary.product_categories_interest = list(dict.fromkeys(interests))
+
+        if user is not None:
+            primary.updated_by = user
+        primary.save()
+
+        Customer.objects.filter(id__in=duplicate_ids).delete()
+        refresh_customer_stats([primary.id])
+
+    return primary
@@ -0,0 +1,196 @@
+"""
+地區正規化
+
+country / state 為自由輸入的文字 (USA、United States、美國…)，儲存與匯入時
+轉換為標準代碼寫入 country_code (ISO 3166-1 alpha-2) 與 state_code
+(ISO 3166-2 的行政區代碼，不含國家前綴)，地區統計一律以代碼分組。
+無法辨識的值保留空字串，原始文字不受影響。
+
+city 沒有對照表，只做與代碼相同的文字正規化 (去除空白與標點、小寫、台→臺)
+寫入 city_key，讓「Taipei」「taipei 」「TAIPEI」在城市統計中歸為同一組。
+"""
+
+import re
+
+_SEPARATORS = re.compile(r"[\s.\-_,]+")
+
+# 與 Customer.city_key 的 max_length 相同
+CITY_KEY_MAX_LENGTH = 100
+
+COUNTRY_ALIASES = {
+    "US": ["us", "usa", "unitedstates", "unitedstatesofamerica", "america", "美國"],
+    "TW": ["tw", "twn", "taiwan", "roc", "republicofchina", "台灣", "臺灣", "中華民國"],
+    "CN": ["cn", "chn", "china", "prc", "中國", "中國大陸", "大陸"],
+    "HK": ["hk", "hkg", "hongkong", "香港"],
+    "MO": ["mo", "mac", "macau", "macao", "澳門"],
+    "JP": ["jp", "jpn", "japan", "日本"],
+    "KR": ["kr", "kor", "korea", "southkorea", "韓國", "南韓"],
+    "SG": ["sg", "sgp", "singapore", "新加坡"],
+    "MY": ["my", "mys", "malaysia", "馬來西亞"],
+    "TH": ["th", "tha", "thailand", "泰國"],
+    "VN": ["vn", "vnm", "vietnam", "越南"],
+    "PH": ["ph", "phl", "philippines", "菲律賓"],
+    "ID": ["id", "idn", "indonesia", "印尼"],
+    "IN": ["in", "ind", "india", "印度"],
+    "AU": ["au", "aus", "australia", "澳洲"],
+    "NZ": ["nz", "nzl", "newzealand", "紐西蘭"],
+    "CA": ["ca", "can", "canada", "加拿大"],
+    "GB": ["gb", "gbr", "uk", "unitedkingdom", "greatbritain", "england", "英國"],
+    "DE": ["de", "deu", "germany", "德國"],
+    "FR": ["fr", "fra", "france", "法國"],
+}
+
+US_STATES = {
+    "AL": "alabama",
+    "AK": "alaska",
+    "AZ": "arizona",
+    "AR": "arkansas",
+    "CA": "california",
+    "CO": "colorado",
+    "CT": "connecticut",
+    "DE": "delaware",
+    "DC": "districtofcolumbia",
+    "FL": "florida",
+    "GA": "georgia",
+    "HI": "hawaii",
+    "ID": "idaho",
+    "IL": "illinois",
+    "IN": "indiana",
+    "IA": "iowa",
+    "KS": "kansas",
+    "KY": "kentucky",
+    "LA": "louisiana",
+    "ME": "maine",
+    "MD": "maryland",
+    "MA": "massachusetts",
+    "MI": "michigan",
+    "MN": "minnesota",
+    "MS": "mississippi",
+    "MO": "missouri",
+    "MT": "montana",
+    "NE": "nebraska",
+    "NV": "nevada",
+    "NH": "newhampshire",
+    "NJ": "newjersey",
+    "NM": "newmexico",
+    "NY": "newyork",
+    "NC": "northcarolina",
+    "ND": "northdakota",
+    "OH": "ohio",
+    "OK": "oklahoma",
+    "OR": "oregon",
+    "PA": "pennsylvania",
+    "RI": "rhodeisland",
+    "SC": "southcarolina",
+    "SD": "southdakota",
+    "TN": "tennessee",
+    "TX": "texas",
+    "UT": "utah",
+    "VT": "vermont",
+    "VA": "virginia",
+    "WA": "washington",
+    "WV": "westvirginia",
+    "WI": "wisconsin",
+    "WY": "wyoming",
+}
+
+# 臺灣縣市 (ISO 3166-2:TW)，中文名稱同時接受「台」與「臺」
+TW_DIVISIONS = {
+    "TPE": ["tp", "taipei", "taipeicity", "臺北市", "臺北"],
+    "NWT": ["newtaipei", "newtaipeicity", "新北市", "新北"],
+    "KEE": ["keelung", "keelungcity", "基隆市", "基隆"],
+    "TAO": ["taoyuan", "taoyuancity", "桃園市", "桃園"],
+    "HSZ": ["hsinchucity", "新竹市"],
+    "HSQ": ["hsinchucounty", "新竹縣"],
+    "MIA": ["miaoli", "miaolicounty", "苗栗縣", "苗栗"],
+    "TXG": ["taichung", "taichungcity", "臺中市", "臺中"],
+    "CHA": ["changhua", "changhuacounty", "彰化縣", "彰化"],
+    "NAN": ["nantou", "nantoucounty", "南投縣", "南投"],
+    "YUN": ["yunlin", "yunlincounty", "雲林縣", "雲林"],
+    "CYI": ["chiayicity", "嘉義市"],
+    "CYQ": ["chiayicounty", "嘉義縣"],
+    "TNN": ["tainan", "tainancity", "臺南市", "臺南"],
+    "KHH": ["kaohsiung", "kaohsiungcity", "高雄市", "高雄"],
+    "PIF": ["pingtung", "pingtungcounty", "屏東縣", "屏東"],
+    "ILA": ["yilan", "yilancounty", "宜蘭縣", "宜蘭"],
+    "HUA": ["hualien", "hualiencounty", "花蓮縣", "花蓮"],
+    "TTT": ["taitung", "taitungcounty", "臺東縣", "臺東"],
+    "PEN": ["penghu", "penghucounty", "澎湖縣", "澎湖"],
+    "KIN": ["kinmen", "kinmencounty", "金門縣", "金門"],
+    "LIE": ["lienchiang", "lienchiangcounty", "matsu", "連江縣", "馬祖"],
+}
+
+
+def _normalize(value) -> str:
+    return _SEPARATORS.sub("", (value or "").strip().lower()).replace("台", "臺")
+
+
+def _build_lookup(aliases) -> dict[str, str]:
+    lookup = {}
+    for code, names in aliases.items():
+        lookup[_normalize(code)] = code
+        for name in names:
+            lookup[_normalize(name)] = code
+    return lookup
+
+
+_COUNTRY_LOOKUP = _build_lookup(COUNTRY_ALIASES)
+_STATE_LOOKUPS = {
+    "US": _build_lookup({code: [name] for code, name in US_STATES.items()}),
+    "TW": _build_lookup(TW_DIVISIONS),
+}
+
+
+def normalize_country(country) -> str:
+    """回傳 ISO 3166-1 alpha-2 國家代碼，無法辨識時回傳空字串"""
+    key = _normalize(country)
+    if key in _COUNTRY_LOOKUP:
+        return _COUNTRY_LOOKUP[key]
+    # 未列在對照表但看起來已經是兩碼代碼
+    if len(key) == 2 and key.isascii() and key.isalpha():  # noqa: PLR2004
+        return key.upper()
+    return ""
+
+
+def normalize_state(country_code, state) -> str:
+    """回傳行政區代碼；只有建立對照表的國家會轉換，其餘回傳空字串"""
+    lookup = _STATE_LOOKUPS.get(country_code)
+    if not lookup:
+        return ""
+    return lookup.get(_normalize(state), "")
+
+
+def normalize_city(city) -> str:
+    """回傳城市的分組鍵，空白或未填時回傳空字串"""
+    return _normalize(city)[:CITY_KEY_MAX_LENGTH]
+
+
+def normalize_geo(country, state) -> tuple[str, str]:
+    country_code = normalize_country(country)
+    return country_code, normalize_state(country_code, state)
+
+
+def assign_geo_codes(queryset) -> int:
+    """
+    依 country / state / city 重新計算 queryset 內客戶的地區代碼與城市分組鍵
+    以不重複的 (country, state) 組合與 city 分組，每組只需要一次 UPDATE
+    回傳實際更新的筆數 (同一位客戶的代碼與城市都變動時計為兩次)
+    """
+    updated = 0
+    pairs = queryset.order_by().values_list("country", "state").distinct()
+    for country, state in list(pairs):
+        country_code, state_code = normalize_geo(country, state)
+        updated += (
+            queryset.filter(country=country, state=state)
+            .exclude(country_code=country_code, state_code=state_code)
+            .update(country_code=country_code, state_code=state_code)
+        )
+    cities = queryset.order_by().values_list("city", flat=True).distinct()
+    for city in list(cities):
+        city_key = normalize_city(city)
+        updated += (
+            queryset.filter(city=city)
+            .exclude(city_key=city_key)
+            .update(city_key=city_key)
+        )
+    return updated
@@ -0,0 +1,67 @@
+"""
+產品興趣類別 (product_categories_interest) 的查詢
+
+欄位為 JSON 陣列，以 jsonb_path_ops 的 GIN 索引支援 @> (contains) 查詢；
+各類別的客戶數以 jsonb_array_elements_text 展開後 GROUP BY，一次查詢取得。
+"""
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import CustomerStats
+
+
+def interests_any_q(categories) -> Q:
+    """包含任一類別：多個 @> 以 OR 串接，每個條件都能使用 GIN 索引"""
+    condition = Q()
+    for category in categories:
+        condition |= Q(product_categories_interest__contains=[category])
+    return condition
+
+
+def interests_all_q(categories) -> Q:
+    """包含所有類別：單一 @> 條件"""
+    return Q(product_categories_interest__contains=list(categories))
+
+
+FACET_SQL = """
+SELECT interest.category, COUNT(*) AS customer_count{spend_select}
+FROM ({customers}) AS customer
+CROSS JOIN LATERAL (
+    -- 同一位客戶重複填寫的類別只算一次
+    SELECT DISTINCT value FROM jsonb_array_elements_text(customer.interests)
+) AS interest(category){spend_join}
+WHERE jsonb_typeof(customer.interests) = 'array'
+GROUP BY interest.category
+ORDER BY customer_count DESC, interest.category
+"""
+
+
+def interest_facets(queryset, with_spend=False):
+    """
+    依 queryset 篩選後的客戶，回傳各興趣類別的客戶數
+    with_spend 為 True 時一併加總 CustomerStats 的消費額
+    """
+    inner_sql, params = (
+        queryset.order_by()
+        .values("id", "product_categories_interest")
+        .query.sql_with_params()
+    )
+    # 內層查詢的欄位名稱由 Django 產生，外層以位置重新命名
+    customers = f"SELECT * FROM ({inner_sql}) AS filtered(id, interests)"
+
+    spend_select = spend_join = ""
+    if with_spend:
+        spend_select = ", COALESCE(SUM(stats.total_spent), 0) AS total_spent"
+        spend_join = (
+            f"\nLEFT JOIN {CustomerStats._meta.db_table} AS stats"
+            " ON stats.customer_id = customer.id"
+        )
+
+    sql = FACET_SQL.format(
+        customers=customers, spend_select=spend_select, spend_join=spend_join
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row, strict=True)) for row in cursor.fetchall()]
@@ -0,0 +1,20 @@
+"""
+重新計算客戶的地區代碼
+
+更新 customers.geo 的對照表後執行，讓既有客戶套用新的對照：
+
+    python manage.py normalize_customer_geo
+"""
+
+from django.core.management.base import BaseCommand
+
+from customers.geo import assign_geo_codes
+from customers.models import Customer
+
+
+class Command(BaseCommand):
+    help = "依 country / state / city 重新計算客戶的地區代碼與城市分組鍵"
+
+    def handle(self, *args, **options) -> None:
+        updated = assign_geo_codes(Customer.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"已更新 {updated} 位客戶的地區代碼"))
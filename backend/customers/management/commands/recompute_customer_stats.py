@@ -0,0 +1,36 @@
+"""
+客戶統計對帳
+
+依 id 區間分批，以訂單與交易重新計算 CustomerStats，修正與實際資料不一致的列：
+
+    python manage.py recompute_customer_stats --batch-size 5000
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from customers.models import Customer
+from customers.stats import rebuild_customer_stats
+
+
+class Command(BaseCommand):
+    help = "以訂單與交易批次重算客戶統計 (CustomerStats)"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--batch-size", type=int, default=5000, help="每批處理的客戶 id 數量"
+        )
+
+    def handle(self, *args, **options) -> None:
+        batch_size = options["batch_size"]
+        bounds = Customer.objects.aggregate(min_id=Min("id"), max_id=Max("id"))
+        if bounds["min_id"] is None:
+            self.stdout.write("沒有客戶資料")
+            return
+
+        corrected = 0
+        for start_id in range(bounds["min_id"], bounds["max_id"] + 1, batch_size):
+            end_id = start_id + batch_size - 1
+            corrected += rebuild_customer_stats(start_id, end_id)
+
+        self.stdout.write(self.style.SUCCESS(f"已修正 {corrected} 筆客戶統計"))
@@ -0,0 +1,34 @@
+"""
+更新客戶分群成員
+
+預設只重新判斷上次更新後有異動的客戶 (已刪除的客戶也會移除)，可排程每隔幾分鐘
+執行；未更新 updated_at 的直接修改 (例如原生 SQL) 不會被察覺，建議每天搭配 --full
+完整重建一次：
+
+    python manage.py refresh_segments
+    python manage.py refresh_segments --full
+"""
+
+from django.core.management.base import BaseCommand
+
+from customers.models import Segment
+from customers.segments import refresh_segment
+
+
+class Command(BaseCommand):
+    help = "更新所有客戶分群的快取成員"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--full", action="store_true", help="完整重建成員")
+        parser.add_argument(
+            "--segment", type=int, nargs="*", default=None, help="只更新指定的分群 id"
+        )
+
+    def handle(self, *args, **options) -> None:
+        segments = Segment.objects.order_by("id")
+        if options["segment"]:
+            segments = segments.filter(id__in=options["segment"])
+
+        for segment in segments.iterator(chunk_size=100):
+            refresh_segment(segment, full=options["full"])
+            self.stdout.write(f"{segment.name}: {segment.member_count:,} 位客戶")
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("customers", "0002_customer_age_customer_gender_and_more"),
+        ("orders", "0001_initial"),
+        ("transactions", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CustomerStats",
+            fields=[
+                (
+                    "customer",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="customers.customer",
+                    ),
+                ),
+                (
+                    "total_spent",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("order_count", models.PositiveIntegerField(default=0)),
+                ("first_order_at", models.DateTimeField(blank=True, null=True)),
+                ("last_order_at", models.DateTimeField(blank=True, null=True)),
+                ("last_transaction_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["total_spent"], name="customers_c_total_s_0fff57_idx"
+                    ),
+                    models.Index(
+                        fields=["order_count"], name="customers_c_order_c_656b2c_idx"
+                    ),
+                    models.Index(
+                        fields=["last_order_at"], name="customers_c_last_or_a535e5_idx"
+                    ),
+                ],
+            },
+        ),
+        # 以現有訂單與交易回填統計
+        migrations.RunSQL(
+            sql="""
+            INSERT INTO customers_customerstats (
+                customer_id, total_spent, order_count,
+                first_order_at, last_order_at, last_transaction_at, updated_at
+            )
+            SELECT
+                c.id,
+                COALESCE(o.total_spent, 0),
+                COALESCE(o.order_count, 0),
+                o.first_order_at,
+                o.last_order_at,
+                t.last_transaction_at,
+                NOW()
+            FROM customers_customer c
+            LEFT JOIN (
+                SELECT customer_id,
+                       SUM(total) AS total_spent,
+                       COUNT(*) AS order_count,
+                       MIN(order_date) AS first_order_at,
+                       MAX(order_date) AS last_order_at
+                FROM orders_order
+                GROUP BY customer_id
+            ) o ON o.customer_id = c.id
+            LEFT JOIN (
+                SELECT customer_id, MAX(created_at) AS last_transaction_at
+                FROM transactions_transaction
+                GROUP BY customer_id
+            ) t ON t.customer_id = c.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("customers", "0004_duplicatecandidate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Segment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("description", models.TextField(blank=True, null=True)),
+                ("definition", models.JSONField(default=dict)),
+                ("member_ids", models.BinaryField(default=bytes)),
+                (
+                    "member_count",
+                    models.PositiveIntegerField(default=0, editable=False),
+                ),
+                (
+                    "refreshed_at",
+                    models.DateTimeField(blank=True, editable=False, null=True),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["updated_at"], name="customers_c_updated_7518c4_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customerstats",
+            index=models.Index(
+                fields=["updated_at"], name="customers_c_updated_cb9426_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="segment",
+            name="created_by",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="created_segments",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
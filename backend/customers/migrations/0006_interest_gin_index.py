@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:53
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("customers", "0005_segment"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customer",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["product_categories_interest"],
+                name="customers_interest_gin",
+                opclasses=["jsonb_path_ops"],
+            ),
+        ),
+    ]
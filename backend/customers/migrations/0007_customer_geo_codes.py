@@ -0,0 +1,184 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:54
+
+import re
+
+from django.db import migrations, models
+
+# 以下對照表與正規化邏輯複製自建立此遷移時的 customers.geo，
+# 之後修改 customers.geo 不影響此遷移；既有資料請以 normalize_customer_geo 指令重算
+
+_SEPARATORS = re.compile(r"[\s.\-_,]+")
+
+COUNTRY_ALIASES = {
+    "US": ["us", "usa", "unitedstates", "unitedstatesofamerica", "america", "美國"],
+    "TW": ["tw", "twn", "taiwan", "roc", "republicofchina", "台灣", "臺灣", "中華民國"],
+    "CN": ["cn", "chn", "china", "prc", "中國", "中國大陸", "大陸"],
+    "HK": ["hk", "hkg", "hongkong", "香港"],
+    "MO": ["mo", "mac", "macau", "macao", "澳門"],
+    "JP": ["jp", "jpn", "japan", "日本"],
+    "KR": ["kr", "kor", "korea", "southkorea", "韓國", "南韓"],
+    "SG": ["sg", "sgp", "singapore", "新加坡"],
+    "MY": ["my", "mys", "malaysia", "馬來西亞"],
+    "TH": ["th", "tha", "thailand", "泰國"],
+    "VN": ["vn", "vnm", "vietnam", "越南"],
+    "PH": ["ph", "phl", "philippines", "菲律賓"],
+    "ID": ["id", "idn", "indonesia", "印尼"],
+    "IN": ["in", "ind", "india", "印度"],
+    "AU": ["au", "aus", "australia", "澳洲"],
+    "NZ": ["nz", "nzl", "newzealand", "紐西蘭"],
+    "CA": ["ca", "can", "canada", "加拿大"],
+    "GB": ["gb", "gbr", "uk", "unitedkingdom", "greatbritain", "england", "英國"],
+    "DE": ["de", "deu", "germany", "德國"],
+    "FR": ["fr", "fra", "france", "法國"],
+}
+
+US_STATES = {
+    "AL": "alabama",
+    "AK": "alaska",
+    "AZ": "arizona",
+    "AR": "arkansas",
+    "CA": "california",
+    "CO": "colorado",
+    "CT": "connecticut",
+    "DE": "delaware",
+    "DC": "districtofcolumbia",
+    "FL": "florida",
+    "GA": "georgia",
+    "HI": "hawaii",
+    "ID": "idaho",
+    "IL": "illinois",
+    "IN": "indiana",
+    "IA": "iowa",
+    "KS": "kansas",
+    "KY": "kentucky",
+    "LA": "louisiana",
+    "ME": "maine",
+    "MD": "maryland",
+    "MA": "massachusetts",
+    "MI": "michigan",
+    "MN": "minnesota",
+    "MS": "mississippi",
+    "MO": "missouri",
+    "MT": "montana",
+    "NE": "nebraska",
+    "NV": "nevada",
+    "NH": "newhampshire",
+    "NJ": "newjersey",
+    "NM": "newmexico",
+    "NY": "newyork",
+    "NC": "northcarolina",
+    "ND": "northdakota",
+    "OH": "ohio",
+    "OK": "oklahoma",
+    "OR": "oregon",
+    "PA": "pennsylvania",
+    "RI": "rhodeisland",
+    "SC": "southcarolina",
+    "SD": "southdakota",
+    "TN": "tennessee",
+    "TX": "texas",
+    "UT": "utah",
+    "VT": "vermont",
+    "VA": "virginia",
+    "WA": "washington",
+    "WV": "westvirginia",
+    "WI": "wisconsin",
+    "WY": "wyoming",
+}
+
+# 臺灣縣市 (ISO 3166-2:TW)，中文名稱同時接受「台」與「臺」
+TW_DIVISIONS = {
+    "TPE": ["tp", "taipei", "taipeicity", "臺北市", "臺北"],
+    "NWT": ["newtaipei", "newtaipeicity", "新北市", "新北"],
+    "KEE": ["keelung", "keelungcity", "基隆市", "基隆"],
+    "TAO": ["taoyuan", "taoyuancity", "桃園市", "桃園"],
+    "HSZ": ["hsinchucity", "新竹市"],
+    "HSQ": ["hsinchucounty", "新竹縣"],
+    "MIA": ["miaoli", "miaolicounty", "苗栗縣", "苗栗"],
+    "TXG": ["taichung", "taichungcity", "臺中市", "臺中"],
+    "CHA": ["changhua", "changhuacounty", "彰化縣", "彰化"],
+    "NAN": ["nantou", "nantoucounty", "南投縣", "南投"],
+    "YUN": ["yunlin", "yunlincounty", "雲林縣", "雲林"],
+    "CYI": ["chiayicity", "嘉義市"],
+    "CYQ": ["chiayicounty", "嘉義縣"],
+    "TNN": ["tainan", "tainancity", "臺南市", "臺南"],
+    "KHH": ["kaohsiung", "kaohsiungcity", "高雄市", "高雄"],
+    "PIF": ["pingtung", "pingtungcounty", "屏東縣", "屏東"],
+    "ILA": ["yilan", "yilancounty", "宜蘭縣", "宜蘭"],
+    "HUA": ["hualien", "hualiencounty", "花蓮縣", "花蓮"],
+    "TTT": ["taitung", "taitungcounty", "臺東縣", "臺東"],
+    "PEN": ["penghu", "penghucounty", "澎湖縣", "澎湖"],
+    "KIN": ["kinmen", "kinmencounty", "金門縣", "金門"],
+    "LIE": ["lienchiang", "lienchiangcounty", "matsu", "連江縣", "馬祖"],
+}
+
+
+def _normalize(value) -> str:
+    return _SEPARATORS.sub("", (value or "").strip().lower()).replace("台", "臺")
+
+
+def _build_lookup(aliases) -> dict[str, str]:
+    lookup = {}
+    for code, names in aliases.items():
+        lookup[_normalize(code)] = code
+        for name in names:
+            lookup[_normalize(name)] = code
+    return lookup
+
+
+_COUNTRY_LOOKUP = _build_lookup(COUNTRY_ALIASES)
+_STATE_LOOKUPS = {
+    "US": _build_lookup({code: [name] for code, name in US_STATES.items()}),
+    "TW": _build_lookup(TW_DIVISIONS),
+}
+
+
+def _normalize_geo(country, state) -> tuple[str, str]:
+    key = _normalize(country)
+    country_code = _COUNTRY_LOOKUP.get(key, "")
+    if not country_code and len(key) == 2 and key.isascii() and key.isalpha():  # noqa: PLR2004
+        country_code = key.upper()
+    lookup = _STATE_LOOKUPS.get(country_code)
+    state_code = lookup.get(_normalize(state), "") if lookup else ""
+    return country_code, state_code
+
+
+def backfill_geo_codes(apps, schema_editor) -> None:
+    Customer = apps.get_model("customers", "Customer")
+    pairs = Customer.objects.order_by().values_list("country", "state").distinct()
+    for country, state in list(pairs):
+        country_code, state_code = _normalize_geo(country, state)
+        Customer.objects.filter(country=country, state=state).update(
+            country_code=country_code, state_code=state_code
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("customers", "0006_interest_gin_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="country_code",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=2
+            ),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="state_code",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=10
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["country_code", "state_code", "city"],
+                name="customers_c_country_c1127f_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_geo_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:47
+
+import re
+
+from django.db import migrations, models
+
+# 複製自建立此遷移時的 customers.geo.normalize_city
+_SEPARATORS = re.compile(r"[\s.\-_,]+")
+
+
+def _normalize_city(city) -> str:
+    return _SEPARATORS.sub("", (city or "").strip().lower()).replace("台", "臺")[:100]
+
+
+def backfill_city_keys(apps, schema_editor) -> None:
+    Customer = apps.get_model("customers", "Customer")
+    cities = Customer.objects.order_by().values_list("city", flat=True).distinct()
+    for city in list(cities):
+        Customer.objects.filter(city=city).update(city_key=_normalize_city(city))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("customers", "0007_customer_geo_codes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="customer",
+            name="customers_c_country_c1127f_idx",
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="city_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=100
+            ),
+        ),
+        migrations.RunPython(backfill_city_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["country_code", "state_code", "city_key"],
+                name="customers_c_country_d0564c_idx",
+            ),
+        ),
+    ]
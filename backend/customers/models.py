@@ -1,6 +1,9 @@
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
+from .geo import normalize_city, normalize_geo
+
 
 class Customer(models.Model):
     CUSTOMER_SOURCES = [
@@ -36,6 +39,13 @@ class Customer(models.Model):
     state = models.CharField(max_length=100, blank=True, null=True)
     zip_code = models.CharField(max_length=10, blank=True, null=True)
     country = models.CharField(max_length=100, default="USA")
+    # 由 country / state 正規化而來的標準代碼 (見 customers.geo)，儲存時自動計算
+    country_code = models.CharField(
+        max_length=2, blank=True, default="", editable=False
+    )
+    state_code = models.CharField(max_length=10, blank=True, default="", editable=False)
+    # city 的正規化分組鍵 (見 customers.geo.normalize_city)，儲存時自動計算
+    city_key = models.CharField(max_length=100, blank=True, default="", editable=False)
 
     source = models.CharField(max_length=20, choices=CUSTOMER_SOURCES, default="other")
     tags = models.TextField(blank=True, null=True, help_text="Comma-separated tags")
@@ -82,12 +92,33 @@ class Customer(models.Model):
         indexes = [
             models.Index(fields=["email"]),
             models.Index(fields=["created_at"]),
+            models.Index(fields=["updated_at"]),
             models.Index(fields=["is_active"]),
+            models.Index(fields=["country_code", "state_code", "city_key"]),
+            # 支援 product_categories_interest @> [...] 的查詢
+            GinIndex(
+                fields=["product_categories_interest"],
+                opclasses=["jsonb_path_ops"],
+                name="customers_interest_gin",
+            ),
         ]
 
     def __str__(self) -> str:
         return f"{self.first_name} {self.last_name} ({self.email})"
 
+    def save(self, *args, **kwargs) -> None:
+        self.country_code, self.state_code = normalize_geo(self.country, self.state)
+        self.city_key = normalize_city(self.city)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {"country", "state"} & update_fields:
+                update_fields |= {"country_code", "state_code"}
+            if "city" in update_fields:
+                update_fields.add("city_key")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+
     @property
     def full_name(self) -> str:
         return f"{self.first_name} {self.last_name}"
@@ -107,3 +138,118 @@ class Customer(models.Model):
         在 ViewSet 中我們使用 annotate 的 total_spent，效能更好
         """
         return sum(order.total for order in self.orders.all())
+
+
+class CustomerStats(models.Model):
+    """
+    客戶終身統計 (反正規化)
+    訂單、交易異動時在同一個資料庫交易內更新，列表排序與報表直接讀取這張表，
+    不需要每次都對 orders 做 SUM / COUNT
+    """
+
+    customer = models.OneToOneField(
+        Customer, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    first_order_at = models.DateTimeField(null=True, blank=True)
+    last_order_at = models.DateTimeField(null=True, blank=True)
+    last_transaction_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["total_spent"]),
+            models.Index(fields=["order_count"]),
+            models.Index(fields=["last_order_at"]),
+            models.Index(fields=["updated_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.customer_id}: {self.order_count} orders / {self.total_spent}"
+
+
+class DuplicateCandidate(models.Model):
+    """
+    疑似重複的客戶配對，由去重引擎產生，等待人工審核後合併或忽略
+    customer_a 一律是 id 較小的一方，確保同一組配對只會有一筆；
+    合併後重複的客戶會被刪除，配對也隨之刪除
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "待審核"),
+        ("dismissed", "非重複"),
+    ]
+
+    customer_a = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="+")
+    customer_b = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    reviewed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="reviewed_duplicate_candidates",
+    )
+
+    class Meta:
+        ordering = ["-score"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer_a", "customer_b"], name="unique_duplicate_pair"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "score"]),
+            models.Index(fields=["customer_b"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.customer_a_id} ~ {self.customer_b_id} ({self.score:.2f})"
+
+
+class Segment(models.Model):
+    """
+    儲存的客戶分群
+    definition 為分群條件 (見 customers.segments)，成員以排序後的 int64 id 陣列快取
+    """
+
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True, null=True)
+    definition = models.JSONField(default=dict)
+
+    member_ids = models.BinaryField(default=bytes, editable=False)
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    refreshed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="created_segments",
+    )
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.member_count})"
+
+    @property
+    def members(self):
+        from .segments import unpack_members  # noqa: PLC0415
+
+        return unpack_members(self.member_ids)
+
+    @members.setter
+    def members(self, member_ids) -> None:
+        from .segments import pack_members  # noqa: PLC0415
+
+        self.member_ids = pack_members(member_ids)
+        self.member_count = len(member_ids)
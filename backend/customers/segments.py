@@ -0,0 +1,188 @@
+"""
+客戶分群 (Segment)
+
+分群條件以 JSON 儲存，編譯成單一的 Q 物件，一次查詢取得所有成員 id。
+成員以排序後的 int64 id 陣列存放在 Segment.member_ids，計數、分頁與分群之間的
+聯集 / 交集 / 差集都直接在快取的陣列上以 numpy 計算，不需要重新查詢。
+
+增量更新只重新判斷上次更新後有異動的客戶 (客戶資料或 CustomerStats 的 updated_at)；
+客戶被刪除不會留下異動紀錄，其餘的快取成員另外確認仍然存在。
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from .interests import interests_all_q, interests_any_q
+from .models import Customer, CustomerStats
+
+MEMBER_DTYPE = np.int64
+REFRESH_OVERLAP = timedelta(minutes=5)
+REFRESH_CHUNK_SIZE = 10_000
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _as_decimal(value):
+    try:
+        return Decimal(str(value))
+    except InvalidOperation as exc:
+        raise ValueError(f"無效的數值：{value}") from exc
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"無效的整數：{value}") from exc
+
+
+def _as_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in {"true", "false"}:
+        return value.lower() == "true"
+    raise ValueError(f"無效的布林值：{value}")
+
+
+def _as_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"無效的日期：{value}") from exc
+
+
+# 條件名稱 → 產生 Q 的函式
+SEGMENT_FILTERS = {
+    "source": lambda value: Q(source__in=_as_list(value)),
+    "gender": lambda value: Q(gender__in=_as_list(value)),
+    "seasonal_purchase_pattern": lambda value: Q(
+        seasonal_purchase_pattern__in=_as_list(value)
+    ),
+    "city": lambda value: Q(city__in=_as_list(value)),
+    "state": lambda value: Q(state__in=_as_list(value)),
+    "country": lambda value: Q(country__in=_as_list(value)),
+    "is_active": lambda value: Q(is_active=_as_bool(value)),
+    "age_min": lambda value: Q(age__gte=_as_int(value)),
+    "age_max": lambda value: Q(age__lte=_as_int(value)),
+    "interests_any": lambda value: interests_any_q(_as_list(value)),
+    "interests_all": lambda value: interests_all_q(_as_list(value)),
+    "min_total_spent": lambda value: Q(stats__total_spent__gte=_as_decimal(value)),
+    "max_total_spent": lambda value: Q(stats__total_spent__lte=_as_decimal(value)),
+    "min_orders": lambda value: Q(stats__order_count__gte=_as_int(value)),
+    "max_orders": lambda value: Q(stats__order_count__lte=_as_int(value)),
+    "last_order_after": lambda value: Q(
+        stats__last_order_at__date__gte=_as_date(value)
+    ),
+    "last_order_before": lambda value: Q(
+        stats__last_order_at__date__lte=_as_date(value)
+    ),
+    "created_from": lambda value: Q(created_at__date__gte=_as_date(value)),
+    "created_to": lambda value: Q(created_at__date__lte=_as_date(value)),
+}
+
+
+def compile_definition(definition) -> Q:
+    """
+    將分群條件編譯成 Q 物件，各條件之間為 AND
+    不認得的條件或格式錯誤會拋出 ValueError
+    """
+    if not isinstance(definition, dict):
+        raise ValueError("分群條件必須是物件")
+
+    unknown = set(definition) - set(SEGMENT_FILTERS)
+    if unknown:
+        raise ValueError(f"不支援的分群條件：{', '.join(sorted(unknown))}")
+
+    condition = Q()
+    for name, value in definition.items():
+        if value is None or value in ("", []):
+            continue
+        condition &= SEGMENT_FILTERS[name](value)
+    return condition
+
+
+def segment_queryset(definition):
+    return Customer.objects.filter(compile_definition(definition))
+
+
+def _fetch_ids(queryset) -> np.ndarray:
+    ids = queryset.order_by("id").values_list("id", flat=True)
+    return np.fromiter(ids.iterator(chunk_size=10_000), dtype=MEMBER_DTYPE)
+
+
+def pack_members(member_ids) -> bytes:
+    return np.asarray(member_ids, dtype=MEMBER_DTYPE).tobytes()
+
+
+def unpack_members(data) -> np.ndarray:
+    if not data:
+        return np.empty(0, dtype=MEMBER_DTYPE)
+    return np.frombuffer(bytes(data), dtype=MEMBER_DTYPE)
+
+
+def _fetch_ids_in(queryset, ids) -> np.ndarray:
+    """queryset 中 id 屬於 ids 的客戶，分批查詢避免 IN 清單過長"""
+    chunks = np.array_split(ids, max(len(ids) // REFRESH_CHUNK_SIZE, 1))
+    return np.concatenate(
+        [_fetch_ids(queryset.filter(id__in=chunk.tolist())) for chunk in chunks]
+    )
+
+
+def _changed_customer_ids(since) -> np.ndarray:
+    """客戶資料或統計在 since 之後有異動的客戶，兩邊各自走 updated_at 索引"""
+    customer_ids = _fetch_ids(Customer.objects.filter(updated_at__gte=since))
+    stats_ids = np.fromiter(
+        CustomerStats.objects.filter(updated_at__gte=since)
+        .values_list("customer_id", flat=True)
+        .iterator(chunk_size=10_000),
+        dtype=MEMBER_DTYPE,
+    )
+    return np.union1d(customer_ids, stats_ids)
+
+
+def refresh_segment(segment, full=False) -> None:
+    """
+    更新分群成員
+
+    增量更新時只重新判斷上次更新後有異動的客戶：先從快取移除這些客戶，再加回其中
+    仍符合條件的客戶；其餘的快取成員只保留仍然存在的客戶 (例如合併時被刪除的重複客戶
+    會在這裡移除)。異動區間往前多抓 REFRESH_OVERLAP，涵蓋更新當下尚未提交的交易。
+    """
+    started_at = timezone.now()
+    queryset = segment_queryset(segment.definition)
+
+    if full or segment.refreshed_at is None:
+        members = _fetch_ids(queryset)
+    else:
+        changed_ids = _changed_customer_ids(segment.refreshed_at - REFRESH_OVERLAP)
+        unchanged_ids = np.setdiff1d(segment.members, changed_ids, assume_unique=True)
+        members = np.union1d(
+            _fetch_ids_in(Customer.objects.all(), unchanged_ids),
+            _fetch_ids_in(queryset, changed_ids),
+        )
+
+    segment.members = members
+    segment.refreshed_at = started_at
+    segment.save(update_fields=["member_ids", "member_count", "refreshed_at"])
+
+
+SET_OPERATIONS = {
+    "union": np.union1d,
+    "intersection": lambda left, right: np.intersect1d(left, right, assume_unique=True),
+    "difference": lambda left, right: np.setdiff1d(left, right, assume_unique=True),
+}
+
+
+def combine_segments(segments, operation) -> np.ndarray:
+    """依序對多個分群的快取成員做集合運算，例如 A - B - C"""
+    combine = SET_OPERATIONS[operation]
+    result = segments[0].members
+    for segment in segments[1:]:
+        result = combine(result, segment.members)
+    return result
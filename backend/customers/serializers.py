@@ -1,9 +1,19 @@
+from crm_backend.fieldsets import SparseFieldsetSerializerMixin
 from rest_framework import serializers
 
-from .models import Customer
+from .models import Customer, CustomerStats, DuplicateCandidate, Segment
+from .segments import compile_definition
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+def customer_stats(customer):
+    """客戶的 CustomerStats，尚未建立時回傳 None"""
+    try:
+        return customer.stats
+    except CustomerStats.DoesNotExist:
+        return None
+
+
+class CustomerSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     full_name = serializers.ReadOnlyField()
     # 使用 SerializerMethodField 來取得 annotated 欄位或 property 作為後備
     total_orders = serializers.SerializerMethodField()
@@ -11,17 +21,26 @@ class CustomerSerializer(serializers.ModelSerializer):
 
     def get_total_orders(self, obj):
         """
-        優先使用 annotated_total_orders，如果沒有則使用 property
+        優先使用 annotated_total_orders，其次是 CustomerStats，最後才使用 property
         """
-        return getattr(obj, "annotated_total_orders", obj.total_orders_property)
+        annotated_value = getattr(obj, "annotated_total_orders", None)
+        if annotated_value is not None:
+            return annotated_value
+        stats = customer_stats(obj)
+        if stats is not None:
+            return stats.order_count
+        return obj.total_orders_property
 
     def get_total_spent(self, obj):
         """
-        優先使用 annotated_total_spent，如果沒有則使用 property
+        優先使用 annotated_total_spent，其次是 CustomerStats，最後才使用 property
         """
         annotated_value = getattr(obj, "annotated_total_spent", None)
         if annotated_value is not None:
             return float(annotated_value)
+        stats = customer_stats(obj)
+        if stats is not None:
+            return float(stats.total_spent)
         return float(obj.total_spent_property)
 
     class Meta:
@@ -39,6 +58,9 @@ class CustomerSerializer(serializers.ModelSerializer):
             "state",
             "zip_code",
             "country",
+            "country_code",
+            "state_code",
+            "city_key",
             "source",
             "tags",
             "notes",
@@ -78,3 +100,85 @@ class CustomerCreateUpdateSerializer(serializers.ModelSerializer):
             "seasonal_purchase_pattern",
             "is_active",
         ]
+
+
+class CustomerSummarySerializer(serializers.ModelSerializer):
+    """僅包含識別用欄位的客戶摘要，用於巢狀顯示"""
+
+    full_name = serializers.ReadOnlyField()
+
+    class Meta:
+        model = Customer
+        fields = ["id", "full_name", "email", "phone", "company"]
+
+
+class CustomerBriefSerializer(CustomerSummarySerializer):
+    """
+    訂單 / 交易列表內嵌的客戶資訊
+    消費統計只讀取 CustomerStats，搭配 select_related("customer__stats")
+    不論列表筆數，都不會產生額外查詢
+    """
+
+    total_orders = serializers.SerializerMethodField()
+    total_spent = serializers.SerializerMethodField()
+
+    class Meta(CustomerSummarySerializer.Meta):
+        fields = [*CustomerSummarySerializer.Meta.fields, "total_orders", "total_spent"]
+
+    def get_total_orders(self, obj):
+        stats = customer_stats(obj)
+        return stats.order_count if stats is not None else 0
+
+    def get_total_spent(self, obj):
+        stats = customer_stats(obj)
+        return float(stats.total_spent) if stats is not None else 0.0
+
+
+class DuplicateCandidateSerializer(serializers.ModelSerializer):
+    customer_a_info = CustomerSummarySerializer(source="customer_a", read_only=True)
+    customer_b_info = CustomerSummarySerializer(source="customer_b", read_only=True)
+
+    class Meta:
+        model = DuplicateCandidate
+        fields = [
+            "id",
+            "customer_a",
+            "customer_a_info",
+            "customer_b",
+            "customer_b_info",
+            "score",
+            "status",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+
+class SegmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Segment
+        fields = [
+            "id",
+            "name",
+            "description",
+            "definition",
+            "member_count",
+            "refreshed_at",
+            "created_by",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = [
+            "member_count",
+            "refreshed_at",
+            "created_by",
+            "created_at",
+            "updated_at",
+        ]
+
+    def validate_definition(self, value):
+        try:
+            compile_definition(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc)) from exc
+        return value
@@ -0,0 +1,43 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from orders.models import Order
+from transactions.models import Transaction
+
+from .models import Customer, CustomerStats
+from .stats import refresh_customer_stats
+
+# 批次更新客戶後送出一次 (而非每筆 post_save)
+# 參數：customer_ids (實際更新的客戶 id)、fields (更新的欄位)、user
+customers_bulk_updated = Signal()
+
+
+def _deleting_customer(origin) -> bool:
+    """刪除客戶時會連帶刪除訂單與交易，此時不需要再回寫統計"""
+    if isinstance(origin, QuerySet):
+        return origin.model is Customer
+    return isinstance(origin, Customer)
+
+
+@receiver(post_save, sender=Customer)
+def create_customer_stats(sender, instance, created, **kwargs) -> None:
+    if created:
+        CustomerStats.objects.get_or_create(customer=instance)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Transaction)
+def refresh_stats_on_save(sender, instance, **kwargs) -> None:
+    # 訂單改掛到其他客戶時，原客戶的統計也要更新
+    refresh_customer_stats(
+        [instance.customer_id, getattr(instance, "_loaded_customer_id", None)]
+    )
+    instance._loaded_customer_id = instance.customer_id
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Transaction)
+def refresh_stats_on_delete(sender, instance, origin=None, **kwargs) -> None:
+    if _deleting_customer(origin):
+        return
+    refresh_customer_stats([instance.customer_id])
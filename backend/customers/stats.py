@@ -0,0 +1,144 @@
+"""
+客戶終身統計 (CustomerStats) 的維護
+
+- refresh_customer_stats：訂單 / 交易異動時，針對受影響的客戶重新計算
+- rebuild_customer_stats：以單一 SQL 依 id 區間批次重建，供對帳指令使用
+"""
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+from orders.models import Order
+from transactions.models import Transaction
+
+from .models import Customer, CustomerStats
+
+STATS_FIELDS = [
+    "total_spent",
+    "order_count",
+    "first_order_at",
+    "last_order_at",
+    "last_transaction_at",
+    "updated_at",
+]
+
+
+def refresh_customer_stats(customer_ids) -> None:
+    """
+    重新計算指定客戶的統計
+    先依主鍵順序鎖定統計列再聚合，同一客戶的併發異動會排隊執行，
+    後面的交易一定看得到前一筆已提交的訂單，不會互相覆蓋
+    """
+    customer_ids = sorted({customer_id for customer_id in customer_ids if customer_id})
+    if not customer_ids:
+        return
+
+    with transaction.atomic():
+        existing_ids = Customer.objects.filter(id__in=customer_ids).values_list(
+            "id", flat=True
+        )
+        CustomerStats.objects.bulk_create(
+            [CustomerStats(customer_id=customer_id) for customer_id in existing_ids],
+            ignore_conflicts=True,
+        )
+        stats_list = list(
+            CustomerStats.objects.select_for_update()
+            .filter(customer_id__in=customer_ids)
+            .order_by("customer_id")
+        )
+
+        order_stats = {
+            row["customer_id"]: row
+            for row in Order.objects.filter(customer_id__in=customer_ids)
+            .values("customer_id")
+            .annotate(
+                total_spent=Sum("total"),
+                order_count=Count("id"),
+                first_order_at=Min("order_date"),
+                last_order_at=Max("order_date"),
+            )
+            .order_by()
+        }
+        last_transactions = dict(
+            Transaction.objects.filter(customer_id__in=customer_ids)
+            .values("customer_id")
+            .annotate(last_transaction_at=Max("created_at"))
+            .values_list("customer_id", "last_transaction_at")
+            .order_by()
+        )
+
+        now = timezone.now()
+        for stats in stats_list:
+            row = order_stats.get(stats.customer_id, {})
+            stats.total_spent = row.get("total_spent") or 0
+            stats.order_count = row.get("order_count") or 0
+            stats.first_order_at = row.get("first_order_at")
+            stats.last_order_at = row.get("last_order_at")
+            stats.last_transaction_at = last_transactions.get(stats.customer_id)
+            stats.updated_at = now
+
+        CustomerStats.objects.bulk_update(stats_list, STATS_FIELDS)
+
+
+REBUILD_SQL = """
+INSERT INTO {stats} (
+    customer_id, total_spent, order_count,
+    first_order_at, last_order_at, last_transaction_at, updated_at
+)
+SELECT
+    c.id,
+    COALESCE(o.total_spent, 0),
+    COALESCE(o.order_count, 0),
+    o.first_order_at,
+    o.last_order_at,
+    t.last_transaction_at,
+    NOW()
+FROM {customer} c
+LEFT JOIN (
+    SELECT customer_id,
+           SUM(total) AS total_spent,
+           COUNT(*) AS order_count,
+           MIN(order_date) AS first_order_at,
+           MAX(order_date) AS last_order_at
+    FROM {order}
+    WHERE customer_id BETWEEN %(start)s AND %(end)s
+    GROUP BY customer_id
+) o ON o.customer_id = c.id
+LEFT JOIN (
+    SELECT customer_id, MAX(created_at) AS last_transaction_at
+    FROM {transaction}
+    WHERE customer_id BETWEEN %(start)s AND %(end)s
+    GROUP BY customer_id
+) t ON t.customer_id = c.id
+WHERE c.id BETWEEN %(start)s AND %(end)s
+ON CONFLICT (customer_id) DO UPDATE SET
+    total_spent = EXCLUDED.total_spent,
+    order_count = EXCLUDED.order_count,
+    first_order_at = EXCLUDED.first_order_at,
+    last_order_at = EXCLUDED.last_order_at,
+    last_transaction_at = EXCLUDED.last_transaction_at,
+    updated_at = EXCLUDED.updated_at
+WHERE (
+    {stats}.total_spent, {stats}.order_count, {stats}.first_order_at,
+    {stats}.last_order_at, {stats}.last_transaction_at
+) IS DISTINCT FROM (
+    EXCLUDED.total_spent, EXCLUDED.order_count, EXCLUDED.first_order_at,
+    EXCLUDED.last_order_at, EXCLUDED.last_transaction_at
+)
+"""
+
+
+def rebuild_customer_stats(start_id: int, end_id: int) -> int:
+    """
+    以單一 INSERT ... SELECT ... ON CONFLICT 重建 id 區間內的客戶統計
+    只有數值不一致的列會被寫入，回傳實際修正的筆數
+    """
+    sql = REBUILD_SQL.format(
+        stats=CustomerStats._meta.db_table,
+        customer=Customer._meta.db_table,
+        order=Order._meta.db_table,
+        transaction=Transaction._meta.db_table,
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, {"start": start_id, "end": end_id})
+        return cursor.rowcount
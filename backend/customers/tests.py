@@ -1 +1,407 @@
-# Create your tests here.
+import csv
+import gzip
+import io
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from customer_service.models import ServiceTicket
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from orders.models import Order
+from reports.views import geo_analytics
+from rest_framework.test import APIRequestFactory, force_authenticate
+from transactions.ledger import balance_as_of
+from transactions.models import Transaction
+
+from .bulk import bulk_add_tag, bulk_remove_tag, bulk_update_customers
+from .dedup import (
+    TRIGRAM_DIMENSIONS,
+    _crc32,
+    cosine_similarity,
+    find_duplicate_candidates,
+    merge_customers,
+    trigram_vectors,
+    trigrams,
+)
+from .models import Customer, CustomerStats, DuplicateCandidate, Segment
+from .segments import compile_definition, refresh_segment, segment_queryset
+from .signals import customers_bulk_updated
+from .stats import rebuild_customer_stats
+from .timeline import decode_cursor, get_customer_timeline
+from .views import CustomerViewSet
+
+
+def _customer(name, **fields):
+    return Customer.objects.create(
+        first_name=name, last_name="User", email=f"{name}@example.com", **fields
+    )
+
+
+def _order(customer, total):
+    return Order.objects.create(
+        customer=customer, subtotal=Decimal(total), total=Decimal(total)
+    )
+
+
+class CustomerStatsTests(TestCase):
+    """訂單與交易異動時即時更新 CustomerStats，重建只修正不一致的列"""
+
+    def _stats(self, customer):
+        stats = CustomerStats.objects.get(customer=customer)
+        return stats.order_count, stats.total_spent
+
+    def test_order_changes_refresh_stats(self):
+        customer = _customer("stats")
+        other = _customer("stats-other")
+        first = _order(customer, "10.00")
+        _order(customer, "5.50")
+        self.assertEqual(self._stats(customer), (2, Decimal("15.50")))
+
+        # 改掛到其他客戶時，兩邊的統計都要更新
+        first = Order.objects.get(pk=first.pk)
+        first.customer = other
+        first.save()
+        self.assertEqual(self._stats(customer), (1, Decimal("5.50")))
+        self.assertEqual(self._stats(other), (1, Decimal("10.00")))
+
+        first.delete()
+        self.assertEqual(self._stats(other), (0, Decimal("0")))
+
+    def test_transaction_updates_last_transaction_at(self):
+        customer = _customer("stats-txn")
+        txn = Transaction.objects.create(
+            customer=customer,
+            status="completed",
+            amount=Decimal("10.00"),
+            net_amount=Decimal("10.00"),
+        )
+        stats = CustomerStats.objects.get(customer=customer)
+        self.assertEqual(stats.last_transaction_at, txn.created_at)
+
+    def test_rebuild_fixes_only_drifted_rows(self):
+        customer = _customer("stats-rebuild")
+        other = _customer("stats-rebuild-other")
+        _order(customer, "10.00")
+        _order(other, "20.00")
+        CustomerStats.objects.filter(customer=customer).update(order_count=9)
+
+        ids = sorted([customer.id, other.id])
+        self.assertEqual(rebuild_customer_stats(ids[0], ids[-1]), 1)
+        self.assertEqual(self._stats(customer), (1, Decimal("10.00")))
+        self.assertEqual(rebuild_customer_stats(ids[0], ids[-1]), 0)
+
+
+class CustomerTimelineTests(TestCase):
+    """各來源依 (時間, 種類, id) 合併，逐頁翻完不重複也不遺漏"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = _customer("timeline")
+        user = User.objects.create_user("timeline")
+        now = timezone.now()
+        for i in range(3):
+            order = _order(cls.customer, "10.00")
+            Transaction.objects.create(
+                customer=cls.customer,
+                order=order,
+                status="completed",
+                amount=Decimal("10.00"),
+                net_amount=Decimal("10.00"),
+            )
+            ServiceTicket.objects.create(
+                customer=cls.customer,
+                title=f"工單 {i}",
+                description="內容",
+                created_by=user,
+            )
+        # 讓部分事件落在同一時間點，檢查跨來源的排序與游標
+        Order.objects.update(order_date=now)
+        Transaction.objects.update(created_at=now)
+        ServiceTicket.objects.filter(title="工單 0").update(created_at=now)
+        ServiceTicket.objects.exclude(title="工單 0").update(
+            created_at=now - timedelta(hours=1)
+        )
+
+    def _keys(self, events):
+        return [(event["type"], event["id"]) for event in events]
+
+    def test_pages_cover_full_timeline(self):
+        expected, cursor = get_customer_timeline(self.customer.id, limit=100)
+        self.assertIsNone(cursor)
+        self.assertEqual(len(expected), 9)
+        # 同一時間點依訂單、交易、工單的順序排列
+        self.assertEqual(
+            [event["type"] for event in expected[:7]],
+            ["order"] * 3 + ["transaction"] * 3 + ["ticket"],
+        )
+
+        pages = []
+        cursor = None
+        while True:
+            events, cursor = get_customer_timeline(
+                self.customer.id,
+                cursor=cursor and decode_cursor(cursor),
+                limit=2,
+            )
+            pages.extend(events)
+            if cursor is None:
+                break
+        self.assertEqual(self._keys(pages), self._keys(expected))
+        self.assertTrue(all(event["item_count"] == 0 for event in pages[:3]))
+
+    def test_kind_filter(self):
+        events, _ = get_customer_timeline(
+            self.customer.id, limit=100, kinds=["transaction"]
+        )
+        self.assertEqual({event["type"] for event in events}, {"transaction"})
+        self.assertEqual(len(events), 3)
+
+
+class DuplicateDetectionTests(TestCase):
+    def test_sparse_cosine_matches_dense_vectors(self):
+        texts = ["johnsmith", "jonsmith", "", "王小明", "王曉明", "johnsmith"]
+        dense = np.zeros((len(texts), TRIGRAM_DIMENSIONS))
+        for row, text in enumerate(texts):
+            for gram in trigrams(text):
+                dense[row, _crc32(gram) % TRIGRAM_DIMENSIONS] += 1
+        norms = np.linalg.norm(dense, axis=1, keepdims=True)
+        dense = np.divide(dense, norms, out=dense, where=norms > 0)
+
+        index_a = np.array([0, 0, 1, 2, 3, 5])
+        index_b = np.array([1, 5, 2, 3, 4, 0])
+        np.testing.assert_allclose(
+            cosine_similarity(trigram_vectors(texts), index_a, index_b),
+            np.einsum("ij,ij->i", dense[index_a], dense[index_b]),
+            rtol=1e-6,
+        )
+
+    def test_find_candidates(self):
+        first = _customer("john", phone="0912-345-678")
+        Customer.objects.filter(pk=first.pk).update(last_name="Smith")
+        second = Customer.objects.create(
+            first_name="John",
+            last_name="Smith",
+            email="john.smith@example.org",
+            phone="+886 912 345 678",
+        )
+        _customer("mary", phone="0933-000-111")
+
+        stats = find_duplicate_candidates(batch_size=1)
+        self.assertEqual(stats["candidates"], 1)
+        candidate = DuplicateCandidate.objects.get()
+        self.assertEqual(
+            (candidate.customer_a_id, candidate.customer_b_id), (first.id, second.id)
+        )
+
+
+class SegmentTests(TestCase):
+    def test_compile_rejects_invalid_definitions(self):
+        for definition in (
+            [],
+            {"unknown": 1},
+            {"age_min": "abc"},
+            {"min_total_spent": "abc"},
+            {"created_from": "2026-13-01"},
+            {"is_active": "0"},
+            {"is_active": "no"},
+            {"is_active": 1},
+        ):
+            with self.subTest(definition=definition), self.assertRaises(ValueError):
+                compile_definition(definition)
+
+    def test_incremental_refresh_only_rechecks_changed_customers(self):
+        taipei = _customer("segment-1", city="Taipei")
+        tainan = _customer("segment-2", city="Tainan")
+        segment = Segment.objects.create(name="臺北", definition={"city": ["Taipei"]})
+        refresh_segment(segment)
+        self.assertEqual(segment.members.tolist(), [taipei.id])
+
+        tainan.city = "Taipei"
+        tainan.save()
+        # 直接改資料庫且不動 updated_at，增量更新不會看到
+        stale = _customer("segment-3")
+        Customer.objects.filter(pk=stale.pk).update(
+            city="Taipei", updated_at=timezone.now() - timedelta(days=1)
+        )
+        CustomerStats.objects.filter(customer=stale).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+
+        refresh_segment(segment)
+        self.assertEqual(segment.members.tolist(), [taipei.id, tainan.id])
+        self.assertEqual(segment.member_count, 2)
+
+        refresh_segment(segment, full=True)
+        self.assertEqual(segment.members.tolist(), [taipei.id, tainan.id, stale.id])
+
+    def test_is_active_accepts_bool_or_true_false(self):
+        active = _customer("segment-active")
+        inactive = _customer("segment-inactive", is_active=False)
+        for value, expected in (
+            (False, [inactive.id]),
+            ("false", [inactive.id]),
+            ("False", [inactive.id]),
+            (True, [active.id]),
+            ("true", [active.id]),
+        ):
+            with self.subTest(value=value):
+                queryset = segment_queryset({"is_active": value})
+                self.assertEqual(list(queryset.values_list("id", flat=True)), expected)
+
+    def test_incremental_refresh_drops_deleted_customers(self):
+        primary = _customer("segment-primary", city="Taipei")
+        duplicate = _customer("segment-duplicate", city="Taipei")
+        removed = _customer("segment-removed", city="Taipei")
+        segment = Segment.objects.create(name="臺北", definition={"city": ["Taipei"]})
+        refresh_segment(segment)
+        self.assertEqual(segment.member_count, 3)
+
+        # 讓主要客戶在合併後也不算有異動，只靠存在檢查移除重複客戶
+        merge_customers(primary, [duplicate])
+        removed.delete()
+        past = timezone.now() - timedelta(days=1)
+        Customer.objects.update(updated_at=past)
+        CustomerStats.objects.update(updated_at=past)
+
+        refresh_segment(segment)
+        self.assertEqual(segment.members.tolist(), [primary.id])
+        self.assertEqual(segment.member_count, 1)
+
+
+class BulkUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [
+            _customer(f"bulk-{i}", tags="vip" if i % 2 else None) for i in range(5)
+        ]
+
+    def test_update_in_chunks_and_send_one_signal(self):
+        received = []
+
+        def receiver(customer_ids, fields, **kwargs):
+            received.append((sorted(customer_ids), fields))
+
+        customers_bulk_updated.connect(receiver)
+        self.addCleanup(customers_bulk_updated.disconnect, receiver)
+
+        ids = [customer.id for customer in self.customers]
+        updated, chunks = bulk_update_customers(
+            ids, {"country": "Taiwan", "city": " taipei"}, chunk_size=2
+        )
+        self.assertEqual((updated, chunks), (5, 3))
+        self.assertEqual(received, [(sorted(ids), ["city", "country"])])
+        # queryset.update 之後仍重算地區代碼
+        self.assertEqual(
+            set(Customer.objects.values_list("country_code", "city_key")),
+            {("TW", "taipei")},
+        )
+
+    def test_tags_skip_customers_already_matching(self):
+        queryset = Customer.objects.filter(email__startswith="bulk-")
+        self.assertEqual(bulk_add_tag(queryset, "vip")[0], 3)
+        self.assertEqual(bulk_add_tag(queryset, "vip")[0], 0)
+        self.assertEqual(bulk_add_tag(queryset, "new")[0], 5)
+        self.assertEqual(set(queryset.values_list("tags", flat=True)), {"vip, new"})
+
+        self.assertEqual(bulk_remove_tag(queryset, "vip")[0], 5)
+        self.assertEqual(bulk_remove_tag(queryset, "vip")[0], 0)
+        self.assertEqual(set(queryset.values_list("tags", flat=True)), {"new"})
+
+
+class GeoRollupTests(TestCase):
+    """地區彙總以正規化後的代碼與城市鍵分組"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("geo")
+        for i, (country, city) in enumerate(
+            [("USA", "New York"), ("United States", "new york "), ("台灣", "Taipei")]
+        ):
+            customer = _customer(f"geo-{i}", country=country, city=city)
+            _order(customer, "10.00")
+
+    def _rollup(self, **params):
+        request = APIRequestFactory().get("/api/reports/geo/", params)
+        force_authenticate(request, self.user)
+        response = geo_analytics(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_country_level(self):
+        results = self._rollup()
+        self.assertEqual(
+            [(row["country_code"], row["customer_count"]) for row in results],
+            [("US", 2), ("TW", 1)],
+        )
+        self.assertEqual(results[0]["total_revenue"], 20.0)
+
+    def test_city_level_groups_spelling_variants(self):
+        results = self._rollup(level="city", country_code="US")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["city_key"], "newyork")
+        self.assertEqual(results[0]["customer_count"], 2)
+
+    def test_invalid_level(self):
+        request = APIRequestFactory().get("/api/reports/geo/", {"level": "street"})
+        force_authenticate(request, self.user)
+        self.assertEqual(geo_analytics(request).status_code, 400)
+
+
+class LedgerBalanceExportTests(TestCase):
+    """餘額匯出沿用列表匯出的 CSV 串流與 gzip 壓縮"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("ledger")
+        cls.customers = [_customer(f"ledger-{i}") for i in range(3)]
+        for customer, amount in zip(cls.customers, ("10.00", "2.50"), strict=False):
+            Transaction.objects.create(
+                customer=customer,
+                status="completed",
+                amount=Decimal(amount),
+                net_amount=Decimal(amount),
+            )
+
+    def _get(self, **params):
+        request = APIRequestFactory().get("/api/customers/ledger-balances/", params)
+        force_authenticate(request, self.user)
+        view = CustomerViewSet.as_view(
+            {"get": "ledger_balances"}, **CustomerViewSet.ledger_balances.kwargs
+        )
+        return view(request)
+
+    def _export(self, **params):
+        response = self._get(**params)
+        return response, b"".join(response.streaming_content)
+
+    def _rows(self, text):
+        return list(csv.reader(io.StringIO(text)))
+
+    def test_csv(self):
+        response, content = self._export()
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn(".csv", response["Content-Disposition"])
+        rows = self._rows(content.decode())
+        self.assertEqual(rows[0], ["customer_id", "email", "balance_USD"])
+        now = timezone.now()
+        self.assertEqual(
+            rows[1:],
+            [
+                [str(c.id), c.email, str(balance_as_of(c.id, now))]
+                for c in self.customers
+            ],
+        )
+
+    def test_gzip_matches_plain_csv(self):
+        _, plain = self._export(as_of="2099-01-01")
+        response, compressed = self._export(as_of="2099-01-01", gzip="true")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn(
+            "ledger-balances-2099-01-01.csv.gz", response["Content-Disposition"]
+        )
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_invalid_as_of(self):
+        self.assertEqual(self._get(as_of="yesterday").status_code, 400)
@@ -0,0 +1,196 @@
+"""
+客戶 360 時間軸
+
+將單一客戶的訂單、交易、客服工單與客服記錄合併成依時間排序 (新到舊) 的事件流：
+
+- 每種事件各自以 (時間, id) 由新到舊查詢，直接走 (customer, 時間) 複合索引
+- 以 heapq.merge 做 k 路合併，每種事件最多只需讀取 limit + 1 筆
+- 分頁使用游標 (時間, 事件種類, id)，不論資料量多大，翻頁成本都固定
+- 合併完成後才針對該頁的事件批次補上關聯資料 (例如訂單明細數)
+"""
+
+import base64
+import heapq
+import json
+from datetime import datetime
+
+from customer_service.models import ServiceNote, ServiceTicket
+from django.db.models import Count, F, Q
+from orders.models import Order, OrderItem
+from transactions.models import Transaction
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    """游標格式錯誤"""
+
+
+class TimelineSource:
+    """
+    一種時間軸事件的來源
+
+    rank 用於同一時間點的排序，確保不同種類事件的順序穩定
+    """
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        kind,
+        rank,
+        model,
+        customer_lookup,
+        timestamp_field,
+        fields,
+        related_fields=None,
+    ):
+        self.kind = kind
+        self.rank = rank
+        self.model = model
+        self.customer_lookup = customer_lookup
+        self.timestamp_field = timestamp_field
+        self.fields = fields
+        # 輸出名稱 → 關聯欄位，透過 JOIN 一併取出
+        self.related_fields = related_fields or {}
+
+    def get_queryset(self, customer_id, cursor=None):
+        queryset = self.model.objects.filter(**{self.customer_lookup: customer_id})
+        if cursor is not None:
+            queryset = queryset.filter(self._after_cursor(cursor))
+        return queryset.order_by(f"-{self.timestamp_field}", "-id").values(
+            "id",
+            self.timestamp_field,
+            *self.fields,
+            **{alias: F(lookup) for alias, lookup in self.related_fields.items()},
+        )
+
+    def _after_cursor(self, cursor):
+        """(時間, rank, id) 嚴格小於游標的條件"""
+        timestamp, rank, object_id = cursor
+        before = Q(**{f"{self.timestamp_field}__lt": timestamp})
+        same_time = Q(**{self.timestamp_field: timestamp})
+        if self.rank < rank:
+            return before | same_time
+        if self.rank > rank:
+            return before
+        return before | (same_time & Q(id__lt=object_id))
+
+    def fetch(self, customer_id, cursor, limit):
+        """取出最多 limit 筆事件，回傳 (排序鍵, 事件) 的序列"""
+        for row in self.get_queryset(customer_id, cursor)[:limit]:
+            timestamp = row.pop(self.timestamp_field)
+            yield (
+                (timestamp, self.rank, row["id"]),
+                {"type": self.kind, "id": row["id"], "timestamp": timestamp, **row},
+            )
+
+
+TIMELINE_SOURCES = [
+    TimelineSource(
+        "order",
+        3,
+        Order,
+        "customer_id",
+        "order_date",
+        ("order_number", "status", "total"),
+    ),
+    TimelineSource(
+        "transaction",
+        2,
+        Transaction,
+        "customer_id",
+        "created_at",
+        (
+            "transaction_id",
+            "transaction_type",
+            "payment_method",
+            "status",
+            "amount",
+            "currency",
+        ),
+        {"order_number": "order__order_number"},
+    ),
+    TimelineSource(
+        "ticket",
+        1,
+        ServiceTicket,
+        "customer_id",
+        "created_at",
+        ("ticket_number", "title", "category", "priority", "status"),
+    ),
+    TimelineSource(
+        "note",
+        0,
+        ServiceNote,
+        "ticket__customer_id",
+        "created_at",
+        ("note_type", "content", "ticket_id"),
+        {
+            "ticket_number": "ticket__ticket_number",
+            "created_by_name": "created_by__username",
+        },
+    ),
+]
+TIMELINE_KINDS = [source.kind for source in TIMELINE_SOURCES]
+
+
+def encode_cursor(sort_key) -> str:
+    timestamp, rank, object_id = sort_key
+    payload = json.dumps([timestamp.isoformat(), rank, object_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(value):
+    try:
+        timestamp, rank, object_id = json.loads(base64.urlsafe_b64decode(value))
+        return datetime.fromisoformat(timestamp), int(rank), int(object_id)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(value) from exc
+
+
+def _attach_order_item_counts(events) -> None:
+    """批次查詢該頁訂單的明細數量，避免逐筆查詢"""
+    order_ids = [event["id"] for event in events if event["type"] == "order"]
+    if not order_ids:
+        return
+
+    item_counts = dict(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values("order_id")
+        .annotate(count=Count("id"))
+        .values_list("order_id", "count")
+        .order_by()
+    )
+    for event in events:
+        if event["type"] == "order":
+            event["item_count"] = item_counts.get(event["id"], 0)
+
+
+def get_customer_timeline(customer_id, cursor=None, limit=DEFAULT_LIMIT, kinds=None):
+    """
+    取得客戶時間軸的一頁事件
+    回傳 (事件列表, 下一頁游標)；沒有下一頁時游標為 None
+    """
+    sources = [
+        source for source in TIMELINE_SOURCES if not kinds or source.kind in kinds
+    ]
+    # 每個來源都已經由新到舊排序，合併後取 limit + 1 筆即可判斷是否還有下一頁
+    merged = heapq.merge(
+        *(source.fetch(customer_id, cursor, limit + 1) for source in sources),
+        key=lambda item: item[0],
+        reverse=True,
+    )
+
+    page = []
+    for sort_key, event in merged:
+        if len(page) == limit:
+            return _finalize(page), encode_cursor(page[-1][0])
+        page.append((sort_key, event))
+
+    return _finalize(page), None
+
+
+def _finalize(page):
+    events = [event for _, event in page]
+    _attach_order_item_counts(events)
+    return events
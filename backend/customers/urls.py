@@ -1,9 +1,12 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CustomerViewSet
+from .views import CustomerViewSet, DuplicateCandidateViewSet, SegmentViewSet
 
 router = DefaultRouter()
+# 需在空字串前註冊，否則會被客戶的詳情路由 (/{pk}/) 攔截
+router.register(r"duplicates", DuplicateCandidateViewSet)
+router.register(r"segments", SegmentViewSet)
 router.register(r"", CustomerViewSet)
 
 urlpatterns = [
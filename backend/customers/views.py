@@ -1,13 +1,46 @@
-from django.db.models import Count, DecimalField, Sum, Value
+from crm_backend.export import StreamingExportMixin, csv_lines, export_response
+from crm_backend.fieldsets import SparseFieldsetViewSetMixin
+from django.conf import settings
+from django.db.models import DecimalField, F, Value
 from django.db.models.functions import Coalesce
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters import rest_framework as filters_drf
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, viewsets
+from rest_framework import filters, mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from transactions.ledger import (
+    balance_as_of,
+    iter_balances_as_of,
+    parse_day,
+    running_ledger,
+)
 
-from .models import Customer
-from .serializers import CustomerCreateUpdateSerializer, CustomerSerializer
+from .bulk import (
+    BULK_UPDATE_FIELDS,
+    bulk_add_tag,
+    bulk_remove_tag,
+    bulk_update_customers,
+)
+from .dedup import merge_customers
+from .interests import interest_facets, interests_all_q, interests_any_q
+from .models import Customer, DuplicateCandidate, Segment
+from .segments import SET_OPERATIONS, combine_segments, refresh_segment
+from .serializers import (
+    CustomerCreateUpdateSerializer,
+    CustomerSerializer,
+    DuplicateCandidateSerializer,
+    SegmentSerializer,
+)
+from .timeline import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    InvalidCursor,
+    decode_cursor,
+    get_customer_timeline,
+)
 
 
 # 多新增一個篩選器，讓使用者可以根據創建日期範圍來過濾客戶資料
@@ -18,6 +51,9 @@ class CustomerFilter(filters_drf.FilterSet):
     date_to = filters_drf.DateFilter(
         field_name="created_at", lookup_expr="lte"
     )  # 小於等於創建日期
+    # 產品興趣類別，以逗號分隔多個類別
+    interests_any = filters_drf.CharFilter(method="filter_interests_any")
+    interests_all = filters_drf.CharFilter(method="filter_interests_all")
 
     class Meta:
         model = Customer
@@ -27,12 +63,31 @@ class CustomerFilter(filters_drf.FilterSet):
             "city",
             "state",
             "country",
+            "country_code",
+            "state_code",
+            "city_key",
             "date_from",
             "date_to",
+            "interests_any",
+            "interests_all",
         ]
 
+    @staticmethod
+    def _split_categories(value):
+        return [category.strip() for category in value.split(",") if category.strip()]
 
-class CustomerViewSet(viewsets.ModelViewSet):
+    def filter_interests_any(self, queryset, name, value):
+        categories = self._split_categories(value)
+        return queryset.filter(interests_any_q(categories)) if categories else queryset
+
+    def filter_interests_all(self, queryset, name, value):
+        categories = self._split_categories(value)
+        return queryset.filter(interests_all_q(categories)) if categories else queryset
+
+
+class CustomerViewSet(
+    StreamingExportMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet
+):
     # 保留基本的 queryset 屬性給 DRF 路由使用
     queryset = Customer.objects.all()
     filter_backends = [
@@ -50,6 +105,11 @@ class CustomerViewSet(viewsets.ModelViewSet):
         "annotated_total_orders",
     ]
     ordering = ["-created_at"]
+    sparse_only_dependencies = {
+        "full_name": ("first_name", "last_name"),
+        "total_orders": (),
+        "total_spent": (),
+    }
 
     def get_queryset(self):
         """
@@ -58,19 +118,17 @@ class CustomerViewSet(viewsets.ModelViewSet):
         """
         queryset = Customer.objects.all()
 
-        # 使用 Django ORM 的聚合功能計算每個客戶的總消費額和總訂單數
-        # 這樣就可以在資料庫層面進行排序，而不需要在 Python 層面處理
+        # 直接讀取 CustomerStats 已彙總好的數值，不必每次請求都 JOIN 全部訂單聚合
+        # 統計表的 total_spent / order_count 皆有索引，可在資料庫層面排序
         return queryset.annotate(
-            # 計算總消費額：將該客戶所有訂單的 total 欄位相加
-            # 使用 Coalesce 處理 NULL 值，如果 Sum 結果是 NULL（沒有訂單）就設為 0
+            # 尚未建立統計列的客戶 (LEFT JOIN 為 NULL) 以 0 表示
             annotated_total_spent=Coalesce(
-                Sum("orders__total"),
+                F("stats__total_spent"),
                 Value(0),
-                output_field=DecimalField(max_digits=10, decimal_places=2),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
             ),
-            # 計算總訂單數：計算該客戶的訂單數量
             # 使用不同名稱避免與模型 property 衝突
-            annotated_total_orders=Count("orders"),
+            annotated_total_orders=Coalesce(F("stats__order_count"), Value(0)),
         )
 
     def get_serializer_class(self):
@@ -84,22 +142,375 @@ class CustomerViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer) -> None:
         serializer.save(updated_by=self.request.user)
 
+    def _get_bulk_target(self, data):
+        """
+        批次操作的對象：ids (客戶 id 列表) 或 filter (與列表篩選相同的參數)
+        回傳 (對象, 錯誤回應)
+        """
+        if "ids" in data:
+            ids = data["ids"]
+            if not isinstance(ids, list) or not ids:
+                return None, "ids 必須是非空的客戶 id 列表"
+            try:
+                return [int(customer_id) for customer_id in ids], None
+            except (TypeError, ValueError):
+                return None, "ids 必須是非空的客戶 id 列表"
+
+        filter_data = data.get("filter")
+        if not isinstance(filter_data, dict) or not filter_data:
+            return None, "必須提供 ids 或 filter"
+        filterset = CustomerFilter(data=filter_data, queryset=Customer.objects.all())
+        if not filterset.is_valid():
+            return None, filterset.errors
+        return filterset.qs, None
+
+    @action(detail=False, methods=["post"])
+    def bulk_update(self, request) -> Response:
+        """
+        批次更新客戶欄位
+        {"ids": [1, 2]} 或 {"filter": {"source": "website"}}，加上 {"patch": {"is_active": false}}
+        """
+        target, error = self._get_bulk_target(request.data)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        patch = request.data.get("patch")
+        if not isinstance(patch, dict) or not patch:
+            return Response(
+                {"error": "patch 必須是要更新的欄位"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        unsupported = set(patch) - set(BULK_UPDATE_FIELDS)
+        if unsupported:
+            return Response(
+                {"error": f"不支援批次更新的欄位：{', '.join(sorted(unsupported))}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = CustomerCreateUpdateSerializer(data=patch, partial=True)
+        serializer.is_valid(raise_exception=True)
+
+        updated, chunks = bulk_update_customers(
+            target, serializer.validated_data, user=request.user
+        )
+        return Response({"updated": updated, "chunks": chunks})
+
+    @action(detail=False, methods=["post"])
+    def bulk_tag(self, request) -> Response:
+        """
+        批次加上或移除標籤
+        {"ids": [1, 2]} 或 {"filter": {...}}，加上 {"add": "VIP"} 或 {"remove": "VIP"}
+        """
+        target, error = self._get_bulk_target(request.data)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        add_tag = str(request.data.get("add") or "").strip()
+        remove_tag = str(request.data.get("remove") or "").strip()
+        if bool(add_tag) == bool(remove_tag) or "," in add_tag + remove_tag:
+            return Response(
+                {"error": "必須提供 add 或 remove 其中之一 (單一標籤)"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if add_tag:
+            updated, chunks = bulk_add_tag(target, add_tag, user=request.user)
+        else:
+            updated, chunks = bulk_remove_tag(target, remove_tag, user=request.user)
+        return Response({"updated": updated, "chunks": chunks})
+
+    @action(detail=False, methods=["get"])
+    def interest_facets(self, request) -> Response:
+        """
+        各產品興趣類別的客戶數，套用與列表相同的篩選條件
+        例如 ?source=website 只統計來自網站的客戶
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response({"results": interest_facets(queryset)})
+
     @action(detail=True, methods=["get"])
-    def orders(self) -> Response:
+    def orders(self, request, pk=None) -> Response:
         customer = self.get_object()
-        orders = customer.orders.all()
+        # 每筆訂單內嵌的 customer_info 都是同一位客戶，一次 JOIN 取得客戶與統計
+        orders = customer.orders.select_related("customer__stats").prefetch_related(
+            "items"
+        )
         # Import here to avoid circular import
         from orders.serializers import OrderSerializer  # noqa: PLC0415
 
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(orders)
+        serializer = OrderSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=["get"])
-    def transactions(self) -> Response:
+    def transactions(self, request, pk=None) -> Response:
         customer = self.get_object()
-        transactions = customer.transactions.all()
+        transactions = customer.transactions.select_related("customer__stats", "order")
         # Import here to avoid circular import
         from transactions.serializers import TransactionSerializer  # noqa: PLC0415
 
-        serializer = TransactionSerializer(transactions, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(transactions)
+        serializer = TransactionSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=["get"])
+    def timeline(self, request, pk=None) -> Response:
+        """
+        客戶 360 時間軸：訂單、交易、客服工單與客服記錄依時間由新到舊合併
+
+        查詢參數：
+        - cursor：上一頁回傳的 next_cursor
+        - limit：每頁筆數 (預設 20，最多 100)
+        - types：只顯示指定種類，例如 types=order,ticket
+        """
+        customer = self.get_object()
+
+        try:
+            limit = int(request.query_params.get("limit", DEFAULT_LIMIT))
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        limit = min(max(limit, 1), MAX_LIMIT)
+
+        cursor = request.query_params.get("cursor")
+        try:
+            cursor = decode_cursor(cursor) if cursor else None
+        except InvalidCursor:
+            return Response(
+                {"error": "cursor 格式錯誤"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        kinds = request.query_params.get("types")
+        kinds = {kind.strip() for kind in kinds.split(",")} if kinds else None
+
+        events, next_cursor = get_customer_timeline(
+            customer.id, cursor=cursor, limit=limit, kinds=kinds
+        )
+
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), "cursor", next_cursor
+            )
+
+        return Response(
+            {"next": next_url, "next_cursor": next_cursor, "results": events}
+        )
+
+    @action(detail=True, methods=["get"])
+    def ledger(self, request, pk=None) -> Response:
+        """
+        客戶流水帳：已完成交易依時間排序，附上每筆之後的餘額 (基準幣別)
+        ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD，含分頁
+        """
+        # date_from / date_to 是流水帳的區間，不套用客戶列表的 CustomerFilter
+        customer = get_object_or_404(self.get_queryset(), pk=pk)
+        self.check_object_permissions(request, customer)
+        try:
+            date_from = request.query_params.get("date_from")
+            date_from = parse_day(date_from) if date_from else None
+            date_to = request.query_params.get("date_to")
+            date_to = parse_day(date_to, end=True) if date_to else None
+        except ValueError:
+            return Response(
+                {"error": "日期格式應為 YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        opening = balance_as_of(customer.id, date_from) if date_from else 0
+        page = self.paginate_queryset(running_ledger(customer.id, date_from, date_to))
+        for entry in page:
+            entry["balance"] = opening + entry.pop("running_total")
+
+        response = self.get_paginated_response(page)
+        response.data["base_currency"] = settings.BASE_CURRENCY
+        response.data["opening_balance"] = opening
+        response.data["closing_balance"] = balance_as_of(
+            customer.id, date_to or timezone.now()
+        )
+        return response
+
+    @action(detail=True, methods=["get"])
+    def balance(self, request, pk=None) -> Response:
+        """客戶在 ?as_of=YYYY-MM-DD 當天結束時的餘額，未指定時為目前餘額"""
+        customer = self.get_object()
+        as_of = request.query_params.get("as_of")
+        try:
+            at = parse_day(as_of, end=True) if as_of else timezone.now()
+        except ValueError:
+            return Response(
+                {"error": "as_of 格式應為 YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {
+                "customer": customer.id,
+                "as_of": as_of,
+                "balance": balance_as_of(customer.id, at),
+                "base_currency": settings.BASE_CURRENCY,
+            }
+        )
+
+    @action(detail=False, methods=["get"], url_path="ledger-balances")
+    def ledger_balances(self, request):
+        """
+        所有客戶在 ?as_of=YYYY-MM-DD 當天結束時的餘額 (CSV，?gzip=true 時壓縮)
+        依客戶 id 分批查詢並逐批輸出，不會一次載入所有客戶
+        """
+        as_of = request.query_params.get("as_of")
+        try:
+            at = parse_day(as_of, end=True) if as_of else timezone.now()
+        except ValueError:
+            return Response(
+                {"error": "as_of 格式應為 YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        field_names = ["customer_id", "email", f"balance_{settings.BASE_CURRENCY}"]
+        rows = (
+            dict(zip(field_names, row, strict=True)) for row in iter_balances_as_of(at)
+        )
+        return export_response(
+            request,
+            csv_lines(field_names, [rows]),
+            "csv",
+            f"ledger-balances-{as_of or timezone.localdate()}",
+        )
+
+
+class DuplicateCandidateViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    重複客戶審核：列出去重引擎找到的配對，合併或標記為非重複
+    配對由 find_duplicate_customers 指令產生
+    """
+
+    queryset = DuplicateCandidate.objects.select_related("customer_a", "customer_b")
+    serializer_class = DuplicateCandidateSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ["status"]
+    ordering_fields = ["score", "created_at"]
+    ordering = ["-score"]
+
+    @action(detail=True, methods=["post"])
+    def merge(self, request, pk=None) -> Response:
+        """
+        合併配對中的兩位客戶
+        可用 primary 指定保留的客戶，預設保留較早建立 (id 較小) 的一方
+        """
+        candidate = self.get_object()
+        pair = {candidate.customer_a_id: candidate.customer_a}
+        pair[candidate.customer_b_id] = candidate.customer_b
+
+        primary_id = request.data.get("primary", candidate.customer_a_id)
+        try:
+            primary = pair[int(primary_id)]
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {"error": "primary 必須是配對中的其中一位客戶"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        duplicates = [customer for customer in pair.values() if customer != primary]
+        primary = merge_customers(primary, duplicates, user=request.user)
+        return Response(CustomerSerializer(primary).data)
+
+    @action(detail=True, methods=["post"])
+    def dismiss(self, request, pk=None) -> Response:
+        """標記為非重複，之後重新偵測也不會再出現在待審核清單"""
+        candidate = self.get_object()
+        candidate.status = "dismissed"
+        candidate.reviewed_by = request.user
+        candidate.save(update_fields=["status", "reviewed_by", "updated_at"])
+        return Response(self.get_serializer(candidate).data)
+
+
+class SegmentViewSet(viewsets.ModelViewSet):
+    """
+    客戶分群：儲存篩選條件並快取成員
+    計數、成員分頁與分群間的集合運算都使用快取的成員 id，不重新執行篩選
+    """
+
+    queryset = Segment.objects.all()
+    serializer_class = SegmentSerializer
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    search_fields = ["name", "description"]
+    ordering_fields = ["name", "member_count", "created_at", "refreshed_at"]
+    ordering = ["name"]
+
+    def get_queryset(self):
+        # 成員陣列可能很大，只有需要成員的動作才讀取
+        queryset = super().get_queryset()
+        if self.action in {"list", "create", "update", "partial_update"}:
+            queryset = queryset.defer("member_ids")
+        return queryset
+
+    def perform_create(self, serializer) -> None:
+        segment = serializer.save(created_by=self.request.user)
+        refresh_segment(segment, full=True)
+
+    def perform_update(self, serializer) -> None:
+        previous_definition = serializer.instance.definition
+        segment = serializer.save()
+        # 條件改變後快取的成員已失效，需完整重建
+        if segment.definition != previous_definition:
+            refresh_segment(segment, full=True)
+
+    def _paginated_members(self, member_ids) -> Response:
+        page = self.paginate_queryset(member_ids)
+        page_ids = [int(customer_id) for customer_id in page]
+        customers = Customer.objects.filter(id__in=page_ids).select_related("stats")
+        customers = sorted(customers, key=lambda customer: customer.id)
+        serializer = CustomerSerializer(
+            customers, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=["get"])
+    def members(self, request, pk=None) -> Response:
+        """分群成員 (依客戶 id 排序，含分頁)"""
+        return self._paginated_members(self.get_object().members)
+
+    @action(detail=True, methods=["post"])
+    def refresh(self, request, pk=None) -> Response:
+        """更新分群成員；帶 full=true 時完整重建，否則只處理有異動的客戶"""
+        segment = self.get_object()
+        full = str(request.data.get("full", "")).lower() in {"1", "true"}
+        refresh_segment(segment, full=full)
+        return Response(self.get_serializer(segment).data)
+
+    @action(detail=False, methods=["get"])
+    def combine(self, request) -> Response:
+        """
+        分群集合運算
+        ?operation=union|intersection|difference&segments=1,2,3
+        依 segments 的順序運算，例如 difference 為 1 - 2 - 3
+        """
+        operation = request.query_params.get("operation", "union")
+        if operation not in SET_OPERATIONS:
+            return Response(
+                {"error": f"operation 必須是 {', '.join(SET_OPERATIONS)} 其中之一"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            segment_ids = [
+                int(segment_id)
+                for segment_id in request.query_params.get("segments", "").split(",")
+                if segment_id.strip()
+            ]
+        except ValueError:
+            segment_ids = []
+        segments = Segment.objects.in_bulk(segment_ids)
+        if not segment_ids or len(segments) != len(set(segment_ids)):
+            return Response(
+                {"error": "segments 必須是存在的分群 id，以逗號分隔"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        member_ids = combine_segments(
+            [segments[segment_id] for segment_id in segment_ids], operation
+        )
+        return self._paginated_members(member_ids)
@@ -0,0 +1,244 @@
+"""
+訂單批次匯入
+
+電商通路尖峰時一次推送大量訂單，逐筆 POST 每張訂單都要數次往返。
+批次匯入的流程：
+
+- 逐筆驗證欄位 (不查資料庫)，客戶是否存在以單一查詢一次確認
+- 冪等鍵 (idempotency_key) 已存在的訂單直接回傳既有結果，重送不會重複建立；
+  寫入時與其他請求衝突的那一組會回滾並逐筆重試，不影響同組的其他訂單
+- 每 BATCH_CHUNK_SIZE 筆為一個交易，以 bulk_create 寫入訂單與明細，
+  訂單編號與金額在 Python 端產生，不需要逐筆往返
+- bulk_create 不會觸發 post_save，狀態歷程在同一個交易內批次寫入，
+  交易完成後批次更新受影響客戶的統計
+- 待付款 / 處理中的訂單在同一個交易內一次預留整組訂單的庫存，
+  建立時已出貨 (shipped / delivered) 的訂單一併出庫並記錄 fulfilled 預留
+  (products/reservations.py 的 reserve_orders)，庫存不足的訂單不寫入
+"""
+
+from operator import itemgetter
+
+from customers.models import Customer
+from customers.stats import refresh_customer_stats
+from django.db import IntegrityError, transaction
+from products.reservations import (
+    FULFIL_STATUSES,
+    HOLD_STATUSES,
+    product_ids_for_skus,
+    record_fulfilments,
+    record_reservations,
+    requested_quantities,
+    reserve_orders,
+)
+from rest_framework import serializers
+
+from .models import Order, OrderItem, OrderStatusEvent, generate_order_number
+
+MAX_BATCH_SIZE = 5000
+BATCH_CHUNK_SIZE = 500
+
+
+class BatchOrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ["product_name", "product_sku", "quantity", "unit_price"]
+
+
+class BatchOrderSerializer(serializers.ModelSerializer):
+    # 以整數接收客戶 id，存在與否在批次層級一次查詢
+    customer = serializers.IntegerField(min_value=1)
+    items = BatchOrderItemSerializer(many=True)
+
+    class Meta:
+        model = Order
+        fields = [
+            "idempotency_key",
+            "customer",
+            "status",
+            "subtotal",
+            "tax_amount",
+            "shipping_amount",
+            "discount_amount",
+            "shipping_address",
+            "billing_address",
+            "notes",
+            "items",
+        ]
+        # 唯一性由批次流程處理，避免每筆各查一次
+        extra_kwargs = {"idempotency_key": {"validators": []}}
+
+
+def _result(index, status, order=None, errors=None):
+    result = {"index": index, "status": status}
+    if order is not None:
+        result |= {"id": order.id, "order_number": order.order_number}
+    if errors is not None:
+        result["errors"] = errors
+    return result
+
+
+def _validate(orders_data):
+    """回傳 (通過驗證的 [(index, 資料)], 未通過的結果)"""
+    valid, results = [], []
+    seen_keys = set()
+    for index, order_data in enumerate(orders_data):
+        serializer = BatchOrderSerializer(data=order_data)
+        if not serializer.is_valid():
+            results.append(_result(index, "invalid", errors=serializer.errors))
+            continue
+        key = serializer.validated_data.get("idempotency_key")
+        if key and key in seen_keys:
+            results.append(
+                _result(
+                    index,
+                    "invalid",
+                    errors={"idempotency_key": ["同一批次中的冪等鍵重複"]},
+                )
+            )
+            continue
+        if key:
+            seen_keys.add(key)
+        valid.append((index, serializer.validated_data))
+
+    customer_ids = {data["customer"] for _, data in valid}
+    existing_customers = set(
+        Customer.objects.filter(id__in=customer_ids).values_list("id", flat=True)
+    )
+    checked = []
+    for index, data in valid:
+        if data["customer"] in existing_customers:
+            checked.append((index, data))
+        else:
+            results.append(
+                _result(index, "invalid", errors={"customer": ["客戶不存在"]})
+            )
+    return checked, results
+
+
+def _build_order(data, user) -> tuple[Order, list]:
+    # 複製一份，寫入衝突時同一筆資料還會再建立一次
+    data = {**data}
+    items_data = data.pop("items")
+    # 空字串的冪等鍵視為未提供，避免觸發唯一限制
+    data["idempotency_key"] = data.get("idempotency_key") or None
+    order = Order(
+        customer_id=data.pop("customer"),
+        order_number=generate_order_number(),
+        created_by=user,
+        **data,
+    )
+    order.calculate_total()
+    items = [OrderItem(**item_data) for item_data in items_data]
+    for item in items:
+        item.total_price = item.quantity * item.unit_price
+    return order, items
+
+
+def _insert_chunk(chunk, user):
+    """單一交易寫入一組訂單與明細；庫存不足的訂單不寫入"""
+    built = [(index, *_build_order(data, user)) for index, data in chunk]
+    sku_map = product_ids_for_skus(
+        item.product_sku for _, _, items in built for item in items
+    )
+    requested, shipments = {}, {}
+    for index, order, items in built:
+        quantities = requested_quantities(items, sku_map)
+        if quantities and order.status in HOLD_STATUSES:
+            requested[index] = quantities
+        elif quantities and order.status in FULFIL_STATUSES:
+            shipments[index] = quantities
+
+    with transaction.atomic():
+        failures = (
+            reserve_orders(requested, shipments) if requested or shipments else {}
+        )
+        built = [entry for entry in built if entry[0] not in failures]
+        orders = Order.objects.bulk_create([order for _, order, _ in built])
+        items = []
+        for (_, _, order_items), order in zip(built, orders, strict=True):
+            for item in order_items:
+                item.order = order
+            items.extend(order_items)
+        OrderItem.objects.bulk_create(items, batch_size=BATCH_CHUNK_SIZE * 4)
+        OrderStatusEvent.objects.bulk_create(
+            OrderStatusEvent(
+                order=order,
+                to_status=order.status,
+                changed_at=order.order_date,
+                changed_by=user,
+            )
+            for order in orders
+        )
+        record_reservations(
+            (order, requested[index]) for index, order, _ in built if index in requested
+        )
+        record_fulfilments(
+            (order, shipments[index]) for index, order, _ in built if index in shipments
+        )
+
+    refresh_customer_stats({order.customer_id for order in orders})
+    return [_result(index, "created", order) for index, order, _ in built] + [
+        _result(index, "out_of_stock", errors={"items": [message]})
+        for index, message in failures.items()
+    ]
+
+
+def _existing_orders(entries) -> dict:
+    """{冪等鍵: 既有訂單}，只查詢 entries 中有提供冪等鍵的訂單"""
+    keys = [
+        data["idempotency_key"] for _, data in entries if data.get("idempotency_key")
+    ]
+    if not keys:
+        return {}
+    return {
+        order.idempotency_key: order
+        for order in Order.objects.filter(idempotency_key__in=keys).only(
+            "id", "order_number", "idempotency_key"
+        )
+    }
+
+
+def _insert_one(entry, user):
+    """整組寫入衝突後逐筆重試：冪等鍵已被其他請求寫入時回傳該筆訂單"""
+    index, data = entry
+    key = data.get("idempotency_key")
+    order = _existing_orders([entry]).get(key)
+    if order is None:
+        try:
+            return _insert_chunk([entry], user)
+        except IntegrityError:
+            order = _existing_orders([entry]).get(key)
+    if order is not None:
+        return [_result(index, "duplicate", order)]
+    return [_result(index, "conflict", errors={"detail": ["寫入衝突，請重新送出"]})]
+
+
+def ingest_orders(orders_data, user=None):
+    """
+    批次建立訂單，回傳依輸入順序排列的逐筆結果
+    status：created (新建)、duplicate (冪等鍵已存在)、invalid (驗證失敗)、
+    out_of_stock (庫存不足，未建立)、conflict (寫入時發生衝突，可直接重送)
+    """
+    valid, results = _validate(orders_data)
+
+    existing_orders = _existing_orders(valid)
+    pending = []
+    for index, data in valid:
+        order = existing_orders.get(data.get("idempotency_key"))
+        if order is not None:
+            results.append(_result(index, "duplicate", order))
+        else:
+            pending.append((index, data))
+
+    for start in range(0, len(pending), BATCH_CHUNK_SIZE):
+        chunk = pending[start : start + BATCH_CHUNK_SIZE]
+        try:
+            results.extend(_insert_chunk(chunk, user))
+        except IntegrityError:
+            # 其他請求同時寫入相同冪等鍵 (或訂單編號碰撞)，整組回滾後逐筆重試，
+            # 只有實際衝突的訂單會回報 duplicate / conflict
+            for entry in chunk:
+                results.extend(_insert_one(entry, user))
+
+    results.sort(key=itemgetter("index"))
+    return results
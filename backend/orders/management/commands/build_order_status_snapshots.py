@@ -0,0 +1,25 @@
+"""
+訂單狀態每日快照
+
+從最後一筆快照的隔天接續產生到今天為止的每日狀態分布，建議每日排程執行：
+
+    python manage.py build_order_status_snapshots
+    python manage.py build_order_status_snapshots --rebuild
+"""
+
+from django.core.management.base import BaseCommand
+
+from orders.status_history import build_snapshots
+
+
+class Command(BaseCommand):
+    help = "產生訂單狀態的每日快照 (OrderStatusSnapshot)，供時間點查詢使用"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--rebuild", action="store_true", help="清除所有快照後從頭重新產生"
+        )
+
+    def handle(self, *args, **options) -> None:
+        days = build_snapshots(rebuild=options["rebuild"])
+        self.stdout.write(self.style.SUCCESS(f"已產生 {days} 天的狀態快照"))
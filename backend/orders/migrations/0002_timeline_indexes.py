@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("orders", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="order",
+            name="orders_orde_custome_59b6fb_idx",
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["customer", "order_date", "id"],
+                name="orders_orde_custome_5f473d_idx",
+            ),
+        ),
+    ]
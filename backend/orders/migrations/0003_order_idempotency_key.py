@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("orders", "0002_timeline_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="idempotency_key",
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("orders", "0003_order_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderStatusEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "from_status",
+                    models.CharField(blank=True, default="", max_length=20),
+                ),
+                ("to_status", models.CharField(blank=True, default="", max_length=20)),
+                ("changed_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["changed_at", "id"],
+            },
+        ),
+        migrations.CreateModel(
+            name="OrderStatusSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("status", models.CharField(max_length=20)),
+                ("count", models.PositiveIntegerField()),
+            ],
+            options={
+                "ordering": ["day", "status"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="orderstatussnapshot",
+            constraint=models.UniqueConstraint(
+                fields=("day", "status"), name="unique_order_status_snapshot"
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderstatusevent",
+            name="changed_by",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="order_status_events",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderstatusevent",
+            name="order",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="status_events",
+                to="orders.order",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="orderstatusevent",
+            index=models.Index(
+                fields=["to_status", "changed_at"],
+                name="orders_orde_to_stat_cae076_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="orderstatusevent",
+            index=models.Index(
+                fields=["from_status", "changed_at"],
+                name="orders_orde_from_st_564e7f_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="orderstatusevent",
+            index=models.Index(
+                fields=["changed_at"], name="orders_orde_changed_1b3e6d_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="orderstatusevent",
+            index=models.Index(
+                fields=["order", "changed_at"], name="orders_orde_order_i_bc1322_idx"
+            ),
+        ),
+        # 既有訂單沒有狀態歷程，以下單時間寫入一筆「新建 → 目前狀態」的事件
+        migrations.RunSQL(
+            sql="""
+            INSERT INTO orders_orderstatusevent (
+                order_id, from_status, to_status, changed_at
+            )
+            SELECT id, '', status, order_date FROM orders_order
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:15
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("customers", "0007_customer_geo_codes"),
+        ("orders", "0004_order_status_history"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="order",
+            name="orders_orde_order_n_f3ada5_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="order",
+            name="orders_orde_order_d_d71205_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="orderitem",
+            name="orders_orde_order_i_5d347b_idx",
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="customer",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="orders",
+                to="customers.customer",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="idempotency_key",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="order_number",
+            field=models.CharField(editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=django.contrib.postgres.indexes.BrinIndex(
+                autosummarize=True, fields=["order_date"], name="order_date_brin"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="order",
+            constraint=models.UniqueConstraint(
+                fields=("order_number",), name="unique_order_number"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="order",
+            constraint=models.UniqueConstraint(
+                fields=("idempotency_key",), name="unique_order_idempotency_key"
+            ),
+        ),
+    ]
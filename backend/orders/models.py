@@ -2,7 +2,13 @@ import uuid
 
 from customers.models import Customer
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
+from django.utils import timezone
+
+
+def generate_order_number() -> str:
+    return f"ORD-{uuid.uuid4().hex[:8].upper()}"
 
 
 class Order(models.Model):
@@ -15,11 +21,12 @@ class Order(models.Model):
         ("refunded", "Refunded"),
     ]
 
-    order_number = models.CharField(
-        max_length=50, unique=True, editable=False
-    )  # 訂單編號，唯一且不可編輯
+    # 訂單編號，唯一且不可編輯；唯一性以 Meta.constraints 定義，
+    # 避免 unique=True 另外建立只供 LIKE 使用的 varchar_pattern_ops 索引
+    order_number = models.CharField(max_length=50, editable=False)
+    # (customer, order_date, id) 複合索引已涵蓋以客戶查詢，不另外建立外鍵索引
     customer = models.ForeignKey(
-        Customer, on_delete=models.CASCADE, related_name="orders"
+        Customer, on_delete=models.CASCADE, related_name="orders", db_index=False
     )
 
     status = models.CharField(max_length=20, choices=ORDER_STATUS, default="pending")
@@ -35,6 +42,8 @@ class Order(models.Model):
     billing_address = models.TextField(blank=True, null=True)
 
     notes = models.TextField(blank=True, null=True)
+    # 外部通路提供的冪等鍵，重送同一筆訂單時不會重複建立
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -55,18 +64,41 @@ class Order(models.Model):
 
     class Meta:
         ordering = ["-order_date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["order_number"], name="unique_order_number"
+            ),
+            models.UniqueConstraint(
+                fields=["idempotency_key"], name="unique_order_idempotency_key"
+            ),
+        ]
         indexes = [
-            models.Index(fields=["order_number"]),
-            models.Index(fields=["customer"]),
+            # 客戶訂單列表與時間軸依 (order_date, id) 由新到舊分頁
+            models.Index(fields=["customer", "order_date", "id"]),
             models.Index(fields=["status"]),
-            models.Index(fields=["order_date"]),
+            # order_date 與寫入順序一致，以 BRIN 取代 B-tree 做時間範圍篩選
+            BrinIndex(
+                fields=["order_date"], autosummarize=True, name="order_date_brin"
+            ),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 記錄載入時的客戶，改掛客戶時兩邊的客戶統計都要更新
+        instance._loaded_customer_id = instance.__dict__.get("customer_id")
+        # 記錄載入時的狀態，儲存時狀態有變才寫入狀態歷程
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
     def save(self, *args, **kwargs) -> None:
         if not self.order_number:
-            self.order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+            self.order_number = generate_order_number()
 
-        # Calculate total
+        self.calculate_total()
+        super().save(*args, **kwargs)
+
+    def calculate_total(self) -> None:
         self.total = (
             self.subtotal
             + self.tax_amount
@@ -74,8 +106,6 @@ class Order(models.Model):
             - self.discount_amount
         )
 
-        super().save(*args, **kwargs)
-
     def __str__(self) -> str:
         return f"Order {self.order_number} - {self.customer.full_name}"
 
@@ -92,8 +122,8 @@ class OrderItem(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
+        # order 已有外鍵索引，不重複建立
         indexes = [
-            models.Index(fields=["order"]),
             models.Index(fields=["product_sku"]),
         ]
 
@@ -103,3 +133,62 @@ class OrderItem(models.Model):
 
     def __str__(self) -> str:
         return f"{self.product_name} x {self.quantity} - {self.order.order_number}"
+
+
+class OrderStatusEvent(models.Model):
+    """
+    訂單狀態歷程 (只新增不修改)
+
+    每次狀態變更寫入一筆 from_status → to_status；新建訂單的 from_status 為空字串，
+    刪除訂單時寫入 to_status 為空字串的事件並保留歷程 (order 設為 NULL)。
+    任一時間點的狀態分布 = 當日快照 + 快照之後的事件增減，見 orders/status_history.py
+    """
+
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="status_events",
+    )
+    from_status = models.CharField(max_length=20, blank=True, default="")
+    to_status = models.CharField(max_length=20, blank=True, default="")
+    changed_at = models.DateTimeField(default=timezone.now)
+    changed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="order_status_events",
+    )
+
+    class Meta:
+        ordering = ["changed_at", "id"]
+        indexes = [
+            models.Index(fields=["to_status", "changed_at"]),
+            models.Index(fields=["from_status", "changed_at"]),
+            models.Index(fields=["changed_at"]),
+            models.Index(fields=["order", "changed_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.order_id}: {self.from_status or '-'} → {self.to_status or '-'}"
+
+
+class OrderStatusSnapshot(models.Model):
+    """每日 00:00 (當地時間) 的訂單狀態分布檢查點"""
+
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["day", "status"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "status"], name="unique_order_status_snapshot"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} {self.status}: {self.count}"
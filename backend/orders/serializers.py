@@ -1,10 +1,16 @@
-from customers.serializers import CustomerSerializer
+from decimal import Decimal
+
+from crm_backend.fieldsets import SparseFieldsetSerializerMixin
+from customers.serializers import CustomerBriefSerializer
+from django.db import transaction
+from django.utils import timezone
+from products.reservations import InsufficientStock, sync_order_reservations
 from rest_framework import serializers
 
 from .models import Order, OrderItem
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     unit_price = serializers.FloatField()
     total_price = serializers.FloatField(read_only=True)
 
@@ -23,8 +29,76 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ["total_price", "created_at", "updated_at"]
 
 
-class OrderSerializer(serializers.ModelSerializer):
-    customer_info = CustomerSerializer(source="customer", read_only=True)
+class OrderItemWriteSerializer(OrderItemSerializer):
+    """巢狀寫入用：可帶入既有明細的 id 以更新該筆明細"""
+
+    id = serializers.IntegerField(required=False)
+
+
+ITEM_DIFF_FIELDS = ["product_name", "product_sku", "quantity", "unit_price"]
+
+
+def _to_decimal(value) -> Decimal:
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _build_item(order, item_data) -> OrderItem:
+    """建立尚未寫入的明細；bulk 操作不會呼叫 save()，小計在此計算"""
+    item = OrderItem(order=order, **item_data)
+    item.unit_price = _to_decimal(item.unit_price)
+    item.total_price = item.quantity * item.unit_price
+    return item
+
+
+def _match_items(existing, items_data):
+    """
+    依 id 對應既有明細，沒有 id 時以 product_sku 對應尚未被使用的明細
+    回傳 [(既有明細或 None, 明細資料)]
+    """
+    by_id = {item.id: item for item in existing}
+    by_sku = {}
+    for item in existing:
+        if item.product_sku:
+            by_sku.setdefault(item.product_sku, []).append(item)
+
+    # 先處理有 id 的明細，避免同一筆被 SKU 對應搶走
+    matched = {}
+    for index, item_data in enumerate(items_data):
+        item_id = item_data.get("id")
+        if item_id is None:
+            continue
+        if item_id not in by_id:
+            raise serializers.ValidationError(
+                {"items": f"訂單明細 {item_id} 不屬於此訂單"}
+            )
+        if item_id in matched.values():
+            raise serializers.ValidationError({"items": f"訂單明細 {item_id} 重複"})
+        matched[index] = item_id
+
+    used = set(matched.values())
+    pairs = []
+    for index, item_data in enumerate(items_data):
+        item = by_id[matched[index]] if index in matched else None
+        if item is None and item_data.get("product_sku"):
+            candidates = by_sku.get(item_data["product_sku"], [])
+            item = next((c for c in candidates if c.id not in used), None)
+            if item is not None:
+                used.add(item.id)
+        pairs.append((item, item_data))
+    return pairs
+
+
+def _sync_reservations(order, previous_status, items) -> None:
+    try:
+        sync_order_reservations(order, previous_status, items)
+    except InsufficientStock as exc:
+        raise serializers.ValidationError({"items": [str(exc)]}) from exc
+
+
+class OrderSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = ("customer_info", "items")
+
+    customer_info = CustomerBriefSerializer(source="customer", read_only=True)
     items = OrderItemSerializer(many=True, read_only=True)
     subtotal = serializers.FloatField()
     tax_amount = serializers.FloatField()
@@ -57,7 +131,7 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 class OrderCreateUpdateSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True, required=False)
+    items = OrderItemWriteSerializer(many=True, required=False)
 
     class Meta:
         model = Order
@@ -76,25 +150,74 @@ class OrderCreateUpdateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         items_data = validated_data.pop("items", [])
-        order = Order.objects.create(**validated_data)
-
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
-
+        with transaction.atomic():
+            order = Order.objects.create(**validated_data)
+            items = OrderItem.objects.bulk_create(
+                _build_item(order, {**item_data, "id": None})
+                for item_data in items_data
+            )
+            # 最後才預留，縮短持有熱門商品庫存列鎖的時間
+            _sync_reservations(order, "", items)
         return order
 
     def update(self, instance, validated_data):
-        items_data = validated_data.pop("items", [])
+        items_data = validated_data.pop("items", None)
+
+        previous_status = instance.status
 
-        # Update order fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        with transaction.atomic():
+            # Update order fields
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
 
-        # Handle items if provided
-        if items_data:
-            instance.items.all().delete()
-            for item_data in items_data:
-                OrderItem.objects.create(order=instance, **item_data)
+            # 有帶 items 時才同步明細
+            if items_data is not None:
+                self._sync_items(instance, items_data)
+
+            if items_data is not None or instance.status != previous_status:
+                _sync_reservations(
+                    instance,
+                    previous_status,
+                    OrderItem.objects.filter(order=instance),
+                )
 
         return instance
+
+    def _sync_items(self, order, items_data) -> None:
+        """
+        比對既有明細：只更新有變動的、新增沒有對應的、刪除未出現的
+        未變動的明細保留原本的 id 與 updated_at
+        """
+        existing = list(order.items.all())
+        now = timezone.now()
+        to_create, to_update, kept = [], [], set()
+
+        for item, raw_data in _match_items(existing, items_data):
+            item_data = {k: v for k, v in raw_data.items() if k != "id"}
+            if item is None:
+                to_create.append(_build_item(order, item_data))
+                continue
+
+            kept.add(item.id)
+            new_values = {
+                field: _to_decimal(value) if field == "unit_price" else value
+                for field, value in item_data.items()
+            }
+            if all(getattr(item, field) == new_values[field] for field in new_values):
+                continue
+            for field, value in new_values.items():
+                setattr(item, field, value)
+            item.total_price = item.quantity * item.unit_price
+            item.updated_at = now
+            to_update.append(item)
+
+        removed = [item.id for item in existing if item.id not in kept]
+        if removed:
+            OrderItem.objects.filter(id__in=removed).delete()
+        if to_update:
+            OrderItem.objects.bulk_update(
+                to_update, [*ITEM_DIFF_FIELDS, "total_price", "updated_at"]
+            )
+        if to_create:
+            OrderItem.objects.bulk_create(to_create)
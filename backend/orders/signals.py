@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from products.reservations import release_order
+
+from .models import Order, OrderStatusEvent
+
+
+@receiver(post_save, sender=Order)
+def record_status_change(sender, instance, created, **kwargs) -> None:
+    previous = "" if created else getattr(instance, "_loaded_status", None)
+    # 未經 from_db 載入 (例如手動建構後 save) 時無法得知原狀態，不寫入事件
+    if previous is None or previous == instance.status:
+        return
+    OrderStatusEvent.objects.create(
+        order=instance,
+        from_status=previous,
+        to_status=instance.status,
+        changed_by_id=instance.updated_by_id or instance.created_by_id,
+    )
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Order)
+def record_order_removed(sender, instance, **kwargs) -> None:
+    # 刪除也是一次狀態變更，as-of 查詢才不會把已刪除的訂單一直算在原狀態
+    OrderStatusEvent.objects.create(from_status=instance.status)
+
+
+@receiver(pre_delete, sender=Order)
+def release_reservations(sender, instance, **kwargs) -> None:
+    # 預留紀錄會隨訂單一起刪除，先把預留的庫存歸還
+    release_order(instance)
@@ -0,0 +1,140 @@
+"""
+訂單狀態的時間點查詢 (as-of)
+
+OrderStatusEvent 只新增不修改，每筆事件代表 from_status 減一、to_status 加一。
+任一時間點 t 的狀態分布 = t 之前最近一天的每日快照 + 快照之後到 t 為止的事件增減：
+
+- 每日快照 (OrderStatusSnapshot) 由 build_order_status_snapshots 指令每日產生
+- 事件增減以 (to_status / from_status, changed_at) 索引做兩次 GROUP BY 取得
+- 連續多個時間點 (趨勢圖) 只需一次快照查詢與一組依日期分組的增減查詢
+"""
+
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import OrderStatusEvent, OrderStatusSnapshot
+
+
+def _day_start(day) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _events_between(start, end):
+    events = OrderStatusEvent.objects.all()
+    if start is not None:
+        events = events.filter(changed_at__gte=start)
+    return events.filter(changed_at__lt=end)
+
+
+def _grouped_deltas(events, *group_by) -> Counter:
+    """依 group_by 與狀態加總的增減；group_by 為空時 key 為 None"""
+    rows = events.values(*group_by, "from_status", "to_status").annotate(
+        count=Count("id")
+    )
+    deltas = Counter()
+    for row in rows.order_by():
+        group = row[group_by[0]] if group_by else None
+        if row["to_status"]:
+            deltas[group, row["to_status"]] += row["count"]
+        if row["from_status"]:
+            deltas[group, row["from_status"]] -= row["count"]
+    return deltas
+
+
+def _checkpoint(at):
+    """at 之前最近的快照，回傳 (快照日期, 狀態分布)；沒有快照時為 (None, 空分布)"""
+    day = OrderStatusSnapshot.objects.filter(day__lte=timezone.localdate(at)).aggregate(
+        day=Max("day")
+    )["day"]
+    if day is None:
+        return None, Counter()
+    snapshot = OrderStatusSnapshot.objects.filter(day=day).values_list(
+        "status", "count"
+    )
+    return day, Counter(dict(snapshot))
+
+
+def _clean(counter) -> dict[str, int]:
+    return {status: count for status, count in sorted(counter.items()) if count}
+
+
+def status_distribution_as_of(at) -> dict[str, int]:
+    """at 這個時間點各狀態的訂單數"""
+    day, counts = _checkpoint(at)
+    start = _day_start(day) if day else None
+    for (_, status), delta in _grouped_deltas(_events_between(start, at)).items():
+        counts[status] += delta
+    return _clean(counts)
+
+
+def status_distribution_series(points) -> list[dict[str, int]]:
+    """
+    多個時間點 (由舊到新、皆為當地日期的 00:00) 的狀態分布
+    第一個時間點以快照計算，之後以依日期分組的事件增減累加
+    """
+    if not points:
+        return []
+
+    counts = Counter(status_distribution_as_of(points[0]))
+    series = [_clean(counts)]
+    daily = _grouped_deltas(
+        _events_between(points[0], points[-1])
+        .annotate(day=TruncDate("changed_at"))
+        .order_by(),
+        "day",
+    )
+
+    # 每天的增減歸入所屬的區間 [points[i], points[i + 1])
+    buckets = [Counter() for _ in points[1:]]
+    for (day, status), delta in daily.items():
+        index = bisect_right(points, _day_start(day)) - 1
+        buckets[index][status] += delta
+
+    for bucket in buckets:
+        counts.update(bucket)
+        series.append(_clean(counts))
+    return series
+
+
+def build_snapshots(until=None, rebuild=False) -> int:
+    """
+    產生到 until (預設今天) 為止的每日快照，從最後一筆快照的隔天接續
+    rebuild 時清除所有快照，從第一筆事件的日期重新產生
+    回傳新增的快照天數
+    """
+    until = until or timezone.localdate()
+    with transaction.atomic():
+        if rebuild:
+            OrderStatusSnapshot.objects.all().delete()
+
+        last_day = OrderStatusSnapshot.objects.aggregate(day=Max("day"))["day"]
+        if last_day is not None:
+            start = last_day + timedelta(days=1)
+        else:
+            first_event = OrderStatusEvent.objects.order_by("changed_at").first()
+            if first_event is None:
+                return 0
+            start = timezone.localdate(first_event.changed_at)
+        if start > until:
+            return 0
+
+        days = [
+            start + timedelta(days=offset) for offset in range((until - start).days + 1)
+        ]
+        series = status_distribution_series([_day_start(day) for day in days])
+        OrderStatusSnapshot.objects.bulk_create(
+            [
+                OrderStatusSnapshot(day=day, status=status, count=count)
+                for day, distribution in zip(days, series, strict=True)
+                for status, count in distribution.items()
+                if count > 0
+            ],
+            batch_size=5000,
+        )
+    return len(days)
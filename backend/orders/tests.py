@@ -1 +1,233 @@
-# Create your tests here.
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from customers.models import Customer
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import batch
+from .models import Order, OrderItem, OrderStatusEvent, OrderStatusSnapshot
+from .status_history import (
+    build_snapshots,
+    status_distribution_as_of,
+    status_distribution_series,
+)
+from .views import OrderViewSet
+
+
+def _batch_order(customer, key):
+    return {
+        "idempotency_key": key,
+        "customer": customer.id,
+        "status": "delivered",
+        "subtotal": "10.00",
+        "items": [
+            {
+                "product_name": "商品",
+                "product_sku": "SKU-1",
+                "quantity": 1,
+                "unit_price": "10.00",
+            }
+        ],
+    }
+
+
+class IngestOrdersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name="Test", last_name="User", email="batch@example.com"
+        )
+
+    def test_existing_key_is_duplicate(self):
+        [created] = batch.ingest_orders([_batch_order(self.customer, "k1")])
+        [duplicate] = batch.ingest_orders([_batch_order(self.customer, "k1")])
+        self.assertEqual(created["status"], "created")
+        self.assertEqual(duplicate["status"], "duplicate")
+        self.assertEqual(duplicate["id"], created["id"])
+
+    def test_conflict_only_affects_colliding_order(self):
+        [existing] = batch.ingest_orders([_batch_order(self.customer, "k2")])
+        # 模擬其他請求在預先查詢冪等鍵之後才寫入 k2
+        real = batch._existing_orders
+        with mock.patch.object(batch, "_existing_orders") as existing_orders:
+            existing_orders.side_effect = lambda entries: (
+                {} if existing_orders.call_count == 1 else real(entries)
+            )
+            results = batch.ingest_orders(
+                [_batch_order(self.customer, key) for key in ("k1", "k2", "k3")]
+            )
+
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["created", "duplicate", "created"],
+        )
+        self.assertEqual(results[1]["id"], existing["id"])
+        self.assertEqual(Order.objects.count(), 3)
+
+
+class OrderListQueryTests(TestCase):
+    """列表的查詢數固定，與每頁筆數無關"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("orders")
+        customers = [
+            Customer.objects.create(
+                first_name="Test", last_name=str(i), email=f"orders{i}@example.com"
+            )
+            for i in range(5)
+        ]
+        for i in range(30):
+            order = Order.objects.create(
+                customer=customers[i % len(customers)],
+                status="delivered",
+                subtotal=Decimal("10.00"),
+                total=Decimal("10.00"),
+            )
+            OrderItem.objects.create(
+                order=order,
+                product_name="商品",
+                product_sku=f"SKU-{i}",
+                quantity=1,
+                unit_price=Decimal("10.00"),
+                total_price=Decimal("10.00"),
+            )
+
+    def _list(self, limit):
+        request = APIRequestFactory().get("/api/orders/", {"limit": limit})
+        force_authenticate(request, self.user)
+        response = OrderViewSet.as_view({"get": "list"})(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        # 總筆數、訂單 (含客戶統計)、訂單明細
+        for limit in (5, 25):
+            with self.subTest(limit=limit), self.assertNumQueries(3):
+                results = self._list(limit)
+            self.assertEqual(len(results), limit)
+            self.assertIn("total_orders", results[0]["customer_info"])
+
+
+class StatusHistoryTests(TestCase):
+    """快照 + 事件增減的結果，要與只用事件重算的結果一致"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Test", last_name="User", email="history@example.com"
+        )
+        self.day = timezone.localdate() - timedelta(days=10)
+        # 第 0 天建立 a、b；第 1 天 a 確認；第 2 天 b 出貨、建立 c；第 3 天刪除 c
+        self.a = self._create(self._at(0, 10))
+        self.b = self._create(self._at(0, 11))
+        self._set_status(self.a, "confirmed", self._at(1, 12))
+        self._set_status(self.b, "shipped", self._at(2, 9))
+        self.c = self._create(self._at(2, 15))
+        self.c.delete()
+        self._move_last_event(self._at(3, 10))
+
+    def _at(self, offset, hour=0):
+        day = self.day + timedelta(days=offset)
+        return timezone.make_aware(datetime.combine(day, time(hour)))
+
+    def _move_last_event(self, at):
+        event = OrderStatusEvent.objects.latest("id")
+        OrderStatusEvent.objects.filter(pk=event.pk).update(changed_at=at)
+
+    def _create(self, at):
+        order = Order.objects.create(
+            customer=self.customer, subtotal=Decimal("1.00"), total=Decimal("1.00")
+        )
+        self._move_last_event(at)
+        return order
+
+    def _set_status(self, order, status, at):
+        order.status = status
+        order.save()
+        self._move_last_event(at)
+
+    def _points(self):
+        return [
+            self._at(1),  # 快照邊界
+            self._at(2),
+            self._at(2, 12),  # 兩個快照之間
+            self._at(3, 9),  # 最後一個快照之後、刪除之前
+            self._at(3, 12),  # 刪除之後
+            self._at(5),
+        ]
+
+    def test_matches_event_replay_at_and_between_snapshots(self):
+        self.assertFalse(OrderStatusSnapshot.objects.exists())
+        replayed = [status_distribution_as_of(at) for at in self._points()]
+        self.assertEqual(
+            replayed,
+            [
+                {"pending": 2},
+                {"confirmed": 1, "pending": 1},
+                {"confirmed": 1, "shipped": 1},
+                {"confirmed": 1, "pending": 1, "shipped": 1},
+                {"confirmed": 1, "shipped": 1},
+                {"confirmed": 1, "shipped": 1},
+            ],
+        )
+
+        self.assertEqual(build_snapshots(until=self.day + timedelta(days=2)), 3)
+        self.assertEqual(
+            dict(
+                OrderStatusSnapshot.objects.filter(
+                    day=self.day + timedelta(days=2)
+                ).values_list("status", "count")
+            ),
+            {"confirmed": 1, "pending": 1},
+        )
+        self.assertEqual(
+            [status_distribution_as_of(at) for at in self._points()], replayed
+        )
+
+    def test_deleted_order_leaves_its_status(self):
+        deleted = OrderStatusEvent.objects.get(order__isnull=True, to_status="")
+        self.assertEqual(deleted.from_status, "pending")
+        # c 的建立事件保留，訂單設為 NULL
+        self.assertEqual(OrderStatusEvent.objects.filter(order__isnull=True).count(), 2)
+
+        build_snapshots(until=self.day + timedelta(days=4))
+        self.assertFalse(
+            OrderStatusSnapshot.objects.filter(
+                day=self.day + timedelta(days=4), status="pending"
+            ).exists()
+        )
+        self.assertEqual(
+            status_distribution_as_of(self._at(4)), {"confirmed": 1, "shipped": 1}
+        )
+
+    def test_incremental_snapshots_match_rebuild(self):
+        build_snapshots(until=self.day + timedelta(days=1))
+        self.assertEqual(build_snapshots(until=self.day + timedelta(days=4)), 3)
+        incremental = list(
+            OrderStatusSnapshot.objects.values_list("day", "status", "count")
+        )
+        self.assertEqual(build_snapshots(until=self.day + timedelta(days=4)), 0)
+
+        build_snapshots(until=self.day + timedelta(days=4), rebuild=True)
+        self.assertEqual(
+            list(OrderStatusSnapshot.objects.values_list("day", "status", "count")),
+            incremental,
+        )
+
+    def test_series_matches_point_queries(self):
+        points = [self._at(offset) for offset in range(6)]
+        expected = [status_distribution_as_of(at) for at in points]
+        build_snapshots(until=self.day + timedelta(days=2))
+        self.assertEqual(status_distribution_series(points), expected)
+        self.assertEqual(
+            expected[1:4],
+            [
+                {"pending": 2},
+                {"confirmed": 1, "pending": 1},
+                {"confirmed": 1, "pending": 1, "shipped": 1},
+            ],
+        )
@@ -1,6 +1,11 @@
+from crm_backend.export import StreamingExportMixin
+from crm_backend.fieldsets import SparseFieldsetViewSetMixin
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, viewsets
+from rest_framework import filters, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
+from .batch import MAX_BATCH_SIZE, ingest_orders
 from .models import Order, OrderItem
 from .serializers import (
     OrderCreateUpdateSerializer,
@@ -9,8 +14,10 @@ from .serializers import (
 )
 
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.select_related("customer").prefetch_related("items")
+class OrderViewSet(
+    StreamingExportMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet
+):
+    queryset = Order.objects.select_related("customer__stats").prefetch_related("items")
     filter_backends = [
         DjangoFilterBackend,
         filters.SearchFilter,
@@ -24,7 +31,10 @@ class OrderViewSet(viewsets.ModelViewSet):
         "customer__email",
     ]
     ordering_fields = ["order_number", "order_date", "total", "status"]
-    ordering = ["-order_date"]
+    # order_date 改為 BRIN 索引後無法提供排序，預設依同樣遞增的主鍵排序
+    ordering = ["-id"]
+    sparse_select_related = {"customer_info": ("customer__stats",)}
+    sparse_prefetch_related = {"items": ("items",)}
 
     def get_serializer_class(self):
         if self.action in {"create", "update", "partial_update"}:
@@ -37,8 +47,33 @@ class OrderViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer) -> None:
         serializer.save(updated_by=self.request.user)
 
+    @action(detail=False, methods=["post"])
+    def batch(self, request) -> Response:
+        """
+        批次建立訂單
+        {"orders": [{"idempotency_key": "...", "customer": 1, ..., "items": [...]}]}
+        回傳逐筆結果，部分失敗不影響其他訂單
+        """
+        orders = request.data.get("orders")
+        if not isinstance(orders, list) or not orders:
+            return Response(
+                {"error": "orders 必須是訂單陣列"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(orders) > MAX_BATCH_SIZE:
+            return Response(
+                {"error": f"單次最多 {MAX_BATCH_SIZE} 筆訂單"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-class OrderItemViewSet(viewsets.ModelViewSet):
+        results = ingest_orders(orders, request.user)
+        summary = {}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+        return Response({"summary": summary, "results": results})
+
+
+class OrderItemViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = OrderItem.objects.select_related("order")
     serializer_class = OrderItemSerializer
     filter_backends = [
@@ -4,10 +4,12 @@ from .models import (
     Brand,
     Category,
     Inventory,
+    InventoryCheckpoint,
     PriceHistory,
     Product,
     ProductVariant,
     StockMovement,
+    StockReservation,
     Supplier,
 )
 
@@ -160,6 +162,31 @@ class InventoryAdmin(admin.ModelAdmin):
     is_low_stock.boolean = True
 
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = (
+        "order",
+        "product",
+        "quantity",
+        "status",
+        "expires_at",
+        "created_at",
+    )
+    list_filter = ("status", "created_at")
+    search_fields = ("product__name", "product__sku", "order__order_number")
+    raw_id_fields = ("order", "product")
+    ordering = ("-created_at",)
+
+
+@admin.register(InventoryCheckpoint)
+class InventoryCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("product", "as_of", "quantity_on_hand", "created_at")
+    list_filter = ("as_of",)
+    search_fields = ("product__name", "product__sku")
+    raw_id_fields = ("product",)
+    ordering = ("-as_of", "product")
+
+
 @admin.register(StockMovement)
 class StockMovementAdmin(admin.ModelAdmin):
     list_display = (
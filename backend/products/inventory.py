@@ -0,0 +1,175 @@
+"""
+庫存異動服務
+
+所有庫存數量的變更都經由這裡，異動記錄與庫存更新在同一個交易中完成：
+
+- 單筆異動以條件式 UPDATE (quantity_on_hand = quantity_on_hand ± n WHERE 庫存足夠)
+  在資料庫上計算，並發異動不會互相覆蓋；條件不成立時整筆回滾
+- 批次異動以 SELECT ... FOR UPDATE 鎖定相關庫存 (依 product_id 排序，與訂單預留
+  相同的鎖定順序，避免死結)，依序套用後以 bulk_update / bulk_create 寫回，
+  查詢數與筆數無關
+
+異動記錄只新增不修改，是庫存數量的依據；異動時間在取得庫存列的鎖之後才產生，
+依 created_at 重播的順序與實際套用的順序一致。
+
+異動規則：
+
+- inbound：入庫，數量須大於 0
+- outbound：出庫，數量須大於 0，且不超過可用庫存 (現有 - 已預留)
+- adjustment：調整，數量可正可負 (不可為 0)，調整後現有庫存不可小於 0
+- stocktake：盤點，數量為盤點後的實際庫存 (不可小於 0)
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Inventory, StockMovement
+from .stats import invalidate_product_stats
+
+# 產品尚無庫存資料時，這些異動會自動建立庫存
+CREATING_TYPES = ("inbound", "adjustment", "stocktake")
+MAX_BATCH_SIZE = 1000
+
+
+class InventoryError(ValueError):
+    """異動數量不合法或庫存不足"""
+
+
+def _validate_quantity(movement_type, quantity) -> None:
+    if movement_type in ("inbound", "outbound") and quantity <= 0:
+        raise InventoryError("入庫 / 出庫數量必須大於 0")
+    if movement_type == "adjustment" and quantity == 0:
+        raise InventoryError("調整數量不可為 0")
+    if movement_type == "stocktake" and quantity < 0:
+        raise InventoryError("盤點數量不可小於 0")
+
+
+def _conditional_update(movement_type, quantity) -> tuple[dict, dict]:
+    """回傳單筆異動的 (UPDATE 條件, UPDATE 欄位)"""
+    if movement_type == "inbound":
+        return {}, {"quantity_on_hand": F("quantity_on_hand") + quantity}
+    if movement_type == "outbound":
+        return (
+            {"quantity_on_hand__gte": F("quantity_reserved") + quantity},
+            {"quantity_on_hand": F("quantity_on_hand") - quantity},
+        )
+    if movement_type == "adjustment":
+        return (
+            {"quantity_on_hand__gte": -quantity},
+            {"quantity_on_hand": F("quantity_on_hand") + quantity},
+        )
+    return {}, {"quantity_on_hand": quantity}
+
+
+def _next_quantity(inventory, movement_type, quantity) -> int:
+    """批次異動在 Python 中套用的規則，與 _conditional_update 相同"""
+    on_hand = inventory.quantity_on_hand
+    if movement_type == "inbound":
+        return on_hand + quantity
+    if movement_type == "outbound":
+        if on_hand - inventory.quantity_reserved < quantity:
+            raise InventoryError(
+                f"可用庫存不足 (可用 {inventory.quantity_available}，出庫 {quantity})"
+            )
+        return on_hand - quantity
+    if movement_type == "adjustment":
+        if on_hand + quantity < 0:
+            raise InventoryError(f"調整後庫存小於 0 (現有 {on_hand}，調整 {quantity})")
+        return on_hand + quantity
+    return quantity
+
+
+def _ensure_inventories(product_ids) -> None:
+    """為尚無庫存資料的產品建立庫存 (並發建立時以唯一鍵忽略重複)"""
+    Inventory.objects.bulk_create(
+        [Inventory(product_id=product_id) for product_id in product_ids],
+        ignore_conflicts=True,
+    )
+
+
+def apply_movement(movement: StockMovement) -> StockMovement:
+    """
+    套用一筆尚未儲存的異動並寫入異動記錄
+    庫存不足或數量不合法時拋出 InventoryError，不會留下任何變更
+    """
+    _validate_quantity(movement.movement_type, movement.quantity)
+    conditions, changes = _conditional_update(movement.movement_type, movement.quantity)
+    inventory = Inventory.objects.filter(product_id=movement.product_id, **conditions)
+
+    with transaction.atomic():
+        updated = inventory.update(**changes, last_updated=timezone.now())
+        if not updated and movement.movement_type in CREATING_TYPES:
+            _ensure_inventories([movement.product_id])
+            updated = inventory.update(**changes, last_updated=timezone.now())
+        if not updated:
+            raise InventoryError("庫存不足或尚無庫存資料")
+        movement.save()
+        invalidate_product_stats()
+    return movement
+
+
+def save_inventory(serializer, **kwargs) -> Inventory:
+    """
+    以 InventorySerializer 建立 / 修改庫存；新建或直接修改現有庫存時同時寫入盤點異動，
+    異動記錄才能重播出相同的數量 (見 products/stock_ledger.py)
+    """
+    instance = serializer.instance
+    with transaction.atomic():
+        previous = None
+        if instance is not None and instance.pk is not None:
+            # 鎖定後才讀取原數量，之後的異動時間必定晚於這筆盤點
+            previous = (
+                Inventory.objects.select_for_update()
+                .values_list("quantity_on_hand", flat=True)
+                .get(pk=instance.pk)
+            )
+        inventory = serializer.save(**kwargs)
+        if previous is None or inventory.quantity_on_hand != previous:
+            StockMovement.objects.create(
+                product_id=inventory.product_id,
+                movement_type="stocktake",
+                quantity=inventory.quantity_on_hand,
+                reference_type="stocktake",
+                notes="直接修改庫存數量",
+            )
+    return inventory
+
+
+def apply_movements(movements) -> list[StockMovement]:
+    """
+    依序套用多筆尚未儲存的異動，全部成功才寫入
+    任一筆不合法時拋出 InventoryError (訊息含該筆的序號)，不會留下任何變更
+    """
+    for index, movement in enumerate(movements, start=1):
+        try:
+            _validate_quantity(movement.movement_type, movement.quantity)
+        except InventoryError as exc:
+            raise InventoryError(f"第 {index} 筆：{exc}") from exc
+
+    product_ids = sorted({movement.product_id for movement in movements})
+    with transaction.atomic():
+        _ensure_inventories(product_ids)
+        inventories = {
+            inventory.product_id: inventory
+            for inventory in Inventory.objects.select_for_update()
+            .filter(product_id__in=product_ids)
+            .order_by("product_id")
+        }
+        for index, movement in enumerate(movements, start=1):
+            inventory = inventories[movement.product_id]
+            try:
+                inventory.quantity_on_hand = _next_quantity(
+                    inventory, movement.movement_type, movement.quantity
+                )
+            except InventoryError as exc:
+                raise InventoryError(f"第 {index} 筆：{exc}") from exc
+
+        now = timezone.now()
+        for inventory in inventories.values():
+            inventory.last_updated = now
+        Inventory.objects.bulk_update(
+            inventories.values(), ["quantity_on_hand", "last_updated"]
+        )
+        invalidate_product_stats()
+        return StockMovement.objects.bulk_create(movements)
@@ -0,0 +1,166 @@
+"""
+訂單庫存預留的並發吞吐量基準測試
+
+建立暫時的熱門商品 (庫存 --stock)，多個行程 (各自一個資料庫連線與客戶) 同時以
+訂單 API 相同的流程 (OrderCreateUpdateSerializer) 下單搶購同一個 SKU，回報每秒
+建立的訂單數與延遲，並檢查沒有超賣：成功的訂單數量加總 = 已預留數量 <= 庫存。
+
+    python manage.py benchmark_reservations --workers 16 --orders 50 --stock 500
+
+測試用的客戶、訂單與商品在結束時刪除；訂單狀態歷程會留下成對的建立 / 刪除事件，
+對各時間點的狀態分布沒有影響。
+"""
+
+import multiprocessing
+import statistics
+import time
+
+from customers.models import Customer
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from orders.serializers import OrderCreateUpdateSerializer
+from rest_framework import serializers
+
+from products.models import Inventory, Product, StockReservation
+
+
+def _worker(barrier, queue, customer_id, product, options) -> None:
+    """子行程：連續建立 --orders 筆訂單，回傳每筆的耗時"""
+    results = {"created": [], "rejected": [], "errors": []}
+    data = {
+        "customer": customer_id,
+        "subtotal": options["quantity"],
+        "items": [
+            {
+                "product_name": product.name,
+                "product_sku": product.sku,
+                "quantity": options["quantity"],
+                "unit_price": 1,
+            }
+        ],
+    }
+    try:
+        barrier.wait()
+        for _ in range(options["orders"]):
+            started = time.perf_counter()
+            serializer = OrderCreateUpdateSerializer(data=data)
+            serializer.is_valid(raise_exception=True)
+            try:
+                serializer.save()
+            except serializers.ValidationError:
+                results["rejected"].append(time.perf_counter() - started)
+            else:
+                results["created"].append(time.perf_counter() - started)
+    except Exception as exc:  # noqa: BLE001 - 回報給主行程
+        results["errors"].append(repr(exc))
+    finally:
+        connection.close()
+        queue.put(results)
+
+
+class Command(BaseCommand):
+    help = "多個行程同時下單搶購同一個 SKU，測試庫存預留的吞吐量並檢查沒有超賣"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--workers", type=int, default=16, help="行程數")
+        parser.add_argument(
+            "--orders", type=int, default=50, help="每個行程建立的訂單數"
+        )
+        parser.add_argument("--stock", type=int, default=500, help="熱門商品的庫存")
+        parser.add_argument("--quantity", type=int, default=1, help="每筆訂單的數量")
+
+    def handle(self, *args, **options) -> None:
+        if options["workers"] < 2:
+            raise CommandError("--workers 至少為 2")
+
+        suffix = f"{time.time_ns()}"
+        product = Product.objects.create(
+            name="搶購測試商品",
+            sku=f"BENCH-HOT-{suffix}",
+            base_price=1,
+            cost_price=0,
+        )
+        Inventory.objects.create(product=product, quantity_on_hand=options["stock"])
+        # 每個行程一個客戶，避免客戶統計的更新互相等待而掩蓋庫存列的競爭
+        customers = Customer.objects.bulk_create(
+            Customer(
+                first_name="Bench",
+                last_name=str(number),
+                email=f"bench-{suffix}-{number}@example.com",
+            )
+            for number in range(options["workers"])
+        )
+
+        try:
+            results, seconds = self._run(product, customers, options)
+            self._report(product, results, seconds, options)
+        finally:
+            Customer.objects.filter(id__in=[c.id for c in customers]).delete()
+            product.delete()
+
+    def _run(self, product, customers, options):
+        # 以多個行程執行，避免 GIL 讓序列化等 Python 端的工作成為瓶頸；
+        # fork 前關閉連線，子行程各自建立新的資料庫連線
+        connection.close()
+        context = multiprocessing.get_context("fork")
+        barrier = context.Barrier(len(customers))
+        queue = context.Queue()
+        workers = [
+            context.Process(
+                target=_worker,
+                args=(barrier, queue, customer.id, product, options),
+            )
+            for customer in customers
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        results = {"created": [], "rejected": [], "errors": []}
+        for _ in workers:
+            for key, values in queue.get().items():
+                results[key] += values
+        seconds = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+
+        if results["errors"]:
+            raise CommandError(f"子行程發生錯誤：{results['errors'][0]}")
+        return results, seconds
+
+    def _report(self, product, results, seconds, options) -> None:
+        created, rejected = results["created"], results["rejected"]
+        attempts = len(created) + len(rejected)
+        self.stdout.write(
+            f"{options['workers']} 個行程共 {attempts} 筆訂單，{seconds:.2f} 秒 "
+            f"({attempts / seconds:,.0f} 筆/秒)"
+        )
+        for label, timings in (("成功", created), ("庫存不足", rejected)):
+            if timings:
+                timings = sorted(timings)
+                p95 = timings[int(len(timings) * 0.95) - 1] * 1000
+                self.stdout.write(
+                    f"{label} {len(timings)} 筆：中位數 "
+                    f"{statistics.median(timings) * 1000:.1f} ms，p95 {p95:.1f} ms"
+                )
+
+        inventory = Inventory.objects.get(product=product)
+        reserved = (
+            StockReservation.objects.filter(product=product, status="active").aggregate(
+                total=Sum("quantity")
+            )["total"]
+            or 0
+        )
+        expected = len(created) * options["quantity"]
+        possible = options["stock"] // options["quantity"]
+        self.stdout.write(
+            f"庫存 {inventory.quantity_on_hand}，已預留 {inventory.quantity_reserved}，"
+            f"預留紀錄 {reserved}，成功訂單數量 {expected}"
+        )
+        if not (
+            inventory.quantity_reserved == reserved == expected
+            and expected <= options["stock"]
+            and len(created) == min(attempts, possible)
+        ):
+            raise CommandError("預留數量不一致或超賣")
+        self.stdout.write(self.style.SUCCESS("沒有超賣"))
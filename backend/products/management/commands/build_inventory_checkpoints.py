@@ -0,0 +1,25 @@
+"""
+依庫存異動重播建立每月的庫存檢查點 (建議每日排程執行，月初後即會補上上個月)
+
+    python manage.py build_inventory_checkpoints
+
+    # 清除所有檢查點，從第一筆異動完整重播
+    python manage.py build_inventory_checkpoints --rebuild
+"""
+
+from django.core.management.base import BaseCommand
+
+from products.stock_ledger import build_checkpoints
+
+
+class Command(BaseCommand):
+    help = "重播庫存異動，建立每月的庫存檢查點"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--rebuild", action="store_true", help="清除所有檢查點後重新建立"
+        )
+
+    def handle(self, *args, **options) -> None:
+        created = build_checkpoints(rebuild=options["rebuild"])
+        self.stdout.write(self.style.SUCCESS(f"已建立 {created} 個檢查點"))
@@ -0,0 +1,94 @@
+"""
+比對 Inventory.quantity_on_hand 與庫存異動重播的結果 (單一查詢檢查所有產品)
+
+    python manage.py check_inventory_drift
+    # 不使用檢查點，從第一筆異動完整重播
+    python manage.py check_inventory_drift --full
+
+發現不一致時以錯誤結束，可用於排程告警。修正方式：
+
+- --fix：以異動記錄為準，把重播的數量寫回 Inventory
+- --baseline：以目前的 Inventory 為準，為不一致的產品寫入盤點異動
+  (適用於導入異動記錄之前就存在的庫存資料)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Inventory, Product, StockMovement
+from products.stats import invalidate_product_stats
+from products.stock_ledger import detect_drift
+
+
+class Command(BaseCommand):
+    help = "檢查庫存數量與異動記錄重播的結果是否一致"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--full", action="store_true", help="不使用檢查點，完整重播所有異動"
+        )
+        fix = parser.add_mutually_exclusive_group()
+        fix.add_argument(
+            "--fix", action="store_true", help="以重播的數量更新 Inventory"
+        )
+        fix.add_argument(
+            "--baseline",
+            action="store_true",
+            help="以目前的 Inventory 數量寫入盤點異動",
+        )
+
+    def handle(self, *args, **options) -> None:
+        drift = detect_drift(use_checkpoints=not options["full"])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("庫存與異動記錄一致"))
+            return
+
+        skus = dict(
+            Product.objects.filter(id__in=[row[0] for row in drift]).values_list(
+                "id", "sku"
+            )
+        )
+        self.stdout.write(
+            f"{'產品':>8}  {'SKU':<20}{'庫存':>10}{'重播':>10}{'差異':>10}"
+        )
+        for product_id, stored, replayed in drift:
+            self.stdout.write(
+                f"{product_id:>8}  {skus.get(product_id, ''):<20}"
+                f"{stored:>10}{replayed:>10}{stored - replayed:>+10}"
+            )
+
+        if options["fix"]:
+            self._apply_replayed(drift)
+        elif options["baseline"]:
+            self._record_baseline(drift)
+        else:
+            raise CommandError(f"{len(drift)} 個產品的庫存與異動記錄不一致")
+
+    def _apply_replayed(self, drift) -> None:
+        now = timezone.now()
+        with transaction.atomic():
+            for product_id, _, replayed in sorted(drift):
+                # 依 product_id 順序更新，與其他庫存流程的鎖定順序相同
+                updated = Inventory.objects.filter(product_id=product_id).update(
+                    quantity_on_hand=max(replayed, 0), last_updated=now
+                )
+                if not updated:
+                    Inventory.objects.create(
+                        product_id=product_id, quantity_on_hand=max(replayed, 0)
+                    )
+            invalidate_product_stats()
+        self.stdout.write(self.style.SUCCESS(f"已更新 {len(drift)} 個產品的庫存"))
+
+    def _record_baseline(self, drift) -> None:
+        StockMovement.objects.bulk_create(
+            StockMovement(
+                product_id=product_id,
+                movement_type="stocktake",
+                quantity=stored,
+                reference_type="stocktake",
+                notes="check_inventory_drift --baseline",
+            )
+            for product_id, stored, _ in drift
+        )
+        self.stdout.write(self.style.SUCCESS(f"已為 {len(drift)} 個產品寫入盤點異動"))
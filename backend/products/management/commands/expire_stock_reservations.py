@@ -0,0 +1,27 @@
+"""
+釋放已過期的庫存預留 (待付款訂單超過 STOCK_RESERVATION_TTL_MINUTES 未付款)
+
+建議以排程每分鐘執行：
+
+    python manage.py expire_stock_reservations --batch-size 1000
+"""
+
+from django.core.management.base import BaseCommand
+
+from products.reservations import EXPIRE_BATCH_SIZE, expire_reservations
+
+
+class Command(BaseCommand):
+    help = "釋放已過期的庫存預留"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=EXPIRE_BATCH_SIZE,
+            help="每個交易處理的預留筆數",
+        )
+
+    def handle(self, *args, **options) -> None:
+        expired = expire_reservations(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"已釋放 {expired} 筆過期預留"))
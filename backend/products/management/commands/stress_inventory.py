@@ -0,0 +1,184 @@
+"""
+庫存異動的並發壓力測試
+
+建立暫時的測試產品，多個執行緒 (各自一個資料庫連線) 同時對相同產品入庫 / 出庫，
+結束後檢查庫存是否等於初始庫存 + 所有成功異動的加總 (沒有遺失的更新)、
+異動記錄是否與成功的異動一致，並回報吞吐量：
+
+    python manage.py stress_inventory --threads 8 --movements 200
+    # 以批次 API 的服務函式 (每批 50 筆，跨兩個產品) 測試
+    python manage.py stress_inventory --threads 8 --movements 200 --batch-size 50
+
+測試產品在結束時刪除 (連同異動記錄)。
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Sum, When
+
+from products.inventory import InventoryError, apply_movement, apply_movements
+from products.models import Inventory, Product, StockMovement
+
+INITIAL_STOCK = 50
+
+
+def _random_movement(product_ids, rng) -> StockMovement:
+    inbound = rng.random() < 0.5
+    return StockMovement(
+        product_id=rng.choice(product_ids),
+        movement_type="inbound" if inbound else "outbound",
+        quantity=rng.randint(1, 5),
+        reference_type="purchase" if inbound else "order",
+        notes="stress_inventory",
+    )
+
+
+def _signed(movement) -> int:
+    return (
+        movement.quantity if movement.movement_type == "inbound" else -movement.quantity
+    )
+
+
+class Command(BaseCommand):
+    help = "多執行緒並發套用庫存異動，檢查沒有遺失的更新"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--threads", type=int, default=8, help="執行緒數")
+        parser.add_argument(
+            "--movements", type=int, default=200, help="每個執行緒的異動筆數"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=0,
+            help="大於 0 時以 apply_movements 每批套用的筆數；0 為逐筆套用",
+        )
+        parser.add_argument("--seed", type=int, default=None, help="亂數種子")
+
+    def handle(self, *args, **options) -> None:
+        if options["threads"] < 2:
+            raise CommandError("--threads 至少為 2")
+
+        suffix = f"{time.time_ns()}"
+        products = [
+            Product.objects.create(
+                name=f"壓力測試產品 {index}",
+                sku=f"STRESS-{suffix}-{index}",
+                base_price=1,
+                cost_price=0,
+            )
+            for index in range(2 if options["batch_size"] else 1)
+        ]
+        product_ids = [product.id for product in products]
+        Inventory.objects.bulk_create(
+            [
+                Inventory(product_id=product_id, quantity_on_hand=INITIAL_STOCK)
+                for product_id in product_ids
+            ]
+        )
+
+        try:
+            applied, counts, seconds = self._run(product_ids, options)
+            self._verify(product_ids, applied, counts, seconds)
+        finally:
+            Product.objects.filter(id__in=product_ids).delete()
+
+    def _run(self, product_ids, options):
+        applied = Counter()
+        counts = Counter()
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options["threads"])
+        base_seed = options["seed"] if options["seed"] is not None else time.time_ns()
+
+        def worker(number) -> None:
+            rng = random.Random(base_seed + number)
+            local_applied, local_counts = Counter(), Counter()
+            try:
+                barrier.wait()
+                remaining = options["movements"]
+                while remaining > 0:
+                    size = min(options["batch_size"] or 1, remaining)
+                    remaining -= size
+                    movements = [
+                        _random_movement(product_ids, rng) for _ in range(size)
+                    ]
+                    try:
+                        if options["batch_size"]:
+                            apply_movements(movements)
+                        else:
+                            apply_movement(movements[0])
+                    except InventoryError:
+                        local_counts["rejected"] += size
+                        continue
+                    local_counts["applied"] += size
+                    for movement in movements:
+                        local_applied[movement.product_id] += _signed(movement)
+            except Exception as exc:  # noqa: BLE001 - 回報給主執行緒
+                errors.append(exc)
+            finally:
+                connection.close()
+                with lock:
+                    applied.update(local_applied)
+                    counts.update(local_counts)
+
+        threads = [
+            threading.Thread(target=worker, args=(number,))
+            for number in range(options["threads"])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        if errors:
+            raise CommandError(f"執行緒發生錯誤：{errors[0]!r}")
+        return applied, counts, seconds
+
+    def _verify(self, product_ids, applied, counts, seconds) -> None:
+        total = counts["applied"] + counts["rejected"]
+        self.stdout.write(
+            f"成功 {counts['applied']} 筆，庫存不足拒絕 {counts['rejected']} 筆，"
+            f"{seconds:.2f} 秒 ({total / seconds:,.0f} 筆/秒)"
+        )
+
+        recorded = dict(
+            StockMovement.objects.filter(product_id__in=product_ids)
+            .values("product_id")
+            .annotate(
+                total=Sum(
+                    Case(
+                        When(movement_type="outbound", then=-F("quantity")),
+                        default=F("quantity"),
+                        output_field=IntegerField(),
+                    )
+                )
+            )
+            .values_list("product_id", "total")
+        )
+        on_hand = dict(
+            Inventory.objects.filter(product_id__in=product_ids).values_list(
+                "product_id", "quantity_on_hand"
+            )
+        )
+
+        failed = False
+        for product_id in product_ids:
+            expected = INITIAL_STOCK + applied[product_id]
+            logged = INITIAL_STOCK + recorded.get(product_id, 0)
+            ok = on_hand[product_id] == expected == logged
+            failed |= not ok
+            self.stdout.write(
+                f"產品 {product_id}：庫存 {on_hand[product_id]}，預期 {expected}，"
+                f"依異動記錄 {logged} {'OK' if ok else 'MISMATCH'}"
+            )
+        if failed:
+            raise CommandError("庫存與異動不一致")
+        self.stdout.write(self.style.SUCCESS("沒有遺失的更新"))
@@ -0,0 +1,94 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("orders", "0005_append_only_indexes"),
+        ("products", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockReservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField(verbose_name="預留數量")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("active", "預留中"),
+                            ("released", "已釋放"),
+                            ("expired", "已過期"),
+                            ("fulfilled", "已出貨"),
+                        ],
+                        default="active",
+                        max_length=20,
+                        verbose_name="狀態",
+                    ),
+                ),
+                (
+                    "expires_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="到期時間"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="建立時間"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新時間"),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_reservations",
+                        to="orders.order",
+                        verbose_name="訂單",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservations",
+                        to="products.product",
+                        verbose_name="產品",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "庫存預留",
+                "verbose_name_plural": "庫存預留",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "active")),
+                        fields=["expires_at"],
+                        name="reservation_expiry_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="stockreservation",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "active")),
+                fields=("order", "product"),
+                name="unique_active_reservation",
+            ),
+        ),
+    ]
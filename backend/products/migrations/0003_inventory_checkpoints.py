@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0002_stock_reservations"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InventoryCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("as_of", models.DateTimeField(verbose_name="時間點")),
+                ("quantity_on_hand", models.IntegerField(verbose_name="現有庫存")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="建立時間"),
+                ),
+            ],
+            options={
+                "verbose_name": "庫存檢查點",
+                "verbose_name_plural": "庫存檢查點",
+                "ordering": ["product", "-as_of"],
+            },
+        ),
+        migrations.AlterField(
+            model_name="stockmovement",
+            name="product",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="stock_movements",
+                to="products.product",
+                verbose_name="產品",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["product", "created_at", "id"],
+                name="products_st_product_c380bc_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="inventorycheckpoint",
+            name="product",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="inventory_checkpoints",
+                to="products.product",
+                verbose_name="產品",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="inventorycheckpoint",
+            constraint=models.UniqueConstraint(
+                fields=("product", "as_of"), name="unique_inventory_checkpoint"
+            ),
+        ),
+    ]
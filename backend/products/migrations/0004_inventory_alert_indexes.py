@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0003_inventory_checkpoints"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="inventory",
+            index=models.Index(
+                condition=models.Q(
+                    ("quantity_on_hand__lte", models.F("reorder_level"))
+                ),
+                fields=["product"],
+                name="inventory_low_stock_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="inventory",
+            index=models.Index(
+                condition=models.Q(("quantity_on_hand", 0)),
+                fields=["product"],
+                name="inventory_out_of_stock_idx",
+            ),
+        ),
+    ]
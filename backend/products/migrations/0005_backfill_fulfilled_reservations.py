@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:40
+
+from django.db import migrations
+
+# 在依狀態轉換出庫之前已出貨的訂單沒有 fulfilled 預留；補上紀錄 (不寫入異動、不扣庫存)，
+# 之後這些訂單改回處理中再出貨時才不會重複出庫。SKU 對應規則同
+# products.reservations.product_ids_for_skus：產品 SKU 優先，其次為變體所屬的產品
+BACKFILL_SQL = """
+INSERT INTO products_stockreservation (
+    order_id, product_id, quantity, status, created_at, updated_at
+)
+SELECT item.order_id, COALESCE(product.id, variant.product_id), SUM(item.quantity),
+       'fulfilled', NOW(), NOW()
+FROM orders_orderitem item
+JOIN orders_order o ON o.id = item.order_id
+LEFT JOIN products_product product
+       ON product.sku = item.product_sku
+      AND EXISTS (
+          SELECT 1 FROM products_inventory inventory
+          WHERE inventory.product_id = product.id
+      )
+LEFT JOIN products_productvariant variant
+       ON variant.sku = item.product_sku
+      AND EXISTS (
+          SELECT 1 FROM products_inventory inventory
+          WHERE inventory.product_id = variant.product_id
+      )
+WHERE o.status IN ('shipped', 'delivered')
+  AND COALESCE(product.id, variant.product_id) IS NOT NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM products_stockreservation reservation
+      WHERE reservation.order_id = o.id AND reservation.status = 'fulfilled'
+  )
+GROUP BY item.order_id, COALESCE(product.id, variant.product_id)
+HAVING SUM(item.quantity) > 0
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("orders", "0005_append_only_indexes"),
+        ("products", "0004_inventory_alert_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=BACKFILL_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -241,6 +241,19 @@ class Inventory(models.Model):
     class Meta:
         verbose_name = "庫存"
         verbose_name_plural = "庫存"
+        indexes = [
+            # 低庫存 / 缺貨的列通常很少，部分索引讓統計與警示只需掃描這些列
+            models.Index(
+                fields=["product"],
+                name="inventory_low_stock_idx",
+                condition=models.Q(quantity_on_hand__lte=models.F("reorder_level")),
+            ),
+            models.Index(
+                fields=["product"],
+                name="inventory_out_of_stock_idx",
+                condition=models.Q(quantity_on_hand=0),
+            ),
+        ]
 
     def __str__(self) -> str:
         if self.variant:
@@ -281,11 +294,13 @@ class StockMovement(models.Model):
         ("return", "退貨"),
     ]
 
+    # (product, created_at, id) 複合索引已涵蓋以產品查詢，不另外建立外鍵索引
     product = models.ForeignKey(
         Product,
         on_delete=models.CASCADE,
         related_name="stock_movements",
         verbose_name="產品",
+        db_index=False,
     )
     variant = models.ForeignKey(
         ProductVariant,
@@ -312,12 +327,104 @@ class StockMovement(models.Model):
         verbose_name = "庫存異動記錄"
         verbose_name_plural = "庫存異動記錄"
         ordering = ["-created_at"]
+        indexes = [
+            # 依產品重播異動 (庫存檢查點、歷史庫存查詢)
+            models.Index(fields=["product", "created_at", "id"]),
+        ]
 
     def __str__(self) -> str:
         item_name = self.variant or self.product
         return f"{item_name} - {self.get_movement_type_display()}: {self.quantity}"
 
 
+class StockReservation(models.Model):
+    """
+    訂單的庫存預留
+
+    每筆訂單每個產品最多一筆 active 預留，數量同時計入 Inventory.quantity_reserved；
+    釋放、過期或出貨後保留紀錄並改變狀態。expires_at 為 NULL 表示不會過期 (已付款)
+    """
+
+    STATUS_CHOICES = [
+        ("active", "預留中"),
+        ("released", "已釋放"),
+        ("expired", "已過期"),
+        ("fulfilled", "已出貨"),
+    ]
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="reservations",
+        verbose_name="產品",
+    )
+    order = models.ForeignKey(
+        "orders.Order",
+        on_delete=models.CASCADE,
+        related_name="stock_reservations",
+        verbose_name="訂單",
+    )
+    quantity = models.PositiveIntegerField(verbose_name="預留數量")
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="active", verbose_name="狀態"
+    )
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="到期時間")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "庫存預留"
+        verbose_name_plural = "庫存預留"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["order", "product"],
+                condition=models.Q(status="active"),
+                name="unique_active_reservation",
+            )
+        ]
+        indexes = [
+            # 過期掃描只看 active 的預留
+            models.Index(
+                fields=["expires_at"],
+                condition=models.Q(status="active"),
+                name="reservation_expiry_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.order_id} - {self.product} x {self.quantity} ({self.status})"
+
+
+class InventoryCheckpoint(models.Model):
+    """
+    庫存檢查點：as_of (月初 00:00) 之前所有庫存異動重播後的現有庫存，
+    只為當月有異動的產品建立；異動記錄有問題時可能為負數，因此不限制為正數
+    """
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="inventory_checkpoints",
+        verbose_name="產品",
+    )
+    as_of = models.DateTimeField(verbose_name="時間點")
+    quantity_on_hand = models.IntegerField(verbose_name="現有庫存")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+
+    class Meta:
+        verbose_name = "庫存檢查點"
+        verbose_name_plural = "庫存檢查點"
+        ordering = ["product", "-as_of"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "as_of"], name="unique_inventory_checkpoint"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.product_id} @ {self.as_of:%Y-%m-%d}: {self.quantity_on_hand}"
+
+
 class PriceHistory(models.Model):
     """價格歷史模型"""
 
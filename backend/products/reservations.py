@@ -0,0 +1,398 @@
+"""
+訂單庫存預留
+
+訂單明細的 product_sku 對應到產品 (或產品變體) 的 SKU；只有已建立庫存資料的產品
+才追蹤庫存，其他明細 (例如數位商品、手動輸入的品項) 不預留。
+
+- 待付款 (pending) 與處理中 (processing) 的訂單持有預留，pending 的預留在
+  STOCK_RESERVATION_TTL_MINUTES 後過期，processing (已付款) 不會過期
+- 取消 / 退款 / 刪除訂單時釋放預留；狀態變為出貨 (shipped / delivered) 時依明細的數量
+  出庫 (寫入 outbound 異動)，有預留的部分由預留轉換，預留已過期的部分從可用庫存扣除；
+  已出貨的訂單之後的變更 (shipped → delivered、修改明細) 不再出庫
+- 每筆訂單的預留在同一個交易中以條件式 UPDATE 套用，全部成功或全部不預留：
+  SET quantity_reserved = quantity_reserved + n
+  WHERE quantity_on_hand - quantity_reserved >= n
+- 所有修改庫存的流程 (預留、釋放、出貨、products/inventory.py 的異動) 都依 product_id
+  遞增的順序鎖定庫存列，並發交易不會互相等待成環 (死結)
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .inventory import InventoryError, apply_movement
+from .models import Inventory, Product, ProductVariant, StockMovement, StockReservation
+from .stats import invalidate_product_stats
+
+HOLD_STATUSES = ("pending", "processing")
+RELEASE_STATUSES = ("cancelled", "refunded")
+FULFIL_STATUSES = ("shipped", "delivered")
+EXPIRE_BATCH_SIZE = 1000
+
+
+class InsufficientStock(InventoryError):
+    """可用庫存不足，無法預留"""
+
+
+def product_ids_for_skus(skus) -> dict[str, int]:
+    """{SKU: 產品 id}，只包含已建立庫存資料的產品；變體的 SKU 對應到所屬產品"""
+    skus = {sku for sku in skus if sku}
+    if not skus:
+        return {}
+    mapping = dict(
+        Product.objects.filter(sku__in=skus, inventory__isnull=False).values_list(
+            "sku", "id"
+        )
+    )
+    if remaining := skus - mapping.keys():
+        mapping |= dict(
+            ProductVariant.objects.filter(
+                sku__in=remaining, product__inventory__isnull=False
+            ).values_list("sku", "product_id")
+        )
+    return mapping
+
+
+def requested_quantities(items, sku_map=None) -> dict[int, int]:
+    """
+    訂單明細需要預留的數量 {產品 id: 數量}
+    items 為 OrderItem 或含 product_sku / quantity 的 dict
+    """
+
+    def field(item, name):
+        return item[name] if isinstance(item, dict) else getattr(item, name)
+
+    if sku_map is None:
+        sku_map = product_ids_for_skus(field(item, "product_sku") for item in items)
+    quantities = defaultdict(int)
+    for item in items:
+        product_id = sku_map.get(field(item, "product_sku"))
+        if product_id is not None:
+            quantities[product_id] += field(item, "quantity")
+    return dict(quantities)
+
+
+def _expires_at(order, now):
+    if order.status == "pending":
+        return now + timedelta(minutes=settings.STOCK_RESERVATION_TTL_MINUTES)
+    return None
+
+
+def _adjust_reserved(deltas, now) -> None:
+    """依 product_id 遞增的順序調整已預留數量；增加時庫存不足拋出 InsufficientStock"""
+    for product_id in sorted(deltas):
+        delta = deltas[product_id]
+        inventory = Inventory.objects.filter(product_id=product_id)
+        if delta > 0:
+            updated = inventory.filter(
+                quantity_on_hand__gte=F("quantity_reserved") + delta
+            ).update(quantity_reserved=F("quantity_reserved") + delta, last_updated=now)
+            if not updated:
+                raise InsufficientStock(
+                    f"產品 {product_id} 可用庫存不足 (需要 {delta})"
+                )
+        elif delta < 0:
+            # 庫存曾被手動修改時不讓已預留數量小於 0
+            inventory.update(
+                quantity_reserved=Greatest(F("quantity_reserved") + delta, 0),
+                last_updated=now,
+            )
+
+
+def _active_reservations(order):
+    """鎖定訂單的 active 預留，依 product_id 排序"""
+    return list(
+        StockReservation.objects.select_for_update()
+        .filter(order=order, status="active")
+        .order_by("product_id")
+    )
+
+
+def _release(reservations, status, now) -> None:
+    deltas = defaultdict(int)
+    for reservation in reservations:
+        deltas[reservation.product_id] -= reservation.quantity
+    _adjust_reserved(deltas, now)
+    StockReservation.objects.filter(
+        id__in=[reservation.id for reservation in reservations]
+    ).update(status=status, updated_at=now)
+
+
+def _fulfilled_quantities(order) -> dict[int, int]:
+    """訂單已出貨的數量 {產品 id: 數量}"""
+    return dict(
+        StockReservation.objects.filter(order=order, status="fulfilled")
+        .values("product_id")
+        .annotate(quantity=Sum("quantity"))
+        .values_list("product_id", "quantity")
+    )
+
+
+def _outbound(order, product_id, quantity) -> StockMovement:
+    return StockMovement(
+        product_id=product_id,
+        movement_type="outbound",
+        quantity=quantity,
+        reference_type="order",
+        reference_id=order.id,
+        notes=f"訂單 {order.order_number} 出貨",
+    )
+
+
+def _fulfil(order, reservations, items, now) -> None:
+    """
+    出貨：依訂單明細扣除已出貨的數量出庫，並寫入 outbound 異動
+    - 有 active 預留的部分由預留轉為出庫，多預留的數量歸還
+    - 沒有預留的部分 (例如預留已過期) 以 apply_movement 從可用庫存出庫，
+      可用庫存不足時拋出 InsufficientStock
+    出貨數量都記錄為 fulfilled 預留，再次同步 (例如 shipped → delivered) 不會重複出庫
+    """
+    fulfilled = _fulfilled_quantities(order)
+    requested = {
+        product_id: quantity - fulfilled.get(product_id, 0)
+        for product_id, quantity in requested_quantities(items).items()
+        if quantity > fulfilled.get(product_id, 0)
+    }
+    held = {reservation.product_id: reservation for reservation in reservations}
+
+    movements, unreserved = [], []
+    for product_id in sorted(requested.keys() | held.keys()):
+        quantity = requested.get(product_id, 0)
+        reservation = held.get(product_id)
+        covered = min(quantity, reservation.quantity) if reservation else 0
+        if reservation is not None:
+            updated = Inventory.objects.filter(
+                product_id=product_id, quantity_on_hand__gte=covered
+            ).update(
+                quantity_on_hand=F("quantity_on_hand") - covered,
+                # 庫存曾被手動修改時不讓已預留數量小於 0
+                quantity_reserved=Greatest(
+                    F("quantity_reserved") - reservation.quantity, 0
+                ),
+                last_updated=now,
+            )
+            if not updated:
+                raise InsufficientStock(
+                    f"產品 {product_id} 現有庫存不足 (出貨需要 {covered})"
+                )
+            reservation.updated_at = now
+            if covered:
+                # 預留多於出貨的數量已在上面一併歸還
+                reservation.status, reservation.quantity = "fulfilled", covered
+                movements.append(_outbound(order, product_id, covered))
+            else:
+                reservation.status = "released"
+        if quantity > covered:
+            try:
+                apply_movement(_outbound(order, product_id, quantity - covered))
+            except InventoryError as exc:
+                raise InsufficientStock(
+                    f"產品 {product_id} 可用庫存不足 (出貨需要 {quantity - covered})"
+                ) from exc
+            unreserved.append(
+                StockReservation(
+                    order=order,
+                    product_id=product_id,
+                    quantity=quantity - covered,
+                    status="fulfilled",
+                )
+            )
+
+    StockMovement.objects.bulk_create(movements)
+    StockReservation.objects.bulk_update(
+        reservations, ["status", "quantity", "updated_at"]
+    )
+    StockReservation.objects.bulk_create(unreserved)
+    invalidate_product_stats()
+
+
+def sync_order_reservations(order, previous_status, items=None) -> None:
+    """
+    依訂單目前的狀態與明細調整預留，訂單建立、狀態或明細變更後呼叫
+    previous_status 為變更前的狀態，新建的訂單為空字串
+    - pending / processing：預留數量調整為明細的數量 (只補差額)
+    - cancelled / refunded：釋放
+    - 由其他狀態變為 shipped / delivered：依明細出庫 (見 _fulfil)；
+      原本就已出貨的訂單不再出庫
+    庫存不足時拋出 InsufficientStock，呼叫端的交易應整筆回滾
+    """
+    if order.status in FULFIL_STATUSES and previous_status in FULFIL_STATUSES:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        current = _active_reservations(order)
+        if order.status in RELEASE_STATUSES:
+            _release(current, "released", now)
+            return
+        items = order.items.all() if items is None else items
+        if order.status in FULFIL_STATUSES:
+            _fulfil(order, current, items, now)
+            return
+        if order.status not in HOLD_STATUSES:
+            return
+
+        requested = requested_quantities(items)
+        existing = {reservation.product_id: reservation for reservation in current}
+        deltas = {
+            product_id: requested.get(product_id, 0)
+            - getattr(existing.get(product_id), "quantity", 0)
+            for product_id in requested.keys() | existing.keys()
+        }
+        _adjust_reserved(deltas, now)
+
+        expires_at = _expires_at(order, now)
+        changed, removed = [], []
+        for product_id, reservation in existing.items():
+            quantity = requested.get(product_id, 0)
+            if quantity == 0:
+                removed.append(reservation.id)
+                continue
+            # 數量增加時重新計算到期時間；付款後 (processing) 不再過期
+            if deltas[product_id] <= 0 and expires_at is not None:
+                expires_at_after = reservation.expires_at
+            else:
+                expires_at_after = expires_at
+            if (
+                reservation.quantity != quantity
+                or reservation.expires_at != expires_at_after
+            ):
+                reservation.quantity = quantity
+                reservation.expires_at = expires_at_after
+                reservation.updated_at = now
+                changed.append(reservation)
+
+        StockReservation.objects.filter(id__in=removed).update(
+            status="released", updated_at=now
+        )
+        StockReservation.objects.bulk_update(
+            changed, ["quantity", "expires_at", "updated_at"]
+        )
+        StockReservation.objects.bulk_create(
+            StockReservation(
+                order=order,
+                product_id=product_id,
+                quantity=quantity,
+                expires_at=expires_at,
+            )
+            for product_id, quantity in requested.items()
+            if product_id not in existing
+        )
+
+
+def release_order(order) -> None:
+    """釋放訂單所有的 active 預留 (例如刪除訂單前)"""
+    with transaction.atomic():
+        _release(_active_reservations(order), "released", timezone.now())
+
+
+def reserve_orders(requests, shipments=None) -> dict:
+    """
+    批次預留與出庫，需在呼叫端的交易中執行 (訂單尚未寫入)
+    requests 為要預留的 {key: {產品 id: 數量}}，shipments 為建立時已出貨、直接出庫的
+    {key: {產品 id: 數量}}；一次鎖定所有相關庫存 (依 product_id 排序) 後依序配置，
+    每筆訂單全部成功或全部不配置，最後以 bulk_update 寫回
+    回傳無法配置的 {key: 錯誤訊息}
+    """
+    shipments = shipments or {}
+    product_ids = sorted(
+        {
+            pid
+            for allocations in (requests, shipments)
+            for quantities in allocations.values()
+            for pid in quantities
+        }
+    )
+    inventories = {
+        inventory.product_id: inventory
+        for inventory in Inventory.objects.select_for_update()
+        .filter(product_id__in=product_ids)
+        .order_by("product_id")
+    }
+
+    failures = {}
+    for allocations, shipping in ((requests, False), (shipments, True)):
+        for key, quantities in allocations.items():
+            short = [
+                product_id
+                for product_id, quantity in quantities.items()
+                if inventories[product_id].quantity_available < quantity
+            ]
+            if short:
+                failures[key] = f"產品 {short} 可用庫存不足"
+                continue
+            for product_id, quantity in quantities.items():
+                if shipping:
+                    inventories[product_id].quantity_on_hand -= quantity
+                else:
+                    inventories[product_id].quantity_reserved += quantity
+
+    now = timezone.now()
+    for inventory in inventories.values():
+        inventory.last_updated = now
+    Inventory.objects.bulk_update(
+        inventories.values(), ["quantity_on_hand", "quantity_reserved", "last_updated"]
+    )
+    return failures
+
+
+def record_reservations(orders_quantities) -> None:
+    """寫入 reserve_orders 配置成功的預留紀錄，orders_quantities 為 [(訂單, 數量)]"""
+    now = timezone.now()
+    StockReservation.objects.bulk_create(
+        StockReservation(
+            order=order,
+            product_id=product_id,
+            quantity=quantity,
+            expires_at=_expires_at(order, now),
+        )
+        for order, quantities in orders_quantities
+        for product_id, quantity in quantities.items()
+    )
+
+
+def record_fulfilments(orders_quantities) -> None:
+    """
+    寫入 reserve_orders 已出庫的 outbound 異動與 fulfilled 預留，
+    orders_quantities 為 [(訂單, 數量)]
+    """
+    movements, reservations = [], []
+    for order, quantities in orders_quantities:
+        for product_id, quantity in quantities.items():
+            movements.append(_outbound(order, product_id, quantity))
+            reservations.append(
+                StockReservation(
+                    order=order,
+                    product_id=product_id,
+                    quantity=quantity,
+                    status="fulfilled",
+                )
+            )
+    if movements:
+        StockMovement.objects.bulk_create(movements)
+        StockReservation.objects.bulk_create(reservations)
+        invalidate_product_stats()
+
+
+def expire_reservations(now=None, batch_size=EXPIRE_BATCH_SIZE) -> int:
+    """
+    釋放已過期的預留，依 batch_size 分批處理，回傳處理筆數
+    其他交易正在處理的預留 (已鎖定) 會略過，下次執行時再處理
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            reservations = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(status="active", expires_at__lte=now)
+                .order_by("product_id", "id")[:batch_size]
+            )
+            if not reservations:
+                return expired
+            _release(reservations, "expired", timezone.now())
+        expired += len(reservations)
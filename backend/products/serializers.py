@@ -1,5 +1,9 @@
+from crm_backend.counts import RelatedCountField
+from crm_backend.fieldsets import SparseFieldsetSerializerMixin
+from django.db.models import Q
 from rest_framework import serializers
 
+from .inventory import MAX_BATCH_SIZE
 from .models import (
     Brand,
     Category,
@@ -12,8 +16,8 @@ from .models import (
 )
 
 
-class CategorySerializer(serializers.ModelSerializer):
-    product_count = serializers.SerializerMethodField()
+class CategorySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    product_count = RelatedCountField("products", Q(is_active=True))
 
     class Meta:
         model = Category
@@ -29,12 +33,9 @@ class CategorySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["created_at", "updated_at"]
 
-    def get_product_count(self, obj):
-        return obj.products.filter(is_active=True).count()
 
-
-class BrandSerializer(serializers.ModelSerializer):
-    product_count = serializers.SerializerMethodField()
+class BrandSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    product_count = RelatedCountField("products", Q(is_active=True))
 
     class Meta:
         model = Brand
@@ -51,12 +52,9 @@ class BrandSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["created_at", "updated_at"]
 
-    def get_product_count(self, obj):
-        return obj.products.filter(is_active=True).count()
-
 
-class SupplierSerializer(serializers.ModelSerializer):
-    product_count = serializers.SerializerMethodField()
+class SupplierSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    product_count = RelatedCountField("products", Q(is_active=True))
 
     class Meta:
         model = Supplier
@@ -76,11 +74,8 @@ class SupplierSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["created_at", "updated_at"]
 
-    def get_product_count(self, obj):
-        return obj.products.filter(is_active=True).count()
-
 
-class InventorySerializer(serializers.ModelSerializer):
+class InventorySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     quantity_available = serializers.ReadOnlyField()
     is_low_stock = serializers.ReadOnlyField()
     is_out_of_stock = serializers.ReadOnlyField()
@@ -102,7 +97,11 @@ class InventorySerializer(serializers.ModelSerializer):
         read_only_fields = ["last_updated"]
 
 
-class ProductVariantSerializer(serializers.ModelSerializer):
+class ProductVariantSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
+    expandable_fields = ("inventory",)
+
     inventory = InventorySerializer(read_only=True)
 
     class Meta:
@@ -123,14 +122,14 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at", "updated_at"]
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """簡化的產品序列化器，用於列表顯示"""
 
     category_name = serializers.ReadOnlyField()
     brand_name = serializers.ReadOnlyField()
     supplier_name = serializers.ReadOnlyField()
     profit_margin = serializers.ReadOnlyField()
-    variant_count = serializers.SerializerMethodField()
+    variant_count = RelatedCountField("variants", Q(is_active=True))
 
     class Meta:
         model = Product
@@ -153,13 +152,14 @@ class ProductListSerializer(serializers.ModelSerializer):
             "variant_count",
         ]
 
-    def get_variant_count(self, obj):
-        return obj.variants.filter(is_active=True).count()
-
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     """詳細的產品序列化器，包含所有關聯資料"""
 
+    expandable_fields = ("variants", "inventory")
+
     category_name = serializers.ReadOnlyField()
     brand_name = serializers.ReadOnlyField()
     supplier_name = serializers.ReadOnlyField()
@@ -241,7 +241,9 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
         return data
 
 
-class StockMovementSerializer(serializers.ModelSerializer):
+class StockMovementSerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     product_name = serializers.CharField(source="product.name", read_only=True)
     variant_name = serializers.CharField(source="variant.name", read_only=True)
     movement_type_display = serializers.CharField(
@@ -271,7 +273,63 @@ class StockMovementSerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at"]
 
 
-class PriceHistorySerializer(serializers.ModelSerializer):
+class StockMovementBatchItemSerializer(serializers.ModelSerializer):
+    # 以 id 接收，產品 / 變體是否存在由 StockMovementBatchSerializer 一次查詢
+    product = serializers.IntegerField(source="product_id", min_value=1)
+    variant = serializers.IntegerField(
+        source="variant_id", min_value=1, required=False, allow_null=True
+    )
+
+    class Meta:
+        model = StockMovement
+        fields = [
+            "product",
+            "variant",
+            "movement_type",
+            "quantity",
+            "reference_type",
+            "reference_id",
+            "notes",
+        ]
+
+
+class StockMovementBatchSerializer(serializers.Serializer):
+    """批次庫存異動，依 movements 的順序套用"""
+
+    movements = StockMovementBatchItemSerializer(
+        many=True, allow_empty=False, max_length=MAX_BATCH_SIZE
+    )
+
+    def validate_movements(self, movements):
+        product_ids = {movement["product_id"] for movement in movements}
+        existing = set(
+            Product.objects.filter(id__in=product_ids).values_list("id", flat=True)
+        )
+        if missing := sorted(product_ids - existing):
+            raise serializers.ValidationError(f"產品不存在：{missing}")
+
+        variant_ids = {
+            movement["variant_id"]
+            for movement in movements
+            if movement.get("variant_id")
+        }
+        variant_products = dict(
+            ProductVariant.objects.filter(id__in=variant_ids).values_list(
+                "id", "product_id"
+            )
+        )
+        for index, movement in enumerate(movements, start=1):
+            variant_id, product_id = movement.get("variant_id"), movement["product_id"]
+            if variant_id and variant_products.get(variant_id) != product_id:
+                raise serializers.ValidationError(
+                    f"第 {index} 筆：變體 {variant_id} 不屬於產品 {product_id}"
+                )
+        return movements
+
+
+class PriceHistorySerializer(
+    SparseFieldsetSerializerMixin, serializers.ModelSerializer
+):
     product_name = serializers.CharField(source="product.name", read_only=True)
     variant_name = serializers.CharField(source="variant.name", read_only=True)
     price_change_percentage = serializers.ReadOnlyField()
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Brand, Category, Inventory, Product, Supplier
+from .stats import invalidate_product_stats
+
+# 以 QuerySet.update / bulk_update 修改庫存的流程 (products/inventory.py 等)
+# 不會送出這些訊號，需自行呼叫 invalidate_product_stats
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Inventory)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Inventory)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Supplier)
+def invalidate_stats(sender, **kwargs) -> None:
+    invalidate_product_stats()
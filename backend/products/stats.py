@@ -0,0 +1,75 @@
+"""
+產品統計 (ProductViewSet.stats) 的計算與快取
+
+- 產品數、啟用產品數與庫存總價值：以產品 LEFT JOIN 庫存的條件式聚合一次算出
+- 啟用的分類 / 品牌 / 供應商數與低庫存 / 缺貨數：同一個查詢中的純量子查詢，
+  低庫存與缺貨的條件與 Inventory 的部分索引相同，只需掃描索引
+- 結果依 PRODUCT_STATS_CACHE_SECONDS 快取；產品、庫存、分類、品牌、供應商異動後
+  (交易提交時) 換一個版本號，舊的快取自然失效
+"""
+
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Brand, Category, Inventory, Product, Supplier
+
+CACHE_KEY = "products:stats:{version}"
+VERSION_KEY = "products:stats:version"
+
+# 條件需與 Inventory.Meta.indexes 的部分索引一致，PostgreSQL 才會使用該索引
+COUNTS_SQL = """
+SELECT
+    (SELECT COUNT(*) FROM {category} WHERE is_active) AS total_categories,
+    (SELECT COUNT(*) FROM {brand} WHERE is_active) AS total_brands,
+    (SELECT COUNT(*) FROM {supplier} WHERE is_active) AS total_suppliers,
+    (SELECT COUNT(*) FROM {inventory} WHERE quantity_on_hand <= reorder_level)
+        AS low_stock_items,
+    (SELECT COUNT(*) FROM {inventory} WHERE quantity_on_hand = 0)
+        AS out_of_stock_items
+"""
+
+
+def compute_product_stats() -> dict:
+    """不經快取，以兩個查詢計算產品統計"""
+    stats = Product.objects.aggregate(
+        total_products=Count("id"),
+        active_products=Count("id", filter=Q(is_active=True)),
+        total_inventory_value=Coalesce(
+            Sum(F("inventory__quantity_on_hand") * F("cost_price")),
+            Decimal("0.00"),
+        ),
+    )
+    sql = COUNTS_SQL.format(
+        category=Category._meta.db_table,
+        brand=Brand._meta.db_table,
+        supplier=Supplier._meta.db_table,
+        inventory=Inventory._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        columns = [column.name for column in cursor.description]
+        stats.update(zip(columns, cursor.fetchone(), strict=True))
+    return stats
+
+
+def product_stats() -> dict:
+    """產品統計，快取中沒有 (或已失效) 時重新計算"""
+    # 先取得版本號再計算：計算期間若有異動，結果只會寫到已失效的舊版本
+    version = cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+    key = CACHE_KEY.format(version=version)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_product_stats()
+        cache.set(key, stats, settings.PRODUCT_STATS_CACHE_SECONDS)
+    return stats
+
+
+def invalidate_product_stats() -> None:
+    """使產品統計的快取失效；在交易中呼叫時等到提交後才生效"""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, time.time_ns(), timeout=None))
@@ -0,0 +1,180 @@
+"""
+以庫存異動 (StockMovement) 為準的庫存帳
+
+異動依 (product_id, created_at, id) 排序重播：inbound 與 adjustment 加上數量、
+outbound 減去數量，stocktake (盤點) 直接設為盤點數量。重播全部在 SQL 中完成：
+
+- 以 COUNT(*) FILTER (WHERE stocktake) OVER (...) 把每個產品的異動依盤點切成區段，
+  區段內以 SUM(...) OVER (...) 累加；盤點之後的區段從盤點數量開始，
+  第一個區段從檢查點 (或 0) 開始
+- 每月為當月有異動的產品建立 InventoryCheckpoint，任一時間點的庫存 =
+  最近的檢查點 + 之後到該時間點的異動，需要重播的異動最多一個多月
+- 漂移檢查以單一查詢重播所有產品，與 Inventory.quantity_on_hand 比對
+"""
+
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from transactions.ledger import month_start
+
+from .models import Inventory, InventoryCheckpoint, StockMovement
+
+# 依 (產品, 月份) 重播 start 之後的異動，每個產品每月最後一筆的庫存即為下個月初的檢查點
+BUILD_CHECKPOINTS_SQL = """
+WITH openings AS (
+    SELECT DISTINCT ON (product_id) product_id, quantity_on_hand AS quantity
+    FROM {checkpoints}
+    WHERE as_of <= %(start)s
+    ORDER BY product_id, as_of DESC
+), moves AS (
+    SELECT product_id, created_at, id,
+           CASE WHEN movement_type = 'outbound' THEN -quantity ELSE quantity END
+               AS amount,
+           COUNT(*) FILTER (WHERE movement_type = 'stocktake') OVER (
+               PARTITION BY product_id ORDER BY created_at, id
+           ) AS segment
+    FROM {movements}
+    WHERE created_at >= %(start)s AND created_at < %(end)s
+), replayed AS (
+    SELECT moves.product_id, moves.created_at, moves.id,
+           SUM(moves.amount) OVER (
+               PARTITION BY moves.product_id, moves.segment
+               ORDER BY moves.created_at, moves.id
+           ) + CASE WHEN moves.segment = 0 THEN COALESCE(openings.quantity, 0)
+                    ELSE 0 END AS on_hand
+    FROM moves LEFT JOIN openings USING (product_id)
+)
+INSERT INTO {checkpoints} (product_id, as_of, quantity_on_hand, created_at)
+SELECT DISTINCT ON (product_id, date_trunc('month', created_at))
+       product_id,
+       date_trunc('month', created_at) + interval '1 month',
+       on_hand,
+       %(now)s
+FROM replayed
+ORDER BY product_id, date_trunc('month', created_at), created_at DESC, id DESC
+"""
+
+# 每個產品在 at 之前 (不含，NULL 為不限) 的庫存：最近的檢查點 + 之後的異動重播
+# use_checkpoints 為 false 時從第一筆異動開始完整重播
+QUANTITIES_AS_OF_SQL = """
+WITH openings AS (
+    SELECT DISTINCT ON (product_id) product_id, as_of, quantity_on_hand AS quantity
+    FROM {checkpoints}
+    WHERE %(use_checkpoints)s AND (%(at)s IS NULL OR as_of <= %(at)s)
+      {product_filter}
+    ORDER BY product_id, as_of DESC
+), moves AS (
+    SELECT movement.product_id, movement.created_at, movement.id,
+           CASE WHEN movement.movement_type = 'outbound'
+                THEN -movement.quantity ELSE movement.quantity END AS amount,
+           COUNT(*) FILTER (WHERE movement.movement_type = 'stocktake') OVER (
+               PARTITION BY movement.product_id
+               ORDER BY movement.created_at, movement.id
+           ) AS segment
+    FROM {movements} movement
+    LEFT JOIN openings ON openings.product_id = movement.product_id
+    WHERE (%(at)s IS NULL OR movement.created_at < %(at)s)
+      AND (openings.as_of IS NULL OR movement.created_at >= openings.as_of)
+      {movement_filter}
+), replayed AS (
+    SELECT DISTINCT ON (moves.product_id)
+           moves.product_id,
+           SUM(moves.amount) OVER (
+               PARTITION BY moves.product_id, moves.segment
+               ORDER BY moves.created_at, moves.id
+           ) + CASE WHEN moves.segment = 0 THEN COALESCE(openings.quantity, 0)
+                    ELSE 0 END AS on_hand
+    FROM moves LEFT JOIN openings USING (product_id)
+    ORDER BY moves.product_id, moves.created_at DESC, moves.id DESC
+)
+SELECT COALESCE(replayed.product_id, openings.product_id) AS product_id,
+       COALESCE(replayed.on_hand, openings.quantity) AS on_hand
+FROM replayed
+FULL OUTER JOIN openings ON openings.product_id = replayed.product_id
+"""
+
+# 重播結果與 Inventory 比對；任一方沒有資料時視為 0
+DRIFT_SQL = """
+WITH replayed AS ({quantities})
+SELECT COALESCE(inventory.product_id, replayed.product_id) AS product_id,
+       COALESCE(inventory.quantity_on_hand, 0) AS stored,
+       COALESCE(replayed.on_hand, 0) AS replayed
+FROM {inventories} inventory
+FULL OUTER JOIN replayed ON replayed.product_id = inventory.product_id
+WHERE COALESCE(inventory.quantity_on_hand, 0) <> COALESCE(replayed.on_hand, 0)
+ORDER BY 1
+"""
+
+
+def _quantities_sql(filtered) -> str:
+    return QUANTITIES_AS_OF_SQL.format(
+        checkpoints=InventoryCheckpoint._meta.db_table,
+        movements=StockMovement._meta.db_table,
+        product_filter="AND product_id = ANY(%(product_ids)s)" if filtered else "",
+        movement_filter=(
+            "AND movement.product_id = ANY(%(product_ids)s)" if filtered else ""
+        ),
+    )
+
+
+def quantities_as_of(at, product_ids=None, use_checkpoints=True) -> dict[int, int]:
+    """
+    at 之前 (不含) 的庫存 {產品 id: 數量}，只包含有異動或檢查點的產品
+    product_ids 為 None 時計算所有產品
+    """
+    filtered = product_ids is not None
+    params = {
+        "at": at,
+        "use_checkpoints": use_checkpoints,
+        "product_ids": list(product_ids) if filtered else None,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_quantities_sql(filtered), params)
+        return dict(cursor.fetchall())
+
+
+def detect_drift(use_checkpoints=True) -> list[tuple[int, int, int]]:
+    """
+    以單一查詢重播所有產品的異動並與 Inventory 比對
+    回傳不一致的 [(產品 id, Inventory 的數量, 重播的數量)]
+    """
+    sql = DRIFT_SQL.format(
+        quantities=_quantities_sql(filtered=False),
+        inventories=Inventory._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"at": None, "use_checkpoints": use_checkpoints})
+        return cursor.fetchall()
+
+
+def build_checkpoints(rebuild=False) -> int:
+    """
+    建立到本月初為止的每月檢查點 (本月尚未結束，不建立)
+    異動記錄只新增不修改，從最後一個檢查點接續即可；rebuild 時全部重建
+    回傳新增的檢查點數
+    """
+    end = month_start(timezone.now())
+    last = InventoryCheckpoint.objects.aggregate(as_of=Max("as_of"))["as_of"]
+    start = None if rebuild else last
+    if start is not None and start >= end:
+        return 0
+
+    with transaction.atomic():
+        if start is None:
+            InventoryCheckpoint.objects.all().delete()
+        sql = BUILD_CHECKPOINTS_SQL.format(
+            checkpoints=InventoryCheckpoint._meta.db_table,
+            movements=StockMovement._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql,
+                {
+                    "start": start or datetime.min.replace(tzinfo=end.tzinfo),
+                    "end": end,
+                    "now": timezone.now(),
+                },
+            )
+            return cursor.rowcount
@@ -1 +1,395 @@
-# Create your tests here.
+import importlib
+from datetime import datetime, timedelta
+
+from customers.models import Customer
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase
+from django.utils import timezone
+from orders import batch
+from orders.models import Order, OrderItem
+from orders.views import OrderViewSet
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .models import (
+    Brand,
+    Category,
+    Inventory,
+    InventoryCheckpoint,
+    Product,
+    ProductVariant,
+    StockMovement,
+    StockReservation,
+    Supplier,
+)
+from .reservations import expire_reservations
+from .stock_ledger import build_checkpoints, detect_drift, quantities_as_of
+from .views import (
+    BrandViewSet,
+    CategoryViewSet,
+    InventoryViewSet,
+    ProductViewSet,
+    SupplierViewSet,
+)
+
+
+class CatalogListQueryTests(TestCase):
+    """列表的查詢數固定，計數欄位以子查詢取得，與每頁筆數無關"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("catalog")
+        for i in range(12):
+            product = Product.objects.create(
+                name=f"商品 {i}",
+                sku=f"SKU-{i}",
+                base_price=1,
+                cost_price=0,
+                category=Category.objects.create(name=f"分類 {i}", slug=f"c-{i}"),
+                brand=Brand.objects.create(name=f"品牌 {i}"),
+                supplier=Supplier.objects.create(name=f"供應商 {i}"),
+            )
+            ProductVariant.objects.create(
+                product=product, name="款式", sku=f"SKU-{i}-V", price=1, cost_price=0
+            )
+
+    def _assert_list_queries(self, viewset, queries, count_field):
+        for limit in (5, 10):
+            request = APIRequestFactory().get("/", {"limit": limit})
+            force_authenticate(request, self.user)
+            with self.subTest(viewset=viewset.__name__, limit=limit):
+                with self.assertNumQueries(queries):
+                    response = viewset.as_view({"get": "list"})(request)
+                self.assertEqual(len(response.data["results"]), limit)
+                self.assertEqual(response.data["results"][0][count_field], 1)
+
+    def test_category_list(self):
+        # 總筆數、分類 (含產品數子查詢)
+        self._assert_list_queries(CategoryViewSet, 2, "product_count")
+
+    def test_brand_list(self):
+        self._assert_list_queries(BrandViewSet, 2, "product_count")
+
+    def test_supplier_list(self):
+        self._assert_list_queries(SupplierViewSet, 2, "product_count")
+
+    def test_product_list(self):
+        self._assert_list_queries(ProductViewSet, 3, "variant_count")
+
+
+class OrderFulfilmentTests(TestCase):
+    """出貨時依明細出庫，異動記錄的數量與實際扣除的庫存一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("fulfilment")
+        cls.customer = Customer.objects.create(
+            first_name="Test", last_name="User", email="fulfilment@example.com"
+        )
+        cls.product = Product.objects.create(
+            name="商品", sku="SKU-1", base_price=1, cost_price=0
+        )
+        Inventory.objects.create(product=cls.product, quantity_on_hand=10)
+
+    def _request(self, method, data, pk=None):
+        request = getattr(APIRequestFactory(), method)(
+            "/api/orders/", data, format="json"
+        )
+        force_authenticate(request, self.user)
+        action = "create" if method == "post" else "partial_update"
+        kwargs = {"pk": pk} if pk else {}
+        return OrderViewSet.as_view({method: action})(request, **kwargs)
+
+    def _create_order(self, quantity):
+        response = self._request(
+            "post",
+            {
+                "customer": self.customer.id,
+                "subtotal": quantity,
+                "items": [
+                    {
+                        "product_name": "商品",
+                        "product_sku": "SKU-1",
+                        "quantity": quantity,
+                        "unit_price": 1,
+                    }
+                ],
+            },
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return Order.objects.latest("id")
+
+    def _set_status(self, order, status):
+        return self._request("patch", {"status": status}, pk=order.pk)
+
+    def _stock(self):
+        inventory = Inventory.objects.get(product=self.product)
+        return inventory.quantity_on_hand, inventory.quantity_reserved
+
+    def _shipped(self, order):
+        return StockMovement.objects.filter(
+            reference_type="order", reference_id=order.pk, movement_type="outbound"
+        ).aggregate(total=Sum("quantity"))["total"]
+
+    def test_reserved_order_ships_once(self):
+        order = self._create_order(4)
+        self.assertEqual(self._stock(), (10, 4))
+
+        self._set_status(order, "shipped")
+        self.assertEqual(self._stock(), (6, 0))
+        self._set_status(order, "delivered")
+        self.assertEqual(self._stock(), (6, 0))
+        self.assertEqual(self._shipped(order), 4)
+        self.assertEqual(
+            list(StockReservation.objects.filter(order=order).values_list("status")),
+            [("fulfilled",)],
+        )
+
+    def test_expired_reservation_still_ships(self):
+        order = self._create_order(3)
+        expire_reservations(now=timezone.now() + timedelta(days=1))
+        self.assertEqual(self._stock(), (10, 0))
+
+        response = self._set_status(order, "shipped")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self._stock(), (7, 0))
+        self.assertEqual(self._shipped(order), 3)
+
+    def test_insufficient_stock_is_rejected_without_changes(self):
+        order = self._create_order(3)
+        expire_reservations(now=timezone.now() + timedelta(days=1))
+        Inventory.objects.filter(product=self.product).update(quantity_on_hand=2)
+
+        response = self._set_status(order, "shipped")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._stock(), (2, 0))
+        self.assertIsNone(self._shipped(order))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, "pending")
+
+    def _legacy_shipped_order(self, quantity, sku="SKU-1"):
+        """依狀態轉換出庫之前就已出貨的訂單：沒有任何預留紀錄"""
+        order = Order.objects.create(
+            customer=self.customer, status="shipped", subtotal=quantity
+        )
+        OrderItem.objects.create(
+            order=order,
+            product_name="商品",
+            product_sku=sku,
+            quantity=quantity,
+            unit_price=1,
+        )
+        return order
+
+    def test_shipped_order_changes_do_not_ship_again(self):
+        order = self._legacy_shipped_order(4)
+        self.assertEqual(self._set_status(order, "delivered").status_code, 200)
+        response = self._request(
+            "patch",
+            {
+                "items": [
+                    {
+                        "product_name": "商品",
+                        "product_sku": "SKU-1",
+                        "quantity": 5,
+                        "unit_price": 1,
+                    }
+                ]
+            },
+            pk=order.pk,
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self._stock(), (10, 0))
+        self.assertIsNone(self._shipped(order))
+
+    def test_backfill_marks_legacy_orders_fulfilled(self):
+        ProductVariant.objects.create(
+            product=self.product, name="款式", sku="SKU-1-V", price=1, cost_price=0
+        )
+        order = self._legacy_shipped_order(3, sku="SKU-1-V")
+        shipped = self._create_order(2)
+        self._set_status(shipped, "shipped")
+
+        migration = importlib.import_module(
+            "products.migrations.0005_backfill_fulfilled_reservations"
+        )
+        with connection.cursor() as cursor:
+            for _ in range(2):
+                cursor.execute(migration.BACKFILL_SQL)
+        self.assertEqual(
+            list(
+                StockReservation.objects.filter(status="fulfilled")
+                .order_by("order_id")
+                .values_list("order_id", "product_id", "quantity")
+            ),
+            [(order.pk, self.product.pk, 3), (shipped.pk, self.product.pk, 2)],
+        )
+
+        # 退回處理中後再出貨，不會把已出貨的數量再出庫一次
+        self._set_status(order, "processing")
+        self.assertEqual(self._stock(), (8, 3))
+        self._set_status(order, "shipped")
+        self.assertEqual(self._stock(), (8, 0))
+        self.assertIsNone(self._shipped(order))
+
+    def test_batch_shipped_orders_are_fulfilled(self):
+        def entry(key, status, quantity):
+            return {
+                "idempotency_key": key,
+                "customer": self.customer.id,
+                "status": status,
+                "subtotal": quantity,
+                "items": [
+                    {
+                        "product_name": "商品",
+                        "product_sku": "SKU-1",
+                        "quantity": quantity,
+                        "unit_price": 1,
+                    }
+                ],
+            }
+
+        results = batch.ingest_orders(
+            [
+                entry("held", "pending", 3),
+                entry("shipped", "delivered", 4),
+                entry("too-many", "shipped", 4),
+            ]
+        )
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["created", "created", "out_of_stock"],
+        )
+        self.assertEqual(self._stock(), (6, 3))
+        order = Order.objects.get(idempotency_key="shipped")
+        self.assertEqual(self._shipped(order), 4)
+        self.assertEqual(
+            list(StockReservation.objects.filter(order=order).values_list("status")),
+            [("fulfilled",)],
+        )
+        self.assertFalse(Order.objects.filter(idempotency_key="too-many").exists())
+
+
+def _at(month, day, hour=12):
+    return timezone.make_aware(datetime(2026, month, day, hour))
+
+
+class StockLedgerTests(TestCase):
+    """每月檢查點與時間點查詢的結果，要與從第一筆異動完整重播的結果一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("ledger")
+        cls.product = Product.objects.create(
+            name="商品", sku="SKU-1", base_price=1, cost_price=0
+        )
+        Inventory.objects.create(product=cls.product, quantity_on_hand=8)
+        # 1 月：+10 -3 → 7；2 月：+5 → 12，月中盤點為 9，-2 → 7；3 月：+1 → 8
+        for at, movement_type, quantity in [
+            (_at(1, 10), "inbound", 10),
+            (_at(1, 20), "outbound", 3),
+            (_at(2, 5), "inbound", 5),
+            (_at(2, 15), "stocktake", 9),
+            (_at(2, 20), "outbound", 2),
+            (_at(3, 3), "adjustment", 1),
+        ]:
+            cls._movement(at, movement_type, quantity)
+
+    @classmethod
+    def _movement(cls, at, movement_type, quantity):
+        movement = StockMovement.objects.create(
+            product=cls.product, movement_type=movement_type, quantity=quantity
+        )
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=at)
+
+    def _checkpoints(self):
+        return list(
+            InventoryCheckpoint.objects.order_by("as_of").values_list(
+                "as_of", "quantity_on_hand"
+            )
+        )
+
+    def _as_of(self, at, **kwargs):
+        return quantities_as_of(at, **kwargs).get(self.product.pk)
+
+    def test_monthly_checkpoints_with_stocktake_inside_month(self):
+        self.assertEqual(build_checkpoints(), 3)
+        self.assertEqual(
+            self._checkpoints(),
+            [(_at(2, 1, 0), 7), (_at(3, 1, 0), 7), (_at(4, 1, 0), 8)],
+        )
+
+        # 從最後一個檢查點接續，結果與完整重建相同
+        self._movement(_at(5, 2), "outbound", 3)
+        self._movement(_at(5, 9), "inbound", 4)
+        self.assertEqual(build_checkpoints(), 1)
+        incremental = self._checkpoints()
+        self.assertEqual(incremental[-1], (_at(6, 1, 0), 9))
+        build_checkpoints(rebuild=True)
+        self.assertEqual(self._checkpoints(), incremental)
+
+    def test_as_of_before_on_and_after_checkpoint(self):
+        build_checkpoints()
+        points = {
+            _at(1, 31, 23): 7,  # 檢查點之前
+            _at(2, 1, 0): 7,  # 正好在檢查點
+            _at(2, 10): 12,  # 檢查點之後、盤點之前
+            _at(2, 15): 12,  # 不含盤點當下
+            _at(2, 16): 9,  # 盤點之後
+            _at(3, 10): 8,
+            _at(9, 1): 8,
+        }
+        for at, expected in points.items():
+            with self.subTest(at=at):
+                self.assertEqual(self._as_of(at), expected)
+                self.assertEqual(self._as_of(at, use_checkpoints=False), expected)
+        self.assertIsNone(self._as_of(_at(1, 1)))
+
+        # 檢查點之後的時間點以檢查點為起點，不重播更早的異動
+        InventoryCheckpoint.objects.filter(as_of=_at(2, 1, 0)).update(
+            quantity_on_hand=100
+        )
+        self.assertEqual(self._as_of(_at(2, 10)), 105)
+        self.assertEqual(self._as_of(_at(2, 16)), 9)
+        self.assertEqual(self._as_of(_at(2, 10), use_checkpoints=False), 12)
+
+    def test_drift_report(self):
+        build_checkpoints()
+        other = Product.objects.create(
+            name="商品 2", sku="SKU-2", base_price=1, cost_price=0
+        )
+        Inventory.objects.create(product=other, quantity_on_hand=3)
+        Inventory.objects.filter(product=self.product).update(quantity_on_hand=5)
+        for use_checkpoints in (True, False):
+            with self.subTest(use_checkpoints=use_checkpoints):
+                self.assertEqual(
+                    detect_drift(use_checkpoints=use_checkpoints),
+                    [(self.product.pk, 5, 8), (other.pk, 3, 0)],
+                )
+
+        Inventory.objects.filter(product=self.product).update(quantity_on_hand=8)
+        Inventory.objects.filter(product=other).delete()
+        self.assertEqual(detect_drift(), [])
+
+    def test_as_of_endpoint_is_paginated(self):
+        other = Product.objects.create(
+            name="商品 2", sku="SKU-2", base_price=1, cost_price=0
+        )
+        Inventory.objects.create(product=other, quantity_on_hand=3)
+        request = APIRequestFactory().get(
+            "/api/products/inventory/as_of/",
+            {"date": "2026-02-15", "limit": 1, "ordering": "quantity_on_hand"},
+        )
+        force_authenticate(request, self.user)
+        view = InventoryViewSet.as_view(
+            {"get": "as_of"}, **InventoryViewSet.as_of.kwargs
+        )
+        data = view(request).data
+        self.assertEqual(data["count"], 2)
+        self.assertIsNotNone(data["next"])
+        self.assertEqual(data["as_of"], _at(2, 16, 0))
+        [row] = data["results"]
+        self.assertEqual(
+            (row["product"], row["quantity_on_hand"], row["current_quantity_on_hand"]),
+            (other.pk, 0, 3),
+        )
@@ -1,13 +1,16 @@
-from decimal import Decimal
-
-from django.db.models import Count, F, Q, Sum
-from django.db.models.functions import Coalesce
+from crm_backend.counts import CountedRelationsViewSetMixin, annotate_counts
+from crm_backend.export import StreamingExportMixin
+from crm_backend.fieldsets import SparseFieldsetViewSetMixin
+from django.db.models import Count, F, Q
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from transactions.ledger import parse_day
 
+from .inventory import InventoryError, apply_movement, apply_movements, save_inventory
 from .models import (
     Brand,
     Category,
@@ -30,12 +33,17 @@ from .serializers import (
     ProductListSerializer,
     ProductStatsSerializer,
     ProductVariantSerializer,
+    StockMovementBatchSerializer,
     StockMovementSerializer,
     SupplierSerializer,
 )
+from .stats import product_stats
+from .stock_ledger import quantities_as_of
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(
+    CountedRelationsViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet
+):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
@@ -54,6 +62,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         """取得分類下的所有產品"""
         category = self.get_object()
         products = category.products.filter(is_active=True)
+        products = annotate_counts(products, ProductListSerializer())
         serializer = ProductListSerializer(products, many=True)
         return Response(serializer.data)
 
@@ -68,7 +77,9 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class BrandViewSet(viewsets.ModelViewSet):
+class BrandViewSet(
+    CountedRelationsViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet
+):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
     permission_classes = [IsAuthenticated]
@@ -87,11 +98,14 @@ class BrandViewSet(viewsets.ModelViewSet):
         """取得品牌下的所有產品"""
         brand = self.get_object()
         products = brand.products.filter(is_active=True)
+        products = annotate_counts(products, ProductListSerializer())
         serializer = ProductListSerializer(products, many=True)
         return Response(serializer.data)
 
 
-class SupplierViewSet(viewsets.ModelViewSet):
+class SupplierViewSet(
+    CountedRelationsViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet
+):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     permission_classes = [IsAuthenticated]
@@ -110,11 +124,17 @@ class SupplierViewSet(viewsets.ModelViewSet):
         """取得供應商的所有產品"""
         supplier = self.get_object()
         products = supplier.products.filter(is_active=True)
+        products = annotate_counts(products, ProductListSerializer())
         serializer = ProductListSerializer(products, many=True)
         return Response(serializer.data)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(
+    StreamingExportMixin,
+    CountedRelationsViewSetMixin,
+    SparseFieldsetViewSetMixin,
+    viewsets.ModelViewSet,
+):
     permission_classes = [IsAuthenticated]
     filter_backends = [
         DjangoFilterBackend,
@@ -125,6 +145,19 @@ class ProductViewSet(viewsets.ModelViewSet):
     search_fields = ["name", "sku", "description"]
     ordering_fields = ["name", "sku", "base_price", "created_at"]
     ordering = ["-created_at"]
+    sparse_select_related = {
+        "category_name": ("category",),
+        "brand_name": ("brand",),
+        "supplier_name": ("supplier",),
+        "inventory": ("inventory",),
+    }
+    sparse_prefetch_related = {"variants": ("variants",)}
+    sparse_only_dependencies = {
+        "category_name": ("category",),
+        "brand_name": ("brand",),
+        "supplier_name": ("supplier",),
+        "profit_margin": ("base_price", "cost_price"),
+    }
 
     def get_queryset(self):
         return Product.objects.select_related(
@@ -181,7 +214,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         serializer = InventorySerializer(inventory, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            save_inventory(serializer)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -195,40 +228,20 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=["post"])
     def add_stock_movement(self, request, pk=None):
-        """新增庫存異動記錄"""
+        """新增庫存異動記錄並同步更新庫存"""
         product = self.get_object()
         serializer = StockMovementSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(product=product)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            # 更新庫存數量
-            movement_type = serializer.validated_data["movement_type"]
-            quantity = serializer.validated_data["quantity"]
-
-            try:
-                inventory = product.inventory
-                if movement_type == "inbound":
-                    inventory.quantity_on_hand += quantity
-                elif movement_type == "outbound":
-                    inventory.quantity_on_hand = max(
-                        0, inventory.quantity_on_hand - quantity
-                    )
-                elif movement_type == "adjustment":
-                    inventory.quantity_on_hand = max(
-                        0, inventory.quantity_on_hand + quantity
-                    )
-                inventory.save()
-            except Inventory.DoesNotExist:
-                # 如果庫存不存在，建立新的
-                if movement_type == "inbound" or (
-                    movement_type == "adjustment" and quantity > 0
-                ):
-                    Inventory.objects.create(
-                        product=product, quantity_on_hand=max(0, quantity)
-                    )
-
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        movement = StockMovement(**{**serializer.validated_data, "product": product})
+        try:
+            apply_movement(movement)
+        except InventoryError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            StockMovementSerializer(movement).data, status=status.HTTP_201_CREATED
+        )
 
     @action(detail=True, methods=["get"])
     def price_history(self, request, pk=None):
@@ -240,50 +253,23 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"])
     def stats(self, request):
-        """產品統計資訊"""
-        total_products = Product.objects.count()
-        active_products = Product.objects.filter(is_active=True).count()
-        total_categories = Category.objects.filter(is_active=True).count()
-        total_brands = Brand.objects.filter(is_active=True).count()
-        total_suppliers = Supplier.objects.filter(is_active=True).count()
-
-        # 庫存警示統計
-        low_stock_items = Inventory.objects.filter(
-            quantity_on_hand__lte=F("reorder_level")
-        ).count()
-        out_of_stock_items = Inventory.objects.filter(quantity_on_hand=0).count()
-
-        # 庫存總價值
-        inventory_value = Inventory.objects.annotate(
-            value=F("quantity_on_hand") * F("product__cost_price")
-        ).aggregate(total_value=Coalesce(Sum("value"), Decimal("0.00")))["total_value"]
-
-        stats_data = {
-            "total_products": total_products,
-            "active_products": active_products,
-            "total_categories": total_categories,
-            "total_brands": total_brands,
-            "total_suppliers": total_suppliers,
-            "low_stock_items": low_stock_items,
-            "out_of_stock_items": out_of_stock_items,
-            "total_inventory_value": inventory_value,
-        }
-
-        serializer = ProductStatsSerializer(stats_data)
+        """產品統計資訊 (快取，見 products/stats.py)"""
+        serializer = ProductStatsSerializer(product_stats())
         return Response(serializer.data)
 
     @action(detail=False, methods=["get"])
     def low_stock_alerts(self, request):
         """低庫存警示"""
+        # reorder_level 不小於 0，缺貨必定也符合這個條件 (可使用低庫存的部分索引)
         low_stock_inventory = Inventory.objects.filter(
-            Q(quantity_on_hand__lte=F("reorder_level")) | Q(quantity_on_hand=0)
+            quantity_on_hand__lte=F("reorder_level")
         ).select_related("product", "variant", "product__category")
 
         serializer = InventoryAlertSerializer(low_stock_inventory, many=True)
         return Response(serializer.data)
 
 
-class ProductVariantViewSet(viewsets.ModelViewSet):
+class ProductVariantViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = ProductVariant.objects.select_related("product").all()
     serializer_class = ProductVariantSerializer
     permission_classes = [IsAuthenticated]
@@ -296,9 +282,10 @@ class ProductVariantViewSet(viewsets.ModelViewSet):
     search_fields = ["name", "sku", "product__name"]
     ordering_fields = ["name", "sku", "price", "created_at"]
     ordering = ["product", "name"]
+    sparse_select_related = {"inventory": ("inventory",)}
 
 
-class InventoryViewSet(viewsets.ModelViewSet):
+class InventoryViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = Inventory.objects.select_related("product", "variant").all()
     serializer_class = InventorySerializer
     permission_classes = [IsAuthenticated]
@@ -310,6 +297,11 @@ class InventoryViewSet(viewsets.ModelViewSet):
     search_fields = ["product__name", "product__sku", "variant__name", "location"]
     ordering_fields = ["quantity_on_hand", "quantity_available", "last_updated"]
     ordering = ["-last_updated"]
+    sparse_only_dependencies = {
+        "quantity_available": ("quantity_on_hand", "quantity_reserved"),
+        "is_low_stock": ("quantity_on_hand", "quantity_reserved", "reorder_level"),
+        "is_out_of_stock": ("quantity_on_hand", "quantity_reserved"),
+    }
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -324,9 +316,49 @@ class InventoryViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def perform_create(self, serializer) -> None:
+        save_inventory(serializer)
+
+    def perform_update(self, serializer) -> None:
+        save_inventory(serializer)
 
-class StockMovementViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=["get"])
+    def as_of(self, request):
+        """
+        某日結束時的庫存 (依庫存異動重播)，與列表相同的篩選與分頁
+        - date：YYYY-MM-DD (必填)
+        """
+        try:
+            at = parse_day(request.query_params.get("date", ""), end=True)
+        except ValueError:
+            return Response(
+                {"detail": "date 格式應為 YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        quantities = quantities_as_of(
+            at, product_ids={inventory.product_id for inventory in page}
+        )
+        rows = [
+            {
+                "product": inventory.product_id,
+                "product_name": inventory.product.name,
+                "product_sku": inventory.product.sku,
+                "quantity_on_hand": quantities.get(inventory.product_id, 0),
+                "current_quantity_on_hand": inventory.quantity_on_hand,
+            }
+            for inventory in page
+        ]
+        response = self.get_paginated_response(rows)
+        response.data["as_of"] = at
+        return response
+
+
+class StockMovementViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = StockMovement.objects.select_related("product", "variant").all()
+    # 異動記錄只新增不修改 (庫存數量以異動重播)，更正請新增調整或盤點異動
+    http_method_names = ["get", "post", "head", "options"]
     serializer_class = StockMovementSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [
@@ -338,9 +370,61 @@ class StockMovementViewSet(viewsets.ModelViewSet):
     search_fields = ["product__name", "product__sku", "variant__name", "notes"]
     ordering_fields = ["created_at", "quantity"]
     ordering = ["-created_at"]
-
-
-class PriceHistoryViewSet(viewsets.ModelViewSet):
+    sparse_select_related = {
+        "product_name": ("product",),
+        "variant_name": ("variant",),
+    }
+    sparse_only_dependencies = {
+        "movement_type_display": ("movement_type",),
+        "reference_type_display": ("reference_type",),
+    }
+
+    def perform_create(self, serializer) -> None:
+        movement = StockMovement(**serializer.validated_data)
+        try:
+            apply_movement(movement)
+        except InventoryError as exc:
+            raise ValidationError({"detail": str(exc)}) from exc
+        serializer.instance = movement
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        批次新增庫存異動 (最多 1000 筆)，依順序套用，任一筆失敗時全部不寫入
+        request body：{"movements": [{"product": 1, "movement_type": "inbound",
+        "quantity": 10, "reference_type": "purchase"}, ...]}
+        """
+        serializer = StockMovementBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        movements = [
+            StockMovement(**item) for item in serializer.validated_data["movements"]
+        ]
+        try:
+            created = apply_movements(movements)
+        except InventoryError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        inventories = Inventory.objects.filter(
+            product_id__in={movement.product_id for movement in created}
+        ).order_by("product_id")
+        return Response(
+            {
+                "created": len(created),
+                "movement_ids": [movement.id for movement in created],
+                "inventory": [
+                    {
+                        "product": inventory.product_id,
+                        "quantity_on_hand": inventory.quantity_on_hand,
+                        "quantity_available": inventory.quantity_available,
+                    }
+                    for inventory in inventories
+                ],
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class PriceHistoryViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = PriceHistory.objects.select_related("product", "variant").all()
     serializer_class = PriceHistorySerializer
     permission_classes = [IsAuthenticated]
@@ -353,3 +437,8 @@ class PriceHistoryViewSet(viewsets.ModelViewSet):
     search_fields = ["product__name", "product__sku", "variant__name", "change_reason"]
     ordering_fields = ["effective_date", "created_at"]
     ordering = ["-created_at"]
+    sparse_select_related = {
+        "product_name": ("product",),
+        "variant_name": ("variant",),
+    }
+    sparse_only_dependencies = {"price_change_percentage": ("old_price", "new_price")}
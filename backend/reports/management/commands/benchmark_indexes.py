@@ -0,0 +1,242 @@
+"""
+交易資料表索引策略的效能基準測試
+
+以暫存資料表模擬只追加寫入的交易資料 (created_at 遞增)，分別套用調整前的索引
+(before) 與目前資料庫上的索引 (current)，比較寫入速度、索引大小與常用查詢的延遲：
+
+    python manage.py benchmark_indexes --rows 500000 --repeat 20
+
+暫存資料表只存在於這次連線，不會影響實際資料。
+"""
+
+import re
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from transactions.models import Transaction
+
+BENCH_TABLE = "bench_transactions"
+
+# 調整前的索引：每個欄位各自一個 B-tree，transaction_id / order_id 重複建立，
+# unique=True 的字串欄位另有 varchar_pattern_ops 索引
+BEFORE_INDEXES = [
+    "CREATE UNIQUE INDEX ON {table} (id)",
+    "CREATE UNIQUE INDEX ON {table} (transaction_id)",
+    "CREATE INDEX ON {table} (transaction_id varchar_pattern_ops)",
+    "CREATE UNIQUE INDEX ON {table} (gateway_transaction_id)",
+    "CREATE INDEX ON {table} (gateway_transaction_id varchar_pattern_ops)",
+    "CREATE INDEX ON {table} (customer_id)",
+    "CREATE INDEX ON {table} (order_id)",
+    "CREATE INDEX ON {table} (created_by_id)",
+    "CREATE INDEX ON {table} (updated_by_id)",
+    "CREATE INDEX ON {table} (transaction_id)",
+    "CREATE INDEX ON {table} (customer_id, created_at, id)",
+    "CREATE INDEX ON {table} (order_id)",
+    "CREATE INDEX ON {table} (status)",
+    "CREATE INDEX ON {table} (created_at)",
+    "CREATE INDEX ON {table} (status, created_at)"
+    " INCLUDE (amount_base, net_amount_base)",
+]
+
+# 模擬資料：約 80% 已完成，created_at 依序遞增，分散到 --days 天
+INSERT_SQL = """
+INSERT INTO {table} (
+    transaction_id, customer_id, order_id, transaction_type, payment_method,
+    status, amount, fee_amount, net_amount, currency, amount_base,
+    net_amount_base, created_at, updated_at
+)
+SELECT 'BENCH-' || n,
+       1 + (n * 7919) %% %(customers)s,
+       CASE WHEN n %% 5 = 0 THEN NULL ELSE 1 + (n * 104729) %% %(orders)s END,
+       CASE WHEN n %% 20 = 0 THEN 'refund' ELSE 'sale' END,
+       'credit_card',
+       CASE WHEN n %% 10 < 8 THEN 'completed' ELSE 'pending' END,
+       10 + n %% 990, 1, 9 + n %% 990, 'USD', 10 + n %% 990, 9 + n %% 990,
+       %(start)s + n * %(step)s, %(start)s + n * %(step)s
+FROM generate_series(%(first)s::bigint, %(last)s) AS n
+"""
+
+QUERIES = [
+    (
+        "營收加總 (近 30 天已完成)",
+        "SELECT SUM(amount_base), SUM(net_amount_base) FROM {table}"
+        " WHERE status = 'completed' AND created_at >= %(recent)s",
+    ),
+    (
+        "每日營收 (近 90 天已完成)",
+        "SELECT date_trunc('day', created_at), SUM(amount_base) FROM {table}"
+        " WHERE status = 'completed' AND created_at >= %(quarter)s GROUP BY 1",
+    ),
+    (
+        "交易數 (近 30 天全部狀態)",
+        "SELECT COUNT(*) FROM {table} WHERE created_at >= %(recent)s",
+    ),
+    (
+        "最新交易列表 (依 id，預設排序)",
+        "SELECT id FROM {table} ORDER BY id DESC LIMIT 20",
+    ),
+    (
+        "最新交易列表 (?ordering=-created_at)",
+        "SELECT id FROM {table} ORDER BY created_at DESC LIMIT 20",
+    ),
+    (
+        "已完成交易列表 (前 20 筆)",
+        "SELECT id FROM {table} WHERE status = 'completed'"
+        " ORDER BY created_at DESC LIMIT 20",
+    ),
+    (
+        "客戶交易時間軸",
+        "SELECT id FROM {table} WHERE customer_id = %(customer)s"
+        " ORDER BY created_at DESC, id DESC LIMIT 20",
+    ),
+    (
+        "訂單的交易",
+        "SELECT id FROM {table} WHERE order_id = %(order)s",
+    ),
+    (
+        "以交易編號查詢",
+        "SELECT id FROM {table} WHERE transaction_id = %(transaction_id)s",
+    ),
+]
+
+
+def _current_indexes() -> list[str]:
+    """目前資料庫上交易資料表的索引定義，改成建立在暫存資料表上"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s ORDER BY indexname",
+            [Transaction._meta.db_table],
+        )
+        definitions = [row[0] for row in cursor.fetchall()]
+    return [
+        re.sub(
+            r"^CREATE (UNIQUE )?INDEX \S+ ON (?:ONLY )?\S+ ",
+            r"CREATE \1INDEX ON {table} ",
+            definition,
+        )
+        for definition in definitions
+    ]
+
+
+class Command(BaseCommand):
+    help = "比較調整前後的交易索引：寫入速度、索引大小與查詢延遲"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--rows", type=int, default=200000, help="模擬的交易筆數")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="每個 INSERT 寫入的筆數"
+        )
+        parser.add_argument("--days", type=int, default=365, help="模擬資料分散的天數")
+        parser.add_argument(
+            "--repeat", type=int, default=10, help="每個查詢執行幾次取中位數"
+        )
+
+    def handle(self, *args, **options) -> None:
+        if connection.vendor != "postgresql":
+            raise CommandError("索引基準測試僅支援 PostgreSQL")
+        if options["rows"] < options["batch_size"]:
+            raise CommandError("--rows 必須大於等於 --batch-size")
+
+        results = {}
+        for name, indexes in (
+            ("before", BEFORE_INDEXES),
+            ("current", _current_indexes()),
+        ):
+            self.stdout.write(f"== {name}: {len(indexes)} 個索引")
+            for definition in indexes:
+                self.stdout.write(f"   {definition.format(table=BENCH_TABLE)}")
+            results[name] = self._run(indexes, options)
+
+        self._report(results)
+
+    def _run(self, indexes, options) -> dict:
+        rows, batch_size = options["rows"], options["batch_size"]
+        end = timezone.now()
+        start = end - timedelta(days=options["days"])
+        step = (end - start) / rows
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+            cursor.execute(
+                f"CREATE TEMP TABLE {BENCH_TABLE} (LIKE {Transaction._meta.db_table}"
+                " INCLUDING DEFAULTS INCLUDING IDENTITY)"
+            )
+            for definition in indexes:
+                cursor.execute(definition.format(table=BENCH_TABLE))
+
+            insert = INSERT_SQL.format(table=BENCH_TABLE)
+            params = {
+                "customers": 1000,
+                "orders": max(rows // 3, 1),
+                "start": start,
+                "step": step,
+            }
+            started = time.perf_counter()
+            for first in range(0, rows, batch_size):
+                params.update(first=first, last=min(first + batch_size, rows) - 1)
+                cursor.execute(insert, params)
+            insert_seconds = time.perf_counter() - started
+
+            # 模擬 autovacuum：更新統計資料並摘要 BRIN 範圍
+            cursor.execute(f"VACUUM ANALYZE {BENCH_TABLE}")
+            cursor.execute(
+                "SELECT pg_indexes_size(%s), pg_relation_size(%s)",
+                [BENCH_TABLE, BENCH_TABLE],
+            )
+            index_bytes, table_bytes = cursor.fetchone()
+
+            query_params = {
+                "recent": end - timedelta(days=30),
+                "quarter": end - timedelta(days=90),
+                "customer": 42,
+                "order": rows // 7,
+                "transaction_id": f"BENCH-{rows // 2}",
+            }
+            latencies = {}
+            for label, sql in QUERIES:
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    cursor.execute(sql.format(table=BENCH_TABLE), query_params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - started) * 1000)
+                latencies[label] = statistics.median(timings)
+
+            cursor.execute(f"DROP TABLE {BENCH_TABLE}")
+
+        return {
+            "rows_per_second": rows / insert_seconds,
+            "index_mb": index_bytes / 1024 / 1024,
+            "table_mb": table_bytes / 1024 / 1024,
+            "latencies": latencies,
+        }
+
+    def _report(self, results) -> None:
+        before, current = results["before"], results["current"]
+        self.stdout.write("")
+        self.stdout.write(f"{'指標':<32}{'before':>12}{'current':>12}{'變化':>10}")
+        rows = [
+            ("寫入 (筆/秒)", "rows_per_second", "{:,.0f}"),
+            ("索引大小 (MB)", "index_mb", "{:.1f}"),
+            ("資料表大小 (MB)", "table_mb", "{:.1f}"),
+        ]
+        for label, key, fmt in rows:
+            self._line(label, before[key], current[key], fmt)
+        for label in before["latencies"]:
+            self._line(
+                f"{label} (ms)",
+                before["latencies"][label],
+                current["latencies"][label],
+                "{:.2f}",
+            )
+
+    def _line(self, label, before, current, fmt) -> None:
+        change = (current - before) / before * 100 if before else 0
+        self.stdout.write(
+            f"{label:<32}{fmt.format(before):>12}{fmt.format(current):>12}"
+            f"{change:>+9.0f}%"
+        )
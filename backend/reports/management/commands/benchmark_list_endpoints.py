@@ -0,0 +1,131 @@
+"""
+列表 API 效能基準測試
+
+比較完整輸出與稀疏欄位 (?fields= / ?expand=) 的回應大小、序列化時間與查詢數：
+
+    python manage.py benchmark_list_endpoints --limit 100 --repeat 5
+
+加上 --check-constant 時，會另外以 1 筆與 --limit 筆各請求一次，
+查詢數不同 (也就是逐筆產生 N+1 查詢) 的端點會讓指令以錯誤結束：
+
+    python manage.py benchmark_list_endpoints --limit 100 --check-constant
+"""
+
+import statistics
+import time
+
+from customer_service.views import ServiceTicketViewSet
+from customers.views import CustomerViewSet
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from orders.views import OrderViewSet
+from products.views import ProductViewSet
+from rest_framework.test import APIRequestFactory, force_authenticate
+from transactions.views import TransactionViewSet
+
+# (名稱, ViewSet, 查詢參數)；每個端點都有一組完整輸出與一組列表頁實際需要的欄位
+BENCHMARK_CASES = [
+    ("customers", CustomerViewSet, ""),
+    (
+        "customers (sparse)",
+        CustomerViewSet,
+        "fields=full_name,email,phone,company,source,is_active,created_at",
+    ),
+    ("orders", OrderViewSet, ""),
+    (
+        "orders (sparse)",
+        OrderViewSet,
+        "fields=order_number,status,order_date,total&expand=customer_info",
+    ),
+    ("transactions", TransactionViewSet, ""),
+    (
+        "transactions (sparse)",
+        TransactionViewSet,
+        "fields=transaction_id,transaction_type,payment_method,status,amount,"
+        "currency,created_at&expand=customer_info",
+    ),
+    ("products", ProductViewSet, ""),
+    (
+        "products (sparse)",
+        ProductViewSet,
+        "fields=name,sku,category_name,base_price,is_active",
+    ),
+    ("tickets", ServiceTicketViewSet, ""),
+    (
+        "tickets (sparse)",
+        ServiceTicketViewSet,
+        "fields=ticket_number,title,priority,status,created_at",
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = "量測列表 API 在完整輸出與稀疏欄位下的回應大小、序列化時間與查詢數"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--limit", type=int, default=20, help="每頁筆數")
+        parser.add_argument("--repeat", type=int, default=5, help="重複次數")
+        parser.add_argument(
+            "--only", nargs="*", default=None, help="只執行名稱包含這些字串的案例"
+        )
+        parser.add_argument(
+            "--check-constant",
+            action="store_true",
+            help="檢查查詢數不隨每頁筆數增加",
+        )
+
+    def _request(self, view, params):
+        request = self.factory.get(f"/?{params}")
+        force_authenticate(request, user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            elapsed = (time.perf_counter() - started) * 1000
+        return response, elapsed, len(queries)
+
+    def handle(self, *args, **options) -> None:
+        self.factory = APIRequestFactory()
+        self.user = User(username="benchmark", is_staff=True)
+
+        self.stdout.write(
+            f"{'endpoint':<24}{'bytes':>12}{'median ms':>12}{'queries':>10}"
+        )
+        growing = []
+        for name, viewset_class, query in BENCHMARK_CASES:
+            if options["only"] and not any(key in name for key in options["only"]):
+                continue
+
+            view = viewset_class.as_view({"get": "list"})
+            params = f"limit={options['limit']}"
+            if query:
+                params = f"{params}&{query}"
+
+            timings = []
+            payload_size = 0
+            query_count = 0
+            for _ in range(options["repeat"]):
+                response, elapsed, query_count = self._request(view, params)
+                timings.append(elapsed)
+                payload_size = len(response.content)
+
+            self.stdout.write(
+                f"{name:<24}{payload_size:>12,}"
+                f"{statistics.median(timings):>12.1f}{query_count:>10}"
+            )
+
+            if options["check_constant"]:
+                single_params = params.replace(
+                    f"limit={options['limit']}", "limit=1", 1
+                )
+                _, _, single_count = self._request(view, single_params)
+                if single_count != query_count:
+                    growing.append(f"{name} ({single_count} → {query_count})")
+
+        if growing:
+            raise CommandError(f"查詢數隨筆數增加：{', '.join(growing)}")
+        if options["check_constant"]:
+            self.stdout.write(self.style.SUCCESS("所有端點的查詢數皆與筆數無關"))
@@ -0,0 +1,176 @@
+"""
+訂單 / 交易資料表的月份分割管理
+
+    # 查看各資料表的分割狀態
+    python manage.py manage_partitions status
+
+    # 將現有資料表轉換為分割表 (只印出 SQL，加上 --execute 才會執行)
+    # 不含分割欄位的唯一約束與其他資料表的外鍵改由鍵表 <table>_keys 維持，
+    # status 會列出轉換時的變更與無法轉換的原因
+    python manage.py manage_partitions convert --execute
+
+    # 預先建立未來 3 個月的分割區
+    python manage.py manage_partitions create --months-ahead 3 --execute
+
+    # 卸離 2025-01 之前的分割區並移到 archive schema
+    python manage.py manage_partitions detach --before 2025-01 \\
+        --archive-schema archive --execute
+"""
+
+from datetime import date
+
+from crm_backend.partitioning import (
+    PARTITIONED_TABLES,
+    PartitioningError,
+    add_months,
+    conversion_blockers,
+    conversion_sql,
+    create_partition_sql,
+    detach_partition_sql,
+    execute,
+    expired_partitions,
+    global_uniques,
+    incoming_foreign_keys,
+    is_partitioned,
+    keys_table,
+    list_partitions,
+    missing_partition_months,
+    month_start,
+)
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+
+def _parse_month(value) -> date:
+    try:
+        year, month = value.split("-")
+        return date(int(year), int(month), 1)
+    except ValueError as exc:
+        raise CommandError(f"月份格式應為 YYYY-MM：{value}") from exc
+
+
+class Command(BaseCommand):
+    help = "管理訂單 / 交易資料表的月份分割：轉換、建立未來分割區、卸離舊分割區"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("action", choices=["status", "convert", "create", "detach"])
+        parser.add_argument(
+            "--tables",
+            nargs="*",
+            choices=list(PARTITIONED_TABLES),
+            default=list(PARTITIONED_TABLES),
+            help="要處理的資料表，預設為全部",
+        )
+        parser.add_argument(
+            "--months-ahead", type=int, default=3, help="預先建立幾個月的分割區"
+        )
+        parser.add_argument(
+            "--before", help="detach：卸離此月份 (YYYY-MM) 之前的分割區"
+        )
+        parser.add_argument("--archive-schema", help="detach：卸離後移到此 schema")
+        parser.add_argument(
+            "--drop", action="store_true", help="detach：卸離後直接刪除資料"
+        )
+        parser.add_argument(
+            "--execute", action="store_true", help="實際執行 (預設只印出 SQL)"
+        )
+
+    def handle(self, *args, **options) -> None:
+        if connection.vendor != "postgresql":
+            raise CommandError("資料表分割僅支援 PostgreSQL")
+
+        for table in options["tables"]:
+            partitioned = is_partitioned(table)
+            if options["action"] == "status":
+                self._status(table, partitioned)
+                continue
+
+            if options["action"] == "convert":
+                if partitioned:
+                    self.stdout.write(f"{table}: 已經是分割表，略過")
+                    continue
+                try:
+                    statements = conversion_sql(table, PARTITIONED_TABLES[table])
+                except PartitioningError as exc:
+                    raise CommandError(str(exc)) from exc
+                # 轉換後一併建立未來月份的分割區
+                statements.extend(
+                    create_partition_sql(table, month)
+                    for month in self._future_months(options["months_ahead"])
+                )
+            else:
+                if not partitioned:
+                    self.stdout.write(f"{table}: 尚未轉換為分割表，略過")
+                    continue
+                statements = self._statements(table, options)
+
+            self._run(table, statements, options["execute"])
+
+    def _statements(self, table, options) -> list[str]:
+        if options["action"] == "create":
+            return [
+                create_partition_sql(table, month)
+                for month in missing_partition_months(table, options["months_ahead"])
+            ]
+
+        if not options["before"]:
+            raise CommandError("detach 需要指定 --before")
+        if options["drop"] and options["archive_schema"]:
+            raise CommandError("--drop 與 --archive-schema 只能擇一")
+        statements = []
+        for partition in expired_partitions(table, _parse_month(options["before"])):
+            statements.extend(
+                detach_partition_sql(
+                    table,
+                    partition,
+                    archive_schema=options["archive_schema"],
+                    drop=options["drop"],
+                )
+            )
+        return statements
+
+    @staticmethod
+    def _future_months(months_ahead) -> list[date]:
+        # 轉換時 legacy 分割區已涵蓋本月，從下個月開始建立
+        current = month_start(timezone.localdate())
+        return [add_months(current, offset) for offset in range(1, months_ahead + 1)]
+
+    def _status(self, table, partitioned) -> None:
+        if not partitioned:
+            column = PARTITIONED_TABLES[table]
+            self.stdout.write(f"{table}: 未分割")
+            for unique in global_uniques(table, column):
+                self.stdout.write(
+                    f"  唯一索引 {unique.name} ({', '.join(unique.columns)})"
+                    f" 將移到 {keys_table(table)}"
+                )
+            for referencing, name, _, _ in incoming_foreign_keys(table):
+                if referencing != table:
+                    self.stdout.write(
+                        f"  {referencing} 的外鍵 {name} 將改為參照 {keys_table(table)}"
+                    )
+            for blocker in conversion_blockers(table, column):
+                self.stdout.write(f"  無法轉換：{blocker}")
+            return
+        self.stdout.write(f"{table}:")
+        for partition in list_partitions(table):
+            if partition.is_default:
+                bounds = "DEFAULT"
+            else:
+                bounds = f"{partition.lower or 'MINVALUE'} ~ {partition.upper}"
+            self.stdout.write(f"  {partition.name:<40}{bounds}")
+
+    def _run(self, table, statements, run) -> None:
+        if not statements:
+            self.stdout.write(f"{table}: 沒有需要執行的變更")
+            return
+        if not run:
+            self.stdout.write(f"-- {table}")
+            for statement in statements:
+                self.stdout.write(f"{statement};")
+            return
+        execute(statements)
+        self.stdout.write(
+            self.style.SUCCESS(f"{table}: 已執行 {len(statements)} 個 SQL 指令")
+        )
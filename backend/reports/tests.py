@@ -1 +1,213 @@
-# Create your tests here.
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from crm_backend.partitioning import (
+    PARTITIONED_TABLES,
+    PartitioningError,
+    conversion_sql,
+    is_partitioned,
+    keys_table,
+    list_partitions,
+)
+from customers.models import Customer
+from django.core.management import call_command
+from django.db import IntegrityError, connection, models, transaction
+from django.test import TestCase
+from django.utils import timezone
+from orders import batch
+from orders.models import Order, OrderItem, OrderStatusEvent
+from transactions import gateway
+from transactions.models import Transaction
+
+
+def _check_constraints():
+    """立即檢查延後的外鍵，之後恢復為延後檢查 (Django 刪除時依賴延後檢查)"""
+    with connection.cursor() as cursor:
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+
+
+class PartitionConversionTests(TestCase):
+    """
+    在完整 migrate 後的結構上轉換三張資料表；DDL 隨測試的交易一併回滾
+    轉換前已存在的資料也要回填到鍵表
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name="Test", last_name="User", email="partition@example.com"
+        )
+        cls.order = Order.objects.create(
+            customer=cls.customer,
+            idempotency_key="before",
+            subtotal=Decimal("10.00"),
+            total=Decimal("10.00"),
+        )
+        cls.item = OrderItem.objects.create(
+            order=cls.order,
+            product_name="商品",
+            quantity=1,
+            unit_price=Decimal("10.00"),
+        )
+        cls.txn = Transaction.objects.create(
+            customer=cls.customer,
+            order=cls.order,
+            status="completed",
+            amount=Decimal("10.00"),
+            net_amount=Decimal("10.00"),
+            gateway_transaction_id="gw-before",
+        )
+
+    def setUp(self):
+        # 實際轉換在獨立的交易中執行；測試中先觸發 setUpTestData 延後的外鍵檢查
+        _check_constraints()
+        call_command("manage_partitions", "convert", "--execute", stdout=StringIO())
+        # 金流匯入每個行程只檢查一次交易表是否分割
+        gateway._partitioned.cache_clear()
+        self.addCleanup(gateway._partitioned.cache_clear)
+
+    def _keys(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id FROM {keys_table(table)} ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_tables_are_partitioned(self):
+        for table in PARTITIONED_TABLES:
+            with self.subTest(table=table):
+                self.assertTrue(is_partitioned(table))
+                self.assertTrue(any(p.is_default for p in list_partitions(table)))
+        self.assertEqual(self._keys("orders_order"), [self.order.pk])
+        self.assertEqual(self._keys("transactions_transaction"), [self.txn.pk])
+
+    def test_order_uniqueness_and_idempotency(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(
+                customer=self.customer,
+                order_number=self.order.order_number,
+                subtotal=Decimal("1.00"),
+                total=Decimal("1.00"),
+            )
+
+        entry = {
+            "idempotency_key": "after",
+            "customer": self.customer.id,
+            "status": "pending",
+            "subtotal": "10.00",
+            "items": [{"product_name": "商品", "quantity": 1, "unit_price": "10.00"}],
+        }
+        [created] = batch.ingest_orders([entry])
+        self.assertEqual(created["status"], "created")
+        results = batch.ingest_orders([entry, {**entry, "idempotency_key": "before"}])
+        self.assertEqual(
+            [(r["status"], r["id"]) for r in results],
+            [("duplicate", created["id"]), ("duplicate", self.order.pk)],
+        )
+
+        # 預先查詢沒看到冪等鍵 (其他請求剛寫入) 時，由鍵表的唯一約束擋下
+        real = batch._existing_orders
+        with mock.patch.object(batch, "_existing_orders") as existing_orders:
+            existing_orders.side_effect = lambda entries: (
+                {} if existing_orders.call_count == 1 else real(entries)
+            )
+            [raced] = batch.ingest_orders([{**entry, "idempotency_key": "before"}])
+        self.assertEqual((raced["status"], raced["id"]), ("duplicate", self.order.pk))
+        self.assertEqual(self._keys("orders_order"), [self.order.pk, created["id"]])
+
+    def test_foreign_keys_reference_key_tables(self):
+        missing = self.order.pk + 1000
+        for model, values in (
+            (OrderItem, {"order_id": missing}),
+            (Transaction, {"order_id": missing}),
+        ):
+            with self.subTest(model=model.__name__):
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    model.objects.all().update(**values)
+                    _check_constraints()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderStatusEvent.objects.create(
+                order_id=missing, from_status="", to_status="pending"
+            )
+            _check_constraints()
+
+        # 刪除訂單時 Django 先刪除明細與交易，鍵表同步移除
+        self.order.delete()
+        _check_constraints()
+        self.assertEqual(self._keys("orders_order"), [])
+        self.assertEqual(self._keys("transactions_transaction"), [])
+
+    def test_moving_rows_across_partitions_keeps_keys(self):
+        moved = timezone.now() - timedelta(days=400)
+        Order.objects.filter(pk=self.order.pk).update(order_date=moved)
+        _check_constraints()
+        self.assertEqual(self._keys("orders_order"), [self.order.pk])
+        self.assertEqual(Order.objects.get(pk=self.order.pk).order_date, moved)
+
+    def test_gateway_upsert_on_partitioned_table(self):
+        def event(occurred_at, status, key="gw-1"):
+            return {
+                "gateway_transaction_id": key,
+                "occurred_at": occurred_at,
+                "status": status,
+                "amount": "10.00",
+                "customer": self.customer.id,
+            }
+
+        results = gateway.ingest_gateway_events(
+            [
+                event("2026-01-01T10:00Z", "pending"),
+                event("2026-01-01T10:00Z", "refunded", key="gw-before"),
+            ]
+        )
+        self.assertEqual([r["status"] for r in results], ["inserted", "updated"])
+        [updated] = gateway.ingest_gateway_events(
+            [event("2026-01-01T11:00Z", "completed")]
+        )
+        [stale] = gateway.ingest_gateway_events([event("2026-01-01T10:30Z", "failed")])
+        self.assertEqual([updated["status"], stale["status"]], ["updated", "stale"])
+        self.assertEqual(
+            dict(Transaction.objects.values_list("gateway_transaction_id", "status")),
+            {"gw-1": "completed", "gw-before": "refunded"},
+        )
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Transaction.objects.create(
+                customer=self.customer,
+                transaction_id=self.txn.transaction_id,
+                amount=Decimal("1.00"),
+                net_amount=Decimal("1.00"),
+            )
+
+    def test_later_migrations_still_apply(self):
+        field = models.CharField(max_length=20, null=True, blank=True)
+        field.set_attributes_from_name("batch_code")
+        index = models.Index(fields=["product_name"], name="orders_item_name_idx")
+        with connection.schema_editor() as editor:
+            editor.add_field(OrderItem, field)
+            editor.add_index(OrderItem, index)
+
+        item = OrderItem.objects.create(
+            order=self.order,
+            product_name="商品",
+            quantity=1,
+            unit_price=Decimal("10.00"),
+        )
+        self.assertEqual(self.order.items.count(), 2)
+        # CHECK 約束在分割表上仍然有效
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderItem.objects.filter(pk=item.pk).update(quantity=-1)
+
+
+class PartitionBlockerTests(TestCase):
+    def test_refuses_partial_unique_index_without_partition_column(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE UNIQUE INDEX orders_open_number ON orders_order"
+                " (order_number) WHERE status = 'pending'"
+            )
+        with self.assertRaises(PartitioningError) as raised:
+            conversion_sql("orders_order", PARTITIONED_TABLES["orders_order"])
+        self.assertIn("orders_open_number", str(raised.exception))
+        self.assertFalse(is_partitioned("orders_order"))
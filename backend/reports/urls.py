@@ -13,4 +13,5 @@ urlpatterns = [
     ),
     path("customer-clv/", views.customer_clv_analytics, name="customer_clv_analytics"),
     path("revenue/", views.revenue_analytics, name="revenue_analytics"),
+    path("geo/", views.geo_analytics, name="geo_analytics"),
 ]
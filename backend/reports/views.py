@@ -1,17 +1,34 @@
 import contextlib
 import operator
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 
-from customers.models import Customer
-from django.db.models import Avg, Count, DecimalField, F, Q, Sum, Value
+from customers.interests import interest_facets
+from customers.models import Customer, CustomerStats
+from django.conf import settings
+from django.db.models import Avg, Count, DecimalField, F, Min, Q, Sum, Value
 from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncYear
 from django.utils import timezone
 from orders.models import Order
+from orders.status_history import status_distribution_series
+from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from transactions.models import Transaction
 
+# 交易金額一律加總換算成 BASE_CURRENCY 的欄位，不同幣別才能相加；
+# 手續費 = 換算後金額 - 換算後淨額
+BASE_FEES = F("amount_base") - F("net_amount_base")
+
+
+def day_start(day) -> datetime:
+    """
+    當地時間 day 的 00:00
+    日期篩選一律轉成 [day_start(起), day_start(迄 + 1 天)) 的時間範圍，
+    不對欄位做 ::date 轉換，查詢才能使用索引與依月份分割的資料表裁剪
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
@@ -34,18 +51,20 @@ def dashboard_stats(request):
     if date_from:
         try:
             date_from = datetime.strptime(date_from, "%Y-%m-%d").date()
-            customers_qs = customers_qs.filter(created_at__date__gte=date_from)
-            orders_qs = orders_qs.filter(order_date__date__gte=date_from)
-            transactions_qs = transactions_qs.filter(created_at__date__gte=date_from)
+            date_from_start = day_start(date_from)
+            customers_qs = customers_qs.filter(created_at__gte=date_from_start)
+            orders_qs = orders_qs.filter(order_date__gte=date_from_start)
+            transactions_qs = transactions_qs.filter(created_at__gte=date_from_start)
         except ValueError:
             pass
 
     if date_to:
         try:
             date_to = datetime.strptime(date_to, "%Y-%m-%d").date()
-            customers_qs = customers_qs.filter(created_at__date__lte=date_to)
-            orders_qs = orders_qs.filter(order_date__date__lte=date_to)
-            transactions_qs = transactions_qs.filter(created_at__date__lte=date_to)
+            date_to_end = day_start(date_to + timedelta(days=1))
+            customers_qs = customers_qs.filter(created_at__lt=date_to_end)
+            orders_qs = orders_qs.filter(order_date__lt=date_to_end)
+            transactions_qs = transactions_qs.filter(created_at__lt=date_to_end)
         except ValueError:
             pass
 
@@ -59,6 +78,10 @@ def dashboard_stats(request):
         orders_qs = orders_qs.filter(customer__tags__icontains=tags)
         transactions_qs = transactions_qs.filter(customer__tags__icontains=tags)
 
+    # 今日 / 本月以時間範圍比較，可以使用索引與分割區裁剪
+    today_start = day_start(timezone.localdate())
+    month_start = day_start(timezone.localdate().replace(day=1))
+
     # 計算關鍵指標
     stats = {
         "overview": {
@@ -66,10 +89,10 @@ def dashboard_stats(request):
             "total_orders": orders_qs.count(),
             "total_transactions": transactions_qs.count(),
             "total_revenue": float(
-                transactions_qs.aggregate(Sum("amount"))["amount__sum"] or 0
+                transactions_qs.aggregate(total=Sum("amount_base"))["total"] or 0
             ),
             "net_revenue": float(
-                transactions_qs.aggregate(Sum("net_amount"))["net_amount__sum"] or 0
+                transactions_qs.aggregate(total=Sum("net_amount_base"))["total"] or 0
             ),
             "average_order_value": float(
                 orders_qs.aggregate(Avg("total"))["total__avg"] or 0
@@ -80,14 +103,14 @@ def dashboard_stats(request):
         },
         "customer_stats": {
             "new_customers_today": customers_qs.filter(
-                created_at__date=timezone.now().date()
+                created_at__gte=today_start
             ).count(),
             "new_customers_this_month": customers_qs.filter(
-                created_at__month=timezone.now().month
+                created_at__gte=month_start
             ).count(),
             "avg_customer_value": float(
                 transactions_qs.values("customer")
-                .annotate(customer_total=Sum("amount"))
+                .annotate(customer_total=Sum("amount_base"))
                 .aggregate(Avg("customer_total"))["customer_total__avg"]
                 or 0
             ),
@@ -104,21 +127,13 @@ def dashboard_stats(request):
             "avg_purchase_frequency": float(
                 calculate_avg_purchase_frequency(customers_qs)
             ),  # 平均購買頻率
-            "high_value_customers": customers_qs.annotate(
-                total_spent=Coalesce(
-                    Sum("orders__total"), Value(0), output_field=DecimalField()
-                )
-            )
-            .filter(total_spent__gte=10000)
-            .count(),
+            "high_value_customers": customers_qs.filter(
+                stats__total_spent__gte=10000
+            ).count(),
         },
         "order_stats": {
-            "orders_today": orders_qs.filter(
-                order_date__date=timezone.now().date()
-            ).count(),
-            "orders_this_month": orders_qs.filter(
-                order_date__month=timezone.now().month
-            ).count(),
+            "orders_today": orders_qs.filter(order_date__gte=today_start).count(),
+            "orders_this_month": orders_qs.filter(order_date__gte=month_start).count(),
             "pending_orders": orders_qs.filter(status="pending").count(),
             "order_status_distribution": list(
                 orders_qs.values("status")
@@ -128,17 +143,17 @@ def dashboard_stats(request):
         },
         "transaction_stats": {
             "transactions_today": transactions_qs.filter(
-                created_at__date=timezone.now().date()
+                created_at__gte=today_start
             ).count(),
             "transactions_this_month": transactions_qs.filter(
-                created_at__month=timezone.now().month
+                created_at__gte=month_start
             ).count(),
             "total_fees": float(
-                transactions_qs.aggregate(Sum("fee_amount"))["fee_amount__sum"] or 0
+                transactions_qs.aggregate(total=Sum(BASE_FEES))["total"] or 0
             ),
             "payment_methods": list(
                 transactions_qs.values("payment_method")
-                .annotate(count=Count("id"), total_amount=Sum("amount"))
+                .annotate(count=Count("id"), total_amount=Sum("amount_base"))
                 .order_by("-total_amount")
             ),
         },
@@ -174,18 +189,20 @@ def trend_analysis(request):
     if date_from:
         try:
             date_from = datetime.strptime(date_from, "%Y-%m-%d").date()
-            customers_qs = customers_qs.filter(created_at__date__gte=date_from)
-            orders_qs = orders_qs.filter(order_date__date__gte=date_from)
-            transactions_qs = transactions_qs.filter(created_at__date__gte=date_from)
+            date_from_start = day_start(date_from)
+            customers_qs = customers_qs.filter(created_at__gte=date_from_start)
+            orders_qs = orders_qs.filter(order_date__gte=date_from_start)
+            transactions_qs = transactions_qs.filter(created_at__gte=date_from_start)
         except ValueError:
             pass
 
     if date_to:
         try:
             date_to = datetime.strptime(date_to, "%Y-%m-%d").date()
-            customers_qs = customers_qs.filter(created_at__date__lte=date_to)
-            orders_qs = orders_qs.filter(order_date__date__lte=date_to)
-            transactions_qs = transactions_qs.filter(created_at__date__lte=date_to)
+            date_to_end = day_start(date_to + timedelta(days=1))
+            customers_qs = customers_qs.filter(created_at__lt=date_to_end)
+            orders_qs = orders_qs.filter(order_date__lt=date_to_end)
+            transactions_qs = transactions_qs.filter(created_at__lt=date_to_end)
         except ValueError:
             pass
 
@@ -208,7 +225,9 @@ def trend_analysis(request):
         transactions_qs.annotate(date=trunc_func("created_at"))
         .values("date")
         .annotate(
-            count=Count("id"), total_amount=Sum("amount"), total_fees=Sum("fee_amount")
+            count=Count("id"),
+            total_amount=Sum("amount_base"),
+            total_fees=Sum(BASE_FEES),
         )
         .order_by("date")
     )
@@ -217,12 +236,65 @@ def trend_analysis(request):
         "customer_trend": customer_trend,
         "order_trend": order_trend,
         "transaction_trend": transaction_trend,
+        "order_status_trend": order_status_trend(
+            period,
+            date_from if isinstance(date_from, date) else None,
+            date_to if isinstance(date_to, date) else None,
+        ),
         "period": period,
     }
 
     return Response(trends)
 
 
+# 未指定日期區間時，狀態趨勢預設涵蓋的期數
+STATUS_TREND_DEFAULT_PERIODS = {"day": 30, "month": 12, "year": 5}
+MAX_STATUS_TREND_PERIODS = 366
+
+
+def _next_period_start(period, day) -> date:
+    if period == "day":
+        return day + timedelta(days=1)
+    if period == "month":
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day.replace(year=day.year + 1, month=1, day=1)
+
+
+def _period_start(period, day) -> date:
+    if period == "day":
+        return day
+    if period == "month":
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def order_status_trend(period, date_from=None, date_to=None):
+    """
+    各期間結束時 (下一期的 00:00) 的訂單狀態分布，例如每天結束時仍在 pending 的訂單數
+    以每日快照加上事件增減計算，不需要逐期查詢
+    """
+    if period not in STATUS_TREND_DEFAULT_PERIODS:
+        period = "year"
+    date_to = date_to or timezone.localdate()
+    if date_from is None:
+        date_from = _period_start(period, date_to)
+        for _ in range(STATUS_TREND_DEFAULT_PERIODS[period] - 1):
+            date_from = _period_start(period, date_from - timedelta(days=1))
+
+    starts = [_period_start(period, date_from)]
+    while _next_period_start(period, starts[-1]) <= date_to:
+        starts.append(_next_period_start(period, starts[-1]))
+    starts = starts[-MAX_STATUS_TREND_PERIODS:]
+
+    points = [day_start(day) for day in starts]
+    points.append(day_start(_next_period_start(period, starts[-1])))
+    series = status_distribution_series(points)
+    return [
+        {"date": start, "statuses": distribution}
+        for start, distribution in zip(starts, series[1:], strict=True)
+    ]
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def customer_analytics(request):
@@ -231,13 +303,8 @@ def customer_analytics(request):
     """
     # 客戶價值分析
     customer_value_segments = (
-        Customer.objects.filter(is_active=True)
-        .extra(
-            select={
-                "total_spent": "SELECT COALESCE(SUM(total), 0) FROM orders_order WHERE customer_id = customers_customer.id"
-            }
-        )
-        .extra(where=["total_spent > 0"])
+        Customer.objects.filter(is_active=True, stats__total_spent__gt=0)
+        .annotate(total_spent=F("stats__total_spent"))
         .values("id", "first_name", "last_name", "email", "total_spent")
         .order_by("-total_spent")[:10]
     )
@@ -296,23 +363,27 @@ def revenue_analytics(request):
     if date_from:
         try:
             date_from = datetime.strptime(date_from, "%Y-%m-%d").date()
-            transactions_qs = transactions_qs.filter(created_at__date__gte=date_from)
+            date_from_start = day_start(date_from)
+            transactions_qs = transactions_qs.filter(created_at__gte=date_from_start)
         except ValueError:
             pass
 
     if date_to:
         try:
             date_to = datetime.strptime(date_to, "%Y-%m-%d").date()
-            transactions_qs = transactions_qs.filter(created_at__date__lte=date_to)
+            date_to_end = day_start(date_to + timedelta(days=1))
+            transactions_qs = transactions_qs.filter(created_at__lt=date_to_end)
         except ValueError:
             pass
 
     # 營收統計
     revenue_stats = transactions_qs.aggregate(
-        total_revenue=Sum("amount"),
-        net_revenue=Sum("net_amount"),
-        total_fees=Sum("fee_amount"),
+        total_revenue=Sum("amount_base"),
+        net_revenue=Sum("net_amount_base"),
+        total_fees=Sum(BASE_FEES),
         transaction_count=Count("id"),
+        # 查無匯率、尚未換算的交易不計入金額
+        unconverted_count=Count("id", filter=Q(amount_base__isnull=True)),
     )
 
     # 按付款方式分析
@@ -320,9 +391,9 @@ def revenue_analytics(request):
         transactions_qs.values("payment_method")
         .annotate(
             count=Count("id"),
-            total_amount=Sum("amount"),
-            avg_amount=Avg("amount"),
-            total_fees=Sum("fee_amount"),
+            total_amount=Sum("amount_base"),
+            avg_amount=Avg("amount_base"),
+            total_fees=Sum(BASE_FEES),
         )
         .order_by("-total_amount")
     )
@@ -331,7 +402,9 @@ def revenue_analytics(request):
     transaction_type_analysis = list(
         transactions_qs.values("transaction_type")
         .annotate(
-            count=Count("id"), total_amount=Sum("amount"), avg_amount=Avg("amount")
+            count=Count("id"),
+            total_amount=Sum("amount_base"),
+            avg_amount=Avg("amount_base"),
         )
         .order_by("-total_amount")
     )
@@ -342,6 +415,8 @@ def revenue_analytics(request):
             "net_revenue": float(revenue_stats["net_revenue"] or 0),
             "total_fees": float(revenue_stats["total_fees"] or 0),
             "transaction_count": revenue_stats["transaction_count"],
+            "base_currency": settings.BASE_CURRENCY,
+            "unconverted_count": revenue_stats["unconverted_count"],
             "avg_transaction_value": float(revenue_stats["total_revenue"] or 0)
             / max(revenue_stats["transaction_count"], 1),
         },
@@ -373,14 +448,16 @@ def customer_demographics_analytics(request):
     if date_from:
         try:
             date_from = datetime.strptime(date_from, "%Y-%m-%d").date()
-            customers_qs = customers_qs.filter(created_at__date__gte=date_from)
+            date_from_start = day_start(date_from)
+            customers_qs = customers_qs.filter(created_at__gte=date_from_start)
         except ValueError:
             pass
 
     if date_to:
         try:
             date_to = datetime.strptime(date_to, "%Y-%m-%d").date()
-            customers_qs = customers_qs.filter(created_at__date__lte=date_to)
+            date_to_end = day_start(date_to + timedelta(days=1))
+            customers_qs = customers_qs.filter(created_at__lt=date_to_end)
         except ValueError:
             pass
 
@@ -410,16 +487,7 @@ def customer_demographics_analytics(request):
 
     for group_name, min_age, max_age in age_groups:
         group_customers = customers_qs.filter(age__gte=min_age, age__lte=max_age)
-        total_spent = 0
-        total_orders = 0
-
-        for customer in group_customers:
-            customer_orders = Order.objects.filter(customer=customer)
-            customer_total = customer_orders.aggregate(Sum("total"))["total__sum"] or 0
-            total_spent += customer_total
-            total_orders += customer_orders.count()
-
-        count = group_customers.count()
+        count, total_spent, total_orders = aggregate_customer_stats(group_customers)
         age_analysis.append(
             {
                 "age_group": group_name,
@@ -440,16 +508,7 @@ def customer_demographics_analytics(request):
     gender_analysis = []
     for gender_code, gender_display in gender_choices:
         gender_customers = customers_qs.filter(gender=gender_code)
-        total_spent = 0
-        total_orders = 0
-
-        for customer in gender_customers:
-            customer_orders = Order.objects.filter(customer=customer)
-            customer_total = customer_orders.aggregate(Sum("total"))["total__sum"] or 0
-            total_spent += customer_total
-            total_orders += customer_orders.count()
-
-        count = gender_customers.count()
+        count, total_spent, total_orders = aggregate_customer_stats(gender_customers)
         gender_analysis.append(
             {
                 "gender": gender_code,
@@ -482,19 +541,15 @@ def customer_demographics_analytics(request):
         .count()
     )
 
+    # 一次查詢展開興趣陣列並依類別彙總客戶數與消費額
+    category_facets = {
+        facet["category"]: facet
+        for facet in interest_facets(customers_qs, with_spend=True)
+    }
     for category in product_categories:
-        # 使用 PostgreSQL JSON 查詢來找到包含此類別的客戶
-        interested_customers = customers_qs.filter(
-            product_categories_interest__contains=[category]
-        )
-
-        total_spent = 0
-        for customer in interested_customers:
-            customer_orders = Order.objects.filter(customer=customer)
-            customer_total = customer_orders.aggregate(Sum("total"))["total__sum"] or 0
-            total_spent += customer_total
-
-        count = interested_customers.count()
+        facet = category_facets.get(category, {})
+        count = facet.get("customer_count", 0)
+        total_spent = facet.get("total_spent", 0)
         product_preferences.append(
             {
                 "category": category,
@@ -525,16 +580,7 @@ def customer_demographics_analytics(request):
 
     for season_code, season_display in seasonal_choices:
         season_customers = customers_qs.filter(seasonal_purchase_pattern=season_code)
-        total_spent = 0
-        total_orders = 0
-
-        for customer in season_customers:
-            customer_orders = Order.objects.filter(customer=customer)
-            customer_total = customer_orders.aggregate(Sum("total"))["total__sum"] or 0
-            total_spent += customer_total
-            total_orders += customer_orders.count()
-
-        count = season_customers.count()
+        count, total_spent, total_orders = aggregate_customer_stats(season_customers)
         seasonal_analysis.append(
             {
                 "season": season_code,
@@ -564,12 +610,10 @@ def customer_demographics_analytics(request):
             return "一般客戶"
         return "潛在客戶"
 
-    for customer in customers_qs.filter(age__isnull=False)[
+    for customer in customers_qs.filter(age__isnull=False).select_related("stats")[
         :100
     ]:  # 限制返回數量以提高性能
-        customer_orders = Order.objects.filter(customer=customer)
-        total_spent = customer_orders.aggregate(Sum("total"))["total__sum"] or 0
-        total_orders = customer_orders.count()
+        total_spent, total_orders = get_customer_totals(customer)
 
         customer_segments.append(
             {
@@ -604,24 +648,11 @@ def customer_demographics_analytics(request):
         "潛在客戶": "#EF4444",
     }
 
-    for customer in customers_qs:
-        customer_orders = Order.objects.filter(customer=customer)
-        total_spent = customer_orders.aggregate(Sum("total"))["total__sum"] or 0
-        total_orders = customer_orders.count()
-
-        # 計算客戶等級
-        if total_spent >= 60000:
-            tier = "白金客戶"
-        elif total_spent >= 20000 and total_orders >= 1:
-            tier = "黃金客戶"
-        elif total_spent >= 5000 and total_orders >= 2:
-            tier = "白銀客戶"
-        elif total_spent > 0 and total_orders >= 1:
-            tier = "一般客戶"
-        else:
-            tier = "潛在客戶"
-
-        tier_counts[tier] += 1
+    # 只讀取統計欄位，一次查詢取得全部客戶的消費金額與訂單數
+    for total_spent, total_orders in customers_qs.values_list(
+        "stats__total_spent", "stats__order_count"
+    ):
+        tier_counts[get_customer_tier(total_spent or 0, total_orders or 0)] += 1
 
     for tier, count in tier_counts.items():
         if count > 0:
@@ -674,6 +705,97 @@ def customer_demographics_analytics(request):
     return Response(analytics)
 
 
+# 地區彙總的層級與分組欄位；城市以正規化後的 city_key 分組
+GEO_LEVELS = {
+    "country": ["country_code"],
+    "state": ["country_code", "state_code"],
+    "city": ["country_code", "state_code", "city_key"],
+}
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def geo_analytics(request):
+    """
+    地區彙總：各地區的客戶數與營收
+    以標準化的地區代碼分組，營收讀取 CustomerStats，不需要掃描訂單
+
+    查詢參數：
+    - level: country / state / city (預設 country)；city 層級另以 city_name
+      輸出該組中的一個原始城市名稱供顯示
+    - country_code、state_code: 只看指定地區 (例如 ?level=state&country_code=TW)
+    - source、is_active: 客戶篩選
+    """
+    level = request.GET.get("level", "country")
+    if level not in GEO_LEVELS:
+        return Response(
+            {"error": f"level 必須是 {', '.join(GEO_LEVELS)} 其中之一"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    customers_qs = Customer.objects.all()
+    for field in ("country_code", "state_code", "source"):
+        value = request.GET.get(field)
+        if value:
+            customers_qs = customers_qs.filter(**{field: value})
+    is_active = request.GET.get("is_active")
+    if is_active:
+        customers_qs = customers_qs.filter(is_active=is_active.lower() == "true")
+
+    group_fields = GEO_LEVELS[level]
+    labels = {"city_name": Min("city")} if level == "city" else {}
+    regions = (
+        customers_qs.values(*group_fields)
+        .annotate(
+            **labels,
+            customer_count=Count("id"),
+            active_customers=Count("id", filter=Q(is_active=True)),
+            total_orders=Coalesce(Sum("stats__order_count"), Value(0)),
+            total_revenue=Coalesce(
+                Sum("stats__total_spent"), Value(0), output_field=DecimalField()
+            ),
+        )
+        .order_by("-total_revenue", *group_fields)
+    )
+
+    results = [
+        {
+            **region,
+            "total_revenue": float(region["total_revenue"]),
+            "avg_revenue_per_customer": float(
+                region["total_revenue"] / region["customer_count"]
+            ),
+        }
+        for region in regions
+    ]
+    return Response({"level": level, "results": results})
+
+
+def aggregate_customer_stats(customers_qs):
+    """
+    從 CustomerStats 一次彙總客戶數、總消費額與總訂單數
+    """
+    result = customers_qs.aggregate(
+        count=Count("id"),
+        total_spent=Coalesce(
+            Sum("stats__total_spent"), Value(0), output_field=DecimalField()
+        ),
+        total_orders=Coalesce(Sum("stats__order_count"), Value(0)),
+    )
+    return result["count"], result["total_spent"], result["total_orders"]
+
+
+def get_customer_totals(customer):
+    """
+    取得單一客戶的 (總消費額, 總訂單數)；尚未建立統計時視為 0
+    """
+    try:
+        stats = customer.stats
+    except CustomerStats.DoesNotExist:
+        return 0, 0
+    return stats.total_spent, stats.order_count
+
+
 def calculate_avg_clv(customers_qs):
     """
     計算平均客戶生命週期價值 (CLV)
@@ -686,25 +808,21 @@ def calculate_avg_clv(customers_qs):
     5. CLV = 顧客價值 × 平均顧客壽命
     """
 
-    customers_with_orders = customers_qs.filter(orders__isnull=False).distinct()
+    customers_with_orders = customers_qs.filter(stats__order_count__gt=0)
+    customer_count, total_revenue, total_orders = aggregate_customer_stats(
+        customers_with_orders
+    )
 
-    if not customers_with_orders.exists():
+    if customer_count == 0:
         return 0
 
     # 1. 計算平均客單價 (Average Purchase Value)
     # 該期間總購買金額 ÷ 該期間總訂單數
-    total_revenue = (
-        Order.objects.filter(customer__in=customers_with_orders).aggregate(
-            Sum("total")
-        )["total__sum"]
-        or 0
-    )
-    total_orders = Order.objects.filter(customer__in=customers_with_orders).count()
     avg_purchase_value = float(total_revenue) / total_orders if total_orders > 0 else 0
 
     # 2. 計算平均消費頻率 (Average Purchase Frequency)
     # 該期間總訂單數 ÷ 該期間消費客戶數
-    avg_purchase_frequency = float(total_orders) / customers_with_orders.count()
+    avg_purchase_frequency = float(total_orders) / customer_count
 
     # 3. 計算顧客價值 (Customer Value)
     # 平均消費頻率 × 平均客單價
@@ -715,14 +833,11 @@ def calculate_avg_clv(customers_qs):
     total_lifespan_days = 0
     lifespan_customer_count = 0
 
-    for customer in customers_with_orders:
-        customer_orders = customer.orders.all()
-        if customer_orders.count() > 1:  # 至少要有2筆訂單才能計算壽命
-            first_order = customer_orders.earliest("order_date")
-            last_order = customer_orders.latest("order_date")
-            lifespan_days = (
-                last_order.order_date.date() - first_order.order_date.date()
-            ).days
+    for order_count, first_order_at, last_order_at in customers_with_orders.values_list(
+        "stats__order_count", "stats__first_order_at", "stats__last_order_at"
+    ):
+        if order_count > 1:  # 至少要有2筆訂單才能計算壽命
+            lifespan_days = (last_order_at.date() - first_order_at.date()).days
             # 限制最大壽命為2年（730天），避免測試數據造成的異常大值
             lifespan_days = min(max(lifespan_days, 30), 730)
             total_lifespan_days += lifespan_days
@@ -746,7 +861,7 @@ def calculate_avg_clv(customers_qs):
 
     # Debug: 列印計算過程，幫助診斷問題
     print("DEBUG CLV 計算過程:")
-    print(f"  客戶數: {customers_with_orders.count()}")
+    print(f"  客戶數: {customer_count}")
     print(f"  總營收: ${total_revenue:,.2f}")
     print(f"  總訂單數: {total_orders}")
     print(f"  平均客單價: ${avg_purchase_value:,.2f}")
@@ -768,20 +883,16 @@ def calculate_avg_purchase_frequency(customers_qs):
     from datetime import date
 
     # 計算有訂單的客戶數和總訂單數
-    customers_with_orders = customers_qs.filter(orders__isnull=False).distinct()
-
-    if not customers_with_orders.exists():
-        return 0
-
-    total_orders = Order.objects.filter(customer__in=customers_with_orders).count()
+    customers_with_orders = customers_qs.filter(stats__order_count__gt=0)
+    _, _, total_orders = aggregate_customer_stats(customers_with_orders)
 
     # 計算平均客戶生命週期（月）
     total_months = 0
     customer_count = 0
 
-    for customer in customers_with_orders:
+    for created_at in customers_with_orders.values_list("created_at", flat=True):
         # 計算客戶從註冊到現在的月數
-        customer_age_days = (date.today() - customer.created_at.date()).days
+        customer_age_days = (date.today() - created_at.date()).days
         customer_age_months = max(customer_age_days / 30, 1)  # 至少1個月
         total_months += customer_age_months
         customer_count += 1
@@ -820,14 +931,16 @@ def customer_clv_analytics(request):
     if date_from:
         try:
             date_from = datetime.strptime(date_from, "%Y-%m-%d").date()
-            customers_qs = customers_qs.filter(created_at__date__gte=date_from)
+            date_from_start = day_start(date_from)
+            customers_qs = customers_qs.filter(created_at__gte=date_from_start)
         except ValueError:
             pass
 
     if date_to:
         try:
             date_to = datetime.strptime(date_to, "%Y-%m-%d").date()
-            customers_qs = customers_qs.filter(created_at__date__lte=date_to)
+            date_to_end = day_start(date_to + timedelta(days=1))
+            customers_qs = customers_qs.filter(created_at__lt=date_to_end)
         except ValueError:
             pass
 
@@ -848,7 +961,7 @@ def customer_clv_analytics(request):
     # 1. CLV 概覽統計
     # 重新計算不使用 annotated 字段的聚合
     total_customers = customers_qs.count()
-    customers_with_orders = customers_qs.filter(orders__isnull=False).distinct().count()
+    customers_with_orders = customers_qs.filter(stats__order_count__gt=0).count()
 
     # 使用修正後的 CLV 計算公式（真正的生命週期價值）
     avg_clv = float(calculate_avg_clv(customers_qs))
@@ -880,14 +993,23 @@ def customer_clv_analytics(request):
         ("頂級客戶", 20000, float("inf")),
     ]
 
-    # 建立客戶消費額字典（用於分布分析）
-    customer_clv_dict = {}
-    for customer in customers_qs.filter(orders__isnull=False).distinct():
-        # 使用客戶總消費額作為個人價值指標
-        customer_total_spent = (
-            customer.orders.aggregate(total=Sum("total"))["total"] or 0
+    # 一次讀出有消費客戶的統計，供以下各項分析共用
+    customer_rows = list(
+        customers_qs.filter(stats__order_count__gt=0).values_list(
+            "id",
+            "source",
+            "created_at",
+            "stats__total_spent",
+            "stats__order_count",
         )
-        customer_clv_dict[customer.id] = float(customer_total_spent)
+    )
+
+    # 建立客戶消費額字典（用於分布分析）
+    # 使用客戶總消費額作為個人價值指標
+    customer_clv_dict = {
+        customer_id: float(total_spent)
+        for customer_id, _, _, total_spent, _ in customer_rows
+    }
 
     for segment_name, min_clv, max_clv in clv_ranges:
         segment_customers = []
@@ -920,14 +1042,7 @@ def customer_clv_analytics(request):
     # 3. 按來源的 CLV 分析
     source_clv_dict = {}
 
-    for customer in customers_qs.filter(orders__isnull=False).distinct():
-        source = customer.source
-        # 計算每個客戶的總消費額（作為個人 CLV 的簡化版本）
-        customer_total_spent = (
-            customer.orders.aggregate(total=Sum("total"))["total"] or 0
-        )
-        customer_orders = customer.orders.count()
-
+    for customer_id, source, _, customer_total_spent, customer_orders in customer_rows:
         if source not in source_clv_dict:
             source_clv_dict[source] = {
                 "customers": [],
@@ -935,7 +1050,7 @@ def customer_clv_analytics(request):
                 "total_orders": 0,
             }
 
-        source_clv_dict[source]["customers"].append(customer.id)
+        source_clv_dict[source]["customers"].append(customer_id)
         source_clv_dict[source]["total_spent"] += float(customer_total_spent)
         source_clv_dict[source]["total_orders"] += customer_orders
 
@@ -944,9 +1059,7 @@ def customer_clv_analytics(request):
         count = len(data["customers"])
 
         # 計算該來源的真正 CLV（生命週期價值）
-        source_customers_qs = customers_qs.filter(
-            source=source, orders__isnull=False
-        ).distinct()
+        source_customers_qs = customers_qs.filter(source=source)
         source_avg_clv = float(calculate_avg_clv(source_customers_qs))
         source_total_clv = source_avg_clv * count
 
@@ -971,11 +1084,14 @@ def customer_clv_analytics(request):
         customer_clv_dict.items(), key=operator.itemgetter(1), reverse=True
     )[:20]
 
+    top_customers = Customer.objects.select_related("stats").in_bulk(
+        [customer_id for customer_id, _ in sorted_customers]
+    )
     top_customers_list = []
     for customer_id, total_spent in sorted_customers:
         try:
-            customer = Customer.objects.get(id=customer_id)
-            customer_orders = customer.orders.count()
+            customer = top_customers[customer_id]
+            customer_orders = customer.stats.order_count
 
             customer_data = {
                 "id": customer.id,
@@ -992,15 +1108,14 @@ def customer_clv_analytics(request):
                 else 0,
             }
             top_customers_list.append(customer_data)
-        except Customer.DoesNotExist:
+        except (KeyError, CustomerStats.DoesNotExist):
             continue
 
     # 5. 月度 CLV 趨勢（新客戶的平均 CLV）
     monthly_trends = {}
 
-    for customer in customers_qs.filter(orders__isnull=False).distinct():
-        month = customer.created_at.strftime("%Y-%m")
-        customer_total = customer.orders.aggregate(total=Sum("total"))["total"] or 0
+    for _, _, created_at, customer_total, _ in customer_rows:
+        month = created_at.strftime("%Y-%m")
 
         if month not in monthly_trends:
             monthly_trends[month] = {
@@ -0,0 +1,158 @@
+"""
+匯率載入與基準幣別金額換算
+
+- 匯率檔可以是 CSV (欄位 date, currency, rate) 或 JSON 陣列 (相同的 key)，
+  rate 為 1 單位 currency 換算成 BASE_CURRENCY 的金額
+- 交易寫入時以 FxRate.rate_for 換算 amount_base / net_amount_base；
+  批次匯入以 RateTable 一次載入匯率，不逐筆查詢
+- 補算 / 修正匯率後以 recompute_base_amounts 依 id 範圍分批 UPDATE，
+  以相關子查詢取當天 (或之前最近一天) 的匯率，不需要把交易載入 Python
+"""
+
+import csv
+import json
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import DateField, DecimalField, F, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Cast, Round, Upper
+from django.utils import timezone
+
+from .models import FxRate, Transaction, to_base
+
+BATCH_SIZE = 10000
+
+_BASE_AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+
+class RateTable:
+    """記憶體中的匯率表，批次換算多筆交易時只查一次資料庫"""
+
+    def __init__(self, currencies) -> None:
+        self._days = defaultdict(list)
+        self._rates = defaultdict(list)
+        rows = FxRate.objects.filter(
+            currency__in={currency.upper() for currency in currencies}
+        ).order_by("currency", "day")
+        for currency, day, rate in rows.values_list("currency", "day", "rate"):
+            self._days[currency].append(day)
+            self._rates[currency].append(rate)
+
+    def rate(self, currency, day) -> Decimal | None:
+        currency = currency.upper()
+        if currency == settings.BASE_CURRENCY:
+            return Decimal(1)
+        index = bisect_right(self._days[currency], day) - 1
+        return self._rates[currency][index] if index >= 0 else None
+
+    def convert(self, amount, currency, day) -> Decimal | None:
+        rate = self.rate(currency, day)
+        return None if rate is None else to_base(amount, rate)
+
+
+def parse_rates(path) -> list[FxRate]:
+    """讀取匯率檔，格式錯誤時拋出 ValueError (含行號)"""
+    text = Path(path).read_text(encoding="utf-8")
+    if text.lstrip().startswith("["):
+        rows = json.loads(text)
+    else:
+        rows = list(csv.DictReader(text.splitlines()))
+
+    source = Path(path).name
+    rates = []
+    for line, row in enumerate(rows, start=1):
+        try:
+            rate = Decimal(str(row["rate"]))
+            if rate <= 0:
+                raise ValueError("rate 必須大於 0")
+            rates.append(
+                FxRate(
+                    currency=row["currency"].strip().upper(),
+                    day=date.fromisoformat(str(row["date"]).strip()),
+                    rate=rate,
+                    source=source,
+                )
+            )
+        except (KeyError, AttributeError, ValueError, InvalidOperation) as exc:
+            raise ValueError(f"第 {line} 筆匯率格式錯誤：{exc}") from exc
+    return rates
+
+
+def load_rates(rates) -> dict[str, date]:
+    """
+    寫入匯率 (同一幣別同一天已存在時覆蓋)
+    回傳 {幣別: 最早的異動日期}，該日期之後的交易需要重新換算
+    """
+    FxRate.objects.bulk_create(
+        rates,
+        batch_size=5000,
+        update_conflicts=True,
+        unique_fields=["currency", "day"],
+        update_fields=["rate", "source", "updated_at"],
+    )
+    changed = {}
+    for rate in rates:
+        if rate.currency not in changed or rate.day < changed[rate.currency]:
+            changed[rate.currency] = rate.day
+    return changed
+
+
+def _rate_subquery():
+    return Subquery(
+        FxRate.objects.filter(
+            currency=Upper(OuterRef("currency")),
+            # 資料庫連線時區與 TIME_ZONE 相同，::date 即為當地日期
+            day__lte=Cast(OuterRef("created_at"), DateField()),
+        )
+        .order_by("-day")
+        .values("rate")[:1]
+    )
+
+
+def _converted(field, rate):
+    return Round(F(field) * rate, 2, output_field=_BASE_AMOUNT)
+
+
+def recompute_base_amounts(transactions=None, batch_size=BATCH_SIZE) -> int:
+    """
+    重新換算 transactions (預設全部) 的基準幣別金額，依 id 範圍分批更新
+    查無匯率的交易會設為 NULL；回傳更新筆數
+    """
+    if transactions is None:
+        transactions = Transaction.objects.all()
+    bounds = transactions.aggregate(min_id=Min("id"), max_id=Max("id"))
+    if bounds["min_id"] is None:
+        return 0
+
+    is_base = Q(currency__iexact=settings.BASE_CURRENCY)
+    rate = _rate_subquery()
+    # QuerySet.update 不會觸發 auto_now；寫入 updated_at，分類帳檢查點才會重建
+    now = timezone.now()
+    updated = 0
+    for start_id in range(bounds["min_id"], bounds["max_id"] + 1, batch_size):
+        batch = transactions.filter(id__gte=start_id, id__lt=start_id + batch_size)
+        updated += batch.filter(is_base).update(
+            amount_base=F("amount"), net_amount_base=F("net_amount"), updated_at=now
+        )
+        updated += batch.exclude(is_base).update(
+            amount_base=_converted("amount", rate),
+            net_amount_base=_converted("net_amount", rate),
+            updated_at=now,
+        )
+    return updated
+
+
+def recompute_for_rate_changes(changed, batch_size=BATCH_SIZE) -> int:
+    """載入匯率後，重新換算各幣別在最早異動日期之後建立的交易"""
+    updated = 0
+    for currency, day in changed.items():
+        transactions = Transaction.objects.filter(
+            currency__iexact=currency,
+            created_at__gte=timezone.make_aware(datetime.combine(day, time.min)),
+        )
+        updated += recompute_base_amounts(transactions, batch_size)
+    return updated
@@ -0,0 +1,349 @@
+"""
+金流事件匯入
+
+金流商以 webhook 批次推送交易事件，同一筆交易可能重送、也可能晚到 (較舊的事件
+在較新的事件之後才送達)。匯入流程：
+
+- 逐筆驗證欄位 (不查資料庫)，同一批次內相同 gateway_transaction_id 只保留
+  occurred_at 最新的事件
+- 訂單以 order_number 一次查詢對應，未指定訂單的事件以單一查詢確認客戶存在
+- 以 INSERT ... ON CONFLICT (gateway_transaction_id) DO UPDATE 批次 upsert，
+  只有事件時間比已套用的事件新時才會更新，晚到的舊事件不會覆蓋新狀態；
+  交易表轉換為分割表後改以鎖定既有交易、再更新 / 新增的單一指令完成
+- 新建交易的基準幣別金額以一次載入的匯率表換算；更新的交易沿用建立當天的匯率，
+  upsert 後以 recompute_base_amounts 重新換算
+- upsert 不會觸發 post_save，完成後批次更新受影響客戶的統計
+"""
+
+import functools
+import hashlib
+import hmac
+import json
+import uuid
+from decimal import Decimal
+from operator import itemgetter
+
+from crm_backend.partitioning import is_partitioned
+from customers.models import Customer
+from customers.stats import refresh_customer_stats
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from orders.models import Order
+from rest_framework import serializers
+from rest_framework.permissions import BasePermission
+
+from .fx import RateTable, recompute_base_amounts
+from .models import Transaction
+
+MAX_EVENTS_PER_BATCH = 5000
+UPSERT_CHUNK_SIZE = 1000
+SIGNATURE_HEADER = "HTTP_X_GATEWAY_SIGNATURE"
+
+
+class GatewaySignaturePermission(BasePermission):
+    """
+    以 PAYMENT_GATEWAY_WEBHOOK_SECRET 驗證 X-Gateway-Signature (request body 的
+    HMAC-SHA256 hex)，讓金流商不需要登入即可推送事件；未設定密鑰時一律拒絕
+    """
+
+    def has_permission(self, request, view) -> bool:
+        secret = getattr(settings, "PAYMENT_GATEWAY_WEBHOOK_SECRET", "")
+        signature = request.META.get(SIGNATURE_HEADER, "")
+        if not secret or not signature:
+            return False
+        expected = hmac.new(secret.encode(), request.body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+
+class GatewayEventSerializer(serializers.Serializer):
+    gateway_transaction_id = serializers.CharField(max_length=200)
+    occurred_at = serializers.DateTimeField()
+    status = serializers.ChoiceField(choices=Transaction.TRANSACTION_STATUS)
+    transaction_type = serializers.ChoiceField(
+        choices=Transaction.TRANSACTION_TYPES, default="sale"
+    )
+    payment_method = serializers.ChoiceField(
+        choices=Transaction.PAYMENT_METHODS, default="credit_card"
+    )
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    fee_amount = serializers.DecimalField(
+        max_digits=10, decimal_places=2, default=Decimal(0)
+    )
+    currency = serializers.CharField(max_length=3, default="USD")
+    # 對應的訂單編號 (order_number)；沒有訂單時必須提供客戶 id
+    order_reference = serializers.CharField(
+        max_length=50, required=False, allow_blank=True
+    )
+    customer = serializers.IntegerField(min_value=1, required=False)
+    # 金流商的原始事件內容，存入 gateway_response
+    payload = serializers.JSONField(required=False)
+
+    def validate(self, attrs):
+        if not attrs.get("order_reference") and not attrs.get("customer"):
+            raise serializers.ValidationError("必須提供 order_reference 或 customer")
+        return attrs
+
+
+def _result(index, status, errors=None, transaction_id=None):
+    result = {"index": index, "status": status}
+    if transaction_id is not None:
+        result["id"] = transaction_id
+    if errors is not None:
+        result["errors"] = errors
+    return result
+
+
+def _latest_events(events):
+    """
+    驗證事件並依 gateway_transaction_id 合併，回傳 (最新事件 {id: (index, 資料)}, 結果)
+    同一批次內較舊的事件標記為 superseded
+    """
+    latest, results = {}, []
+    for index, event in enumerate(events):
+        serializer = GatewayEventSerializer(data=event)
+        if not serializer.is_valid():
+            results.append(_result(index, "invalid", serializer.errors))
+            continue
+        data = serializer.validated_data
+        key = data["gateway_transaction_id"]
+        previous = latest.get(key)
+        if previous is None or data["occurred_at"] >= previous[1]["occurred_at"]:
+            if previous is not None:
+                results.append(_result(previous[0], "superseded"))
+            latest[key] = (index, data)
+        else:
+            results.append(_result(index, "superseded"))
+    return latest, results
+
+
+def _resolve_owners(latest):
+    """
+    以訂單編號對應訂單與客戶，並確認直接指定的客戶存在 (各一次查詢)
+    回傳 {gateway_transaction_id: (customer_id, order_id)} 與無法對應的事件結果
+    """
+    references = {
+        data["order_reference"]
+        for _, data in latest.values()
+        if data.get("order_reference")
+    }
+    orders = {
+        order_number: (customer_id, order_id)
+        for order_number, order_id, customer_id in Order.objects.filter(
+            order_number__in=references
+        ).values_list("order_number", "id", "customer_id")
+    }
+    customer_ids = {
+        data["customer"]
+        for _, data in latest.values()
+        if data.get("customer") and data.get("order_reference") not in orders
+    }
+    existing_customers = set(
+        Customer.objects.filter(id__in=customer_ids).values_list("id", flat=True)
+    )
+
+    owners, results = {}, []
+    for key, (index, data) in latest.items():
+        reference = data.get("order_reference")
+        if reference in orders:
+            owners[key] = orders[reference]
+        elif data.get("customer") in existing_customers:
+            owners[key] = (data["customer"], None)
+        else:
+            field = "order_reference" if reference else "customer"
+            results.append(_result(index, "invalid", {field: ["找不到對應的資料"]}))
+    return owners, results
+
+
+UPSERT_COLUMNS = [
+    "transaction_id",
+    "customer_id",
+    "order_id",
+    "transaction_type",
+    "payment_method",
+    "status",
+    "amount",
+    "fee_amount",
+    "net_amount",
+    "currency",
+    "amount_base",
+    "net_amount_base",
+    "gateway_transaction_id",
+    "gateway_response",
+    "gateway_event_at",
+    "processed_at",
+    "created_at",
+    "updated_at",
+]
+
+# 已存在的交易只在事件比上次套用的事件新時更新；客戶與建立時間維持不變
+UPSERT_ASSIGNMENTS = """
+    order_id = COALESCE(EXCLUDED.order_id, existing.order_id),
+    transaction_type = EXCLUDED.transaction_type,
+    payment_method = EXCLUDED.payment_method,
+    status = EXCLUDED.status,
+    amount = EXCLUDED.amount,
+    fee_amount = EXCLUDED.fee_amount,
+    net_amount = EXCLUDED.net_amount,
+    currency = EXCLUDED.currency,
+    gateway_response = EXCLUDED.gateway_response,
+    gateway_event_at = EXCLUDED.gateway_event_at,
+    processed_at = COALESCE(existing.processed_at, EXCLUDED.processed_at),
+    updated_at = EXCLUDED.updated_at
+"""
+UPSERT_CONDITION = """
+    existing.gateway_event_at IS NULL
+    OR existing.gateway_event_at < EXCLUDED.gateway_event_at
+"""
+
+UPSERT_SQL = """
+INSERT INTO {table} AS existing ({columns})
+VALUES {values}
+ON CONFLICT (gateway_transaction_id) DO UPDATE SET {assignments}
+WHERE {condition}
+RETURNING id, gateway_transaction_id, customer_id, (xmax = 0) AS inserted
+"""
+
+# 分割後的交易表沒有 gateway_transaction_id 的唯一索引 (唯一性改由鍵表保證，
+# 見 crm_backend.partitioning)，無法使用 ON CONFLICT：先鎖定已存在的交易，
+# 在同一個指令中更新較舊的交易並新增其餘的交易
+PARTITIONED_UPSERT_SQL = """
+WITH excluded ({columns}) AS (VALUES {values}),
+locked AS (
+    SELECT existing.id, existing.gateway_transaction_id
+    FROM {table} AS existing
+    JOIN excluded USING (gateway_transaction_id)
+    FOR UPDATE OF existing
+),
+updated AS (
+    UPDATE {table} AS existing SET {assignments}
+    FROM excluded JOIN locked USING (gateway_transaction_id)
+    WHERE existing.id = locked.id AND ({condition})
+    RETURNING existing.id, existing.gateway_transaction_id, existing.customer_id,
+        false
+),
+inserted AS (
+    INSERT INTO {table} ({columns})
+    SELECT {columns} FROM excluded
+    WHERE gateway_transaction_id NOT IN (SELECT gateway_transaction_id FROM locked)
+    RETURNING id, gateway_transaction_id, customer_id, true
+)
+SELECT * FROM updated UNION ALL SELECT * FROM inserted
+"""
+
+
+@functools.cache
+def _partitioned() -> bool:
+    """交易表是否已轉換為分割表；每個行程只檢查一次，轉換後需重新啟動應用程式"""
+    return is_partitioned(Transaction._meta.db_table)
+
+
+def _row(data, customer_id, order_id, now, rates) -> list:
+    net_amount = data["amount"] - data["fee_amount"]
+    today = timezone.localdate(now)
+    return [
+        f"TXN-{uuid.uuid4().hex[:8].upper()}",
+        customer_id,
+        order_id,
+        data["transaction_type"],
+        data["payment_method"],
+        data["status"],
+        data["amount"],
+        data["fee_amount"],
+        net_amount,
+        data["currency"].upper(),
+        rates.convert(data["amount"], data["currency"], today),
+        rates.convert(net_amount, data["currency"], today),
+        data["gateway_transaction_id"],
+        json.dumps(data["payload"]) if "payload" in data else None,
+        data["occurred_at"],
+        data["occurred_at"] if data["status"] != "pending" else None,
+        now,
+        now,
+    ]
+
+
+def _upsert(rows) -> list[tuple]:
+    partitioned = _partitioned()
+    if partitioned:
+        # VALUES 沒有目標欄位可推斷型別，逐欄轉型
+        fields = {field.column: field for field in Transaction._meta.concrete_fields}
+        placeholders = ", ".join(
+            f"%s::{fields[column].db_type(connection)}" for column in UPSERT_COLUMNS
+        )
+    else:
+        placeholders = ", ".join(["%s"] * len(UPSERT_COLUMNS))
+    sql = (PARTITIONED_UPSERT_SQL if partitioned else UPSERT_SQL).format(
+        table=Transaction._meta.db_table,
+        columns=", ".join(UPSERT_COLUMNS),
+        values=", ".join([f"({placeholders})"] * len(rows)),
+        assignments=UPSERT_ASSIGNMENTS,
+        condition=UPSERT_CONDITION,
+    )
+    params = [value for row in rows for value in row]
+    with connection.cursor() as cursor:
+        if not partitioned:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        # 其他請求同時新增同一筆交易時，鍵表的唯一約束會讓其中一方失敗；
+        # 重試時該交易已存在，改為鎖定後更新
+        try:
+            with transaction.atomic():
+                cursor.execute(sql, params)
+        except IntegrityError:
+            cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def ingest_gateway_events(events):
+    """
+    批次匯入金流事件，回傳依輸入順序排列的逐筆結果
+    status：inserted (新建)、updated (更新)、stale (比已套用的事件舊，略過)、
+    superseded (同批次有更新的事件)、invalid (驗證失敗或找不到訂單 / 客戶)
+    """
+    latest, results = _latest_events(events)
+    owners, unresolved = _resolve_owners(latest)
+    results.extend(unresolved)
+
+    pending = [
+        (index, data, *owners[key])
+        for key, (index, data) in latest.items()
+        if key in owners
+    ]
+    now = timezone.now()
+    rates = RateTable({data["currency"] for _, data, _, _ in pending})
+    affected_customers, updated_ids = set(), []
+    for start in range(0, len(pending), UPSERT_CHUNK_SIZE):
+        chunk = pending[start : start + UPSERT_CHUNK_SIZE]
+        with transaction.atomic():
+            returned = _upsert(
+                [
+                    _row(data, customer_id, order_id, now, rates)
+                    for _, data, customer_id, order_id in chunk
+                ]
+            )
+        applied = {
+            gateway_id: (transaction_id, inserted)
+            for transaction_id, gateway_id, customer_id, inserted in returned
+        }
+        affected_customers.update(row[2] for row in returned)
+        updated_ids.extend(row[0] for row in returned if not row[3])
+
+        for index, data, _, _ in chunk:
+            if data["gateway_transaction_id"] not in applied:
+                results.append(_result(index, "stale"))
+                continue
+            transaction_id, inserted = applied[data["gateway_transaction_id"]]
+            results.append(
+                _result(
+                    index,
+                    "inserted" if inserted else "updated",
+                    transaction_id=transaction_id,
+                )
+            )
+
+    if updated_ids:
+        recompute_base_amounts(Transaction.objects.filter(id__in=updated_ids))
+    refresh_customer_stats(affected_customers)
+    results.sort(key=itemgetter("index"))
+    return results
@@ -0,0 +1,239 @@
+"""
+客戶餘額帳 (收款 - 退款 / 拒付)
+
+只計入已完成、且已換算成基準幣別的交易，以 (customer_id, created_at, id) 排序：
+
+- 流水帳的累計餘額以 SQL window function (SUM ... OVER) 在資料庫計算
+- 每月為當月有交易的客戶建立 LedgerCheckpoint；任一時間點的餘額 =
+  最近一個檢查點 (依 (customer, as_of) 索引) + 檢查點之後到該時間點的交易加總，
+  需要加總的交易最多一個多月
+- 檢查點以單一 INSERT ... SELECT 建立：依 (客戶, 月份) 分組後以 window function
+  累加，從上一個檢查點的餘額接續
+- 全部客戶在某日的餘額依客戶 id 範圍分批查詢，每批一個查詢
+"""
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from customers.models import Customer
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, Max, Min, Sum, When, Window
+from django.utils import timezone
+
+from .models import LedgerCheckpoint, Transaction
+from .reconciliation import REVERSAL_TYPES
+
+EXPORT_CHUNK_SIZE = 5000
+
+SIGNED_AMOUNT = Case(
+    When(transaction_type__in=REVERSAL_TYPES, then=-F("amount_base")),
+    default=F("amount_base"),
+    output_field=DecimalField(max_digits=14, decimal_places=2),
+)
+
+
+def month_start(value) -> datetime:
+    """value 所在月份的月初 00:00 (當地時間)"""
+    day = timezone.localdate(value) if isinstance(value, datetime) else value
+    return timezone.make_aware(datetime.combine(date(day.year, day.month, 1), time.min))
+
+
+def parse_day(value, end=False) -> datetime:
+    """
+    YYYY-MM-DD 轉成當天 00:00；end 時為隔天 00:00 (包含當天的交易)
+    格式錯誤時拋出 ValueError
+    """
+    day = date.fromisoformat(value)
+    if end:
+        day += timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def ledger_entries(customer_id):
+    """客戶計入餘額的交易，signed_amount 為帶正負號的基準幣別金額"""
+    return Transaction.objects.filter(
+        customer_id=customer_id,
+        status="completed",
+        amount_base__isnull=False,
+    ).annotate(signed_amount=SIGNED_AMOUNT)
+
+
+def running_ledger(customer_id, date_from=None, date_to=None):
+    """
+    依時間排序的流水帳，running_total 為區間內的累計金額
+    餘額 = 區間起點的餘額 (balance_as_of(date_from)) + running_total
+    """
+    entries = ledger_entries(customer_id)
+    if date_from is not None:
+        entries = entries.filter(created_at__gte=date_from)
+    if date_to is not None:
+        entries = entries.filter(created_at__lt=date_to)
+    return (
+        entries.annotate(
+            running_total=Window(
+                Sum("signed_amount"),
+                order_by=[F("created_at").asc(), F("id").asc()],
+            )
+        )
+        .order_by("created_at", "id")
+        .values(
+            "id",
+            "transaction_id",
+            "transaction_type",
+            "created_at",
+            "currency",
+            "amount",
+            "signed_amount",
+            "running_total",
+        )
+    )
+
+
+def balance_as_of(customer_id, at) -> Decimal:
+    """at 之前 (不含) 的餘額：最近的檢查點 + 之後的交易加總"""
+    checkpoint = (
+        LedgerCheckpoint.objects.filter(customer_id=customer_id, as_of__lte=at)
+        .order_by("-as_of")
+        .values_list("as_of", "balance")
+        .first()
+    )
+    entries = ledger_entries(customer_id).filter(created_at__lt=at)
+    balance = Decimal(0)
+    if checkpoint is not None:
+        entries = entries.filter(created_at__gte=checkpoint[0])
+        balance = checkpoint[1]
+    delta = entries.aggregate(total=Sum("signed_amount"))["total"]
+    return balance + (delta or 0)
+
+
+# 依 (客戶, 月份) 分組，以 window function 從 start 之前最近的檢查點接續累加
+BUILD_CHECKPOINTS_SQL = """
+WITH monthly AS (
+    SELECT customer_id,
+           date_trunc('month', created_at) + interval '1 month' AS as_of,
+           SUM(CASE WHEN transaction_type IN %(reversal_types)s
+                    THEN -amount_base ELSE amount_base END) AS delta
+    FROM {transactions}
+    WHERE status = 'completed' AND amount_base IS NOT NULL
+      AND created_at >= %(start)s AND created_at < %(end)s
+    GROUP BY 1, 2
+), openings AS (
+    SELECT DISTINCT ON (customer_id) customer_id, balance
+    FROM {checkpoints}
+    WHERE as_of <= %(start)s
+    ORDER BY customer_id, as_of DESC
+)
+INSERT INTO {checkpoints} (customer_id, as_of, balance, created_at)
+SELECT monthly.customer_id,
+       monthly.as_of,
+       COALESCE(openings.balance, 0) + SUM(monthly.delta) OVER (
+           PARTITION BY monthly.customer_id ORDER BY monthly.as_of
+       ),
+       %(now)s
+FROM monthly LEFT JOIN openings USING (customer_id)
+"""
+
+
+def _rebuild_start():
+    """
+    增量建立的起點：最後一個檢查點的月份，或上次建立後有異動的交易中最早的月份
+    沒有檢查點時回傳 None (從頭建立)
+    """
+    last = LedgerCheckpoint.objects.aggregate(
+        as_of=Max("as_of"), built_at=Max("created_at")
+    )
+    if last["as_of"] is None:
+        return None
+    changed = Transaction.objects.filter(
+        updated_at__gte=last["built_at"], created_at__lt=last["as_of"]
+    ).aggregate(created_at=Min("created_at"))["created_at"]
+    if changed is None:
+        return last["as_of"]
+    return min(last["as_of"], month_start(changed))
+
+
+def build_checkpoints(rebuild=False) -> int:
+    """
+    建立到本月初為止的每月檢查點 (本月尚未結束，不建立)
+    已建立的月份若有交易異動，從該月份起重新建立；rebuild 時全部重建
+    刪除交易不會留下異動紀錄，需要以 rebuild 重建
+    回傳新增的檢查點數
+    """
+    end = month_start(timezone.now())
+    start = None if rebuild else _rebuild_start()
+    if start is not None and start >= end:
+        return 0
+
+    with transaction.atomic():
+        stale = LedgerCheckpoint.objects.all()
+        if start is not None:
+            stale = stale.filter(as_of__gt=start)
+        stale.delete()
+
+        sql = BUILD_CHECKPOINTS_SQL.format(
+            transactions=Transaction._meta.db_table,
+            checkpoints=LedgerCheckpoint._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql,
+                {
+                    "reversal_types": REVERSAL_TYPES,
+                    "start": start or datetime.min.replace(tzinfo=end.tzinfo),
+                    "end": end,
+                    "now": timezone.now(),
+                },
+            )
+            return cursor.rowcount
+
+
+# 一批客戶在 at 時間點的餘額：各自最近的檢查點 + 之後的交易加總
+BALANCES_AS_OF_SQL = """
+WITH checkpoints AS (
+    SELECT DISTINCT ON (customer_id) customer_id, as_of, balance
+    FROM {checkpoints}
+    WHERE customer_id >= %(start_id)s AND customer_id < %(end_id)s
+      AND as_of <= %(at)s
+    ORDER BY customer_id, as_of DESC
+)
+SELECT customer.id,
+       customer.email,
+       COALESCE(checkpoints.balance, 0) + COALESCE(SUM(
+           CASE WHEN txn.transaction_type IN %(reversal_types)s
+                THEN -txn.amount_base ELSE txn.amount_base END
+       ), 0) AS balance
+FROM {customers} customer
+LEFT JOIN checkpoints ON checkpoints.customer_id = customer.id
+LEFT JOIN {transactions} txn
+    ON txn.customer_id = customer.id
+   AND txn.status = 'completed' AND txn.amount_base IS NOT NULL
+   AND txn.created_at < %(at)s
+   AND (checkpoints.as_of IS NULL OR txn.created_at >= checkpoints.as_of)
+WHERE customer.id >= %(start_id)s AND customer.id < %(end_id)s
+GROUP BY customer.id, customer.email, checkpoints.balance
+ORDER BY customer.id
+"""
+
+
+def iter_balances_as_of(at, chunk_size=EXPORT_CHUNK_SIZE):
+    """依客戶 id 分批產生 (客戶 id, email, 餘額)，記憶體用量只與批次大小有關"""
+    bounds = Customer.objects.aggregate(min_id=Min("id"), max_id=Max("id"))
+    if bounds["min_id"] is None:
+        return
+    sql = BALANCES_AS_OF_SQL.format(
+        checkpoints=LedgerCheckpoint._meta.db_table,
+        customers=Customer._meta.db_table,
+        transactions=Transaction._meta.db_table,
+    )
+    for start_id in range(bounds["min_id"], bounds["max_id"] + 1, chunk_size):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql,
+                {
+                    "start_id": start_id,
+                    "end_id": start_id + chunk_size,
+                    "at": at,
+                    "reversal_types": REVERSAL_TYPES,
+                },
+            )
+            yield from cursor.fetchall()
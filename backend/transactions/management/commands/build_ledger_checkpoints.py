@@ -0,0 +1,25 @@
+"""
+建立客戶餘額的每月檢查點 (建議每日排程執行，月初後即會補上上個月)
+
+    python manage.py build_ledger_checkpoints
+
+    # 刪除交易後或檢查點不一致時全部重建
+    python manage.py build_ledger_checkpoints --rebuild
+"""
+
+from django.core.management.base import BaseCommand
+
+from transactions.ledger import build_checkpoints
+
+
+class Command(BaseCommand):
+    help = "建立客戶餘額的每月檢查點，加速任一日期的餘額查詢"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--rebuild", action="store_true", help="清除所有檢查點後重新建立"
+        )
+
+    def handle(self, *args, **options) -> None:
+        created = build_checkpoints(rebuild=options["rebuild"])
+        self.stdout.write(self.style.SUCCESS(f"已建立 {created} 個檢查點"))
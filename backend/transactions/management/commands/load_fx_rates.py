@@ -0,0 +1,43 @@
+"""
+從本機檔案載入每日匯率，並重新換算受影響交易的基準幣別金額
+
+檔案可以是 CSV (欄位 date, currency, rate) 或 JSON 陣列，rate 為 1 單位 currency
+換算成 BASE_CURRENCY 的金額；同一幣別同一天的匯率會被覆蓋 (可用於修正匯率)：
+
+    python manage.py load_fx_rates rates/2025-06.csv
+    python manage.py load_fx_rates rates.json --no-recompute
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.fx import load_rates, parse_rates, recompute_for_rate_changes
+
+
+class Command(BaseCommand):
+    help = "從 CSV / JSON 檔案載入每日匯率"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("paths", nargs="+", help="匯率檔案路徑")
+        parser.add_argument(
+            "--no-recompute",
+            action="store_true",
+            help="只載入匯率，不重新換算交易金額",
+        )
+
+    def handle(self, *args, **options) -> None:
+        rates = []
+        for path in options["paths"]:
+            try:
+                rates.extend(parse_rates(path))
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"{path}: {exc}") from exc
+        if not rates:
+            raise CommandError("檔案中沒有匯率資料")
+
+        changed = load_rates(rates)
+        self.stdout.write(f"載入 {len(rates)} 筆匯率 ({', '.join(sorted(changed))})")
+        if options["no_recompute"]:
+            return
+
+        updated = recompute_for_rate_changes(changed)
+        self.stdout.write(self.style.SUCCESS(f"已重新換算 {updated} 筆交易"))
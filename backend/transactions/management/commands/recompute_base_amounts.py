@@ -0,0 +1,62 @@
+"""
+重新換算交易的基準幣別金額 (amount_base / net_amount_base)
+
+    # 補算所有尚未換算的交易 (例如新增幣別的匯率之後)
+    python manage.py recompute_base_amounts --missing-only
+
+    # 修正某幣別的匯率後，重新換算該幣別在某天之後的交易
+    python manage.py recompute_base_amounts --currency EUR --date-from 2025-01-01
+
+    # 變更 BASE_CURRENCY 後全部重新換算
+    python manage.py recompute_base_amounts
+"""
+
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from transactions.fx import BATCH_SIZE, recompute_base_amounts
+from transactions.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "以目前的匯率表重新換算交易的基準幣別金額"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--currency", nargs="*", help="只處理這些幣別")
+        parser.add_argument(
+            "--date-from", help="只處理此日期 (YYYY-MM-DD) 之後建立的交易"
+        )
+        parser.add_argument(
+            "--missing-only", action="store_true", help="只處理尚未換算的交易"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=BATCH_SIZE, help="每批更新的 id 範圍"
+        )
+
+    def handle(self, *args, **options) -> None:
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size 必須大於 0")
+
+        transactions = Transaction.objects.all()
+        if options["currency"]:
+            transactions = transactions.filter(
+                currency__in={currency.upper() for currency in options["currency"]}
+            )
+        if options["date_from"]:
+            try:
+                day = date.fromisoformat(options["date_from"])
+            except ValueError as exc:
+                raise CommandError("--date-from 格式應為 YYYY-MM-DD") from exc
+            transactions = transactions.filter(
+                created_at__gte=timezone.make_aware(datetime.combine(day, time.min))
+            )
+        if options["missing_only"]:
+            transactions = transactions.filter(amount_base__isnull=True)
+
+        updated = recompute_base_amounts(transactions, options["batch_size"])
+        missing = Transaction.objects.filter(amount_base__isnull=True).count()
+        self.stdout.write(self.style.SUCCESS(f"已重新換算 {updated} 筆交易"))
+        if missing:
+            self.stdout.write(self.style.WARNING(f"{missing} 筆交易查無匯率，尚未換算"))
@@ -0,0 +1,40 @@
+"""
+訂單 / 交易對帳 (建議每日排程執行)
+
+    # 增量對帳：只檢查上次對帳後有異動的訂單與交易
+    python manage.py reconcile_transactions
+
+    # 完整對帳 (刪除交易不會留下異動紀錄，建議每週執行一次)
+    python manage.py reconcile_transactions --full --batch-size 10000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.reconciliation import BATCH_SIZE, run_reconciliation
+
+
+class Command(BaseCommand):
+    help = (
+        "比對訂單金額與已完成的交易，記錄金額不符、重複扣款、未綁訂單與未換算匯率的交易"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--full", action="store_true", help="檢查所有訂單")
+        parser.add_argument(
+            "--batch-size", type=int, default=BATCH_SIZE, help="每批檢查的訂單數"
+        )
+
+    def handle(self, *args, **options) -> None:
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size 必須大於 0")
+
+        run = run_reconciliation(
+            incremental=not options["full"], batch_size=options["batch_size"]
+        )
+        mode = "增量" if run.incremental else "完整"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{mode}對帳完成：檢查 {run.checked_orders} 筆訂單，"
+                f"新增 {run.issues_found} 筆差異，解決 {run.issues_resolved} 筆"
+            )
+        )
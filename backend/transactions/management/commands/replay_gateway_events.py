@@ -0,0 +1,57 @@
+"""
+從本機檔案重播金流事件
+
+檔案可以是 JSON 陣列或每行一筆事件的 JSON Lines，事件格式與
+POST /api/transactions/gateway-events/ 相同，可用於測試或補匯入漏接的 webhook：
+
+    python manage.py replay_gateway_events events.jsonl --batch-size 1000
+"""
+
+import json
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.gateway import MAX_EVENTS_PER_BATCH, ingest_gateway_events
+
+
+def _load_events(path):
+    text = Path(path).read_text(encoding="utf-8")
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class Command(BaseCommand):
+    help = "從 JSON / JSON Lines 檔案批次匯入金流事件"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("path", help="事件檔案路徑")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="每批匯入的事件數"
+        )
+
+    def handle(self, *args, **options) -> None:
+        try:
+            events = _load_events(options["path"])
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"無法讀取事件檔案：{exc}") from exc
+
+        batch_size = min(options["batch_size"], MAX_EVENTS_PER_BATCH)
+        summary = Counter()
+        for start in range(0, len(events), batch_size):
+            results = ingest_gateway_events(events[start : start + batch_size])
+            summary.update(result["status"] for result in results)
+            for result in results:
+                if result["status"] == "invalid":
+                    self.stderr.write(
+                        f"第 {start + result['index'] + 1} 筆：{result['errors']}"
+                    )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                ", ".join(f"{key}: {count}" for key, count in sorted(summary.items()))
+                or "沒有事件"
+            )
+        )
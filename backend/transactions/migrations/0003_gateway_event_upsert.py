@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("transactions", "0002_timeline_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="transaction_gateway_a599e0_idx",
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="gateway_event_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # 空字串統一改為 NULL，唯一限制只套用在實際的金流交易編號
+        migrations.RunSQL(
+            sql="""
+            UPDATE transactions_transaction SET gateway_transaction_id = NULL
+            WHERE gateway_transaction_id = ''
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="gateway_transaction_id",
+            field=models.CharField(blank=True, max_length=200, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,154 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("orders", "0004_order_status_history"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("transactions", "0003_gateway_event_upsert"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReconciliationRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("incremental", models.BooleanField(default=False)),
+                ("started_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("checked_orders", models.PositiveIntegerField(default=0)),
+                ("issues_found", models.PositiveIntegerField(default=0)),
+                ("issues_resolved", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-started_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ReconciliationIssue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("amount_mismatch", "金額不符"),
+                            ("double_charge", "重複扣款"),
+                            ("orphan_transaction", "未綁定訂單的交易"),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("open", "待處理"), ("resolved", "已解決")],
+                        default="open",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "expected_amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+                (
+                    "actual_amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+                ("details", models.JSONField(blank=True, default=dict)),
+                ("detected_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("resolved_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reconciliation_issues",
+                        to="orders.order",
+                    ),
+                ),
+                (
+                    "resolved_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="resolved_reconciliation_issues",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "run",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="issues",
+                        to="transactions.reconciliationrun",
+                    ),
+                ),
+                (
+                    "transaction",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reconciliation_issues",
+                        to="transactions.transaction",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-detected_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "kind", "detected_at"],
+                        name="transaction_status_92ba90_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="reconciliationissue",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("order__isnull", False), ("status", "open")),
+                fields=("kind", "order"),
+                name="unique_open_order_issue",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="reconciliationissue",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "open"), ("transaction__isnull", False)),
+                fields=("kind", "transaction"),
+                name="unique_open_transaction_issue",
+            ),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_base_currency(apps, schema_editor) -> None:
+    # 尚未載入匯率，先補上基準幣別的交易；其他幣別載入匯率後以指令補算
+    Transaction = apps.get_model("transactions", "Transaction")
+    Transaction.objects.filter(currency__iexact=settings.BASE_CURRENCY).update(
+        amount_base=models.F("amount"), net_amount_base=models.F("net_amount")
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("transactions", "0004_reconciliation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FxRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("currency", models.CharField(max_length=3)),
+                ("day", models.DateField()),
+                ("rate", models.DecimalField(decimal_places=8, max_digits=18)),
+                ("source", models.CharField(blank=True, max_length=100)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["currency", "-day"],
+            },
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="amount_base",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=14, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="net_amount_base",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=14, null=True
+            ),
+        ),
+        migrations.RunPython(backfill_base_currency, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["status", "created_at"],
+                include=("amount_base", "net_amount_base"),
+                name="txn_status_created_base_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="fxrate",
+            constraint=models.UniqueConstraint(
+                fields=("currency", "day"), name="unique_fx_rate_per_day"
+            ),
+        ),
+    ]
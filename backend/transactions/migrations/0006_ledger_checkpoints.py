@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("customers", "0007_customer_geo_codes"),
+        ("transactions", "0005_fx_base_amounts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LedgerCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("as_of", models.DateTimeField()),
+                ("balance", models.DecimalField(decimal_places=2, max_digits=14)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ledger_checkpoints",
+                        to="customers.customer",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["customer", "-as_of"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="ledgercheckpoint",
+            constraint=models.UniqueConstraint(
+                fields=("customer", "as_of"), name="unique_ledger_checkpoint"
+            ),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:15
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("customers", "0007_customer_geo_codes"),
+        ("transactions", "0006_ledger_checkpoints"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="transaction_transac_fee96f_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="transaction_order_i_0e7560_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="transaction_status_71abbb_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="transaction_created_67ce7b_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="txn_status_created_base_idx",
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="created_by",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="created_transactions",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="customer",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="transactions",
+                to="customers.customer",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="gateway_transaction_id",
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="transaction_id",
+            field=models.CharField(editable=False, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="updated_by",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="updated_transactions",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=django.contrib.postgres.indexes.BrinIndex(
+                autosummarize=True, fields=["created_at"], name="txn_created_brin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                condition=models.Q(("status", "completed")),
+                fields=["created_at"],
+                include=("amount_base", "net_amount_base"),
+                name="txn_completed_created_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="transaction",
+            constraint=models.UniqueConstraint(
+                fields=("transaction_id",), name="unique_transaction_id"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="transaction",
+            constraint=models.UniqueConstraint(
+                fields=("gateway_transaction_id",), name="unique_gateway_transaction_id"
+            ),
+        ),
+    ]
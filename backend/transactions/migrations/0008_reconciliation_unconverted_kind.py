@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("transactions", "0007_append_only_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reconciliationissue",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("amount_mismatch", "金額不符"),
+                    ("double_charge", "重複扣款"),
+                    ("orphan_transaction", "未綁定訂單的交易"),
+                    ("unconverted_transaction", "未換算匯率的交易"),
+                ],
+                max_length=30,
+            ),
+        ),
+    ]
@@ -1,10 +1,57 @@
 import uuid
+from decimal import ROUND_HALF_UP, Decimal
 
 from customers.models import Customer
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
+from django.utils import timezone
 from orders.models import Order
 
+CENT = Decimal("0.01")
+
+
+def to_base(amount, rate) -> Decimal:
+    return (Decimal(amount) * rate).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class FxRate(models.Model):
+    """
+    每日匯率：1 單位 currency 換算成 BASE_CURRENCY 的金額
+    某天沒有匯率時沿用之前最近一天的匯率
+    """
+
+    currency = models.CharField(max_length=3)
+    day = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    source = models.CharField(max_length=100, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["currency", "-day"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["currency", "day"], name="unique_fx_rate_per_day"
+            ),
+        ]
+
+    @classmethod
+    def rate_for(cls, currency, day):
+        """day 當天 (或之前最近一天) 的匯率，基準幣別為 1，查無匯率時為 None"""
+        currency = currency.upper()
+        if currency == settings.BASE_CURRENCY:
+            return Decimal(1)
+        return (
+            cls.objects.filter(currency=currency, day__lte=day)
+            .order_by("-day")
+            .values_list("rate", flat=True)
+            .first()
+        )
+
+    def __str__(self) -> str:
+        return f"{self.currency} {self.day}: {self.rate}"
+
 
 class Transaction(models.Model):
     TRANSACTION_TYPES = [
@@ -33,9 +80,12 @@ class Transaction(models.Model):
         ("refunded", "Refunded"),
     ]
 
-    transaction_id = models.CharField(max_length=50, unique=True, editable=False)
+    # 唯一性以 Meta.constraints 定義：unique=True 會在 PostgreSQL 另外建立一個
+    # varchar_pattern_ops (LIKE) 索引，交易編號只做等值查詢，不需要
+    transaction_id = models.CharField(max_length=50, editable=False)
+    # (customer, created_at, id) 複合索引已涵蓋以客戶查詢，不另外建立外鍵索引
     customer = models.ForeignKey(
-        Customer, on_delete=models.CASCADE, related_name="transactions"
+        Customer, on_delete=models.CASCADE, related_name="transactions", db_index=False
     )  # 當關聯的 Customer被刪除時，此筆交易紀錄資料也會被刪除
     order = models.ForeignKey(
         Order,
@@ -60,10 +110,21 @@ class Transaction(models.Model):
     net_amount = models.DecimalField(max_digits=10, decimal_places=2)
 
     currency = models.CharField(max_length=3, default="USD")
+    # 以交易建立當天的匯率換算成 BASE_CURRENCY 的金額，報表只加總這兩個欄位；
+    # 查無匯率時為 NULL，載入匯率後由 recompute_base_amounts 補算
+    amount_base = models.DecimalField(
+        max_digits=14, decimal_places=2, null=True, blank=True
+    )
+    net_amount_base = models.DecimalField(
+        max_digits=14, decimal_places=2, null=True, blank=True
+    )
 
     # Payment gateway information
+    # 金流事件以 gateway_transaction_id upsert，未串接金流的交易為 NULL
     gateway_transaction_id = models.CharField(max_length=200, blank=True, null=True)
     gateway_response = models.TextField(blank=True, null=True)
+    # 最後套用的金流事件時間，較舊的重送事件不會覆蓋較新的狀態
+    gateway_event_at = models.DateTimeField(null=True, blank=True)
 
     description = models.TextField(blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
@@ -77,6 +138,8 @@ class Transaction(models.Model):
         null=True,
         blank=True,
         related_name="created_transactions",
+        # 只在刪除使用者時查詢，不值得每次寫入都維護索引
+        db_index=False,
     )
     updated_by = models.ForeignKey(
         User,
@@ -84,19 +147,46 @@ class Transaction(models.Model):
         null=True,
         blank=True,
         related_name="updated_transactions",
+        db_index=False,
     )
 
     class Meta:
         ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["transaction_id"], name="unique_transaction_id"
+            ),
+            models.UniqueConstraint(
+                fields=["gateway_transaction_id"], name="unique_gateway_transaction_id"
+            ),
+        ]
+        # 交易幾乎只追加寫入，每個 B-tree 索引都會拖慢寫入：
+        # transaction_id 已有唯一索引、order 已有外鍵索引，不重複建立；
+        # 效能比較見 benchmark_indexes 指令
         indexes = [
-            models.Index(fields=["transaction_id"]),
-            models.Index(fields=["customer"]),
-            models.Index(fields=["order"]),
-            models.Index(fields=["status"]),
-            models.Index(fields=["created_at"]),
-            models.Index(fields=["gateway_transaction_id"]),
+            # 客戶交易列表與時間軸依 (created_at, id) 由新到舊分頁
+            models.Index(fields=["customer", "created_at", "id"]),
+            # created_at 與寫入順序一致，BRIN 只記錄每個區塊範圍的最小 / 最大值，
+            # 大小只有 B-tree 的極小部分，時間範圍查詢仍可略過無關的區塊
+            BrinIndex(
+                fields=["created_at"], autosummarize=True, name="txn_created_brin"
+            ),
+            # 報表只統計已完成的交易：部分索引只包含 completed，可只掃描索引加總
+            models.Index(
+                fields=["created_at"],
+                include=["amount_base", "net_amount_base"],
+                condition=models.Q(status="completed"),
+                name="txn_completed_created_idx",
+            ),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 記錄載入時的客戶，改掛客戶時兩邊的客戶統計都要更新
+        instance._loaded_customer_id = instance.__dict__.get("customer_id")
+        return instance
+
     def save(self, *args, **kwargs) -> None:
         if not self.transaction_id:
             self.transaction_id = f"TXN-{uuid.uuid4().hex[:8].upper()}"
@@ -104,7 +194,143 @@ class Transaction(models.Model):
         # Calculate net amount
         self.net_amount = self.amount - self.fee_amount
 
+        # 換算成基準幣別
+        day = timezone.localdate(self.created_at or timezone.now())
+        rate = FxRate.rate_for(self.currency, day)
+        if rate is None:
+            self.amount_base = self.net_amount_base = None
+        else:
+            self.amount_base = to_base(self.amount, rate)
+            self.net_amount_base = to_base(self.net_amount, rate)
+
         super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return f"Transaction {self.transaction_id} - {self.customer.full_name} - ${self.amount}"
+
+
+class ReconciliationRun(models.Model):
+    """一次對帳的執行紀錄；增量對帳以上次完成的執行時間為起點"""
+
+    incremental = models.BooleanField(default=False)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    checked_orders = models.PositiveIntegerField(default=0)
+    issues_found = models.PositiveIntegerField(default=0)
+    issues_resolved = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-started_at"]
+
+    def __str__(self) -> str:
+        return f"Reconciliation {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class ReconciliationIssue(models.Model):
+    """
+    對帳差異
+    同一筆訂單 (或交易) 的同一種差異只會有一筆 open 紀錄，
+    之後的對帳若差異已不存在會自動標記為 resolved
+    """
+
+    KIND_CHOICES = [
+        ("amount_mismatch", "金額不符"),
+        ("double_charge", "重複扣款"),
+        ("orphan_transaction", "未綁定訂單的交易"),
+        ("unconverted_transaction", "未換算匯率的交易"),
+    ]
+    STATUS_CHOICES = [
+        ("open", "待處理"),
+        ("resolved", "已解決"),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="open")
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="reconciliation_issues",
+    )
+    transaction = models.ForeignKey(
+        Transaction,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="reconciliation_issues",
+    )
+    expected_amount = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+    actual_amount = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+    details = models.JSONField(default=dict, blank=True)
+    run = models.ForeignKey(
+        ReconciliationRun,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="issues",
+    )
+    detected_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    resolved_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="resolved_reconciliation_issues",
+    )
+
+    class Meta:
+        ordering = ["-detected_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "order"],
+                condition=models.Q(status="open", order__isnull=False),
+                name="unique_open_order_issue",
+            ),
+            models.UniqueConstraint(
+                fields=["kind", "transaction"],
+                condition=models.Q(status="open", transaction__isnull=False),
+                name="unique_open_transaction_issue",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "kind", "detected_at"]),
+        ]
+
+    def __str__(self) -> str:
+        if self.order_id:
+            target = f"order {self.order_id}"
+        else:
+            target = f"txn {self.transaction_id}"
+        return f"{self.get_kind_display()} - {target}"
+
+
+class LedgerCheckpoint(models.Model):
+    """
+    客戶餘額檢查點：as_of (月初 00:00) 之前所有已完成交易的餘額
+    (收款 - 退款 / 拒付，以基準幣別計算)，只為當月有交易的客戶建立
+    """
+
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="ledger_checkpoints"
+    )
+    as_of = models.DateTimeField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["customer", "-as_of"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "as_of"], name="unique_ledger_checkpoint"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Customer {self.customer_id} @ {self.as_of:%Y-%m-%d}: {self.balance}"
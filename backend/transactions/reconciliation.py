@@ -0,0 +1,281 @@
+"""
+訂單 / 交易對帳
+
+以單一 GROUP BY 查詢 (依訂單 id 分批) 計算每筆訂單的已完成收款 (基準幣別金額)，找出：
+
+- amount_mismatch：已付款狀態的訂單，淨收款 (收款 - 退款 / 拒付) 不等於訂單總額；
+  取消或退款的訂單淨收款不為 0。有未換算交易的訂單無法比對，不列入
+- double_charge：同一筆訂單有兩筆以上金額相同的已完成收款
+- orphan_transaction：未綁定訂單的已完成收款
+- unconverted_transaction：查無匯率、amount_base 為 NULL 的已完成收款 / 退款；
+  載入匯率並重新換算後會自動解決
+
+差異寫入 ReconciliationIssue，同一筆訂單的同一種差異只保留一筆 open 紀錄；
+重新對帳時已不存在的差異自動標記為 resolved。
+
+增量對帳只檢查上次對帳後 updated_at 有異動的訂單與交易；刪除交易不會留下異動
+紀錄，仍需定期執行完整對帳。
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Count, DecimalField, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from orders.models import Order
+
+from .models import ReconciliationIssue, ReconciliationRun, Transaction
+
+CHARGE_TYPES = ("sale", "payment")
+REVERSAL_TYPES = ("refund", "chargeback")
+# 這些狀態的訂單應已全額付款；取消 / 退款的訂單淨收款應為 0；pending 尚未付款不檢查
+PAID_STATUSES = ("processing", "shipped", "delivered")
+VOID_STATUSES = ("cancelled", "refunded")
+ORDER_ISSUE_KINDS = ("amount_mismatch", "double_charge")
+TRANSACTION_ISSUE_KINDS = ("orphan_transaction", "unconverted_transaction")
+INCREMENTAL_OVERLAP = timedelta(minutes=5)
+BATCH_SIZE = 5000
+
+_ZERO = Value(Decimal(0), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _completed(types) -> Q:
+    return Q(
+        transactions__status="completed",
+        transactions__transaction_type__in=types,
+    )
+
+
+def order_balances(orders):
+    """
+    每筆訂單的收款、退款 (基準幣別)、收款筆數、不同金額數與未換算的交易數
+    (單一 GROUP BY 查詢)
+    """
+    charges = _completed(CHARGE_TYPES)
+    unconverted = _completed(CHARGE_TYPES + REVERSAL_TYPES) & Q(
+        transactions__amount_base__isnull=True
+    )
+    return (
+        orders.order_by()
+        .annotate(
+            charged=Coalesce(Sum("transactions__amount_base", filter=charges), _ZERO),
+            reversed=Coalesce(
+                Sum("transactions__amount_base", filter=_completed(REVERSAL_TYPES)),
+                _ZERO,
+            ),
+            charge_count=Count("transactions", filter=charges),
+            charge_amounts=Count("transactions__amount", filter=charges, distinct=True),
+            unconverted=Count("transactions", filter=unconverted),
+        )
+        .annotate(net_paid=F("charged") - F("reversed"))
+    )
+
+
+def detect_order_issues(orders) -> dict:
+    """回傳 {(差異種類, 訂單 id): 差異內容}"""
+    mismatched = Q(unconverted=0) & (
+        (Q(status__in=PAID_STATUSES) & ~Q(net_paid=F("total")))
+        | (Q(status__in=VOID_STATUSES) & ~Q(net_paid=0))
+    )
+    rows = (
+        order_balances(orders)
+        .filter(mismatched | Q(charge_count__gt=F("charge_amounts")))
+        .values(
+            "id",
+            "status",
+            "total",
+            "net_paid",
+            "charged",
+            "charge_count",
+            "charge_amounts",
+            "unconverted",
+        )
+    )
+
+    found = {}
+    for row in rows:
+        expected = Decimal(0) if row["status"] in VOID_STATUSES else row["total"]
+        if (
+            row["status"] in PAID_STATUSES + VOID_STATUSES
+            and not row["unconverted"]
+            and row["net_paid"] != expected
+        ):
+            found["amount_mismatch", row["id"]] = {
+                "expected_amount": expected,
+                "actual_amount": row["net_paid"],
+                "details": {"order_status": row["status"]},
+            }
+        if row["charge_count"] > row["charge_amounts"]:
+            found["double_charge", row["id"]] = {
+                "expected_amount": row["total"],
+                "actual_amount": row["charged"],
+                "details": {
+                    "charge_count": row["charge_count"],
+                    "distinct_amounts": row["charge_amounts"],
+                },
+            }
+    return found
+
+
+def detect_orphan_transactions(transactions) -> dict:
+    """回傳 {("orphan_transaction", 交易 id): 差異內容}"""
+    rows = transactions.filter(
+        order__isnull=True,
+        status="completed",
+        transaction_type__in=CHARGE_TYPES,
+    ).values_list("id", "amount", "customer_id")
+    return {
+        ("orphan_transaction", transaction_id): {
+            "expected_amount": None,
+            "actual_amount": amount,
+            "details": {"customer_id": customer_id},
+        }
+        for transaction_id, amount, customer_id in rows.iterator(chunk_size=BATCH_SIZE)
+    }
+
+
+def detect_unconverted_transactions(transactions) -> dict:
+    """回傳 {("unconverted_transaction", 交易 id): 差異內容}"""
+    rows = transactions.filter(
+        amount_base__isnull=True,
+        status="completed",
+        transaction_type__in=CHARGE_TYPES + REVERSAL_TYPES,
+    ).values_list("id", "amount", "currency", "order_id")
+    return {
+        ("unconverted_transaction", transaction_id): {
+            "expected_amount": None,
+            "actual_amount": amount,
+            "details": {"currency": currency, "order_id": order_id},
+        }
+        for transaction_id, amount, currency, order_id in rows.iterator(
+            chunk_size=BATCH_SIZE
+        )
+    }
+
+
+def _sync_issues(run, existing, found, target) -> tuple[int, int]:
+    """
+    以本次偵測結果同步 open 差異：新增、更新金額、解決已消失的差異
+    existing 為本次檢查範圍內的 open 差異；target 為 "order_id" 或 "transaction_id"
+    回傳 (新增數, 解決數)
+    """
+    now = timezone.now()
+    current = {(issue.kind, getattr(issue, target)): issue for issue in existing}
+
+    to_update = []
+    for key, values in found.items():
+        issue = current.get(key)
+        if issue is None:
+            continue
+        if (issue.expected_amount, issue.actual_amount, issue.details) != (
+            values["expected_amount"],
+            values["actual_amount"],
+            values["details"],
+        ):
+            for field, value in values.items():
+                setattr(issue, field, value)
+            issue.run = run
+            issue.updated_at = now
+            to_update.append(issue)
+
+    to_create = [
+        ReconciliationIssue(kind=kind, run=run, **{target: target_id}, **values)
+        for (kind, target_id), values in found.items()
+        if (kind, target_id) not in current
+    ]
+    resolved_ids = [issue.id for key, issue in current.items() if key not in found]
+
+    with db_transaction.atomic():
+        ReconciliationIssue.objects.bulk_create(to_create)
+        ReconciliationIssue.objects.bulk_update(
+            to_update,
+            ["expected_amount", "actual_amount", "details", "run", "updated_at"],
+        )
+        if resolved_ids:
+            ReconciliationIssue.objects.filter(id__in=resolved_ids).update(
+                status="resolved", resolved_at=now, updated_at=now
+            )
+    return len(to_create), len(resolved_ids)
+
+
+def _full_order_batches(batch_size):
+    bounds = Order.objects.aggregate(min_id=Min("id"), max_id=Max("id"))
+    if bounds["min_id"] is None:
+        return
+    for start_id in range(bounds["min_id"], bounds["max_id"] + 1, batch_size):
+        yield Q(id__gte=start_id, id__lt=start_id + batch_size)
+
+
+def _changed_order_batches(since, batch_size):
+    order_ids = set(
+        Order.objects.filter(updated_at__gte=since).values_list("id", flat=True)
+    )
+    order_ids.update(
+        Transaction.objects.filter(updated_at__gte=since, order__isnull=False)
+        .values_list("order_id", flat=True)
+        .distinct()
+    )
+    order_ids = sorted(order_ids)
+    for start in range(0, len(order_ids), batch_size):
+        yield Q(id__in=order_ids[start : start + batch_size])
+
+
+def last_finished_run():
+    return (
+        ReconciliationRun.objects.filter(finished_at__isnull=False)
+        .order_by("-started_at")
+        .first()
+    )
+
+
+def run_reconciliation(incremental=True, batch_size=BATCH_SIZE) -> ReconciliationRun:
+    """
+    執行對帳並回傳執行紀錄
+    incremental 時只檢查上次完成的對帳之後有異動的訂單與交易；沒有紀錄時做完整對帳
+    """
+    previous = last_finished_run() if incremental else None
+    run = ReconciliationRun.objects.create(incremental=previous is not None)
+
+    if previous is None:
+        batches = _full_order_batches(batch_size)
+        transactions = Transaction.objects.all()
+        transaction_scope = ReconciliationIssue.objects.filter(
+            kind__in=TRANSACTION_ISSUE_KINDS
+        )
+    else:
+        since = previous.started_at - INCREMENTAL_OVERLAP
+        batches = _changed_order_batches(since, batch_size)
+        transactions = Transaction.objects.filter(updated_at__gte=since)
+        transaction_scope = ReconciliationIssue.objects.filter(
+            kind__in=TRANSACTION_ISSUE_KINDS, transaction__updated_at__gte=since
+        )
+
+    for batch in batches:
+        orders = Order.objects.filter(batch)
+        existing = ReconciliationIssue.objects.filter(
+            status="open",
+            kind__in=ORDER_ISSUE_KINDS,
+            order__in=orders.values("id"),
+        )
+        created, resolved = _sync_issues(
+            run, existing, detect_order_issues(orders), "order_id"
+        )
+        run.checked_orders += orders.count()
+        run.issues_found += created
+        run.issues_resolved += resolved
+
+    created, resolved = _sync_issues(
+        run,
+        transaction_scope.filter(status="open"),
+        detect_orphan_transactions(transactions)
+        | detect_unconverted_transactions(transactions),
+        "transaction_id",
+    )
+    run.issues_found += created
+    run.issues_resolved += resolved
+
+    run.finished_at = timezone.now()
+    run.save()
+    return run
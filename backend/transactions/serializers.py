@@ -1,15 +1,21 @@
-from customers.serializers import CustomerSerializer
+from crm_backend.fieldsets import SparseFieldsetSerializerMixin
+from customers.serializers import CustomerBriefSerializer
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 
-from .models import Transaction
+from .models import ReconciliationIssue, ReconciliationRun, Transaction
 
 
-class TransactionSerializer(serializers.ModelSerializer):
-    customer_info = CustomerSerializer(source="customer", read_only=True)
+class TransactionSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = ("customer_info", "order_info")
+
+    customer_info = CustomerBriefSerializer(source="customer", read_only=True)
     order_info = serializers.SerializerMethodField()
     amount = serializers.FloatField()
     fee_amount = serializers.FloatField()
     net_amount = serializers.FloatField(read_only=True)
+    amount_base = serializers.FloatField(read_only=True, allow_null=True)
+    net_amount_base = serializers.FloatField(read_only=True, allow_null=True)
 
     class Meta:
         model = Transaction
@@ -27,6 +33,8 @@ class TransactionSerializer(serializers.ModelSerializer):
             "fee_amount",
             "net_amount",
             "currency",
+            "amount_base",
+            "net_amount_base",
             "gateway_transaction_id",
             "gateway_response",
             "description",
@@ -66,3 +74,63 @@ class TransactionCreateUpdateSerializer(serializers.ModelSerializer):
             "notes",
             "processed_at",
         ]
+        # 唯一性定義在 Meta.constraints，DRF 不會自動加上 UniqueValidator
+        extra_kwargs = {
+            "gateway_transaction_id": {
+                "validators": [UniqueValidator(queryset=Transaction.objects.all())]
+            }
+        }
+
+    def validate_gateway_transaction_id(self, value):
+        # 表單未填寫時送出空字串，存成 NULL 以免觸發唯一限制
+        return value or None
+
+
+class ReconciliationRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReconciliationRun
+        fields = [
+            "id",
+            "incremental",
+            "started_at",
+            "finished_at",
+            "checked_orders",
+            "issues_found",
+            "issues_resolved",
+        ]
+
+
+class ReconciliationIssueSerializer(serializers.ModelSerializer):
+    kind_display = serializers.CharField(source="get_kind_display", read_only=True)
+    order_number = serializers.CharField(
+        source="order.order_number", read_only=True, default=None
+    )
+    transaction_code = serializers.CharField(
+        source="transaction.transaction_id", read_only=True, default=None
+    )
+    resolved_by_name = serializers.CharField(
+        source="resolved_by.username", read_only=True, default=None
+    )
+
+    class Meta:
+        model = ReconciliationIssue
+        fields = [
+            "id",
+            "kind",
+            "kind_display",
+            "status",
+            "order",
+            "order_number",
+            "transaction",
+            "transaction_code",
+            "expected_amount",
+            "actual_amount",
+            "details",
+            "run",
+            "detected_at",
+            "updated_at",
+            "resolved_at",
+            "resolved_by",
+            "resolved_by_name",
+        ]
+        read_only_fields = fields
@@ -1 +1,330 @@
-# Create your tests here.
+from datetime import timedelta
+from decimal import Decimal
+
+from customers.dedup import merge_customers
+from customers.models import Customer
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from orders.models import Order
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .fx import recompute_base_amounts
+from .gateway import ingest_gateway_events
+from .ledger import build_checkpoints
+from .models import (
+    FxRate,
+    LedgerCheckpoint,
+    ReconciliationIssue,
+    ReconciliationRun,
+    Transaction,
+)
+from .reconciliation import run_reconciliation
+from .views import TransactionViewSet
+
+
+class TransactionListQueryTests(TestCase):
+    """列表的查詢數固定，與每頁筆數無關"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("transactions")
+        customers = [
+            Customer.objects.create(
+                first_name="Test", last_name=str(i), email=f"txn{i}@example.com"
+            )
+            for i in range(5)
+        ]
+        for i in range(30):
+            customer = customers[i % len(customers)]
+            order = Order.objects.create(
+                customer=customer,
+                status="delivered",
+                subtotal=Decimal("10.00"),
+                total=Decimal("10.00"),
+            )
+            Transaction.objects.create(
+                customer=customer,
+                order=order,
+                status="completed",
+                amount=Decimal("10.00"),
+                net_amount=Decimal("10.00"),
+            )
+
+    def _list(self, limit):
+        request = APIRequestFactory().get("/api/transactions/", {"limit": limit})
+        force_authenticate(request, self.user)
+        response = TransactionViewSet.as_view({"get": "list"})(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        # 總筆數、交易 (含客戶統計與訂單)
+        for limit in (5, 25):
+            with self.subTest(limit=limit), self.assertNumQueries(2):
+                results = self._list(limit)
+            self.assertEqual(len(results), limit)
+            self.assertIn("total_orders", results[0]["customer_info"])
+            self.assertIsNotNone(results[0]["order_info"])
+
+
+class GatewayEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("gateway")
+        cls.customer = Customer.objects.create(
+            first_name="Test", last_name="User", email="gateway@example.com"
+        )
+
+    def _event(self, occurred_at, status):
+        return {
+            "gateway_transaction_id": "gw-1",
+            "occurred_at": occurred_at,
+            "status": status,
+            "amount": "10.00",
+            "customer": self.customer.id,
+        }
+
+    def test_upsert_applies_only_newer_events(self):
+        [inserted] = ingest_gateway_events(
+            [self._event("2026-01-01T10:00Z", "pending")]
+        )
+        [updated] = ingest_gateway_events(
+            [self._event("2026-01-01T11:00Z", "completed")]
+        )
+        [stale] = ingest_gateway_events([self._event("2026-01-01T10:30Z", "failed")])
+        self.assertEqual(
+            [inserted["status"], updated["status"], stale["status"]],
+            ["inserted", "updated", "stale"],
+        )
+        self.assertEqual(Transaction.objects.get().status, "completed")
+
+
+class LedgerCheckpointTests(TestCase):
+    """QuerySet.update 的批次修改也要讓已建立的檢查點重建"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Test", last_name="User", email="ledger@example.com"
+        )
+        self.created_at = timezone.now() - timedelta(days=70)
+        # 另一位客戶的檢查點，讓 build_checkpoints 以增量方式建立
+        other = Customer.objects.create(
+            first_name="Other", last_name="User", email="ledger-other@example.com"
+        )
+        self._transaction(other, "USD")
+
+    def _transaction(self, customer, currency):
+        txn = Transaction.objects.create(
+            customer=customer,
+            status="completed",
+            currency=currency,
+            amount=Decimal("10.00"),
+            net_amount=Decimal("10.00"),
+        )
+        # 模擬早已建立、之後沒有修改過的交易
+        Transaction.objects.filter(pk=txn.pk).update(
+            created_at=self.created_at, updated_at=self.created_at
+        )
+        return txn
+
+    def _balances(self, customer):
+        return list(
+            LedgerCheckpoint.objects.filter(customer=customer).values_list(
+                "balance", flat=True
+            )
+        )
+
+    def test_recompute_base_amounts_rebuilds_checkpoints(self):
+        txn = self._transaction(self.customer, "EUR")
+        build_checkpoints()
+        self.assertEqual(self._balances(self.customer), [])
+
+        FxRate.objects.create(
+            currency="EUR", day=timezone.localdate(self.created_at), rate=Decimal(2)
+        )
+        recompute_base_amounts(Transaction.objects.filter(pk=txn.pk))
+        build_checkpoints()
+        txn.refresh_from_db()
+        self.assertIsNotNone(txn.amount_base)
+        self.assertEqual(self._balances(self.customer), [txn.amount_base])
+
+    def test_merge_customers_rebuilds_checkpoints(self):
+        duplicate = Customer.objects.create(
+            first_name="Test", last_name="User", email="ledger2@example.com"
+        )
+        self._transaction(duplicate, "USD")
+        build_checkpoints()
+        self.assertEqual(self._balances(self.customer), [])
+
+        merge_customers(self.customer, [duplicate])
+        build_checkpoints()
+        self.assertEqual(self._balances(self.customer), [Decimal("10.00")])
+
+
+class ReconciliationTests(TestCase):
+    """完整 / 增量對帳、差異的自動解決，以及重複扣款與金額不符的區分"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Test", last_name="User", email="reconcile@example.com"
+        )
+        # 已付清；兩筆相同金額合計等於總額 (只有重複扣款)；
+        # 兩筆相同金額合計超過總額 (兩種差異)；少收；取消後未退款
+        self.paid = self._order("delivered", "10.00", "10.00")
+        self.split = self._order("delivered", "10.00", "5.00", "5.00")
+        self.doubled = self._order("delivered", "10.00", "10.00", "10.00")
+        self.short = self._order("shipped", "10.00", "7.00")
+        self.cancelled = self._order("cancelled", "10.00", "10.00")
+        self.orphan = self._charge(None, "4.00")
+
+    def _order(self, status, total, *charges):
+        order = Order.objects.create(
+            customer=self.customer,
+            status=status,
+            subtotal=Decimal(total),
+            total=Decimal(total),
+        )
+        for amount in charges:
+            self._charge(order, amount)
+        return order
+
+    def _charge(self, order, amount, transaction_type="sale", currency="USD"):
+        return Transaction.objects.create(
+            customer=self.customer,
+            order=order,
+            transaction_type=transaction_type,
+            status="completed",
+            currency=currency,
+            amount=Decimal(amount),
+            net_amount=Decimal(amount),
+        )
+
+    def _open_issues(self):
+        return {
+            (issue.kind, issue.order_id or issue.transaction_id)
+            for issue in ReconciliationIssue.objects.filter(status="open")
+        }
+
+    def _age_everything(self):
+        """讓目前的資料與對帳紀錄都落在增量對帳的重疊區間之前"""
+        past = timezone.now() - timedelta(hours=2)
+        Order.objects.update(updated_at=past)
+        Transaction.objects.update(updated_at=past)
+        ReconciliationRun.objects.update(started_at=past + timedelta(hours=1))
+
+    def test_full_run_separates_double_charge_from_amount_mismatch(self):
+        run = run_reconciliation(incremental=False)
+        self.assertFalse(run.incremental)
+        self.assertEqual(run.checked_orders, 5)
+        self.assertEqual(
+            self._open_issues(),
+            {
+                ("double_charge", self.split.pk),
+                ("double_charge", self.doubled.pk),
+                ("amount_mismatch", self.doubled.pk),
+                ("amount_mismatch", self.short.pk),
+                ("amount_mismatch", self.cancelled.pk),
+                ("orphan_transaction", self.orphan.pk),
+            },
+        )
+        short = ReconciliationIssue.objects.get(order=self.short)
+        self.assertEqual(
+            (short.expected_amount, short.actual_amount),
+            (Decimal("10.00"), Decimal("7.00")),
+        )
+        cancelled = ReconciliationIssue.objects.get(order=self.cancelled)
+        self.assertEqual(cancelled.expected_amount, Decimal(0))
+
+        # 再執行一次不會重複建立差異
+        again = run_reconciliation(incremental=False)
+        self.assertEqual((again.issues_found, again.issues_resolved), (0, 0))
+        self.assertEqual(ReconciliationIssue.objects.count(), 6)
+
+    def test_incremental_run_checks_changed_rows_and_resolves(self):
+        run_reconciliation()
+        self._age_everything()
+
+        # 補收款 → 少收已解決；退款 → 取消的訂單淨收款為 0；加收運費
+        self._charge(self.short, "3.00")
+        self._charge(self.cancelled, "10.00", transaction_type="refund")
+        self.doubled.shipping_amount = Decimal("5.00")
+        self.doubled.save()
+        self.orphan.order = self.paid
+        self.orphan.save()
+
+        run = run_reconciliation()
+        self.assertTrue(run.incremental)
+        self.assertEqual(run.checked_orders, 4)
+        self.assertEqual((run.issues_found, run.issues_resolved), (1, 3))
+        self.assertEqual(
+            self._open_issues(),
+            {
+                ("double_charge", self.split.pk),
+                ("double_charge", self.doubled.pk),
+                ("amount_mismatch", self.doubled.pk),
+                # 綁定後 paid 多收 4.00
+                ("amount_mismatch", self.paid.pk),
+            },
+        )
+        doubled = ReconciliationIssue.objects.get(
+            order=self.doubled, kind="amount_mismatch"
+        )
+        self.assertEqual(
+            (doubled.expected_amount, doubled.run_id), (Decimal("15.00"), run.pk)
+        )
+        resolved = ReconciliationIssue.objects.filter(status="resolved")
+        self.assertEqual(
+            {
+                (issue.kind, issue.order_id or issue.transaction_id)
+                for issue in resolved
+            },
+            {
+                ("amount_mismatch", self.short.pk),
+                ("amount_mismatch", self.cancelled.pk),
+                ("orphan_transaction", self.orphan.pk),
+            },
+        )
+        self.assertFalse(resolved.filter(resolved_at__isnull=True).exists())
+
+    def test_deleted_transaction_needs_full_run(self):
+        run_reconciliation()
+        self._age_everything()
+        Transaction.objects.filter(order=self.split).first().delete()
+
+        # 刪除沒有留下異動紀錄，增量對帳看不到
+        run = run_reconciliation()
+        self.assertEqual((run.checked_orders, run.issues_resolved), (0, 0))
+        self.assertIn(("double_charge", self.split.pk), self._open_issues())
+
+        run = run_reconciliation(incremental=False)
+        self.assertEqual(run.issues_resolved, 1)
+        self.assertEqual(
+            {key for key in self._open_issues() if key[1] == self.split.pk},
+            {("amount_mismatch", self.split.pk)},
+        )
+
+    def test_unconverted_transaction_is_not_an_amount_mismatch(self):
+        # 以基準幣別比對：20 EUR 換算後才等於 10.00 的訂單總額
+        order = self._order("delivered", "10.00")
+        euros = self._charge(order, "20.00", currency="EUR")
+        self.assertIsNone(euros.amount_base)
+
+        run_reconciliation()
+        self.assertIn(("unconverted_transaction", euros.pk), self._open_issues())
+        self.assertNotIn(("amount_mismatch", order.pk), self._open_issues())
+        issue = ReconciliationIssue.objects.get(transaction=euros)
+        self.assertEqual(issue.details, {"currency": "EUR", "order_id": order.pk})
+
+        self._age_everything()
+        FxRate.objects.create(
+            currency="EUR",
+            day=timezone.localdate(euros.created_at),
+            rate=Decimal("0.5"),
+        )
+        recompute_base_amounts(Transaction.objects.filter(pk=euros.pk))
+        run = run_reconciliation()
+        self.assertEqual((run.checked_orders, run.issues_resolved), (1, 1))
+        open_issues = self._open_issues()
+        self.assertNotIn(("unconverted_transaction", euros.pk), open_issues)
+        self.assertNotIn(("amount_mismatch", order.pk), open_issues)
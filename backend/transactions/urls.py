@@ -1,9 +1,10 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import TransactionViewSet
+from .views import ReconciliationIssueViewSet, TransactionViewSet
 
 router = DefaultRouter()
+router.register(r"reconciliation", ReconciliationIssueViewSet)
 router.register(r"", TransactionViewSet)
 
 urlpatterns = [
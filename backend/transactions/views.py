@@ -1,12 +1,31 @@
+from crm_backend.export import StreamingExportMixin
+from crm_backend.fieldsets import SparseFieldsetViewSetMixin
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, viewsets
+from rest_framework import filters, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
-from .models import Transaction
-from .serializers import TransactionCreateUpdateSerializer, TransactionSerializer
+from .gateway import (
+    MAX_EVENTS_PER_BATCH,
+    GatewaySignaturePermission,
+    ingest_gateway_events,
+)
+from .models import ReconciliationIssue, Transaction
+from .reconciliation import run_reconciliation
+from .serializers import (
+    ReconciliationIssueSerializer,
+    ReconciliationRunSerializer,
+    TransactionCreateUpdateSerializer,
+    TransactionSerializer,
+)
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
-    queryset = Transaction.objects.select_related("customer", "order")
+class TransactionViewSet(
+    StreamingExportMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet
+):
+    queryset = Transaction.objects.select_related("customer__stats", "order")
     filter_backends = [
         DjangoFilterBackend,
         filters.SearchFilter,
@@ -27,7 +46,14 @@ class TransactionViewSet(viewsets.ModelViewSet):
         "gateway_transaction_id",
     ]
     ordering_fields = ["transaction_id", "amount", "created_at", "processed_at"]
-    ordering = ["-created_at"]
+    # created_at 只有 BRIN 索引，無法提供排序；id 與 created_at 同樣依寫入順序遞增，
+    # 預設改以主鍵由新到舊排序，列表第一頁不需要排序整個資料表
+    ordering = ["-id"]
+    sparse_select_related = {
+        "customer_info": ("customer__stats",),
+        "order_info": ("order",),
+    }
+    sparse_only_dependencies = {"order_info": ("order",)}
 
     def get_serializer_class(self):
         if self.action in {"create", "update", "partial_update"}:
@@ -39,3 +65,69 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer) -> None:
         serializer.save(updated_by=self.request.user)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="gateway-events",
+        permission_classes=[IsAuthenticated | GatewaySignaturePermission],
+    )
+    def gateway_events(self, request) -> Response:
+        """
+        金流事件批次匯入 (webhook)
+        {"events": [{"gateway_transaction_id": "...", "occurred_at": "...", ...}]}
+        已登入的使用者或帶有效 X-Gateway-Signature 的請求皆可呼叫
+        """
+        events = request.data.get("events")
+        if not isinstance(events, list) or not events:
+            return Response(
+                {"error": "events 必須是事件陣列"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(events) > MAX_EVENTS_PER_BATCH:
+            return Response(
+                {"error": f"單次最多 {MAX_EVENTS_PER_BATCH} 筆事件"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = ingest_gateway_events(events)
+        summary = {}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+        return Response({"summary": summary, "results": results})
+
+
+class ReconciliationIssueViewSet(viewsets.ReadOnlyModelViewSet):
+    """對帳差異列表；run 執行對帳、resolve 人工標記為已處理"""
+
+    queryset = ReconciliationIssue.objects.select_related(
+        "order", "transaction", "resolved_by"
+    )
+    serializer_class = ReconciliationIssueSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ["kind", "status", "order", "transaction", "run"]
+    ordering_fields = ["detected_at", "updated_at", "actual_amount"]
+    ordering = ["-detected_at"]
+
+    @action(detail=False, methods=["post"])
+    def run(self, request) -> Response:
+        """
+        執行對帳 {"incremental": true}
+        預設只檢查上次對帳後有異動的訂單與交易，incremental 為 false 時完整對帳
+        """
+        incremental = request.data.get("incremental", True) not in (False, "false")
+        run = run_reconciliation(incremental=incremental)
+        return Response(ReconciliationRunSerializer(run).data)
+
+    @action(detail=True, methods=["post"])
+    def resolve(self, request, pk=None) -> Response:
+        issue = self.get_object()
+        if issue.status == "resolved":
+            return Response(
+                {"error": "此差異已經處理"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        issue.status = "resolved"
+        issue.resolved_at = timezone.now()
+        issue.resolved_by = request.user
+        issue.save(update_fields=["status", "resolved_at", "resolved_by", "updated_at"])
+        return Response(self.get_serializer(issue).data)
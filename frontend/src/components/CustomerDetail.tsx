@@ -3,6 +3,7 @@ import { Customer } from '../types/customer';
 import { Order } from '../types/order';
 import { Transaction } from '../types/transaction';
 import { ApiError } from '../types/error';
+import { PaginatedResponse } from '../types/common';
 import api from '../services/api';
 
 interface CustomerDetailProps {
@@ -15,6 +16,10 @@ const CustomerDetail: React.FC<CustomerDetailProps> = ({ customerId, onEdit, onB
   const [customer, setCustomer] = useState<Customer | null>(null);
   const [orders, setOrders] = useState<Order[]>([]);
   const [transactions, setTransactions] = useState<Transaction[]>([]);
+  // 訂單與交易為分頁回應，記錄總筆數與下一頁網址供「載入更多」使用
+  const [ordersPage, setOrdersPage] = useState({ count: 0, next: null as string | null });
+  const [transactionsPage, setTransactionsPage] = useState({ count: 0, next: null as string | null });
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [activeTab, setActiveTab] = useState('details');
   const [error, setError] = useState('');
@@ -24,13 +29,18 @@ const CustomerDetail: React.FC<CustomerDetailProps> = ({ customerId, onEdit, onB
       setLoading(true);
       const [customerResponse, ordersResponse, transactionsResponse] = await Promise.all([
         api.get<Customer>(`/customers/${customerId}/`),
-        api.get<Order[]>(`/customers/${customerId}/orders/`),
-        api.get<Transaction[]>(`/customers/${customerId}/transactions/`)
+        api.get<PaginatedResponse<Order>>(`/customers/${customerId}/orders/`),
+        api.get<PaginatedResponse<Transaction>>(`/customers/${customerId}/transactions/`)
       ]);
 
       setCustomer(customerResponse.data);
-      setOrders(ordersResponse.data);
-      setTransactions(transactionsResponse.data);
+      setOrders(ordersResponse.data.results);
+      setOrdersPage({ count: ordersResponse.data.count, next: ordersResponse.data.next });
+      setTransactions(transactionsResponse.data.results);
+      setTransactionsPage({
+        count: transactionsResponse.data.count,
+        next: transactionsResponse.data.next,
+      });
     } catch (err) {
       const error = err as ApiError;
       setError(error.response?.data?.detail || error.message || '無法取得客戶資料');
@@ -44,6 +54,36 @@ const CustomerDetail: React.FC<CustomerDetailProps> = ({ customerId, onEdit, onB
     fetchCustomerData();
   }, [customerId, fetchCustomerData]);
 
+  const loadMoreOrders = async () => {
+    if (!ordersPage.next) return;
+    try {
+      setLoadingMore(true);
+      const response = await api.get<PaginatedResponse<Order>>(ordersPage.next);
+      setOrders((previous) => [...previous, ...response.data.results]);
+      setOrdersPage({ count: response.data.count, next: response.data.next });
+    } catch (err: unknown) {
+      setError('無法載入更多訂單');
+      console.error('Error loading orders:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const loadMoreTransactions = async () => {
+    if (!transactionsPage.next) return;
+    try {
+      setLoadingMore(true);
+      const response = await api.get<PaginatedResponse<Transaction>>(transactionsPage.next);
+      setTransactions((previous) => [...previous, ...response.data.results]);
+      setTransactionsPage({ count: response.data.count, next: response.data.next });
+    } catch (err: unknown) {
+      setError('無法載入更多交易記錄');
+      console.error('Error loading transactions:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDelete = async () => {
     if (!customer) return;
     
@@ -150,8 +190,8 @@ const CustomerDetail: React.FC<CustomerDetailProps> = ({ customerId, onEdit, onB
           <nav className="-mb-px flex">
             {[
               { id: 'details', name: '詳細資料' },
-              { id: 'orders', name: `訂單 (${orders.length})` },
-              { id: 'transactions', name: `交易記錄 (${transactions.length})` }
+              { id: 'orders', name: `訂單 (${ordersPage.count})` },
+              { id: 'transactions', name: `交易記錄 (${transactionsPage.count})` }
             ].map((tab) => (
               <button
                 key={tab.id}
@@ -345,6 +385,17 @@ const CustomerDetail: React.FC<CustomerDetailProps> = ({ customerId, onEdit, onB
                       ))}
                     </tbody>
                   </table>
+                  {ordersPage.next && (
+                    <div className="flex justify-center py-4">
+                      <button
+                        onClick={loadMoreOrders}
+                        disabled={loadingMore}
+                        className="px-4 py-2 border border-gray-300 rounded-md text-sm font-medium text-gray-700 bg-white hover:bg-gray-50 disabled:opacity-50"
+                      >
+                        {loadingMore ? '載入中...' : `載入更多 (${orders.length}/${ordersPage.count})`}
+                      </button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
@@ -413,6 +464,19 @@ const CustomerDetail: React.FC<CustomerDetailProps> = ({ customerId, onEdit, onB
                       ))}
                     </tbody>
                   </table>
+                  {transactionsPage.next && (
+                    <div className="flex justify-center py-4">
+                      <button
+                        onClick={loadMoreTransactions}
+                        disabled={loadingMore}
+                        className="px-4 py-2 border border-gray-300 rounded-md text-sm font-medium text-gray-700 bg-white hover:bg-gray-50 disabled:opacity-50"
+                      >
+                        {loadingMore
+                          ? '載入中...'
+                          : `載入更多 (${transactions.length}/${transactionsPage.count})`}
+                      </button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>